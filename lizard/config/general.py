@@ -9,6 +9,8 @@ ILEN_BYTES = ILEN // 8
 CSR_SPEC_NBITS = 12
 
 NUM_ISSUE_SLOTS = 16
+# One of 'compacting' or 'age', for the OO issue queue
+ISSUE_QUEUE_KIND = 'age'
 NUM_MEM_ISSUE_SLOTS = 8
 ROB_SIZE = 32
 ROB_IDX_NBITS = clog2(ROB_SIZE)
@@ -24,7 +26,10 @@ PREG_COUNT = 64
 PREG_IDX_NBITS = clog2(PREG_COUNT)
 INST_IDX_NBITS = ROB_IDX_NBITS
 
-MAX_SPEC_DEPTH = 2
+# Unresolved branches in flight. Each one costs a snapshot of the rename
+# table and a mask of the pregs allocated since, but restoring either is a
+# single read however deep speculation goes
+MAX_SPEC_DEPTH = 8
 assert MAX_SPEC_DEPTH > 0
 SPEC_IDX_NBITS = clog2(MAX_SPEC_DEPTH)
 SPEC_MASK_NBITS = MAX_SPEC_DEPTH
@@ -33,6 +38,24 @@ STORE_QUEUE_SIZE = 4
 STORE_IDX_NBITS = clog2(STORE_QUEUE_SIZE)
 MEM_MAX_SIZE = 8
 MEM_SIZE_NBITS = 4
+# Loads waiting on memory at once. Each is tagged in the opaque field of
+# the memory bus alongside stores, so there can be at most
+# 2**opaque_nbits - 1. Every load beyond the first adds a pipeline stage
+LOAD_QUEUE_SIZE = 2
+# Committed stores wait in a buffer of aligned words, which merges stores
+# to the same word. An entry drains once it is full, or
+# STORE_BUFFER_DRAIN_DELAY cycles after it was taken
+STORE_BUFFER_NENTRIES = 4
+STORE_BUFFER_DRAIN_DELAY = 16
+ENABLE_STORE_BUFFER = int(STORE_BUFFER_NENTRIES != 0)
+# Loads issue ahead of older stores with unknown addresses unless the load
+# PC is marked in the store wait table, which learns from loads caught
+# overlapping a store, and is cleared every 2**MEM_DEP_CLEAR_NBITS cycles
+MEM_DEP_PRED_SIZE = 64
+MEM_DEP_CLEAR_NBITS = 14
+# Loads issued ahead of a store are checked against it when its address
+# arrives. A load finding all of these in use is replayed from commit
+MEM_DEP_NLOADS = 4
 
 BIT32_MASK = Bits(32, 0xFFFFFFFF)
 
@@ -40,7 +63,56 @@ BIT32_MASK = Bits(32, 0xFFFFFFFF)
 MCAUSE_NBITS = 4
 
 MUL_NSTAGES = 4
-DIV_NSTEPS = 32
 
-BTB_SIZE = 8
-ENABLE_BTB = int(BTB_SIZE != 0)
+# Instruction requests in flight, each tagged by the opaque field of the
+# memory bus, so at most 2**opaque_nbits
+FETCH_NSLOTS = 4
+FETCH_QUEUE_SIZE = 4
+# Instructions decoded and renamed every cycle
+FRONTEND_WIDTH = 2
+# Instructions retired every cycle
+COMMIT_WIDTH = 2
+# ALU pipes, each of which can be issued to every cycle
+NUM_ALU_PIPES = 2
+
+# Set associative, indexed by the PC above its 2 always-zero bits
+BTB_NSETS = 64
+BTB_NWAYS = 4
+ENABLE_BTB = int(BTB_NWAYS != 0)
+
+# One of 'bimodal', 'gshare', or 'tournament'
+BPRED_KIND = 'tournament'
+BPRED_NENTRIES = 256
+BPRED_HIST_NBITS = 8
+ENABLE_BPRED = int(BPRED_NENTRIES != 0)
+
+# Targets of jalrs, indexed by the PC XOR the global history, so needs at
+# least 2**BPRED_HIST_NBITS entries
+ITP_NENTRIES = 256
+ITP_TAG_NBITS = 8
+ENABLE_ITP = int(ITP_NENTRIES != 0)
+
+RAS_SIZE = 8
+RAS_IDX_NBITS = clog2(RAS_SIZE)
+ENABLE_RAS = 1
+
+ICACHE_NSETS = 16
+ICACHE_NWAYS = 2
+ICACHE_LINE_NBYTES = 32
+# Lines prefetched after a miss, or 0 to disable prefetching
+ICACHE_PREFETCH_LINES = 2
+ENABLE_ICACHE = int(ICACHE_NWAYS != 0)
+
+DCACHE_NSETS = 16
+DCACHE_NWAYS = 2
+DCACHE_LINE_NBYTES = 32
+# Each miss status holding register is identified by the opaque field of
+# the memory bus, so there can be at most 2**opaque_nbits
+DCACHE_NMSHRS = 2
+ENABLE_DCACHE = int(DCACHE_NWAYS != 0)
+# A stride prefetcher indexed by the PC of each load, which prefetches
+# DCACHE_PREFETCH_DISTANCE (a power of 2) strides ahead
+DCACHE_PREFETCH_NENTRIES = 16
+DCACHE_PREFETCH_TAG_NBITS = 8
+DCACHE_PREFETCH_DISTANCE = 4
+ENABLE_DCACHE_PREFETCH = int(ENABLE_DCACHE and DCACHE_PREFETCH_NENTRIES != 0)
@@ -20,6 +20,7 @@ class DataFlowManagerFL(FLModel):
     nstore_queue = s.interface.NumStoreQueue
     num_src_ports = s.interface.NumSrcPorts
     num_dst_ports = s.interface.NumDstPorts
+    num_write_ports = s.interface.NumWritePorts
     num_is_ready_ports = s.interface.NumIsReadyPorts
     num_forward_ports = s.interface.NumForwardPorts
 
@@ -30,7 +31,8 @@ class DataFlowManagerFL(FLModel):
             num_dst_ports,
             num_dst_ports,
             nsnapshots,
-            used_slots_initial=naregs - 1),
+            used_slots_initial=naregs - 1,
+            max_refs=naregs),
         store_ids=SnapshottingFreeListFL(nstore_queue, num_dst_ports,
                                          num_dst_ports, nsnapshots),
     )
@@ -62,7 +64,7 @@ class DataFlowManagerFL(FLModel):
             Bits(dlen),
             npregs,
             num_is_ready_ports,
-            num_dst_ports,
+            num_write_ports,
             True,
             False,
             reset_values=preg_reset,
@@ -71,7 +73,7 @@ class DataFlowManagerFL(FLModel):
             Bits(1),
             npregs,
             num_is_ready_ports,
-            num_dst_ports * 2,
+            num_write_ports + num_dst_ports,
             False,
             False,
             reset_values=ready_reset,
@@ -94,14 +96,17 @@ class DataFlowManagerFL(FLModel):
       s.store_ids.free(id_)
 
     @s.model_method
-    def commit(tag, areg):
-      if tag == s.ZERO_TAG:
+    def commit(tag, areg, move):
+      if areg == 0:
         return
+      if move and tag != s.ZERO_TAG:
+        s.free_regs.share(tag)
       old_preg = s.areg_file.read(areg).data
-      s.free_regs.free(old_preg)
+      if old_preg != s.ZERO_TAG and s.free_regs.drop(old_preg).freed:
+        s.arch_used_pregs.write(addr=old_preg, data=0)
       s.areg_file.write(addr=areg, data=tag)
-      s.arch_used_pregs.write(addr=old_preg, data=0)
-      s.arch_used_pregs.write(addr=tag, data=1)
+      if tag != s.ZERO_TAG:
+        s.arch_used_pregs.write(addr=tag, data=1)
 
     @s.model_method
     def write(tag, value):
@@ -156,9 +161,15 @@ class DataFlowManagerFL(FLModel):
       return s.free_regs.alloc.rdy()
 
     @s.model_method
-    def get_dst(areg):
+    def get_dst(areg, zero, move, src):
       if areg == 0:
         return s.ZERO_TAG
+      if zero:
+        s.rename_table.update(areg=areg, preg=s.ZERO_TAG)
+        return s.ZERO_TAG
+      if move:
+        s.rename_table.update(areg=areg, preg=src)
+        return src
       allocation = s.free_regs.alloc()
 
       s.rename_table.update(areg=areg, preg=allocation.index)
@@ -3,7 +3,7 @@ from lizard.util.rtl.interface import UseInterface
 from lizard.util.rtl import alu
 from lizard.util.rtl.lookup_table import LookupTable, LookupTableInterface
 from lizard.bitutil import clog2
-from lizard.core.rtl.messages import DispatchMsg, ExecuteMsg, AluFunc
+from lizard.core.rtl.messages import DispatchMsg, ExecuteMsg, AluMsg, AluFunc
 from lizard.util.rtl.pipeline_stage import StageInterface, DropControllerInterface
 from lizard.core.rtl.forwarder import gen_forwarding_stage
 from lizard.core.rtl.kill_unit import PipelineKillDropController
@@ -45,6 +45,8 @@ class ALUStage(Model):
     s.alu_ = alu.ALU(alu.ALUInterface(data_len))
     s.msg_ = Wire(DispatchMsg())
     s.msg_imm_ = Wire(imm_len)
+    s.msg_fused_imm_ = Wire(AluMsg().fused_imm.nbits)
+    s.fused_imm_ = Wire(data_len)
 
     # PYMTL_BROKEN, cant do msg.src1[:32]
     s.src1_ = Wire(data_len)
@@ -106,18 +108,21 @@ class ALUStage(Model):
         s.src1_.v = s.rs1_
         s.src2_.v = s.rs2_
         s.res_trunc_.v = s.res_
-        if s.msg_.alu_msg_func == AluFunc.ALU_FUNC_AUIPC:
-          s.src1_.v = s.msg_.hdr_pc
-        elif s.msg_.alu_msg_func == AluFunc.ALU_FUNC_LUI:  # LUI is a special case
-          s.src1_.v = 0
+      # Outside the op32 case, since a lui or auipc fused with addiw is op32
+      if s.msg_.alu_msg_func == AluFunc.ALU_FUNC_AUIPC:
+        s.src1_.v = s.msg_.hdr_pc
+      elif s.msg_.alu_msg_func == AluFunc.ALU_FUNC_LUI:  # LUI is a special case
+        s.src1_.v = 0
 
     @s.combinational
     def set_inputs():
       # PYMTL_BROKEN: sext, concat, and zext only work with wires and constants
       s.msg_imm_.v = s.msg_.imm
+      s.msg_fused_imm_.v = s.msg_.alu_msg_fused_imm
+      s.fused_imm_.v = zext(s.msg_fused_imm_, data_len)
       s.imm_.v = sext(s.msg_imm_, data_len)
       if s.msg_.alu_msg_func == AluFunc.ALU_FUNC_AUIPC or s.msg_.alu_msg_func == AluFunc.ALU_FUNC_LUI:
-        s.imm_.v = s.imm_ << 12
+        s.imm_.v = (s.imm_ << 12) | s.fused_imm_
       s.alu_.exec_src0.v = s.src1_
       s.alu_.exec_src1.v = s.src2_ if s.msg_.rs2_val else s.imm_
 
@@ -4,7 +4,7 @@ from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.comparator import Comparator, ComparatorInterface, CMPFunc
 from lizard.util.rtl.lookup_table import LookupTable, LookupTableInterface
 from lizard.bitutil import clog2
-from lizard.core.rtl.messages import DispatchMsg, ExecuteMsg, BranchType, OpClass
+from lizard.core.rtl.messages import DispatchMsg, ExecuteMsg, BranchType, OpClass, BtbEntry
 from lizard.util.rtl.pipeline_stage import gen_stage, StageInterface, DropControllerInterface
 from lizard.core.rtl.kill_unit import PipelineKillDropController
 from lizard.core.rtl.controlflow import KillType
@@ -33,6 +33,7 @@ class BranchStage(Model):
                 'spec_idx': Bits(spec_idx_len),
                 'branch_mask': Bits(speculative_mask_nbits),
                 'target': Bits(data_len),
+                'hist': Bits(BPRED_HIST_NBITS),
                 'force': Bits(1),
             },
             rets={},
@@ -44,7 +45,29 @@ class BranchStage(Model):
             args={
                 'key': XLEN,
                 'remove': Bits(1),
-                'value': XLEN,
+                'value': BtbEntry(),
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'bpred_update',
+            args={
+                'pc': XLEN,
+                'hist': Bits(BPRED_HIST_NBITS),
+                'taken': Bits(1),
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'itp_update',
+            args={
+                'pc': XLEN,
+                'hist': Bits(BPRED_HIST_NBITS),
+                'target': XLEN,
             },
             rets=None,
             call=True,
@@ -95,6 +118,12 @@ class BranchStage(Model):
     s.connect(s.cflow_redirect_force, 0)
     s.connect(s.cflow_redirect_call, s.process_call)
 
+    # The history fetch should continue with after this instruction
+    @s.combinational
+    def compute_redirect_hist():
+      s.cflow_redirect_hist.v = s.msg_.hdr_pred_hist << 1
+      s.cflow_redirect_hist[0].v = s.take_branch_
+
     @s.combinational
     def set_take_branch():
       s.take_branch_.v = s.cmp_.exec_res or s.msg_.op_class == OpClass.OP_CLASS_JUMP
@@ -128,12 +157,44 @@ class BranchStage(Model):
       s.process_out.rd_val.v = s.msg_.rd_val
       s.process_out.areg_d.v = s.msg_.areg_d
 
+    if ENABLE_BPRED:
+      # The direction predictor decides whether to use the BTB target of a
+      # branch, so only taken branches need an entry
+      @s.combinational
+      def update_btb():
+        s.btb_write_key.v = s.msg_.hdr_pc
+        s.btb_write_value.target.v = s.branch_target_
+        s.btb_write_value.jump.v = s.msg_.op_class == OpClass.OP_CLASS_JUMP
+        s.btb_write_remove.v = 0
+        s.btb_write_call.v = s.process_call and s.take_branch_
+    else:
+
+      @s.combinational
+      def update_btb():
+        s.btb_write_key.v = s.msg_.hdr_pc
+        s.btb_write_value.target.v = s.branch_target_
+        s.btb_write_value.jump.v = s.msg_.op_class == OpClass.OP_CLASS_JUMP
+        s.btb_write_remove.v = not s.take_branch_
+        s.btb_write_call.v = s.process_call
+
+    # Jumps are always taken, so only conditional branches train
+    s.connect(s.bpred_update_pc, s.msg_.hdr_pc)
+    s.connect(s.bpred_update_hist, s.msg_.hdr_pred_hist)
+    s.connect(s.bpred_update_taken, s.take_branch_)
+
+    @s.combinational
+    def update_bpred():
+      s.bpred_update_call.v = s.process_call and s.msg_.op_class == OpClass.OP_CLASS_BRANCH
+
+    # Only jalrs train the indirect predictor, since a jal's target never
+    # changes
+    s.connect(s.itp_update_pc, s.msg_.hdr_pc)
+    s.connect(s.itp_update_hist, s.msg_.hdr_pred_hist)
+    s.connect(s.itp_update_target, s.branch_target_)
+
     @s.combinational
-    def update_btb():
-      s.btb_write_key.v = s.msg_.hdr_pc
-      s.btb_write_value.v = s.branch_target_
-      s.btb_write_remove.v = not s.take_branch_
-      s.btb_write_call.v = s.process_call
+    def update_itp():
+      s.itp_update_call.v = s.process_call and s.msg_.op_class == OpClass.OP_CLASS_JUMP and s.msg_.rs1_val
 
   def line_trace(s):
     return s.process_in_.hdr_seq.hex()[2:]
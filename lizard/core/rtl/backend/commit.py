@@ -4,20 +4,31 @@ from lizard.util.rtl.method import MethodSpec
 from lizard.core.rtl.messages import WritebackMsg, PipelineMsgStatus
 from lizard.util.rtl.reorder_buffer import ReorderBuffer, ReorderBufferInterface
 from lizard.config.general import *
+from lizard.bitutil import clog2
 from lizard.util.rtl.pipeline_stage import PipelineStageInterface
 from lizard.msg.codes import CsrRegisters, MtvecMode
 from lizard.core.rtl.controlflow import KillType
 from lizard.core.rtl.kill_unit import KillDropController, KillDropControllerInterface
 
 
-def CommitInterface():
-  return PipelineStageInterface(None, KillType(MAX_SPEC_DEPTH))
+def CommitInterface(width):
+  return PipelineStageInterface(None, KillType(MAX_SPEC_DEPTH), width)
 
 
 class Commit(Model):
+  """Retires up to width instructions from the head of the ROB every cycle.
 
-  def __init__(s, interface, rob_size):
+  The instructions retired in a cycle are a prefix of the ones at the head,
+  and only the first may raise an exception, replay, or fence, since those
+  redirect or wait on memory. At most 1 store is retired per cycle.
+
+  Results from all num_writeback_ports writeback ports enter the ROB every
+  cycle.
+  """
+
+  def __init__(s, interface, rob_size, num_writeback_ports):
     UseInterface(s, interface)
+    width = s.interface.Width
     s.SeqIdxNbits = WritebackMsg().hdr_seq.nbits
     s.SpecIdxNbits = WritebackMsg().hdr_spec.nbits
     s.SpecMaskNbits = WritebackMsg().hdr_branch_mask.nbits
@@ -30,6 +41,7 @@ class Commit(Model):
             },
             call=False,
             rdy=True,
+            count=num_writeback_ports,
         ),
         MethodSpec(
             'in_take',
@@ -37,16 +49,19 @@ class Commit(Model):
             rets=None,
             call=True,
             rdy=False,
+            count=num_writeback_ports,
         ),
         MethodSpec(
             'dataflow_commit',
             args={
                 'tag': PREG_IDX_NBITS,
                 'areg': AREG_IDX_NBITS,
+                'move': Bits(1),
             },
             rets=None,
             call=True,
             rdy=False,
+            count=width,
         ),
         MethodSpec(
             'dataflow_free_store_id',
@@ -75,6 +90,7 @@ class Commit(Model):
             rets={},
             call=True,
             rdy=False,
+            count=width,
         ),
         # Memoryflow to dispatch stores
         MethodSpec(
@@ -96,6 +112,13 @@ class Commit(Model):
             call=False,
             rdy=False,
         ),
+        MethodSpec(
+            'clean_cache',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
         MethodSpec(
             'store_data_available',
             args={
@@ -118,7 +141,7 @@ class Commit(Model):
             },
             call=False,
             rdy=False,
-            count=3,
+            count=4,
         ),
         MethodSpec(
             'write_csr',
@@ -131,7 +154,7 @@ class Commit(Model):
             },
             call=True,
             rdy=False,
-            count=5,
+            count=6,
         ),
         MethodSpec(
             'btb_clear',
@@ -140,113 +163,210 @@ class Commit(Model):
             call=True,
             rdy=False,
         ),
+        MethodSpec(
+            'icache_flush',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
     )
 
-    s.advance = Wire(1)
-    s.rob_remove = Wire(1)
-    s.seq_num = Wire(s.SeqIdxNbits)
-
     def make_kill():
       return KillDropController(KillDropControllerInterface(s.SpecMaskNbits))
 
     s.rob = ReorderBuffer(
         ReorderBufferInterface(WritebackMsg(), rob_size, s.SpecMaskNbits,
-                               s.interface.KillArgType), make_kill)
+                               s.interface.KillArgType, width,
+                               num_writeback_ports), make_kill)
     s.connect_m(s.rob.kill_notify, s.kill_notify)
-    # Connect head status check
-    s.connect(s.rob.check_done_idx, s.cflow_get_head_seq)
-
-    # if writeback is ready, take the data and commit
-    s.connect(s.advance, s.in_peek_rdy)
-    s.connect(s.in_take_call, s.advance)
-    s.connect(s.seq_num, s.in_peek_msg.hdr_seq)
-
-    # Add incoming message into ROB
-    s.connect(s.rob.add_value, s.in_peek_msg)
-    s.connect(s.rob.add_kill_opaque, s.in_peek_msg.hdr_branch_mask)
-    s.connect_wire(s.rob.add_idx, s.seq_num)
-    s.connect(s.rob.add_call, s.advance)
-
-    # Connect up ROB free
-    s.connect(s.rob.peek_idx, s.cflow_get_head_seq)
-    s.connect(s.rob.free_call, s.rob_remove)
-
-    s.connect(s.cflow_commit_call, s.rob_remove)
 
+    for i in range(num_writeback_ports):
+      # if writeback is ready, take the data and commit
+      s.connect(s.in_take_call[i], s.in_peek_rdy[i])
+
+      # Add incoming message into ROB
+      s.connect(s.rob.add_value[i], s.in_peek_msg[i])
+      s.connect(s.rob.add_kill_opaque[i], s.in_peek_msg[i].hdr_branch_mask)
+      s.connect_wire(s.rob.add_idx[i], s.in_peek_msg[i].hdr_seq)
+      s.connect(s.rob.add_call[i], s.in_peek_rdy[i])
+
+    # head_[i] is the ith instruction after the ROB head
+    s.seq_ = [Wire(s.SeqIdxNbits) for _ in range(width)]
+    s.head_ = [Wire(WritebackMsg()) for _ in range(width)]
+    s.valid_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction is retired this cycle
+    s.rob_remove = [Wire(1) for _ in range(width)]
+    s.store_before_ = [Wire(1) for _ in range(width)]
+    s.store_ok_ = [Wire(1) for _ in range(width)]
+    s.store_id_ = Wire(STORE_IDX_NBITS)
+    s.store_call_ = Wire(1)
+    s.num_retired_ = Wire(clog2(width + 1))
+    # num_fused_[i] is the number of fused instructions retired before lane i
+    s.num_fused_ = [Wire(clog2(width + 1)) for _ in range(width + 1)]
     s.wait_for_fence = Wire(1)
     s.wait_for_store = Wire(1)
+    # Set if nothing can retire after the head this cycle
+    s.ends_group_ = Wire(1)
+
+    for i in range(width):
+
+      @s.combinational
+      def compute_seq(i=i):
+        s.seq_[i].v = s.cflow_get_head_seq + i
+
+      # Connect up ROB status check and free
+      s.connect(s.rob.check_done_idx[i], s.seq_[i])
+      s.connect(s.rob.peek_idx[i], s.seq_[i])
+      s.connect(s.head_[i], s.rob.peek_value[i])
+      s.connect(s.rob.free_call[i], s.rob_remove[i])
+      s.connect(s.cflow_commit_call[i], s.rob_remove[i])
+
+      @s.combinational
+      def handle_lane(i=i):
+        s.valid_[i].v = s.head_[
+            i].hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+        # Make sure the store data is available before we commit it
+        s.store_ok_[i].v = not s.head_[i].hdr_is_store or (
+            not s.store_before_[i] and s.send_store_rdy and
+            s.store_data_available_ret)
+
+      if i == 0:
+
+        @s.combinational
+        def set_rob_remove_0():
+          s.store_before_[0].v = 0
+          s.wait_for_fence.v = 1
+          s.wait_for_store.v = 1
+
+          if s.valid_[0]:
+            if s.head_[0].hdr_fence:
+              s.wait_for_fence.v = not s.store_acks_outstanding_ret
+            s.wait_for_store.v = s.store_ok_[0]
+
+          s.rob_remove[0].v = s.cflow_get_head_rdy and s.rob.check_done_is_rdy[
+              0] and s.wait_for_fence and s.wait_for_store
+          # A fence waiting on memory forces dirty cache lines out
+          s.clean_cache_call.v = s.cflow_get_head_rdy and s.rob.check_done_is_rdy[
+              0] and not s.wait_for_fence
+      else:
 
-    # Check on the store ID for the store at the ROB head
-    s.connect(s.store_data_available_id_, s.rob.peek_value.hdr_store_id)
+        @s.combinational
+        def set_rob_remove(i=i, j=i - 1):
+          s.store_before_[i].v = s.store_before_[j] or s.head_[j].hdr_is_store
+          # Anything that redirects or waits on memory retires alone
+          s.rob_remove[i].v = (
+              s.rob_remove[j] and s.rob.check_done_is_rdy[i] and s.valid_[i] and
+              not s.head_[i].hdr_replay and not s.head_[i].hdr_fence and
+              not s.ends_group_ and s.store_ok_[i])
 
     @s.combinational
-    def set_rob_remove():
-      s.wait_for_fence.v = 1
-      s.wait_for_store.v = 1
+    def compute_ends_group():
+      s.ends_group_.v = (not s.valid_[0] or s.head_[0].hdr_replay or
+                         s.head_[0].hdr_fence)
 
-      if s.rob.peek_value.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
-        if s.rob.peek_value.hdr_fence:
-          s.wait_for_fence.v = not s.store_acks_outstanding_ret
-        if s.rob.peek_value.hdr_is_store:
-          # Make sure the store data is available before we commit it
-          s.wait_for_store.v = s.send_store_rdy and s.store_data_available_ret
+    # Check on the store ID for the first store after the ROB head
+    s.connect(s.store_data_available_id_, s.store_id_)
 
-      s.rob_remove.v = s.cflow_get_head_rdy and s.rob.check_done_is_rdy and s.wait_for_fence and s.wait_for_store
+    @s.combinational
+    def compute_store_id(width=width):
+      s.store_id_.v = 0
+      s.store_call_.v = 0
+      for i in range(width - 1, -1, -1):
+        if s.head_[i].hdr_is_store:
+          s.store_id_.v = s.head_[i].hdr_store_id
+          s.store_call_.v = s.rob_remove[i] and s.valid_[i]
+
+    @s.combinational
+    def count_retired(width=width):
+      s.num_retired_.v = 0
+      for i in range(width):
+        if s.rob_remove[i]:
+          s.num_retired_.v = i + 1
+
+    # A fused instruction retires 2 instructions
+    s.connect(s.num_fused_[0], 0)
+    for i in range(width):
+
+      @s.combinational
+      def count_fused(i=i, j=i + 1):
+        if s.rob_remove[i] and s.valid_[i] and s.head_[i].hdr_fused:
+          s.num_fused_[j].v = s.num_fused_[i] + 1
+        else:
+          s.num_fused_[j].v = s.num_fused_[i]
 
     s.is_exception = Wire(1)
     s.exception_target = Wire(XLEN)
 
+    for i in range(1, width):
+
+      @s.combinational
+      def handle_commit_lane(i=i):
+        s.cflow_commit_redirect[i].v = 0
+        s.cflow_commit_redirect_target[i].v = 0
+        s.dataflow_commit_call[i].v = s.rob_remove[i] and s.head_[i].rd_val
+        s.dataflow_commit_tag[i].v = s.head_[i].rd
+        s.dataflow_commit_areg[i].v = s.head_[i].areg_d
+        s.dataflow_commit_move[i].v = s.head_[i].eliminated
+
     @s.combinational
     def handle_commit():
-      s.dataflow_commit_call.v = 0
-      s.dataflow_commit_tag.v = 0
-      s.dataflow_commit_areg.v = 0
-      s.dataflow_free_store_id_call[0].v = 0
-      s.dataflow_free_store_id_id_[0].v = 0
+      s.dataflow_commit_call[0].v = 0
+      s.dataflow_commit_tag[0].v = 0
+      s.dataflow_commit_areg[0].v = 0
+      s.dataflow_commit_move[0].v = 0
 
-      s.cflow_commit_redirect.v = 0
-      s.cflow_commit_redirect_target.v = 0
+      s.cflow_commit_redirect[0].v = 0
+      s.cflow_commit_redirect_target[0].v = 0
 
       s.is_exception.v = 0
       s.btb_clear_call.v = 0
+      s.icache_flush_call.v = 0
 
       # The head is ready to commit
-      if s.rob_remove:
-        if s.rob.peek_value.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
-          if s.rob.peek_value.rd_val:
-            s.dataflow_commit_call.v = 1
-            s.dataflow_commit_tag.v = s.rob.peek_value.rd
-            s.dataflow_commit_areg.v = s.rob.peek_value.areg_d
-          s.dataflow_free_store_id_call[0].v = s.rob.peek_value.hdr_is_store
-          s.dataflow_free_store_id_id_[0].v = s.rob.peek_value.hdr_store_id
-
-          if s.rob.peek_value.hdr_replay:  # Need to replay the instruction
-            s.cflow_commit_redirect.v = 1
-            s.cflow_commit_redirect_target.v = (
-                s.rob.peek_value.hdr_pc + ILEN_BYTES if
-                s.rob.peek_value.hdr_replay_next else s.rob.peek_value.hdr_pc)
-          if s.rob.peek_value.hdr_fence:
+      if s.rob_remove[0]:
+        if s.valid_[0]:
+          if s.head_[0].rd_val:
+            s.dataflow_commit_call[0].v = 1
+            s.dataflow_commit_tag[0].v = s.head_[0].rd
+            s.dataflow_commit_areg[0].v = s.head_[0].areg_d
+            s.dataflow_commit_move[0].v = s.head_[0].eliminated
+
+          if s.head_[0].hdr_replay:  # Need to replay the instruction
+            s.cflow_commit_redirect[0].v = 1
+            s.cflow_commit_redirect_target[0].v = (
+                s.head_[0].hdr_pc +
+                ILEN_BYTES if s.head_[0].hdr_replay_next else s.head_[0].hdr_pc)
+          if s.head_[0].hdr_fence:
             s.btb_clear_call.v = 1
+          if s.head_[0].hdr_fence_i:
+            s.icache_flush_call.v = 1
         else:
-          s.cflow_commit_redirect.v = 1
-          s.cflow_commit_redirect_target.v = s.exception_target
+          s.cflow_commit_redirect[0].v = 1
+          s.cflow_commit_redirect_target[0].v = s.exception_target
           s.is_exception.v = 1
 
+    # At most 1 store is retired per cycle
+    s.connect(s.dataflow_free_store_id_call[0], s.store_call_)
+    s.connect(s.dataflow_free_store_id_id_[0], s.store_id_)
+    s.connect(s.send_store_call, s.store_call_)
+    s.connect(s.send_store_id_, s.store_id_)
+
     s.connect(s.write_csr_csr[0], int(CsrRegisters.mcause))
     s.zext_mcause = Wire(XLEN)
 
     @s.combinational
     def zext_mcause():
-      s.zext_mcause.v = zext(s.rob.peek_value.exception_info_mcause, XLEN)
+      s.zext_mcause.v = zext(s.head_[0].exception_info_mcause, XLEN)
 
     s.connect(s.write_csr_value[0], s.zext_mcause)
 
     s.connect(s.write_csr_call[0], s.is_exception)
     s.connect(s.write_csr_csr[1], int(CsrRegisters.mtval))
-    s.connect(s.write_csr_value[1], s.rob.peek_value.exception_info_mtval)
+    s.connect(s.write_csr_value[1], s.head_[0].exception_info_mtval)
     s.connect(s.write_csr_call[1], s.is_exception)
     s.connect(s.write_csr_csr[2], int(CsrRegisters.mepc))
-    s.connect(s.write_csr_value[2], s.rob.peek_value.hdr_pc)
+    s.connect(s.write_csr_value[2], s.head_[0].hdr_pc)
     s.connect(s.write_csr_call[2], s.is_exception)
 
     s.mtvec = Wire(XLEN)
@@ -275,21 +395,16 @@ class Commit(Model):
         # the entire processor
         s.exception_target.v = s.mtvec_base
 
-    @s.combinational
-    def handle_committing_store():
-      if s.rob_remove and s.rob.peek_value.hdr_is_store and s.rob.peek_value.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
-        s.send_store_id_.v = s.rob.peek_value.hdr_store_id
-        s.send_store_call.v = 1
-      else:
-        s.send_store_id_.v = 0
-        s.send_store_call.v = 0
-
     s.connect(s.read_csr_csr[1], int(CsrRegisters.mcycle))
     s.connect(s.read_csr_csr[2], int(CsrRegisters.minstret))
     s.connect(s.write_csr_csr[3], int(CsrRegisters.mcycle))
     s.connect(s.write_csr_call[3], 1)
     s.connect(s.write_csr_csr[4], int(CsrRegisters.minstret))
-    s.connect(s.write_csr_call[4], s.rob_remove)
+    s.connect(s.write_csr_call[4], s.rob_remove[0])
+    # mhpmcounter3 counts the fused instructions retired
+    s.connect(s.read_csr_csr[3], int(CsrRegisters.mhpmcounter3))
+    s.connect(s.write_csr_csr[5], int(CsrRegisters.mhpmcounter3))
+    s.connect(s.write_csr_call[5], s.rob_remove[0])
 
     # PYMTL_BROKEN
     # These are the only parts of the write_csr_value which are hooked up in a
@@ -297,20 +412,26 @@ class Commit(Model):
     # ports are set using a connect. But that causes a double assign in verilog.
     s.temp_mcycle_pymtl_broken = Wire(XLEN)
     s.temp_minstret_pymtl_broken = Wire(XLEN)
+    s.temp_mhpmcounter3_pymtl_broken = Wire(XLEN)
 
     @s.combinational
-    def handle_mcycle_minstret():
+    def handle_mcycle_minstret(width=width):
       s.temp_mcycle_pymtl_broken.v = s.read_csr_value[1] + 1
-      s.temp_minstret_pymtl_broken.v = s.read_csr_value[2] + 1
+      s.temp_minstret_pymtl_broken.v = (
+          s.read_csr_value[2] + s.num_retired_ + s.num_fused_[width])
+      s.temp_mhpmcounter3_pymtl_broken.v = (
+          s.read_csr_value[3] + s.num_fused_[width])
 
     s.connect(s.write_csr_value[3], s.temp_mcycle_pymtl_broken)
     s.connect(s.write_csr_value[4], s.temp_minstret_pymtl_broken)
+    s.connect(s.write_csr_value[5], s.temp_mhpmcounter3_pymtl_broken)
 
   def line_trace(s):
-    incoming = s.in_peek_msg.hdr_seq.hex()[2:]
-    if not s.in_take_call:
-      incoming = ' ' * len(incoming)
-    outgoing = s.rob.peek_value.hdr_seq.hex()[2:]
-    if not s.rob_remove:
-      outgoing = ' ' * len(outgoing)
+    incoming = ' '.join(
+        s.in_peek_msg[i].hdr_seq.hex()[2:] if s.in_take_call[i] else ' ' *
+        len(s.in_peek_msg[i].hdr_seq.hex()[2:])
+        for i in range(len(s.in_take_call)))
+    outgoing = ' '.join(
+        s.head_[i].hdr_seq.hex()[2:] if s.rob_remove[i] else ' ' *
+        len(s.head_[i].hdr_seq.hex()[2:]) for i in range(s.interface.Width))
     return '{}/{}'.format(incoming, outgoing)
@@ -80,6 +80,7 @@ class CSRStage(Model):
           elif s.process_in_.system_msg_func == SystemFunc.SYSTEM_FUNC_FENCE_I:
             # Force a replay redirect
             s.process_out.hdr_fence.v = 1
+            s.process_out.hdr_fence_i.v = 1
             s.process_out.hdr_replay.v = 1
             s.process_out.hdr_replay_next.v = 1
           elif s.process_in_.system_msg_func == SystemFunc.SYSTEM_FUNC_FENCE:
@@ -1,18 +1,41 @@
 from pymtl import *
-from lizard.util.rtl.interface import UseInterface
+from lizard.util.rtl.interface import Interface, UseInterface, IncludeAll
+from lizard.util.rtl.method import MethodSpec
 from lizard.core.rtl.backend.multiply import MultDropController
 from lizard.core.rtl.messages import MFunc, MVariant, DispatchMsg, ExecuteMsg, MMsg
 from lizard.util.rtl.pipeline_stage import PipelineStageInterface, gen_valid_value_manager
-from lizard.util.rtl.divide import DivideInterface, NonRestoringDivider
+from lizard.util.rtl.divide import DivideInterface, Radix4Divider
 from lizard.core.rtl.controlflow import KillType
 from lizard.config.general import *
 
 
-def DivInterface():
-  return PipelineStageInterface(ExecuteMsg(), KillType(MAX_SPEC_DEPTH))
+class DivInterface(Interface):
+
+  def __init__(s):
+    base = PipelineStageInterface(ExecuteMsg(), KillType(MAX_SPEC_DEPTH))
+    super(DivInterface, s).__init__(
+        [
+            MethodSpec(
+                'busy',
+                args=None,
+                rets={
+                    'ret': Bits(1),
+                },
+                call=False,
+                rdy=False,
+            ),
+        ],
+        bases=[IncludeAll(base)],
+    )
+    s.KillArgType = base.KillArgType
 
 
 class Div(Model):
+  """The iterative divider, which takes one divide or remainder at a time.
+
+  busy is set while the divider is working, or a divide is waiting for it,
+  so issue can keep the next divide in the issue queue.
+  """
 
   def __init__(s):
     UseInterface(s, DivInterface())
@@ -24,7 +47,7 @@ class Div(Model):
         for m in PipelineStageInterface(DispatchMsg(), None).methods.values()
     ])
 
-    s.divider = NonRestoringDivider(DivideInterface(XLEN), DIV_NSTEPS)
+    s.divider = Radix4Divider(DivideInterface(XLEN))
 
     s.vvm = gen_valid_value_manager(MultDropController)()
     s.can_take_input = Wire(1)
@@ -44,6 +67,10 @@ class Div(Model):
     s.connect(s.vvm.take_call, s.take_call)
     s.connect(s.divider.result_call, s.take_call)
 
+    @s.combinational
+    def handle_busy():
+      s.busy_ret.v = not s.divider.div_rdy or s.in_peek_rdy
+
     s.rs1_32 = Wire(32)
     s.rs2_32 = Wire(32)
 
@@ -100,3 +127,15 @@ class Div(Model):
 
       if s.mul_msg.op32:
         s.peek_msg.result.v = sext(s.res_32, XLEN)
+
+  def line_trace(s):
+    incoming = s.in_peek_msg.hdr_seq.hex()[2:]
+    if not s.in_take_call:
+      incoming = ' ' * len(incoming)
+    if not s.peek_rdy:
+      outgoing_msg = ' '
+    elif s.take_call:
+      outgoing_msg = '*'
+    else:
+      outgoing_msg = '#'
+    return '{}/{}'.format(incoming, outgoing_msg)
@@ -0,0 +1,48 @@
+from pymtl import *
+from lizard.util.rtl.interface import UseInterface
+from lizard.core.rtl.messages import IssueMsg, WritebackMsg, PipelineMsgStatus
+from lizard.util.rtl.pipeline_stage import gen_stage, StageInterface, DropControllerInterface
+from lizard.core.rtl.kill_unit import PipelineKillDropController
+from lizard.core.rtl.controlflow import KillType
+from lizard.config.general import *
+
+
+def EliminateInterface():
+  return StageInterface(IssueMsg(), WritebackMsg())
+
+
+class EliminateStage(Model):
+  """Sends instructions eliminated at rename straight to commit.
+
+  Their destination was already mapped at rename, to the zero tag for a
+  zero idiom or to the source preg for a move, so there is nothing to
+  execute or write back.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+
+    s.connect(s.process_accepted, 1)
+
+    @s.combinational
+    def compute():
+      s.process_out.v = 0
+      s.process_out.hdr.v = s.process_in_.hdr
+      if s.process_in_.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
+        s.process_out.rd_val_pair.v = s.process_in_.rd_val_pair
+        s.process_out.areg_d.v = s.process_in_.areg_d
+        s.process_out.eliminated.v = 1
+      else:
+        s.process_out.exception_info.v = s.process_in_.exception_info
+
+  def line_trace(s):
+    return s.process_in_.hdr_seq.hex()[2:]
+
+
+def EliminateDropController():
+  return PipelineKillDropController(
+      DropControllerInterface(WritebackMsg(), WritebackMsg(),
+                              KillType(MAX_SPEC_DEPTH)))
+
+
+Eliminate = gen_stage(EliminateStage, EliminateDropController)
@@ -4,7 +4,7 @@ from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.issue_queue import CompactingIssueQueue, IssueQueueInterface, AbstractIssueType
 from lizard.util.rtl.pipeline_stage import PipelineStageInterface
 from lizard.bitutil import clog2
-from lizard.core.rtl.messages import RenameMsg, IssueMsg, PipelineMsgStatus, MemFunc
+from lizard.core.rtl.messages import RenameMsg, IssueMsg, PipelineMsgStatus, MemFunc, OpClass, MFunc
 from lizard.core.rtl.kill_unit import KillDropController, KillDropControllerInterface
 from lizard.core.rtl.controlflow import KillType
 from lizard.config.general import *
@@ -13,22 +13,39 @@ from lizard.util.rtl.types import Array
 
 class IssueInterface(Interface):
 
-  def __init__(s):
-    base = PipelineStageInterface(IssueMsg(), KillType(MAX_SPEC_DEPTH))
+  def __init__(s, width=1, num_wakeup=0):
+    base = PipelineStageInterface(IssueMsg(), KillType(MAX_SPEC_DEPTH), width)
+    methods = [
+        MethodSpec(
+            'can_take',
+            args=None,
+            rets=None,
+            rdy=True,
+            call=False,
+        ),
+    ]
+    # Speculative wakeups, from pipes which know when their results will be
+    # ready
+    if num_wakeup != 0:
+      methods.append(
+          MethodSpec(
+              'wakeup',
+              args={
+                  'tag': PREG_IDX_NBITS,
+              },
+              rets=None,
+              call=True,
+              rdy=False,
+              count=num_wakeup,
+          ))
     super(IssueInterface, s).__init__(
-        [
-            MethodSpec(
-                'can_take',
-                args=None,
-                rets=None,
-                rdy=True,
-                call=False,
-            ),
-        ],
+        methods,
         bases=[IncludeAll(base)],
     )
 
     s.KillArgType = base.KillArgType
+    s.Width = width
+    s.NumWakeup = num_wakeup
 
 
 class IssueSetOrdered(Interface):
@@ -42,6 +59,7 @@ class IssueSetOrdered(Interface):
             },
             rets={
                 'ret': Bits(1),
+                'bypass': Bits(1),
             },
             call=False,
             rdy=False,
@@ -58,12 +76,34 @@ class IssueOrderedStores(Model):
     def is_store():
       s.ordered_ret.v = s.ordered_input.mem_msg_func == MemFunc.MEM_FUNC_STORE
 
+    s.connect(s.ordered_bypass, 0)
+
+
+class IssueSpeculativeLoads(Model):
+  """Like IssueOrderedStores, but a load issues ahead of older stores
+  unless it is predicted to depend on one.
+
+  Such a load is checked against each store it passed when the store's
+  address arrives in the memory flow manager.
+  """
+
+  def __init__(s):
+    UseInterface(s, IssueSetOrdered())
+
+    @s.combinational
+    def is_store():
+      s.ordered_ret.v = s.ordered_input.mem_msg_func == MemFunc.MEM_FUNC_STORE
+      s.ordered_bypass.v = (
+          s.ordered_input.mem_msg_func == MemFunc.MEM_FUNC_LOAD and
+          not s.ordered_input.mem_msg_store_wait)
+
 
 class IssueInOrder(Model):
 
   def __init__(s):
     UseInterface(s, IssueSetOrdered())
     s.connect(s.ordered_ret, 1)
+    s.connect(s.ordered_bypass, 0)
 
 
 class IssueOutOfOrder(Model):
@@ -71,9 +111,28 @@ class IssueOutOfOrder(Model):
   def __init__(s):
     UseInterface(s, IssueSetOrdered())
     s.connect(s.ordered_ret, 0)
+    s.connect(s.ordered_bypass, 0)
 
 
 class Issue(Model):
+  """Holds renamed instructions until their sources are ready.
+
+  peek[k] and take[k] refer to the kth oldest ready instruction. Only the
+  ALU is duplicated, so every port but the first only issues ALU
+  instructions.
+
+  A wakeup marks a tag ready before its value exists, on the promise that
+  it will be written or forwarded by the time a dependent issues. If the
+  producer is late, the promise is broken, so every source is checked
+  against dataflow again at issue. An instruction with a missing source
+  stays in the queue and tries again the next cycle. Loads never wake
+  their dependents early: a load has no fixed hit latency, and a woken
+  dependent of a missing load would hold its port until the miss returns.
+
+  If hold_divides is set, a divide or remainder also stays in the queue
+  while div_busy is set, rather than waiting in dispatch for the divider.
+  The queue passes over it, so the next ready instruction issues instead.
+  """
 
   def __init__(s,
                interface,
@@ -81,9 +140,13 @@ class Issue(Model):
                num_slots,
                num_updated,
                set_ordered=IssueOutOfOrder,
-               bypass_ready=True):
+               bypass_ready=True,
+               queue=CompactingIssueQueue,
+               hold_divides=False):
 
     UseInterface(s, interface)
+    width = s.interface.Width
+    num_wakeup = s.interface.NumWakeup
     s.NumPregs = num_pregs
     s.NumUpdated = num_updated
     s.require(
@@ -103,6 +166,8 @@ class Issue(Model):
             rdy=False,
         ),
         # Called on dataflow
+        # The first 2 check the incoming instruction, and the next 2 per
+        # port check the outgoing one
         MethodSpec(
             'is_ready',
             args={
@@ -113,7 +178,7 @@ class Issue(Model):
             },
             call=False,
             rdy=False,
-            count=2,
+            count=2 + 2 * width,
         ),
         MethodSpec(
             'get_updated',
@@ -126,6 +191,17 @@ class Issue(Model):
             rdy=False,
         ),
     )
+    if hold_divides:
+      s.require(
+          MethodSpec(
+              'div_busy',
+              args=None,
+              rets={
+                  'ret': Bits(1),
+              },
+              call=False,
+              rdy=False,
+          ))
     preg_nbits = RenameMsg().rs1.nbits
     branch_mask_nbits = RenameMsg().hdr_branch_mask.nbits
 
@@ -135,10 +211,14 @@ class Issue(Model):
     def make_kill():
       return KillDropController(KillDropControllerInterface(branch_mask_nbits))
 
-    s.iq = CompactingIssueQueue(
+    s.iq = queue(
         IssueQueueInterface(
-            SlotType(), s.interface.KillArgType, num_updated, ordered=True),
-        make_kill, num_slots, bypass_ready)
+            SlotType(),
+            s.interface.KillArgType,
+            num_updated + num_wakeup,
+            ordered=True,
+            num_remove=width,
+            holdable=hold_divides), make_kill, num_slots, bypass_ready)
 
     # Connect up ordered module
     s.set_ordered = set_ordered()
@@ -148,6 +228,9 @@ class Issue(Model):
     for i in range(num_updated):
       s.connect(s.iq.notify_tag[i], s.get_updated_tags[i])
       s.connect(s.iq.notify_call[i], s.get_updated_valid[i])
+    for j in range(num_wakeup):
+      s.connect(s.iq.notify_tag[num_updated + j], s.wakeup_tag[j])
+      s.connect(s.iq.notify_call[num_updated + j], s.wakeup_call[j])
 
     s.connect_m(s.iq.kill_notify, s.kill_notify)
 
@@ -175,6 +258,7 @@ class Issue(Model):
     def handle_input():
       s.iq_slot_in.v = 0
       s.iq_slot_in.ordered.v = s.set_ordered.ordered_ret
+      s.iq_slot_in.bypass.v = s.set_ordered.ordered_bypass
       # Copy header
       s.iq_msg_in.v = 0
       s.iq_msg_in.hdr.v = s.renamed_.hdr
@@ -199,25 +283,73 @@ class Issue(Model):
         # Set the current readyness
         s.iq_slot_in.src0_rdy.v = s.is_ready_ready[0]
         s.iq_slot_in.src1_rdy.v = s.is_ready_ready[1]
+        # A divide must wait for the divider
+        s.iq_slot_in.holdable.v = (
+            s.renamed_.op_class == OpClass.OP_CLASS_MUL) and (
+                s.renamed_.m_msg_func != MFunc.M_FUNC_MUL)
 
       s.iq.add_value.v = s.iq_slot_in
       s.iq.add_value.opaque.v = s.iq_msg_in
 
+    # A woken source might not have been produced yet, so check each one
+    # again against dataflow
+    s.src_ok_ = [Wire(1) for _ in range(2 * width)]
+    for k in range(width):
+      s.connect(s.is_ready_tag[2 + 2 * k], s.iq.remove_value[k].src0)
+      s.connect(s.is_ready_tag[3 + 2 * k], s.iq.remove_value[k].src1)
+
+      @s.combinational
+      def check_src0(k=k, n=2 * k, num_updated=num_updated):
+        s.src_ok_[n].v = not s.iq.remove_value[k].src0_val or s.is_ready_ready[
+            n + 2]
+        for i in range(num_updated):
+          if s.get_updated_valid[i] and s.get_updated_tags[
+              i] == s.iq.remove_value[k].src0:
+            s.src_ok_[n].v = 1
+
+      @s.combinational
+      def check_src1(k=k, n=2 * k + 1, num_updated=num_updated):
+        s.src_ok_[n].v = not s.iq.remove_value[k].src1_val or s.is_ready_ready[
+            n + 2]
+        for i in range(num_updated):
+          if s.get_updated_valid[i] and s.get_updated_tags[
+              i] == s.iq.remove_value[k].src1:
+            s.src_ok_[n].v = 1
+
+    if hold_divides:
+      s.connect(s.iq.hold_call, s.div_busy_ret)
+
     # Connect the output
-    s.connect(s.peek_rdy, s.iq.remove_rdy)
-    s.connect(s.iq.remove_call, s.take_call)
+    for k in range(width):
+      s.connect(s.iq.remove_call[k], s.take_call[k])
+
+      @s.combinational
+      def handle_output(k=k):
+        # Copy over the source info again
+        s.peek_msg[k].v = 0
+        s.peek_msg[k].v = s.iq.remove_value[k].opaque
+        if s.peek_msg[
+            k].hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
+          s.peek_msg[k].rs1.v = s.iq.remove_value[k].src0
+          s.peek_msg[k].rs1_val.v = s.iq.remove_value[k].src0_val
+          s.peek_msg[k].rs2.v = s.iq.remove_value[k].src1
+          s.peek_msg[k].rs2_val.v = s.iq.remove_value[k].src1_val
+        s.peek_msg[k].hdr_branch_mask.v = s.iq.remove_value[k].kill_opaque
+
+      if k == 0:
+
+        @s.combinational
+        def handle_output_rdy_0():
+          s.peek_rdy[0].v = (
+              s.iq.remove_rdy[0] and s.src_ok_[0] and s.src_ok_[1])
+      else:
 
-    @s.combinational
-    def handle_output():
-      # Copy over the source info again
-      s.peek_msg.v = 0
-      s.peek_msg.v = s.iq.remove_value.opaque
-      if s.peek_msg.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
-        s.peek_msg.rs1.v = s.iq.remove_value.src0
-        s.peek_msg.rs1_val.v = s.iq.remove_value.src0_val
-        s.peek_msg.rs2.v = s.iq.remove_value.src1
-        s.peek_msg.rs2_val.v = s.iq.remove_value.src1_val
-      s.peek_msg.hdr_branch_mask.v = s.iq.remove_value.kill_opaque
+        @s.combinational
+        def handle_output_rdy(k=k, n=2 * k):
+          s.peek_rdy[k].v = s.iq.remove_rdy[k] and s.src_ok_[n] and s.src_ok_[
+              n + 1] and (s.peek_msg[k].hdr_status ==
+                          PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID) and (
+                              s.peek_msg[k].op_class == OpClass.OP_CLASS_ALU)
 
   def line_trace(s):
     incoming = s.in_peek_msg.hdr_seq.hex()[2:]
@@ -6,9 +6,22 @@ from lizard.core.rtl.messages import IssueMsg, PipelineMsgStatus, OpClass, MemFu
 
 
 class IssueSelector(Model):
+  """Routes up to width instructions from rename to the issue queues.
 
-  def __init__(s):
-    UseInterface(s, PipelineSplitterInterface(IssueMsg(), ['normal', 'mem']))
+  Each of the normal, mem and done paths takes at most 1 instruction per
+  cycle, so an instruction only goes with the ones before it if they use
+  different paths. A store uses both the normal and mem paths.
+
+  The instructions taken are always a prefix of the ones from rename, so
+  an instruction is only offered if every one before it is sure to be
+  taken. An issue queue takes whatever it is offered when can_take is
+  ready, but the done path gives no such promise, so an eliminated
+  instruction ends the group.
+  """
+
+  def __init__(s, width=1):
+    UseInterface(
+        s, PipelineSplitterInterface(IssueMsg(), ['normal', 'mem', 'done']))
     s.require(
         MethodSpec(
             'in_peek',
@@ -18,6 +31,7 @@ class IssueSelector(Model):
             },
             call=False,
             rdy=True,
+            count=width,
         ),
         MethodSpec(
             'in_take',
@@ -25,6 +39,7 @@ class IssueSelector(Model):
             rets=None,
             call=True,
             rdy=False,
+            count=width,
         ),
         MethodSpec(
             'normal_can_take',
@@ -42,50 +57,101 @@ class IssueSelector(Model):
         ),
     )
 
-    s.msg_valid = Wire(1)
-
-    @s.combinational
-    def check_valid():
-      s.msg_valid.v = s.in_peek_msg.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+    # Set if the instruction goes to commit without issuing
+    s.done_ = [Wire(1) for _ in range(width)]
+    s.load_ = [Wire(1) for _ in range(width)]
+    s.store_ = [Wire(1) for _ in range(width)]
+    # The paths each instruction uses
+    s.uses_normal_ = [Wire(1) for _ in range(width)]
+    s.uses_mem_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction would be taken if offered
+    s.sure_ = [Wire(1) for _ in range(width)]
+    s.offered_ = [Wire(1) for _ in range(width)]
+    # The paths used by the instructions offered before each one
+    s.normal_before_ = [Wire(1) for _ in range(width)]
+    s.mem_before_ = [Wire(1) for _ in range(width)]
 
-    @s.combinational
-    def route():
-      if not s.msg_valid or (s.msg_valid and
-                             s.in_peek_msg.op_class != OpClass.OP_CLASS_MEM):
-        s.normal_peek_msg.v = s.in_peek_msg
-        s.normal_peek_rdy.v = s.in_peek_rdy
-        s.in_take_call.v = s.normal_take_call
+    for i in range(width):
 
-        s.mem_peek_msg.v = 0
-        s.mem_peek_rdy.v = 0
-      else:
-        # If a load, send it down the memory pipe.
-        # If a store, send the data computation down the normal pipe,
-        # but send the address generation down the memory pipe
-        if s.in_peek_msg.mem_msg_func == MemFunc.MEM_FUNC_LOAD:
-          s.mem_peek_msg.v = s.in_peek_msg
-          s.mem_peek_rdy.v = s.in_peek_rdy
-          s.in_take_call.v = s.mem_take_call
+      @s.combinational
+      def classify(i=i):
+        s.done_[i].v = 0
+        s.load_[i].v = 0
+        s.store_[i].v = 0
+        if s.in_peek_msg[
+            i].hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
+          if s.in_peek_msg[i].eliminated:
+            # Eliminated at rename, so it goes straight to commit
+            s.done_[i].v = 1
+          elif s.in_peek_msg[i].op_class == OpClass.OP_CLASS_MEM:
+            # If a load, send it down the memory pipe.
+            # If a store, send the data computation down the normal pipe,
+            # but send the address generation down the memory pipe
+            s.load_[i].v = s.in_peek_msg[
+                i].mem_msg_func == MemFunc.MEM_FUNC_LOAD
+            s.store_[
+                i].v = s.in_peek_msg[i].mem_msg_func != MemFunc.MEM_FUNC_LOAD
+        s.uses_normal_[i].v = not s.done_[i] and not s.load_[i]
+        s.uses_mem_[i].v = s.load_[i] or s.store_[i]
+        s.sure_[i].v = not s.done_[i] and (not s.uses_normal_[i] or
+                                           s.normal_can_take_rdy) and (
+                                               not s.uses_mem_[i] or
+                                               s.mem_can_take_rdy)
 
-          s.normal_peek_msg.v = 0
-          s.normal_peek_rdy.v = 0
-        else:
-          # Mark the data register as invalid for the address generation phase
-          # (done in the mem pipe)
-          # and mark the address register invalid for the data computation phase
-          s.mem_peek_msg.v = s.in_peek_msg
-          s.mem_peek_msg.rs2_val.v = 0
-          s.normal_peek_msg.v = s.in_peek_msg
-          s.normal_peek_msg.rs1_val.v = 0
+      if i == 0:
 
+        @s.combinational
+        def handle_offered_0():
+          s.normal_before_[0].v = 0
+          s.mem_before_[0].v = 0
           # The peek rdy signals are tricky.
-          # Both pipes MUST take this at the same time
+          # Both pipes MUST take a store at the same time
           # As such, we only set peek rdy if in advance we know
           # that BOTH queues would take if their inputs are ready
-          s.mem_peek_rdy.v = s.in_peek_rdy and s.normal_can_take_rdy and s.mem_can_take_rdy
-          s.normal_peek_rdy.v = s.mem_peek_rdy
+          s.offered_[0].v = s.in_peek_rdy[0] and (not s.store_[0] or s.sure_[0])
+      else:
+
+        @s.combinational
+        def handle_offered(i=i, j=i - 1):
+          s.normal_before_[i].v = s.normal_before_[j] or s.uses_normal_[j]
+          s.mem_before_[i].v = s.mem_before_[j] or s.uses_mem_[j]
+          s.offered_[i].v = s.in_peek_rdy[i] and s.offered_[j] and s.sure_[
+              j] and (not s.store_[i] or s.sure_[i]) and not (
+                  s.uses_normal_[i] and s.normal_before_[i]) and not (
+                      s.uses_mem_[i] and s.mem_before_[i])
 
-          # Since both issue queues MUST take at the same time,
-          # we can just pick the take signal from 1
-          # -- which, if we set ready, MUST be one, since we check can_take_rdy
-          s.in_take_call.v = s.mem_take_call
+      # Both pipes take a store at the same time, so either take
+      # signal will do
+      @s.combinational
+      def handle_take(i=i):
+        if s.done_[i]:
+          s.in_take_call[i].v = s.offered_[i] and s.done_take_call
+        elif s.uses_mem_[i]:
+          s.in_take_call[i].v = s.offered_[i] and s.mem_take_call
+        else:
+          s.in_take_call[i].v = s.offered_[i] and s.normal_take_call
+
+    @s.combinational
+    def route(width=width):
+      s.normal_peek_msg.v = 0
+      s.normal_peek_rdy.v = 0
+      s.mem_peek_msg.v = 0
+      s.mem_peek_rdy.v = 0
+      s.done_peek_msg.v = 0
+      s.done_peek_rdy.v = 0
+      for i in range(width):
+        if s.offered_[i] and s.done_[i]:
+          s.done_peek_msg.v = s.in_peek_msg[i]
+          s.done_peek_rdy.v = 1
+        if s.offered_[i] and s.uses_normal_[i]:
+          s.normal_peek_msg.v = s.in_peek_msg[i]
+          s.normal_peek_rdy.v = 1
+          if s.store_[i]:
+            # Mark the address register invalid for the data computation
+            s.normal_peek_msg.rs1_val.v = 0
+        if s.offered_[i] and s.uses_mem_[i]:
+          s.mem_peek_msg.v = s.in_peek_msg[i]
+          s.mem_peek_rdy.v = 1
+          if s.store_[i]:
+            # Mark the data register invalid for the address generation
+            s.mem_peek_msg.rs2_val.v = 0
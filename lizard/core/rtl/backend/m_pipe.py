@@ -1,21 +1,29 @@
 from pymtl import *
 from lizard.util.rtl.interface import UseInterface
-from lizard.core.rtl.backend.divide import Div
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
 from lizard.core.rtl.backend.multiply import Mult
-from lizard.core.rtl.messages import MFunc, DispatchMsg, ExecuteMsg
+from lizard.core.rtl.messages import DispatchMsg, ExecuteMsg, PipelineMsgStatus
 from lizard.util.rtl.pipeline_stage import PipelineStageInterface
 from lizard.core.rtl.controlflow import KillType
 from lizard.config.general import *
 
 
-def MPipeInterface():
+def MulPipeInterface():
   return PipelineStageInterface(ExecuteMsg(), KillType(MAX_SPEC_DEPTH))
 
 
-class MPipe(Model):
+class MulPipe(Model):
+  """The multiplier, which has its own pipe apart from the divider.
+
+  A multiply always takes MUL_NSTAGES cycles, so its destination is known
+  to be produced then, unless the output stalls. wakeup is called with the
+  destination 1 cycle before it comes out, so dependents can issue just as
+  it is written back.
+  """
 
   def __init__(s):
-    UseInterface(s, MPipeInterface())
+    UseInterface(s, MulPipeInterface())
 
     # Require the methods of an incoming pipeline stage
     # Name the methods in_peek, in_take
@@ -23,38 +31,52 @@ class MPipe(Model):
         m.variant(name='in_{}'.format(m.name))
         for m in PipelineStageInterface(DispatchMsg(), None).methods.values()
     ])
+    s.require(
+        MethodSpec(
+            'wakeup',
+            args={
+                'tag': DispatchMsg().rd,
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ))
 
-    s.div = Div()
     s.mult = Mult()
-
-    s.connect(s.div.in_peek_msg, s.in_peek_msg)
-    s.connect(s.mult.in_peek_msg, s.in_peek_msg)
-    s.connect_m(s.div.kill_notify, s.kill_notify)
+    s.connect_m(s.mult.in_peek, s.in_peek)
+    s.connect_m(s.mult.in_take, s.in_take)
     s.connect_m(s.mult.kill_notify, s.kill_notify)
+    s.connect_m(s.mult.peek, s.peek)
+    s.connect_m(s.mult.take, s.take)
+
+    # The destination of every multiply, delayed until 1 cycle before it is
+    # done
+    if MUL_NSTAGES > 1:
+      s.wake_valid_ = [
+          Register(RegisterInterface(1), reset_value=0)
+          for _ in range(MUL_NSTAGES - 1)
+      ]
+      s.wake_tag_ = [
+          Register(RegisterInterface(DispatchMsg().rd))
+          for _ in range(MUL_NSTAGES - 1)
+      ]
+      s.connect(s.wake_tag_[0].write_data, s.in_peek_msg.rd)
 
-    @s.combinational
-    def route_input():
-      if s.in_peek_msg.m_msg_func == MFunc.M_FUNC_MUL:
-        s.mult.in_peek_rdy.v = s.in_peek_rdy
-        s.in_take_call.v = s.mult.in_take_call
-        s.div.in_peek_rdy.v = 0
-      else:
-        s.div.in_peek_rdy.v = s.in_peek_rdy
-        s.in_take_call.v = s.div.in_take_call
-        s.mult.in_peek_rdy.v = 0
+      @s.combinational
+      def handle_wake_in():
+        s.wake_valid_[0].write_data.v = (
+            s.in_take_call and s.in_peek_msg.rd_val and s.in_peek_msg.hdr_status
+            == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID)
 
-    @s.combinational
-    def route_output():
-      if s.div.peek_rdy:
-        s.peek_rdy.v = s.div.peek_rdy
-        s.peek_msg.v = s.div.peek_msg
-        s.div.take_call.v = s.take_call
-        s.mult.take_call.v = 0
-      else:
-        s.peek_rdy.v = s.mult.peek_rdy
-        s.peek_msg.v = s.mult.peek_msg
-        s.mult.take_call.v = s.take_call
-        s.div.take_call.v = 0
+      for i in range(1, MUL_NSTAGES - 1):
+        s.connect(s.wake_valid_[i].write_data, s.wake_valid_[i - 1].read_data)
+        s.connect(s.wake_tag_[i].write_data, s.wake_tag_[i - 1].read_data)
+
+      s.connect(s.wakeup_call, s.wake_valid_[-1].read_data)
+      s.connect(s.wakeup_tag, s.wake_tag_[-1].read_data)
+    else:
+      s.connect(s.wakeup_call, 0)
+      s.connect(s.wakeup_tag, 0)
 
   def line_trace(s):
     incoming = s.in_peek_msg.hdr_seq.hex()[2:]
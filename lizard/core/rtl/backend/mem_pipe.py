@@ -1,7 +1,9 @@
 from pymtl import *
 from lizard.util.rtl.interface import UseInterface
 from lizard.util.rtl.method import MethodSpec
-from lizard.core.rtl.messages import MemFunc, DispatchMsg, ExecuteMsg
+from lizard.core.rtl.messages import MemFunc, DispatchMsg, ExecuteMsg, PipelineMsgStatus
+from lizard.msg.codes import ExceptionCode
+from lizard.bitutil import clog2
 from lizard.util.rtl.pipeline_stage import gen_stage, StageInterface, PipelineStageInterface
 from lizard.util.rtl.killable_pipeline_wrapper import InputPipelineAdapterInterface, OutputPipelineAdapterInterface, PipelineWrapper
 from lizard.util import line_block
@@ -75,15 +77,32 @@ class MemRequestStage(Model):
             'store_pending',
             args={
                 'live_mask': Bits(STORE_QUEUE_SIZE),
+                'seq': INST_IDX_NBITS,
                 'addr': XLEN,
                 'size': MEM_SIZE_NBITS,
+                'active': Bits(1),
             },
             rets={
                 'pending': Bits(1),
+                'forward': Bits(1),
+                'forward_data': XLEN,
+                'unresolved': Bits(1),
             },
-            call=False,
+            call=True,
             rdy=False,
         ),
+        MethodSpec(
+            'track_load',
+            args={
+                'addr': XLEN,
+                'size': MEM_SIZE_NBITS,
+                'seq': INST_IDX_NBITS,
+                'pc': XLEN,
+            },
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
         MethodSpec(
             'send_load',
             args={
@@ -94,14 +113,27 @@ class MemRequestStage(Model):
             call=True,
             rdy=True,
         ),
+        MethodSpec(
+            'observe_load',
+            args={
+                'pc': XLEN,
+                'addr': XLEN,
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
         MethodSpec(
             'enter_store_address',
             args={
                 'id_': STORE_IDX_NBITS,
                 'addr': XLEN,
                 'size': MEM_SIZE_NBITS,
+                'seq': INST_IDX_NBITS,
+            },
+            rets={
+                'violation': Bits(1),
             },
-            rets=None,
             call=True,
             rdy=False,
         ),
@@ -147,15 +179,44 @@ class MemRequestStage(Model):
       # so 1 << width will compute that
       s.len.v = s.constant_1 << s.width
 
+    # The data cache does not take requests crossing a bus word, so such a
+    # load traps. So does such a store, unless the store buffer splits it
+    s.word_end = Wire(MEM_SIZE_NBITS + 1)
+    s.misaligned = Wire(1)
+    if ENABLE_DCACHE:
+
+      @s.combinational
+      def compute_misaligned(
+          lo=clog2(XLEN_BYTES),
+          nbytes=XLEN_BYTES,
+          split_stores=ENABLE_STORE_BUFFER):
+        s.word_end.v = s.addr[0:lo] + s.len
+        s.misaligned.v = s.word_end > nbytes and (
+            s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD or
+            not split_stores)
+    else:
+      s.connect(s.word_end, 0)
+      s.connect(s.misaligned, 0)
+
     s.can_send = Wire(1)
     s.connect(s.store_pending_addr, s.addr)
     s.connect(s.store_pending_size, s.len)
     s.connect(s.store_pending_live_mask, s.valid_store_mask_mask)
+    s.connect(s.store_pending_seq, s.process_in_.hdr_seq)
+
+    @s.combinational
+    def compute_active():
+      s.store_pending_active.v = s.process_call and (
+          s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD) and (
+              not s.misaligned)
 
     @s.combinational
     def compute_can_send():
-      if s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD:
-        s.can_send.v = not s.store_pending_pending and s.send_load_rdy
+      if s.misaligned:
+        s.can_send.v = 1
+      elif s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD:
+        s.can_send.v = not s.store_pending_pending and (s.store_pending_forward
+                                                        or s.send_load_rdy)
       else:
         s.can_send.v = 1
 
@@ -165,14 +226,34 @@ class MemRequestStage(Model):
     s.sending_load = Wire(1)
     s.sending_store = Wire(1)
 
+    # A load issued ahead of a store with an unknown address is tracked in
+    # case the store turns out to overlap it. If there is no room to track
+    # it, it is replayed from commit, when no store can be older
+    s.speculative = Wire(1)
+    s.untracked = Wire(1)
+
+    @s.combinational
+    def compute_speculative():
+      s.speculative.v = (
+          s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD and
+          not s.process_in_.mem_msg_store_wait and s.store_pending_unresolved)
+      s.untracked.v = s.speculative and not s.track_load_rdy
+
     @s.combinational
     def compute_sending():
-      if s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD:
-        s.sending_load.v = s.can_send and s.process_call
+      if s.misaligned:
+        s.store_pending_call.v = 0
+        s.sending_load.v = 0
+        s.sending_store.v = 0
+      elif s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD:
+        s.store_pending_call.v = s.can_send and s.process_call
+        s.sending_load.v = s.can_send and s.process_call and not s.store_pending_forward
         s.sending_store.v = 0
       else:
+        s.store_pending_call.v = 0
         s.sending_load.v = 0
         s.sending_store.v = s.can_send and s.process_call
+      s.track_load_call.v = s.store_pending_call and s.speculative and s.track_load_rdy
 
     s.connect(s.send_load_call, s.sending_load)
     s.connect(s.enter_store_address_call, s.sending_store)
@@ -181,8 +262,38 @@ class MemRequestStage(Model):
     s.connect(s.enter_store_address_id_, s.process_in_.hdr_store_id)
     s.connect(s.enter_store_address_addr, s.addr)
     s.connect(s.enter_store_address_size, s.len)
-
-    s.connect(s.process_out, s.process_in_)
+    s.connect(s.enter_store_address_seq, s.process_in_.hdr_seq)
+    s.connect(s.track_load_addr, s.addr)
+    s.connect(s.track_load_size, s.len)
+    s.connect(s.track_load_seq, s.process_in_.hdr_seq)
+    s.connect(s.track_load_pc, s.process_in_.hdr_pc)
+    # Every load trains the prefetcher, even if it is forwarded
+    s.connect(s.observe_load_pc, s.process_in_.hdr_pc)
+    s.connect(s.observe_load_addr, s.addr)
+    s.connect(s.observe_load_call, s.store_pending_call)
+
+    # Loads never read rs2, so a load forwarded from a store carries the
+    # forwarded data in rs2 instead of waiting for memory.
+    # A store which overlaps a younger load that already issued flushes
+    # everything after it when it commits, and the load runs again
+    @s.combinational
+    def set_process_out():
+      s.process_out.v = s.process_in_
+      if s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD:
+        s.process_out.rs2_val.v = s.store_pending_forward
+        s.process_out.rs2.v = s.store_pending_forward_data
+        if s.untracked:
+          s.process_out.hdr_replay.v = 1
+      elif s.enter_store_address_violation:
+        s.process_out.hdr_replay.v = 1
+        s.process_out.hdr_replay_next.v = 1
+      if s.misaligned:
+        s.process_out.hdr_status.v = PipelineMsgStatus.PIPELINE_MSG_STATUS_EXCEPTION_RAISED
+        if s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD:
+          s.process_out.exception_info_mcause.v = ExceptionCode.LOAD_ADDRESS_MISALIGNED
+        else:
+          s.process_out.exception_info_mcause.v = ExceptionCode.STORE_AMO_ADDRESS_MISALIGNED
+        s.process_out.exception_info_mtval.v = s.addr
 
   def line_trace(s):
     return s.process_in_.hdr_seq.hex()[2:]
@@ -212,7 +323,10 @@ class MemResponseStage(Model):
 
     @s.combinational
     def compute_accept():
-      s.response_needed.v = s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD
+      s.response_needed.v = (
+          s.process_in_.hdr_status ==
+          PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+      ) and s.process_in_.mem_msg_func == MemFunc.MEM_FUNC_LOAD and not s.process_in_.rs2_val
       if s.response_needed:
         s.can_accept.v = s.recv_load_rdy
       else:
@@ -229,7 +343,14 @@ class MemResponseStage(Model):
 
     s.result = Wire(XLEN)
     s.data = Wire(XLEN)
-    s.connect(s.data, s.recv_load_data)
+
+    @s.combinational
+    def select_data():
+      if s.process_in_.rs2_val:
+        s.data.v = s.process_in_.rs2
+      else:
+        s.data.v = s.recv_load_data
+
     s.data_b = Wire(8)
     s.data_h = Wire(16)
     s.data_w = Wire(32)
@@ -267,16 +388,42 @@ class MemResponseStage(Model):
     def set_process_out():
       s.process_out.v = 0
       s.process_out.hdr.v = s.process_in_.hdr
-      s.process_out.result.v = s.result
-      s.process_out.rd.v = s.process_in_.rd
-      s.process_out.rd_val.v = s.process_in_.rd_val
-      s.process_out.areg_d.v = s.process_in_.areg_d
+      if s.process_in_.hdr_status != PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID:
+        s.process_out.exception_info.v = s.process_in_.exception_info
+      else:
+        s.process_out.result.v = s.result
+        s.process_out.rd.v = s.process_in_.rd
+        s.process_out.rd_val.v = s.process_in_.rd_val
+        s.process_out.areg_d.v = s.process_in_.areg_d
+
+  def line_trace(s):
+    return s.process_in_.hdr_seq.hex()[2:]
+
+
+def MemWaitInterface():
+  return StageInterface(DispatchMsg(), DispatchMsg())
+
+
+class MemWaitStage(Model):
+  """Holds a message while its load is in memory.
+
+  There is one of these stages for each load in flight after the first,
+  so that the request stage can send the next load while older ones are
+  still waiting for their responses.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+
+    s.connect(s.process_accepted, 1)
+    s.connect(s.process_out, s.process_in_)
 
   def line_trace(s):
     return s.process_in_.hdr_seq.hex()[2:]
 
 
 MemRequest = gen_stage(MemRequestStage)
+MemWait = gen_stage(MemWaitStage)
 MemResponse = gen_stage(MemResponseStage)
 
 
@@ -289,6 +436,9 @@ class MemJoint(Model):
   def __init__(s, interface):
     UseInterface(s, interface)
     s.mem_request = MemRequest(MemRequestInterface())
+    s.mem_wait = [
+        MemWait(MemWaitInterface()) for _ in range(LOAD_QUEUE_SIZE - 1)
+    ]
     s.mem_response = MemResponse(MemResponseInterface())
     s.require(
         MethodSpec(
@@ -304,15 +454,32 @@ class MemJoint(Model):
             'store_pending',
             args={
                 'live_mask': Bits(STORE_QUEUE_SIZE),
+                'seq': INST_IDX_NBITS,
                 'addr': XLEN,
                 'size': MEM_SIZE_NBITS,
+                'active': Bits(1),
             },
             rets={
                 'pending': Bits(1),
+                'forward': Bits(1),
+                'forward_data': XLEN,
+                'unresolved': Bits(1),
             },
-            call=False,
+            call=True,
             rdy=False,
         ),
+        MethodSpec(
+            'track_load',
+            args={
+                'addr': XLEN,
+                'size': MEM_SIZE_NBITS,
+                'seq': INST_IDX_NBITS,
+                'pc': XLEN,
+            },
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
         MethodSpec(
             'send_load',
             args={
@@ -323,14 +490,27 @@ class MemJoint(Model):
             call=True,
             rdy=True,
         ),
+        MethodSpec(
+            'observe_load',
+            args={
+                'pc': XLEN,
+                'addr': XLEN,
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
         MethodSpec(
             'enter_store_address',
             args={
                 'id_': STORE_IDX_NBITS,
                 'addr': XLEN,
                 'size': MEM_SIZE_NBITS,
+                'seq': INST_IDX_NBITS,
+            },
+            rets={
+                'violation': Bits(1),
             },
-            rets=None,
             call=True,
             rdy=False,
         ),
@@ -345,7 +525,9 @@ class MemJoint(Model):
         ),
     )
     s.connect_m(s.mem_request.store_pending, s.store_pending)
+    s.connect_m(s.mem_request.track_load, s.track_load)
     s.connect_m(s.mem_request.send_load, s.send_load)
+    s.connect_m(s.mem_request.observe_load, s.observe_load)
     s.connect_m(s.mem_request.enter_store_address, s.enter_store_address)
     s.connect_m(s.mem_request.valid_store_mask, s.valid_store_mask)
     s.connect_m(s.mem_response.recv_load, s.recv_load)
@@ -359,17 +541,22 @@ class MemJoint(Model):
 
     s.connect_m(s.mem_request.in_peek, s.in_peek)
     s.connect_m(s.mem_request.in_take, s.in_take)
-    s.connect_m(s.mem_response.in_peek, s.mem_request.peek)
-    s.connect_m(s.mem_response.in_take, s.mem_request.take)
+    last = s.mem_request
+    for stage in s.mem_wait:
+      s.connect_m(stage.in_peek, last.peek)
+      s.connect_m(stage.in_take, last.take)
+      last = stage
+    s.connect_m(s.mem_response.in_peek, last.peek)
+    s.connect_m(s.mem_response.in_take, last.take)
     s.connect_m(s.peek, s.mem_response.peek)
     s.connect_m(s.take, s.mem_response.take)
 
   def line_trace(s):
-    return line_block.join([
-        s.mem_request.line_trace(),
-        Divider(' | '),
-        s.mem_response.line_trace()
-    ])
+    traces = [s.mem_request.line_trace()]
+    for stage in s.mem_wait:
+      traces.extend([Divider(' | '), stage.line_trace()])
+    traces.extend([Divider(' | '), s.mem_response.line_trace()])
+    return line_block.join(traces)
 
 
 def BranchMaskInputPipelineAdapterInterface(In):
@@ -429,6 +616,6 @@ def Mem(interface):
   def internal_pipeline():
     return MemJoint(MemJointInterface())
 
-  return PipelineWrapper(interface, 2, MemInputPipelineAdapter,
-                         internal_pipeline, MemOutputPipelineAdapter,
-                         MemDropController)
+  return PipelineWrapper(interface, LOAD_QUEUE_SIZE + 1,
+                         MemInputPipelineAdapter, internal_pipeline,
+                         MemOutputPipelineAdapter, MemDropController)
@@ -2,13 +2,13 @@ from pymtl import *
 from lizard.util.rtl.interface import UseInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.core.rtl.pipeline_splitter import PipelineSplitterInterface, PipelineSplitterControllerInterface, PipelineSplitter
-from lizard.core.rtl.messages import DispatchMsg, PipelineMsgStatus, OpClass
+from lizard.core.rtl.messages import DispatchMsg, PipelineMsgStatus, OpClass, MFunc
 
 
 class PipeSelectorController(Model):
 
   def __init__(s):
-    UseInterface(s, PipelineSplitterControllerInterface(DispatchMsg(), 5))
+    UseInterface(s, PipelineSplitterControllerInterface(DispatchMsg(), 6))
 
     @s.combinational
     def handle_sort():
@@ -21,9 +21,12 @@ class PipeSelectorController(Model):
       elif s.sort_msg.op_class == OpClass.OP_CLASS_BRANCH or s.sort_msg.op_class == OpClass.OP_CLASS_JUMP:
         s.sort_pipe.v = 2  # Branch pipe
       elif s.sort_msg.op_class == OpClass.OP_CLASS_MUL:
-        s.sort_pipe.v = 3  # Mul pipe
+        if s.sort_msg.m_msg_func == MFunc.M_FUNC_MUL:
+          s.sort_pipe.v = 3  # Mul pipe
+        else:
+          s.sort_pipe.v = 4  # Div pipe
       elif s.sort_msg.op_class == OpClass.OP_CLASS_MEM:
-        s.sort_pipe.v = 4  # Mem data pipe
+        s.sort_pipe.v = 5  # Mem data pipe
       else:
         s.sort_pipe.v = 0  # Error CSR pipe
 
@@ -36,7 +39,8 @@ class PipeSelector(Model):
     UseInterface(
         s,
         PipelineSplitterInterface(
-            DispatchMsg(), ['csr', 'alu', 'branch', 'm_pipe', 'mem_data']))
+            DispatchMsg(),
+            ['csr', 'alu', 'branch', 'mul_pipe', 'div_pipe', 'mem_data']))
     s.require(
         MethodSpec(
             'in_peek',
@@ -2,29 +2,77 @@ from pymtl import *
 from lizard.util.rtl.interface import UseInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.bitutil import clog2
-from lizard.core.rtl.messages import RenameMsg, DecodeMsg, PipelineMsgStatus
-from lizard.util.rtl.pipeline_stage import gen_stage, StageInterface, DropControllerInterface
+from lizard.core.rtl.messages import RenameMsg, DecodeMsg, PipelineMsgStatus, OpClass, AluFunc, MemFunc
+from lizard.util.rtl.pipeline_stage import PipelineStageInterface, DropControllerInterface, ValidValueGroup, ValidValueGroupInterface
 from lizard.core.rtl.kill_unit import PipelineKillDropController
 from lizard.core.rtl.controlflow import KillType
 from lizard.config.general import *
 
 
-def RenameInterface():
-  return StageInterface(DecodeMsg(), RenameMsg())
+def RenameInterface(width):
+  return PipelineStageInterface(RenameMsg(), KillType(MAX_SPEC_DEPTH), width)
 
 
-class RenameStage(Model):
+def RenameDropController():
+  return PipelineKillDropController(
+      DropControllerInterface(RenameMsg(), RenameMsg(),
+                              KillType(MAX_SPEC_DEPTH)))
+
+
+class Rename(Model):
+  """Renames up to width instructions from decode every cycle.
+
+  The instructions renamed in a cycle are a prefix of the ones from decode,
+  and they are registered with cflow in order. The rename table is looked
+  up before it is updated, so a source naming the destination of an
+  earlier instruction in the same cycle gets that instruction's new preg
+  instead.
 
-  def __init__(s, rename_interface):
-    UseInterface(s, rename_interface)
-    preg_nbits = s.process_out.rs1.nbits
-    seq_idx_nbits = s.process_out.hdr_seq.nbits
-    speculative_idx_nbits = s.process_out.hdr_spec.nbits
-    speculative_mask_nbits = s.process_out.hdr_branch_mask.nbits
-    store_id_nbits = s.process_out.hdr_store_id.nbits
+  A speculative instruction ends the group, since the snapshot it takes
+  includes every rename in the cycle. A serializing instruction is renamed
+  alone, and at most 1 store is renamed per cycle.
+
+  A new group is only renamed once the previous one has been taken.
+
+  Zero idioms, ALU instructions whose result is 0 no matter what the
+  sources hold (like xor x1, x2, x2 or andi x1, x2, 0), map their
+  destination to the zero tag instead of allocating a preg, and are marked
+  eliminated so they go straight to commit without executing. Moves (like
+  mv x1, x2, which is addi x1, x2, 0) are eliminated the same way, with
+  the destination mapped to the preg of the source, which dataflow counts
+  as shared until both aregs are overwritten.
+
+  Loads are marked with whether the memory flow manager predicts they
+  depend on an older store, in which case they issue after it.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+    width = s.interface.Width
+    preg_nbits = RenameMsg().rs1.nbits
+    seq_idx_nbits = RenameMsg().hdr_seq.nbits
+    speculative_idx_nbits = RenameMsg().hdr_spec.nbits
+    speculative_mask_nbits = RenameMsg().hdr_branch_mask.nbits
+    store_id_nbits = RenameMsg().hdr_store_id.nbits
     pc_nbits = DecodeMsg().hdr_pc.nbits
     areg_nbits = DecodeMsg().rs1.nbits
     s.require(
+        MethodSpec(
+            'in_peek',
+            args=None,
+            rets={'msg': DecodeMsg()},
+            call=False,
+            rdy=True,
+            count=width,
+        ),
+        MethodSpec(
+            'in_take',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+            count=width,
+        ),
         # Methods needed from cflow:
         MethodSpec(
             'register',
@@ -34,6 +82,7 @@ class RenameStage(Model):
                 'store': Bits(1),
                 'pc': Bits(pc_nbits),
                 'pc_succ': Bits(pc_nbits),
+                'ras_tos': Bits(RAS_IDX_NBITS),
             },
             rets={
                 'seq': Bits(seq_idx_nbits),
@@ -44,6 +93,7 @@ class RenameStage(Model):
             },
             call=True,
             rdy=False,
+            count=width,
         ),
         # Methods from dataflow
         MethodSpec(
@@ -52,103 +102,229 @@ class RenameStage(Model):
             rets={'preg': preg_nbits},
             call=False,
             rdy=False,
-            count=2,
+            count=2 * width,
         ),
         MethodSpec(
             'get_dst',
-            args={'areg': areg_nbits},
+            args={
+                'areg': areg_nbits,
+                'zero': Bits(1),
+                'move': Bits(1),
+                'src': preg_nbits,
+            },
             rets={'preg': preg_nbits},
             call=True,
             rdy=True,
+            count=width,
         ),
         MethodSpec(
             'mflow_register_store',
             args={
                 'id_': STORE_IDX_NBITS,
+                'seq': INST_IDX_NBITS,
             },
             rets=None,
             call=True,
             rdy=False,
         ),
+        MethodSpec(
+            'mflow_store_wait',
+            args={
+                'pc': pc_nbits,
+            },
+            rets={
+                'wait': Bits(1),
+            },
+            call=False,
+            rdy=False,
+            count=width,
+        ),
     )
-    s.accepted_ = Wire(1)
-    s.going = Wire(1)
-    s.connect(s.process_accepted, s.accepted_)
 
-    s.decoded_ = Wire(DecodeMsg())
-    s.out_ = Wire(RenameMsg())
-    s.no_except_ = Wire(1)
+    s.group = ValidValueGroup(
+        ValidValueGroupInterface(RenameMsg(), RenameMsg(),
+                                 KillType(MAX_SPEC_DEPTH), width),
+        RenameDropController)
+    s.connect_m(s.group.kill_notify, s.kill_notify)
+    s.connect_m(s.group.peek, s.peek)
+    s.connect_m(s.group.take, s.take)
 
-    s.connect(s.decoded_, s.process_in_)
-    s.connect(s.process_out, s.out_)
+    s.decoded_ = [Wire(DecodeMsg()) for _ in range(width)]
+    s.out_ = [Wire(RenameMsg()) for _ in range(width)]
+    s.no_except_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction allocates a preg
+    s.writes_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction is a zero idiom
+    s.zero_idiom_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction copies rs1 into rd
+    s.move_ = [Wire(1) for _ in range(width)]
+    # The sources, after checking earlier instructions in the group
+    s.src_preg_ = [Wire(preg_nbits) for _ in range(2 * width)]
+    # Set if the instruction cannot be renamed with the ones before it
+    s.ends_group_ = [Wire(1) for _ in range(width)]
+    s.store_before_ = [Wire(1) for _ in range(width)]
+    s.accepted_ = [Wire(1) for _ in range(width)]
+    s.store_accepted_ = [Wire(1) for _ in range(width)]
 
-    # Outgoing call's arguments
-    s.connect(s.register_pc, s.decoded_.hdr_pc)
-    s.connect(s.register_pc_succ, s.decoded_.pc_succ)
-    s.connect(s.get_src_areg[0], s.decoded_.rs1)
-    s.connect(s.get_src_areg[1], s.decoded_.rs2)
-    s.connect(s.get_dst_areg, s.decoded_.rd)
+    for i in range(width):
+      s.connect(s.decoded_[i], s.in_peek_msg[i])
+      s.connect(s.group.add_msg[i], s.out_[i])
 
-    # Outgoing call's call signal:
-    @s.combinational
-    def handle_register_call():
-      s.register_call.v = s.process_call and (not (s.decoded_.rd_val and
-                                                   not s.get_dst_rdy))
+      # Outgoing call's arguments
+      s.connect(s.register_pc[i], s.decoded_[i].hdr_pc)
+      s.connect(s.register_pc_succ[i], s.decoded_[i].pc_succ)
+      s.connect(s.register_ras_tos[i], s.decoded_[i].hdr_ras_tos)
+      s.connect(s.get_src_areg[2 * i], s.decoded_[i].rs1)
+      s.connect(s.get_src_areg[2 * i + 1], s.decoded_[i].rs2)
+      s.connect(s.get_dst_areg[i], s.decoded_[i].rd)
+      s.connect(s.mflow_store_wait_pc[i], s.decoded_[i].hdr_pc)
 
-    @s.combinational
-    def handle_register():
-      s.no_except_.v = s.decoded_.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
-      s.register_speculative.v = s.no_except_ and s.decoded_.speculative
-      s.register_store.v = s.no_except_ and s.decoded_.store
-      s.register_serialize.v = s.no_except_ and s.decoded_.serialize
+      @s.combinational
+      def handle_register(i=i):
+        s.no_except_[i].v = s.decoded_[
+            i].hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+        s.register_speculative[
+            i].v = s.no_except_[i] and s.decoded_[i].speculative
+        s.register_store[i].v = s.no_except_[i] and s.decoded_[i].store
+        s.register_serialize[i].v = s.no_except_[i] and s.decoded_[i].serialize
+        s.writes_[i].v = s.no_except_[i] and s.decoded_[i].rd_val
 
-    # Handle the conditional calls
-    @s.combinational
-    def handle_calls():
-      s.going.v = s.accepted_ and (
-          s.decoded_.hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID)
-      s.get_dst_call.v = s.going and s.decoded_.rd_val
-      s.mflow_register_store_call.v = s.going and s.register_store
+      @s.combinational
+      def handle_zero_idiom(i=i):
+        s.zero_idiom_[i].v = 0
+        if s.writes_[i] and s.decoded_[i].rd != 0 and (
+            s.decoded_[i].op_class == OpClass.OP_CLASS_ALU):
+          if s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_AND:
+            # Either operand is 0
+            s.zero_idiom_[i].v = (
+                s.decoded_[i].rs1 == 0 or
+                (s.decoded_[i].rs2_val and s.decoded_[i].rs2 == 0) or
+                (s.decoded_[i].imm_val and s.decoded_[i].imm == 0))
+          elif (s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_SUB or
+                s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_XOR) and (
+                    s.decoded_[i].rs2_val and
+                    s.decoded_[i].rs1 == s.decoded_[i].rs2):
+            # Both operands are the same register
+            s.zero_idiom_[i].v = 1
+          elif (s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_ADD or
+                s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_OR or
+                s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_XOR):
+            # Both operands are 0
+            s.zero_idiom_[i].v = s.decoded_[i].rs1 == 0 and (
+                (s.decoded_[i].rs2_val and s.decoded_[i].rs2 == 0) or
+                (s.decoded_[i].imm_val and s.decoded_[i].imm == 0))
 
-    s.connect(s.mflow_register_store_id_, s.register_store_id)
+      @s.combinational
+      def handle_move(i=i):
+        s.move_[i].v = 0
+        if s.writes_[i] and s.decoded_[i].rd != 0 and (
+            s.decoded_[i].op_class == OpClass.OP_CLASS_ALU) and (
+                not s.zero_idiom_[i]) and s.decoded_[i].rs1_val and (
+                    s.decoded_[i].rs1 != 0) and not s.decoded_[i].alu_msg_op32:
+          if (s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_ADD or
+              s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_OR or
+              s.decoded_[i].alu_msg_func == AluFunc.ALU_FUNC_XOR):
+            # The other operand is 0
+            s.move_[i].v = ((s.decoded_[i].rs2_val and
+                             s.decoded_[i].rs2 == 0) or
+                            (s.decoded_[i].imm_val and s.decoded_[i].imm == 0))
 
-    # Connect the outgoing signals
-    @s.combinational
-    def handle_out():
-      s.out_.v = 0  # No inferred latches
-      s.out_.hdr_frontend_hdr.v = s.decoded_.hdr
-      s.out_.hdr_seq.v = s.register_seq
-      s.out_.hdr_branch_mask.v = s.register_branch_mask
-      s.out_.hdr_store_id.v = s.register_store_id
-      s.out_.hdr_is_store.v = s.decoded_.store
-      if s.no_except_:
-        s.out_.hdr_spec_val.v = s.decoded_.speculative
-        s.out_.hdr_spec.v = s.register_spec_idx
-        s.out_.rs1_val.v = s.decoded_.rs1_val
-        s.out_.rs2_val.v = s.decoded_.rs2_val
-        s.out_.rd_val.v = s.decoded_.rd_val
-        # Copy over the aregs
-        s.out_.rs1.v = s.get_src_preg[0]
-        s.out_.rs2.v = s.get_src_preg[1]
-        s.out_.rd.v = s.get_dst_preg
-        s.out_.areg_d.v = s.decoded_.rd
-        # Copy the execution stuff
-        s.out_.execution_data.v = s.decoded_.execution_data
+      s.connect(s.get_dst_zero[i], s.zero_idiom_[i])
+      s.connect(s.get_dst_move[i], s.move_[i])
+      s.connect(s.get_dst_src[i], s.src_preg_[2 * i])
+
+      if i == 0:
+
+        @s.combinational
+        def handle_group_0():
+          s.ends_group_[0].v = 0
+          s.store_before_[0].v = 0
       else:
-        s.out_.exception_info.v = s.decoded_.exception_info
 
-    @s.combinational
-    def set_accepted():
-      s.accepted_.v = s.register_success and s.register_call
+        @s.combinational
+        def handle_group(i=i, j=i - 1):
+          s.store_before_[i].v = s.store_before_[j] or s.register_store[j]
+          s.ends_group_[i].v = (
+              s.register_speculative[j] or s.register_serialize[j] or
+              s.register_serialize[i] or
+              (s.register_store[i] and s.store_before_[i]))
 
-  def line_trace(s):
-    return s.register_seq.hex()[2:]
+      # Outgoing call's call signal:
+      if i == 0:
 
+        @s.combinational
+        def handle_register_call_0():
+          s.register_call[0].v = s.in_peek_rdy[0] and s.group.add_rdy[0] and (
+              not (s.decoded_[0].rd_val and not s.get_dst_rdy[0]))
+      else:
 
-def RenameDropController():
-  return PipelineKillDropController(
-      DropControllerInterface(RenameMsg(), RenameMsg(),
-                              KillType(MAX_SPEC_DEPTH)))
+        @s.combinational
+        def handle_register_call(i=i, j=i - 1):
+          s.register_call[i].v = s.accepted_[j] and s.in_peek_rdy[i] and (
+              not s.ends_group_[i]) and (not (s.decoded_[i].rd_val and
+                                              not s.get_dst_rdy[i]))
+
+      # Handle the conditional calls
+      @s.combinational
+      def handle_calls(i=i):
+        s.accepted_[i].v = s.register_call[i] and s.register_success[i]
+        s.in_take_call[i].v = s.accepted_[i]
+        s.group.add_call[i].v = s.accepted_[i]
+        s.get_dst_call[i].v = s.accepted_[i] and s.writes_[i]
+        s.store_accepted_[i].v = s.accepted_[i] and s.register_store[i]
 
+      # Intra-group dependencies: the latest earlier writer wins
+      for k in range(2):
 
-Rename = gen_stage(RenameStage, RenameDropController)
+        @s.combinational
+        def handle_src(i=i, n=2 * i + k):
+          s.src_preg_[n].v = s.get_src_preg[n]
+          for j in range(i):
+            if s.writes_[j] and s.decoded_[j].rd == s.get_src_areg[n]:
+              s.src_preg_[n].v = s.get_dst_preg[j]
+
+      # Connect the outgoing signals
+      @s.combinational
+      def handle_out(i=i):
+        s.out_[i].v = 0  # No inferred latches
+        s.out_[i].hdr_frontend_hdr.v = s.decoded_[i].hdr
+        s.out_[i].hdr_seq.v = s.register_seq[i]
+        s.out_[i].hdr_branch_mask.v = s.register_branch_mask[i]
+        s.out_[i].hdr_store_id.v = s.register_store_id[i]
+        s.out_[i].hdr_is_store.v = s.decoded_[i].store
+        if s.no_except_[i]:
+          s.out_[i].hdr_spec_val.v = s.decoded_[i].speculative
+          s.out_[i].hdr_spec.v = s.register_spec_idx[i]
+          s.out_[i].rs1_val.v = s.decoded_[i].rs1_val
+          s.out_[i].rs2_val.v = s.decoded_[i].rs2_val
+          s.out_[i].rd_val.v = s.decoded_[i].rd_val
+          # Copy over the aregs
+          s.out_[i].rs1.v = s.src_preg_[2 * i]
+          s.out_[i].rs2.v = s.src_preg_[2 * i + 1]
+          s.out_[i].rd.v = s.get_dst_preg[i]
+          s.out_[i].areg_d.v = s.decoded_[i].rd
+          s.out_[i].eliminated.v = s.zero_idiom_[i] or s.move_[i]
+          # Copy the execution stuff
+          s.out_[i].execution_data.v = s.decoded_[i].execution_data
+          if s.decoded_[i].op_class == OpClass.OP_CLASS_MEM and (
+              s.decoded_[i].mem_msg_func == MemFunc.MEM_FUNC_LOAD):
+            s.out_[i].mem_msg_store_wait.v = s.mflow_store_wait_wait[i]
+        else:
+          s.out_[i].exception_info.v = s.decoded_[i].exception_info
+
+    # Every lane gets the same store ID, and there is at most 1 store
+    s.connect(s.mflow_register_store_id_, s.register_store_id[0])
+
+    @s.combinational
+    def handle_register_store(width=width):
+      s.mflow_register_store_call.v = 0
+      s.mflow_register_store_seq.v = 0
+      for i in range(width):
+        if s.store_accepted_[i]:
+          s.mflow_register_store_call.v = 1
+          s.mflow_register_store_seq.v = s.register_seq[i]
+
+  def line_trace(s):
+    return ' '.join(s.register_seq[i].hex()[2:] if s.accepted_[i] else ' ' *
+                    len(s.register_seq[i].hex()[2:])
+                    for i in range(s.interface.Width))
@@ -21,12 +21,19 @@ def KillType(nbits):
 class ControlFlowManagerInterface(Interface):
 
   def __init__(s, dlen, seq_idx_nbits, speculative_idx_nbits,
-               speculative_mask_nbits, store_id_nbits):
+               speculative_mask_nbits, store_id_nbits, hist_nbits,
+               ras_idx_nbits, width, commit_width):
     s.DataLen = dlen
     s.SeqIdxNbits = seq_idx_nbits
     s.SpecIdxNbits = speculative_idx_nbits
     s.SpecMaskNbits = speculative_mask_nbits
     s.StoreIdNbits = store_id_nbits
+    s.HistNbits = hist_nbits
+    s.RasIdxNbits = ras_idx_nbits
+    # Up to width instructions can be registered every cycle
+    s.Width = width
+    # Up to commit_width instructions can be committed every cycle
+    s.CommitWidth = commit_width
     s.KillArgType = KillType(s.SpecMaskNbits)
 
     super(ControlFlowManagerInterface, s).__init__(
@@ -37,6 +44,8 @@ class ControlFlowManagerInterface(Interface):
                 rets={
                     'redirect': Bits(1),
                     'target': Bits(dlen),
+                    'hist': Bits(hist_nbits),
+                    'ras_tos': Bits(ras_idx_nbits),
                 },
                 call=False,
                 rdy=False,
@@ -57,6 +66,7 @@ class ControlFlowManagerInterface(Interface):
                     'spec_idx': Bits(speculative_idx_nbits),
                     'branch_mask': Bits(speculative_mask_nbits),
                     'target': Bits(dlen),
+                    'hist': Bits(hist_nbits),
                     'force': Bits(1),
                 },
                 rets={},
@@ -71,6 +81,7 @@ class ControlFlowManagerInterface(Interface):
                     'store': Bits(1),
                     'pc': Bits(dlen),
                     'pc_succ': Bits(dlen),
+                    'ras_tos': Bits(ras_idx_nbits),
                 },
                 rets={
                     'seq': Bits(seq_idx_nbits),
@@ -81,6 +92,7 @@ class ControlFlowManagerInterface(Interface):
                 },
                 call=True,
                 rdy=False,
+                count=width,
             ),
             MethodSpec(
                 'get_head',
@@ -98,6 +110,7 @@ class ControlFlowManagerInterface(Interface):
                 rets={},
                 call=True,
                 rdy=False,
+                count=commit_width,
             ),
         ],
         ordering_chains=[
@@ -107,6 +120,17 @@ class ControlFlowManagerInterface(Interface):
 
 
 class ControlFlowManager(Model):
+  """Tracks the instructions in flight, and redirects fetch.
+
+  register[i] registers the ith instruction in program order, and the calls
+  in a cycle must be a prefix of the ports. At most 1 of the instructions
+  registered in a cycle may be speculative, and it must be the last one,
+  since all of them get the same branch mask. At most 1 may be a store,
+  and a serializing instruction must be registered alone.
+
+  commit[i] commits the ith instruction after the head, and the calls in a
+  cycle must also be a prefix of the ports. Only commit[0] may redirect.
+  """
 
   def __init__(s, cflow_interface, reset_vector):
     UseInterface(s, cflow_interface)
@@ -115,6 +139,9 @@ class ControlFlowManager(Model):
     specidx_nbits = s.interface.SpecIdxNbits
     specmask_nbits = s.interface.SpecMaskNbits
     store_id_nbits = s.interface.StoreIdNbits
+    ras_idx_nbits = s.interface.RasIdxNbits
+    width = s.interface.Width
+    commit_width = s.interface.CommitWidth
     max_entries = 1 << seqidx_nbits
 
     s.require(
@@ -167,8 +194,12 @@ class ControlFlowManager(Model):
     # The speculative predicted PC table
     s.pc_pred = AsynchronousRAM(
         AsynchronousRAMInterface(xlen, specmask_nbits, 1, 1, False))
+    # The return address stack checkpoints, saved with the predicted PCs
+    s.ras_pred = AsynchronousRAM(
+        AsynchronousRAMInterface(ras_idx_nbits, specmask_nbits, 1, 1, False))
 
-    s.seq = SequenceAllocator(SequenceAllocatorInterface(seqidx_nbits))
+    s.seq = SequenceAllocator(
+        SequenceAllocatorInterface(seqidx_nbits, width, commit_width))
     # The redirect registers (needed for sync reset)
     s.reset_redirect_valid_ = Wire(1)
 
@@ -183,9 +214,13 @@ class ControlFlowManager(Model):
     s.commit_redirect_target_ = Wire(xlen)
 
     # Note that these signals are guaranteed to be zero if register_call = 0
-    s.register_success_ = Wire(1)
+    s.register_success_ = [Wire(1) for _ in range(width)]
     s.spec_register_success_ = Wire(1)
     s.store_register_success_ = Wire(1)
+    s.serialize_register_success_ = Wire(1)
+    # The predictions saved for the speculative instruction registered
+    s.spec_pc_succ_ = Wire(xlen)
+    s.spec_ras_tos_ = Wire(ras_idx_nbits)
 
     # Branch mask stuff:
     s.kill_mask_ = Wire(specmask_nbits)
@@ -233,13 +268,16 @@ class ControlFlowManager(Model):
 
     # Alloc the store ID if needed
     s.connect(s.dflow_get_store_id_call, s.store_register_success_)
-    s.connect(s.register_store_id, s.dflow_get_store_id_store_id)
 
     # Save the speculative PC
     s.connect(s.pc_pred.write_call[0], s.spec_register_success_)
     s.connect(s.pc_pred.write_addr[0], s.dflow_snapshot_id_)
-    s.connect(s.pc_pred.write_data[0], s.register_pc_succ)
+    s.connect(s.pc_pred.write_data[0], s.spec_pc_succ_)
     s.connect(s.pc_pred.read_addr[0], s.redirect_spec_idx)
+    s.connect(s.ras_pred.write_call[0], s.spec_register_success_)
+    s.connect(s.ras_pred.write_addr[0], s.dflow_snapshot_id_)
+    s.connect(s.ras_pred.write_data[0], s.spec_ras_tos_)
+    s.connect(s.ras_pred.read_addr[0], s.redirect_spec_idx)
 
     # Connect up check_kill method
     s.connect(s.check_kill_kill.force, s.reg_force.read_data)
@@ -247,17 +285,20 @@ class ControlFlowManager(Model):
     s.connect(s.check_kill_kill.clear_mask, s.reg_clear.read_data)
 
     # Connect up register method rets
-    s.connect(s.register_seq, s.seq.allocate_idx)
-    s.connect(s.register_spec_idx, s.dflow_snapshot_id_)
-    s.connect(s.register_branch_mask, s.bmask_curr_)
-    s.connect(s.seq.allocate_call, s.register_success_)
+    for i in range(width):
+      s.connect(s.register_seq[i], s.seq.allocate_idx[i])
+      s.connect(s.register_spec_idx[i], s.dflow_snapshot_id_)
+      s.connect(s.register_branch_mask[i], s.bmask_curr_)
+      s.connect(s.register_store_id[i], s.dflow_get_store_id_store_id)
+      s.connect(s.seq.allocate_call[i], s.register_success_[i])
 
     # Connect get head method
     s.connect(s.get_head_seq, s.seq.get_head_idx)
     s.connect(s.get_head_rdy, s.seq.get_head_rdy)
 
     # Connect commit
-    s.connect(s.seq.free_call, s.commit_call)
+    for i in range(commit_width):
+      s.connect(s.seq.free_call[i], s.commit_call[i])
 
     # All the backend kill signals are registered to avoid comb. loops
     @s.combinational
@@ -277,17 +318,23 @@ class ControlFlowManager(Model):
       s.is_redirect_.v = s.reset_redirect_valid_ or s.commit_redirect_ or s.branch_redirect_
       s.check_redirect_redirect.v = s.is_redirect_
       s.check_redirect_target.v = 0
+      # Only a branch redirect knows the global history to restart from
+      s.check_redirect_hist.v = 0
+      s.check_redirect_ras_tos.v = 0
       if s.reset_redirect_valid_:
         s.check_redirect_target.v = reset_vector
       elif s.commit_redirect_:
         s.check_redirect_target.v = s.commit_redirect_target_
       else:  # s.branch_redirect_
         s.check_redirect_target.v = s.redirect_target_
+        s.check_redirect_hist.v = s.redirect_hist
+        s.check_redirect_ras_tos.v = s.ras_pred.read_data[0]
 
     @s.combinational
     def set_serial():
-      s.serial.write_call.v = ((s.register_success_ and s.register_serialize) or
-                               (s.serial.read_data and s.commit_call))
+      s.serial.write_call.v = (
+          s.serialize_register_success_ or
+          (s.serial.read_data and s.commit_call[0]))
       s.serial.write_data.v = not s.serial.read_data  #  we are always inverting it
 
     # This is only for a redirect call
@@ -317,30 +364,48 @@ class ControlFlowManager(Model):
       s.bmask_next_.v = s.bmask_curr_
       if s.commit_redirect_:
         s.bmask_next_.v = 0
-      elif s.register_speculative:
+      elif s.spec_register_success_:
         s.bmask_next_.v = s.bmask_curr_ | s.bmask_alloc.encode_onehot
 
+    for i in range(width):
+
+      @s.combinational
+      def handle_register(i=i):
+        s.register_success[i].v = (
+            s.seq.allocate_rdy[i] and  # ROB slot availible
+            (not s.register_speculative[i] or s.dflow_snapshot_rdy) and
+            (not s.register_store[i] or s.dflow_get_store_id_rdy)
+            and  # RT snapshot
+            (not s.register_serialize[i] or
+             not s.seq.free_rdy[0]) and  # Serialized inst
+            not s.serial.read_data)
+
+        s.register_success_[i].v = s.register_call[i] and s.register_success[i]
+
     @s.combinational
-    def handle_register():
-      s.register_success.v = (
-          s.seq.allocate_rdy and  # ROB slot availible
-          (not s.register_speculative or s.dflow_snapshot_rdy) and
-          (not s.register_store or s.dflow_get_store_id_rdy) and  # RT snapshot
-          (not s.register_serialize or
-           not s.seq.free_rdy) and  # Serialized inst
-          not s.serial.read_data)
-
-      s.register_success_.v = s.register_call and s.register_success
-      s.spec_register_success_.v = s.register_success_.v and s.register_speculative
-      s.store_register_success_.v = s.register_success_.v and s.register_store
+    def handle_register_success(width=width):
+      s.spec_register_success_.v = 0
+      s.store_register_success_.v = 0
+      s.serialize_register_success_.v = 0
+      s.spec_pc_succ_.v = s.register_pc_succ[0]
+      s.spec_ras_tos_.v = s.register_ras_tos[0]
+      for i in range(width):
+        if s.register_success_[i] and s.register_speculative[i]:
+          s.spec_register_success_.v = 1
+          s.spec_pc_succ_.v = s.register_pc_succ[i]
+          s.spec_ras_tos_.v = s.register_ras_tos[i]
+        if s.register_success_[i] and s.register_store[i]:
+          s.store_register_success_.v = 1
+        if s.register_success_[i] and s.register_serialize[i]:
+          s.serialize_register_success_.v = 1
 
     @s.combinational
     def handle_commit():
       s.commit_redirect_.v = 0
-      s.commit_redirect_target_.v = s.commit_redirect_target
+      s.commit_redirect_target_.v = s.commit_redirect_target[0]
       # If we are committing there are a couple cases
-      s.commit_redirect_.v = s.commit_call and s.commit_redirect
-      s.dflow_rollback_call.v = s.commit_call and s.commit_redirect
+      s.commit_redirect_.v = s.commit_call[0] and s.commit_redirect[0]
+      s.dflow_rollback_call.v = s.commit_call[0] and s.commit_redirect[0]
 
     @s.combinational
     def update_seq():
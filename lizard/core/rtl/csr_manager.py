@@ -6,6 +6,27 @@ from lizard.core.rtl.messages import CsrFunc
 from lizard.msg.codes import CsrRegisters
 from lizard.config.general import CSR_SPEC_NBITS, XLEN
 
+# The event counters kept by other units, in the order of the read_counter
+# ports. They are read only, as mhpmcounter4 onwards. mhpmcounter3, which
+# counts fused instructions, is kept by commit like minstret
+PERF_COUNTERS = [
+    'icache_hits',
+    'icache_misses',
+    'icache_prefetches',
+    'icache_useful_prefetches',
+    'dcache_hits',
+    'dcache_misses',
+    'dcache_prefetches',
+    'dcache_useful_prefetches',
+    'forwarded_loads',
+    'ordering_violations',
+    'store_buffer_stores',
+    'store_buffer_writes',
+]
+PERF_COUNTER_CSRS = [
+    int(CsrRegisters.mhpmcounter4) + i for i in range(len(PERF_COUNTERS))
+]
+
 
 class CSRManagerInterface(Interface):
 
@@ -78,6 +99,14 @@ class CSRManager(Model):
             call=True,
             rdy=True,
         ),
+        MethodSpec(
+            'read_counter',
+            args=None,
+            rets={'value': Bits(XLEN)},
+            call=False,
+            rdy=False,
+            count=len(PERF_COUNTERS),
+        ),
     )
 
     num_read_ports = s.interface.num_read_ports
@@ -93,6 +122,7 @@ class CSRManager(Model):
                 CsrRegisters.mtval,
                 CsrRegisters.mcycle,
                 CsrRegisters.minstret,
+                CsrRegisters.mhpmcounter3,
                 CsrRegisters.mvendorid,
                 CsrRegisters.marchid,
                 CsrRegisters.mimpid,
@@ -105,12 +135,32 @@ class CSRManager(Model):
             0,
             0,
             0,
+            0,
             0xdeadbeef,
             0x42424242,
             0x00000001,
             0,
         ])
 
+    ncounters = len(PERF_COUNTERS)
+    s.counter_match_ = [Wire(1) for _ in range(ncounters)]
+    s.counter_hit_ = Wire(1)
+    s.counter_value_ = Wire(XLEN)
+    for i in range(ncounters):
+
+      @s.combinational
+      def match_counter(i=i, csr=PERF_COUNTER_CSRS[i]):
+        s.counter_match_[i].v = s.op_csr == csr
+
+    @s.combinational
+    def select_counter(ncounters=ncounters):
+      s.counter_hit_.v = 0
+      s.counter_value_.v = 0
+      for i in range(ncounters):
+        if s.counter_match_[i]:
+          s.counter_hit_.v = 1
+          s.counter_value_.v = s.read_counter_value[i]
+
     # PYMTL_BROKEN
     s.temp_debug_recv_call = Wire(1)
     s.temp_debug_send_call = Wire(1)
@@ -149,11 +199,18 @@ class CSRManager(Model):
           s.temp_debug_recv_call.v = s.op_call
           s.temp_op_success.v = 1
           s.temp_op_old.v = s.debug_recv_msg
+      elif s.counter_hit_:
+        # Only reads of the event counters are allowed
+        s.temp_op_success.v = s.op_op != CsrFunc.CSR_FUNC_READ_WRITE and s.op_rs1_is_x0
+        s.temp_op_old.v = s.counter_value_
       else:
         s.temp_op_success.v = s.csr_file.read_valid[num_read_ports]
         s.temp_read_key.v = s.op_csr
         s.temp_op_old.v = s.csr_file.read_value[num_read_ports]
-        s.temp_write_call.v = s.op_call
+        # A read must not write back the old value, since it may be
+        # speculative, and the counters are written by commit every cycle
+        s.temp_write_call.v = s.op_call and (
+            s.op_op == CsrFunc.CSR_FUNC_READ_WRITE or not s.op_rs1_is_x0)
         if s.op_op == CsrFunc.CSR_FUNC_READ_WRITE:
           s.temp_write_key.v = s.op_csr
           s.temp_write_value.v = s.op_value
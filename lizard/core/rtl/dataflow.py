@@ -15,8 +15,20 @@ from lizard.bitutil import clog2nz
 
 class DataFlowManagerInterface(Interface):
 
-  def __init__(s, dlen, naregs, npregs, nsnapshots, nstore_queue, num_src_ports,
-               num_dst_ports, num_is_ready_ports, num_forward_ports):
+  def __init__(s,
+               dlen,
+               naregs,
+               npregs,
+               nsnapshots,
+               nstore_queue,
+               num_src_ports,
+               num_dst_ports,
+               num_is_ready_ports,
+               num_forward_ports,
+               num_write_ports=None):
+    # By default, there is a write port for every dst port
+    if num_write_ports is None:
+      num_write_ports = num_dst_ports
     s.DataLen = dlen
     s.NumAregs = naregs
     s.NumPregs = npregs
@@ -27,6 +39,7 @@ class DataFlowManagerInterface(Interface):
     s.NumDstPorts = num_dst_ports
     s.NumIsReadyPorts = num_is_ready_ports
     s.NumForwardPorts = num_forward_ports
+    s.NumWritePorts = num_write_ports
     rename_table_interface = RenameTableInterface(naregs, npregs, 0, 0,
                                                   nsnapshots)
 
@@ -52,6 +65,9 @@ class DataFlowManagerInterface(Interface):
                 'get_dst',
                 args={
                     'areg': s.Areg,
+                    'zero': Bits(1),
+                    'move': Bits(1),
+                    'src': s.Preg,
                 },
                 rets={
                     'preg': s.Preg,
@@ -112,7 +128,7 @@ class DataFlowManagerInterface(Interface):
                 rets=None,
                 call=True,
                 rdy=False,
-                count=num_dst_ports,
+                count=num_write_ports,
             ),
             MethodSpec(
                 'forward',
@@ -136,8 +152,10 @@ class DataFlowManagerInterface(Interface):
                 'get_updated',
                 args=None,
                 rets={
-                    'tags': Array(s.Preg, num_dst_ports + num_forward_ports),
-                    'valid': Array(Bits(1), num_dst_ports + num_forward_ports),
+                    'tags':
+                        Array(s.Preg, num_write_ports + num_forward_ports),
+                    'valid':
+                        Array(Bits(1), num_write_ports + num_forward_ports),
                 },
                 call=False,
                 rdy=False,
@@ -157,6 +175,7 @@ class DataFlowManagerInterface(Interface):
                 args={
                     'tag': s.Preg,
                     'areg': s.Areg,
+                    'move': Bits(1),
                 },
                 rets=None,
                 call=True,
@@ -214,6 +233,7 @@ class DataFlowManager(Model):
     nstore_queue = s.interface.NumStoreQueue
     num_src_ports = s.interface.NumSrcPorts
     num_dst_ports = s.interface.NumDstPorts
+    num_write_ports = s.interface.NumWritePorts
     num_is_ready_ports = s.interface.NumIsReadyPorts
     num_forward_ports = s.interface.NumForwardPorts
 
@@ -223,12 +243,15 @@ class DataFlowManager(Model):
     # Reserve the highest tag for x0
     # Free list with 1 alloc ports, 1 free port, and AREG_COUNT - 1 used slots
     # initially
+    # An eliminated move shares its source preg, so every areg can end up
+    # on the same one
     s.free_regs = SnapshottingFreeList(
         npregs - 1,
         num_dst_ports,
         num_dst_ports,
         nsnapshots,
-        used_slots_initial=naregs - 1)
+        used_slots_initial=naregs - 1,
+        max_refs=naregs)
     s.store_ids = SnapshottingFreeList(nstore_queue, num_dst_ports,
                                        num_dst_ports, nsnapshots)
     # arch_used_pregs tracks the physical registers used by the current architectural state
@@ -263,19 +286,19 @@ class DataFlowManager(Model):
     # The physical register file, which stores the values
     # and ready states
     # Number of read ports is the same as number of source ports
-    # Number of write ports is the same as number of dest ports
+    # There is a write port for every write method port
     # Writes are bypassed before reads, and the dump/set is not used
     s.preg_file = AsynchronousRAM(
         AsynchronousRAMInterface(
             Bits(dlen),
             npregs,
             num_is_ready_ports,
-            num_dst_ports,
+            num_write_ports,
             True,
         ),
         reset_values=0,
     )
-    # 2 write ports are needed for every dst port:
+    # A write port is needed for every write port and every dst port:
     # The second set to update all the destination states during issue,
     # (get_dst), and the first set to write the computed value
     # (write)
@@ -291,7 +314,7 @@ class DataFlowManager(Model):
             Bits(1),
             npregs,
             num_is_ready_ports,
-            num_dst_ports * 2,
+            num_write_ports + num_dst_ports,
             False,
         ),
         reset_values=1,
@@ -320,19 +343,54 @@ class DataFlowManager(Model):
       s.valid_store_mask_mask.v = ~s.store_ids.get_state_state
 
     s.is_commit_not_zero_tag = [Wire(1) for _ in range(num_dst_ports)]
+    # Set if the commit changes the areg, which is all of them except x0
+    s.commit_writes_ = [Wire(1) for _ in range(num_dst_ports)]
+    # Set if the old preg is a real one to drop, since a zero idiom leaves
+    # its areg mapped to the zero tag
+    s.commit_frees_ = [Wire(1) for _ in range(num_dst_ports)]
+    # Set if a committing move adds a reference to the preg it shares
+    s.commit_shares_ = [Wire(1) for _ in range(num_dst_ports)]
+    # Set if the old preg has no references left, so the ARF no longer
+    # uses it
+    s.commit_releases_ = [Wire(1) for _ in range(num_dst_ports)]
+    # The preg backing the areg before the commit, which is the one written
+    # by an earlier commit in the same cycle if there is one
+    s.commit_old_preg = [Wire(s.interface.Preg) for _ in range(num_dst_ports)]
     for i in range(num_dst_ports):
       # Determine if the commit is not the zero tag
       @s.combinational
       def check_commit(i=i):
         s.is_commit_not_zero_tag[i].v = (s.commit_tag[i] !=
                                          s.ZERO_TAG) and s.commit_call[i]
+        s.commit_writes_[i].v = s.commit_call[i] and s.commit_areg[i] != 0
 
       # Read the preg currently associated with this areg
       s.connect(s.areg_file.read_addr[i], s.commit_areg[i])
-      # Free the preg currently backing this areg
-      s.connect(s.free_regs.free_index[i], s.areg_file.read_data[i])
-      # Only free if not the zero tag
-      s.connect(s.free_regs.free_call[i], s.is_commit_not_zero_tag[i])
+
+      @s.combinational
+      def handle_commit_old_preg(i=i):
+        s.commit_old_preg[i].v = s.areg_file.read_data[i]
+        for j in range(i):
+          if s.commit_writes_[j] and s.commit_areg[j] == s.commit_areg[i]:
+            s.commit_old_preg[i].v = s.commit_tag[j]
+
+      @s.combinational
+      def check_commit_frees(i=i):
+        s.commit_frees_[i].v = s.commit_writes_[i] and (s.commit_old_preg[i] !=
+                                                        s.ZERO_TAG)
+        s.commit_shares_[i].v = s.commit_writes_[i] and s.commit_move[i] and (
+            s.commit_tag[i] != s.ZERO_TAG)
+        s.commit_releases_[
+            i].v = s.commit_frees_[i] and s.free_regs.drop_freed[i]
+
+      # A move adds a reference to the preg it shares
+      s.connect(s.free_regs.share_index[i], s.commit_tag[i])
+      s.connect(s.free_regs.share_call[i], s.commit_shares_[i])
+      # Drop the preg currently backing this areg, which frees it if this
+      # was the last reference
+      s.connect(s.free_regs.drop_index[i], s.commit_old_preg[i])
+      # Only drop if not the zero tag
+      s.connect(s.free_regs.drop_call[i], s.commit_frees_[i])
       # Free the store ID from the committing instruction
       s.connect(s.store_ids.free_index[i], s.free_store_id_id_[i])
       # Only free if the commit is valid
@@ -341,23 +399,23 @@ class DataFlowManager(Model):
       # Write into the ARF the new preg
       s.connect(s.areg_file.write_addr[i], s.commit_areg[i])
       s.connect(s.areg_file.write_data[i], s.commit_tag[i])
-      # Only write if not the zero tag
-      s.connect(s.areg_file.write_call[i], s.is_commit_not_zero_tag[i])
+      # Only write if not x0
+      s.connect(s.areg_file.write_call[i], s.commit_writes_[i])
 
+      # The write ports are in commit order, since later ports win
       # Mark the old preg used by the ARF as free
-      s.connect(s.arch_used_pregs.write_addr[i], s.areg_file.read_data[i])
-      s.connect(s.arch_used_pregs.write_data[i], 0)
-      s.connect(s.arch_used_pregs.write_call[i], s.is_commit_not_zero_tag[i])
+      s.connect(s.arch_used_pregs.write_addr[2 * i], s.commit_old_preg[i])
+      s.connect(s.arch_used_pregs.write_data[2 * i], 0)
+      s.connect(s.arch_used_pregs.write_call[2 * i], s.commit_releases_[i])
       # Mark the new preg used by the ARF as used
-      s.connect(s.arch_used_pregs.write_addr[i + num_dst_ports],
-                s.commit_tag[i])
-      s.connect(s.arch_used_pregs.write_data[i + num_dst_ports], 1)
-      s.connect(s.arch_used_pregs.write_call[i + num_dst_ports],
+      s.connect(s.arch_used_pregs.write_addr[2 * i + 1], s.commit_tag[i])
+      s.connect(s.arch_used_pregs.write_data[2 * i + 1], 1)
+      s.connect(s.arch_used_pregs.write_call[2 * i + 1],
                 s.is_commit_not_zero_tag[i])
 
     # write
-    s.is_write_not_zero_tag = [Wire(1) for _ in range(num_dst_ports)]
-    for i in range(num_dst_ports):
+    s.is_write_not_zero_tag = [Wire(1) for _ in range(num_write_ports)]
+    for i in range(num_write_ports):
       # Determine if the write is not the zero tag
       @s.combinational
       def check_write(i=i):
@@ -388,19 +446,22 @@ class DataFlowManager(Model):
 
     # Unify the write and forward ports
     # Note that forward occurs after write
-    for i in range(num_dst_ports):
+    for i in range(num_write_ports):
       s.connect(s.get_updated_valid[i], s.is_write_not_zero_tag[i])
       s.connect(s.get_updated_tags[i], s.write_tag[i])
     for i in range(num_forward_ports):
-      s.connect(s.get_updated_valid[num_dst_ports + i],
+      s.connect(s.get_updated_valid[num_write_ports + i],
                 s.is_forward_not_zero_tag[i])
-      s.connect(s.get_updated_tags[num_dst_ports + i], s.forward_tag[i])
+      s.connect(s.get_updated_tags[num_write_ports + i], s.forward_tag[i])
 
     # get_src
     s.connect_m(s.get_src, s.rename_table.lookup)
 
     # get_dst
     s.get_dst_need_writeback = [Wire(1) for _ in range(num_dst_ports)]
+    # Set if the rename table is updated, which a zero idiom or a move does
+    # without allocating a preg
+    s.get_dst_remap_ = [Wire(1) for _ in range(num_dst_ports)]
     for i in range(num_dst_ports):
       s.connect(s.get_dst_rdy[i], s.free_regs.alloc_rdy[i])
       s.connect(s.get_store_id_rdy[i], s.store_ids.alloc_rdy[i])
@@ -414,24 +475,41 @@ class DataFlowManager(Model):
           s.free_regs.alloc_call[i].v = 0
           s.get_dst_preg[i].v = s.ZERO_TAG
           s.get_dst_need_writeback[i].v = 0
+          s.get_dst_remap_[i].v = 0
+        elif s.get_dst_zero[i]:
+          # zero idiom: the areg is mapped to the zero tag
+          s.free_regs.alloc_call[i].v = 0
+          s.get_dst_preg[i].v = s.ZERO_TAG
+          s.get_dst_need_writeback[i].v = 0
+          s.get_dst_remap_[i].v = s.get_dst_call[i]
+        elif s.get_dst_move[i]:
+          # move: the areg is mapped to the preg of the source, which keeps
+          # whatever ready state it has
+          s.free_regs.alloc_call[i].v = 0
+          s.get_dst_preg[i].v = s.get_dst_src[i]
+          s.get_dst_need_writeback[i].v = 0
+          s.get_dst_remap_[i].v = s.get_dst_call[i]
         elif s.free_regs.alloc_rdy[i]:
           # allocate a register from the freelist
           s.free_regs.alloc_call[i].v = s.get_dst_call[i]
           s.get_dst_preg[i].v = s.free_regs.alloc_index[i]
           s.get_dst_need_writeback[i].v = s.get_dst_call[i]
+          s.get_dst_remap_[i].v = s.get_dst_call[i]
         else:
           # free list is full
           s.free_regs.alloc_call[i].v = 0
           s.get_dst_preg[i].v = s.ZERO_TAG
           s.get_dst_need_writeback[i].v = 0
+          s.get_dst_remap_[i].v = 0
 
       # Update the rename table
       s.connect(s.rename_table.update_areg[i], s.get_dst_areg[i])
       s.connect(s.rename_table.update_preg[i], s.get_dst_preg[i])
-      s.connect(s.rename_table.update_call[i], s.get_dst_need_writeback[i])
-      s.connect(s.ready_table.write_addr[i + num_dst_ports], s.get_dst_preg[i])
-      s.connect(s.ready_table.write_data[i + num_dst_ports], 0)
-      s.connect(s.ready_table.write_call[i + num_dst_ports],
+      s.connect(s.rename_table.update_call[i], s.get_dst_remap_[i])
+      s.connect(s.ready_table.write_addr[num_write_ports + i],
+                s.get_dst_preg[i])
+      s.connect(s.ready_table.write_data[num_write_ports + i], 0)
+      s.connect(s.ready_table.write_call[num_write_ports + i],
                 s.get_dst_need_writeback[i])
 
     # is_ready
@@ -1,9 +1,26 @@
 from pymtl import *
 from lizard.util.rtl.interface import UseInterface
+from lizard.util.rtl.lookup_table import LookupTable, LookupTableInterface
 from lizard.core.rtl.messages import CsrMsg, OpClass, CsrFunc
 from lizard.core.rtl.frontend.sub_decoder import SubDecoderInterface, GenDecoder, PayloadGeneratorInterface, compose_decoders
 from lizard.core.rtl.frontend.imm_decoder import ImmType
-from lizard.msg.codes import Opcode
+from lizard.core.rtl.csr_manager import PERF_COUNTER_CSRS
+from lizard.msg.codes import Opcode, CsrRegisters
+from lizard.config.general import CSR_SPEC_NBITS
+
+# CSRs which can be read without side effects. A csrrs or csrrc of one of
+# these with rs1 = x0 is a pure read, so it executes speculatively instead
+# of serializing. The event counters from mhpmcounter4 onwards are taken
+# from the CSR manager, so the two cannot disagree
+READ_ONLY_CSRS = [
+    int(CsrRegisters.mcycle),
+    int(CsrRegisters.minstret),
+    int(CsrRegisters.mhpmcounter3),
+    int(CsrRegisters.mvendorid),
+    int(CsrRegisters.marchid),
+    int(CsrRegisters.mimpid),
+    int(CsrRegisters.mhartid),
+] + PERF_COUNTER_CSRS
 
 
 def csr_msg(func, rs1_is_x0):
@@ -61,7 +78,26 @@ class CsrRDecoder(Model):
     )
 
     s.connect_m(s.decoder.gen, s.generator.gen)
-    s.connect_m(s.decode, s.decoder.decode)
+    s.connect(s.decoder.decode_inst, s.decode_inst)
+    for name in s.interface['decode'].rets:
+      if name != 'serialize':
+        s.connect(
+            getattr(s, 'decode_{}'.format(name)),
+            getattr(s.decoder, 'decode_{}'.format(name)))
+
+    s.read_only = LookupTable(
+        LookupTableInterface(CSR_SPEC_NBITS, Bits(1)),
+        {csr: 1 for csr in READ_ONLY_CSRS})
+
+    @s.combinational
+    def lookup_csr():
+      s.read_only.lookup_in_.v = s.decode_inst.csrnum
+
+    @s.combinational
+    def compute_serialize():
+      s.decode_serialize.v = not (
+          s.read_only.lookup_valid and s.decode_inst.rs1 == 0 and
+          (s.decode_inst.funct3 == 0b010 or s.decode_inst.funct3 == 0b011))
 
 
 class CsrIDecoder(Model):
@@ -1,7 +1,9 @@
 from pymtl import *
 from lizard.util.rtl.interface import UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.bitutil import clog2nz
 from lizard.msg.codes import ExceptionCode
-from lizard.core.rtl.messages import FetchMsg, DecodeMsg, PipelineMsgStatus
+from lizard.core.rtl.messages import FetchMsg, DecodeMsg, PipelineMsgStatus, OpClass, AluFunc
 from lizard.core.rtl.frontend.imm_decoder import ImmDecoderInterface, ImmDecoder
 from lizard.core.rtl.frontend.sub_decoder import compose_decoders
 from lizard.core.rtl.frontend.alu_decoder import AluDecoder
@@ -12,7 +14,7 @@ from lizard.core.rtl.frontend.mem_decoder import MemDecoder
 from lizard.core.rtl.frontend.m_decoder import MDecoder
 from lizard.core.rtl.frontend.system_decoder import SystemDecoder
 from lizard.config.general import *
-from lizard.util.rtl.pipeline_stage import gen_stage, StageInterface, DropControllerInterface
+from lizard.util.rtl.pipeline_stage import StageInterface, DropControllerInterface, PipelineStageInterface, ValidValueGroup, ValidValueGroupInterface
 from lizard.util.arch import rv64g
 
 ComposedDecoder = compose_decoders(AluDecoder, CsrDecoder, BranchDecoder,
@@ -20,10 +22,14 @@ ComposedDecoder = compose_decoders(AluDecoder, CsrDecoder, BranchDecoder,
                                    SystemDecoder)
 
 
-def DecodeInterface():
+def DecodeStageInterface():
   return StageInterface(FetchMsg(), DecodeMsg())
 
 
+def DecodeInterface(width):
+  return PipelineStageInterface(DecodeMsg(), Bits(1), width)
+
+
 class DecodeStage(Model):
 
   def __init__(s, decode_interface):
@@ -91,4 +97,181 @@ def DecodeRedirectDropController():
       RedirectDropControllerInterface(DecodeMsg(), DecodeMsg(), 1))
 
 
-Decode = gen_stage(DecodeStage, DecodeRedirectDropController)
+class Decode(Model):
+  """Decodes up to width instructions from fetch every cycle.
+
+  A new group of instructions is only taken from fetch once rename has
+  taken every instruction in the previous group. On a redirect, everything
+  in decode is dropped.
+
+  Adjacent pairs in a group are fused into 1 ALU instruction when the second
+  just finishes the first's result:
+    lui or auipc rd, followed by addi or addiw rd, rd
+    slli rd, rs, 32, followed by srli rd, rd, 32 (zero extend a word)
+  The fused instruction has the pc of the first and the pc_succ of the
+  second, and has hdr_fused set so commit counts it as 2. Neither can
+  raise an exception, so exceptions stay precise. The remaining
+  instructions are packed down so the group is still a prefix.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+    width = s.interface.Width
+    s.require(
+        MethodSpec(
+            'in_peek',
+            args=None,
+            rets={'msg': FetchMsg()},
+            call=False,
+            rdy=True,
+            count=width,
+        ),
+        MethodSpec(
+            'in_take',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+            count=width,
+        ),
+    )
+
+    s.stages = [DecodeStage(DecodeStageInterface()) for _ in range(width)]
+    s.group = ValidValueGroup(
+        ValidValueGroupInterface(DecodeMsg(), DecodeMsg(), Bits(1), width),
+        DecodeRedirectDropController)
+    s.connect_m(s.group.kill_notify, s.kill_notify)
+    s.connect_m(s.group.peek, s.peek)
+    s.connect_m(s.group.take, s.take)
+
+    imm_nbits = DecodeMsg().imm.nbits
+    fused_imm_nbits = DecodeMsg().alu_msg_fused_imm.nbits
+    s.taking_ = [Wire(1) for _ in range(width)]
+    s.msg_ = [Wire(DecodeMsg()) for _ in range(width)]
+    # Set if the instruction is a valid ALU instruction writing a register
+    s.alu_writes_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction can be fused with the next one
+    s.fusible_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction is fused with the next one
+    s.fuse_ = [Wire(1) for _ in range(width)]
+    # Set if the instruction is fused into the one before it
+    s.absorbed_ = [Wire(1) for _ in range(width)]
+    # The immediates of a fused lui or auipc with addi
+    s.next_imm_ = [Wire(imm_nbits) for _ in range(width)]
+    s.hi_imm_ = [Wire(imm_nbits) for _ in range(width)]
+    s.lo_imm_ = [Wire(fused_imm_nbits) for _ in range(width)]
+    s.out_ = [Wire(DecodeMsg()) for _ in range(width)]
+    # The lane in the group each instruction is added to
+    s.pos_ = [Wire(clog2nz(width)) for _ in range(width)]
+
+    s.connect(s.fusible_[width - 1], 0)
+    s.connect(s.fuse_[width - 1], 0)
+    s.connect(s.absorbed_[0], 0)
+    s.connect(s.pos_[0], 0)
+
+    for i in range(width):
+      s.connect(s.stages[i].process_in_, s.in_peek_msg[i])
+      s.connect(s.msg_[i], s.stages[i].process_out)
+
+      @s.combinational
+      def handle_taking(i=i):
+        s.taking_[i].v = s.in_peek_rdy[i] and s.group.add_rdy[i]
+
+      s.connect(s.stages[i].process_call, s.taking_[i])
+      s.connect(s.in_take_call[i], s.taking_[i])
+
+      @s.combinational
+      def check_alu_writes(i=i):
+        s.alu_writes_[i].v = (
+            s.msg_[i].hdr_status == PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+            and s.msg_[i].op_class == OpClass.OP_CLASS_ALU and
+            s.msg_[i].rd_val and s.msg_[i].rd != 0)
+
+    for i in range(width - 1):
+      s.connect(s.next_imm_[i], s.msg_[i + 1].imm)
+
+      @s.combinational
+      def check_fusible(i=i, j=i + 1):
+        s.fusible_[i].v = 0
+        # The second reads and overwrites the first's result
+        if (s.alu_writes_[i] and s.alu_writes_[j] and
+            s.msg_[j].rd == s.msg_[i].rd and s.msg_[j].rs1_val and
+            s.msg_[j].rs1 == s.msg_[i].rd and s.msg_[j].imm_val):
+          if (s.msg_[i].alu_msg_func == AluFunc.ALU_FUNC_LUI or
+              s.msg_[i].alu_msg_func == AluFunc.ALU_FUNC_AUIPC):
+            s.fusible_[i].v = s.msg_[j].alu_msg_func == AluFunc.ALU_FUNC_ADD
+          elif (s.msg_[i].alu_msg_func == AluFunc.ALU_FUNC_SLL and
+                s.msg_[i].imm_val and not s.msg_[i].alu_msg_op32):
+            s.fusible_[i].v = (
+                s.msg_[i].imm == 32 and
+                s.msg_[j].alu_msg_func == AluFunc.ALU_FUNC_SRL and
+                not s.msg_[j].alu_msg_op32 and s.msg_[j].imm == 32)
+
+      @s.combinational
+      def handle_fuse(i=i, j=i + 1):
+        s.fuse_[i].v = (
+            s.fusible_[i] and s.taking_[i] and s.taking_[j] and
+            not s.absorbed_[i])
+        s.absorbed_[j].v = s.fuse_[i]
+
+      @s.combinational
+      def compute_fused_imm(i=i):
+        # The addi immediate is sign extended, so borrow from the upper
+        # part when it is negative
+        if s.next_imm_[i][11]:
+          s.hi_imm_[i].v = s.msg_[i].imm - 1
+        else:
+          s.hi_imm_[i].v = s.msg_[i].imm
+        s.lo_imm_[i].v = s.next_imm_[i][0:12]
+
+      @s.combinational
+      def handle_out(i=i, j=i + 1):
+        s.out_[i].v = s.msg_[i]
+        if s.fuse_[i]:
+          s.out_[i].hdr_fused.v = 1
+          s.out_[i].hdr_ras_tos.v = s.msg_[j].hdr_ras_tos
+          s.out_[i].pc_succ.v = s.msg_[j].pc_succ
+          if s.msg_[i].alu_msg_func == AluFunc.ALU_FUNC_SLL:
+            # The zero extended low word of rs
+            s.out_[i].alu_msg_func.v = AluFunc.ALU_FUNC_ADD
+            s.out_[i].alu_msg_op32.v = 1
+            s.out_[i].alu_msg_unsigned.v = 1
+            s.out_[i].imm.v = 0
+          else:
+            s.out_[i].imm.v = s.hi_imm_[i]
+            s.out_[i].alu_msg_fused_imm.v = s.lo_imm_[i]
+            s.out_[i].alu_msg_op32.v = s.msg_[j].alu_msg_op32
+
+    s.connect(s.out_[width - 1], s.msg_[width - 1])
+
+    for i in range(1, width):
+
+      @s.combinational
+      def compute_pos(i=i, j=i - 1):
+        if s.absorbed_[j]:
+          s.pos_[i].v = s.pos_[j]
+        else:
+          s.pos_[i].v = s.pos_[j] + 1
+
+    # Pack the instructions left after fusion into a prefix of the group
+    for k in range(width):
+
+      @s.combinational
+      def handle_add(k=k, width=width):
+        s.group.add_call[k].v = 0
+        s.group.add_msg[k].v = 0
+        for i in range(k, width):
+          if s.taking_[i] and not s.absorbed_[i] and s.pos_[i] == k:
+            s.group.add_call[k].v = 1
+            s.group.add_msg[k].v = s.out_[i]
+
+  def line_trace(s):
+    traces = []
+    for i in range(s.interface.Width):
+      trace = s.stages[i].line_trace()
+      if not s.taking_[i]:
+        trace = ' ' * len(trace)
+      elif s.absorbed_[i]:
+        trace = '+' + trace[1:]
+      traces.append(trace)
+    return ' '.join(traces)
@@ -0,0 +1,285 @@
+from pymtl import *
+from lizard.bitutil import clog2
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+
+
+class CounterTableInterface(Interface):
+
+  def __init__(s, nentries):
+    assert nentries > 1 and nentries == 2**clog2(nentries)
+    s.nentries = nentries
+    s.Idx = Bits(clog2(nentries))
+
+    super(CounterTableInterface, s).__init__([
+        MethodSpec(
+            'lookup',
+            args={
+                'idx': s.Idx,
+            },
+            rets={
+                'taken': Bits(1),
+            },
+            call=False,
+            rdy=False,
+        ),
+        MethodSpec(
+            'update',
+            args={
+                'idx': s.Idx,
+                'taken': Bits(1),
+            },
+            rets={
+                'predicted': Bits(1),
+            },
+            call=True,
+            rdy=False,
+        ),
+    ])
+
+
+class CounterTable(Model):
+  """A table of 2-bit saturating counters.
+
+  lookup predicts taken if the counter at idx is 2 or 3.
+  update moves the counter at idx towards taken or not taken. predicted is
+  what lookup would currently return for idx, and is valid even if update
+  is not called.
+
+  All counters reset to 2 (weakly taken), since the BTB only supplies a
+  target for branches which have been taken before.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+
+    s.counters = AsynchronousRAM(
+        AsynchronousRAMInterface(Bits(2), s.interface.nentries, 2, 1),
+        reset_values=2)
+
+    s.connect(s.counters.read_addr[0], s.lookup_idx)
+    s.connect(s.counters.read_addr[1], s.update_idx)
+    s.connect(s.counters.write_addr[0], s.update_idx)
+    s.connect(s.counters.write_call[0], s.update_call)
+
+    s.lookup_counter = Wire(2)
+    s.update_counter = Wire(2)
+    s.connect(s.lookup_counter, s.counters.read_data[0])
+    s.connect(s.update_counter, s.counters.read_data[1])
+
+    @s.combinational
+    def handle_lookup():
+      s.lookup_taken.v = s.lookup_counter[1]
+
+    @s.combinational
+    def handle_update():
+      s.update_predicted.v = s.update_counter[1]
+      if s.update_taken:
+        if s.update_counter == 3:
+          s.counters.write_data[0].v = 3
+        else:
+          s.counters.write_data[0].v = s.update_counter + 1
+      else:
+        if s.update_counter == 0:
+          s.counters.write_data[0].v = 0
+        else:
+          s.counters.write_data[0].v = s.update_counter - 1
+
+  def line_trace(s):
+    return '{}'.format(s.lookup_taken)
+
+
+class DirectionPredictorInterface(Interface):
+
+  def __init__(s, xlen, hist_nbits):
+    s.Addr = Bits(xlen)
+    s.Hist = Bits(hist_nbits)
+
+    super(DirectionPredictorInterface, s).__init__([
+        MethodSpec(
+            'predict',
+            args={
+                'pc': s.Addr,
+                'hist': s.Hist,
+            },
+            rets={
+                'taken': Bits(1),
+            },
+            call=False,
+            rdy=False,
+        ),
+        MethodSpec(
+            'update',
+            args={
+                'pc': s.Addr,
+                'hist': s.Hist,
+                'taken': Bits(1),
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+    ])
+
+
+class PredictorIndexInterface(Interface):
+
+  def __init__(s, xlen, hist_nbits, nentries):
+    assert hist_nbits <= clog2(nentries)
+    s.Addr = Bits(xlen)
+    s.Hist = Bits(hist_nbits)
+    s.Idx = Bits(clog2(nentries))
+
+    super(PredictorIndexInterface, s).__init__([
+        MethodSpec(
+            'index',
+            args={
+                'pc': s.Addr,
+                'hist': s.Hist,
+            },
+            rets={
+                'idx': s.Idx,
+            },
+            call=False,
+            rdy=False,
+        ),
+    ])
+
+
+class PredictorIndex(Model):
+  """Computes a counter table index from a PC and a global history.
+
+  The low pc_offset_nbits of the PC are always 0 and are skipped. If
+  use_hist is set, the history is XORed into the low bits of the index
+  (gshare); otherwise it is ignored (bimodal).
+  """
+
+  def __init__(s, interface, pc_offset_nbits, use_hist):
+    UseInterface(s, interface)
+    idx_nbits = s.interface.Idx.nbits
+    hist_nbits = s.interface.Hist.nbits
+
+    s.pc_idx = Wire(idx_nbits)
+
+    @s.combinational
+    def compute_pc_idx(lo=pc_offset_nbits, hi=pc_offset_nbits + idx_nbits):
+      s.pc_idx.v = s.index_pc[lo:hi]
+
+    if use_hist:
+      s.hist_idx = Wire(idx_nbits)
+
+      @s.combinational
+      def compute_idx(hist_nbits=hist_nbits):
+        s.hist_idx.v = 0
+        s.hist_idx[0:hist_nbits].v = s.index_hist
+        s.index_idx.v = s.pc_idx ^ s.hist_idx
+    else:
+      s.connect(s.index_idx, s.pc_idx)
+
+  def line_trace(s):
+    return '{}'.format(s.index_idx)
+
+
+class CounterPredictor(Model):
+  """Predicts using a single table of counters.
+
+  The table is indexed by the PC alone if use_hist is not set (bimodal),
+  or by the PC XOR the global history if it is (gshare).
+  """
+
+  def __init__(s, interface, nentries, pc_offset_nbits, use_hist):
+    UseInterface(s, interface)
+    index_interface = PredictorIndexInterface(s.interface.Addr.nbits,
+                                              s.interface.Hist.nbits, nentries)
+    s.table = CounterTable(CounterTableInterface(nentries))
+    s.predict_index = PredictorIndex(index_interface, pc_offset_nbits, use_hist)
+    s.update_index = PredictorIndex(index_interface, pc_offset_nbits, use_hist)
+
+    s.connect(s.predict_index.index_pc, s.predict_pc)
+    s.connect(s.predict_index.index_hist, s.predict_hist)
+    s.connect(s.update_index.index_pc, s.update_pc)
+    s.connect(s.update_index.index_hist, s.update_hist)
+    s.connect(s.table.lookup_idx, s.predict_index.index_idx)
+    s.connect(s.predict_taken, s.table.lookup_taken)
+    s.connect(s.table.update_idx, s.update_index.index_idx)
+    s.connect(s.table.update_taken, s.update_taken)
+    s.connect(s.table.update_call, s.update_call)
+
+  def line_trace(s):
+    return '{}'.format(s.predict_taken)
+
+
+def BimodalPredictor(interface, nentries, pc_offset_nbits):
+  return CounterPredictor(interface, nentries, pc_offset_nbits, False)
+
+
+def GSharePredictor(interface, nentries, pc_offset_nbits):
+  return CounterPredictor(interface, nentries, pc_offset_nbits, True)
+
+
+class TournamentPredictor(Model):
+  """Chooses between a bimodal and a gshare prediction.
+
+  A table of chooser counters, indexed by the PC, selects the gshare
+  prediction when taken. On an update where the two components disagree,
+  the chooser moves towards whichever one was right.
+  """
+
+  def __init__(s, interface, nentries, pc_offset_nbits):
+    UseInterface(s, interface)
+    index_interface = PredictorIndexInterface(s.interface.Addr.nbits,
+                                              s.interface.Hist.nbits, nentries)
+    s.local = CounterTable(CounterTableInterface(nentries))
+    s.global_ = CounterTable(CounterTableInterface(nentries))
+    s.chooser = CounterTable(CounterTableInterface(nentries))
+
+    s.predict_local_index = PredictorIndex(index_interface, pc_offset_nbits,
+                                           False)
+    s.predict_global_index = PredictorIndex(index_interface, pc_offset_nbits,
+                                            True)
+    s.update_local_index = PredictorIndex(index_interface, pc_offset_nbits,
+                                          False)
+    s.update_global_index = PredictorIndex(index_interface, pc_offset_nbits,
+                                           True)
+    for index in [s.predict_local_index, s.predict_global_index]:
+      s.connect(index.index_pc, s.predict_pc)
+      s.connect(index.index_hist, s.predict_hist)
+    for index in [s.update_local_index, s.update_global_index]:
+      s.connect(index.index_pc, s.update_pc)
+      s.connect(index.index_hist, s.update_hist)
+
+    s.connect(s.local.lookup_idx, s.predict_local_index.index_idx)
+    s.connect(s.global_.lookup_idx, s.predict_global_index.index_idx)
+    s.connect(s.chooser.lookup_idx, s.predict_local_index.index_idx)
+
+    @s.combinational
+    def handle_predict():
+      if s.chooser.lookup_taken:
+        s.predict_taken.v = s.global_.lookup_taken
+      else:
+        s.predict_taken.v = s.local.lookup_taken
+
+    s.connect(s.local.update_idx, s.update_local_index.index_idx)
+    s.connect(s.local.update_taken, s.update_taken)
+    s.connect(s.local.update_call, s.update_call)
+    s.connect(s.global_.update_idx, s.update_global_index.index_idx)
+    s.connect(s.global_.update_taken, s.update_taken)
+    s.connect(s.global_.update_call, s.update_call)
+    s.connect(s.chooser.update_idx, s.update_local_index.index_idx)
+
+    @s.combinational
+    def handle_choose():
+      s.chooser.update_call.v = s.update_call and (s.local.update_predicted !=
+                                                   s.global_.update_predicted)
+      s.chooser.update_taken.v = s.global_.update_predicted == s.update_taken
+
+  def line_trace(s):
+    return '{}'.format(s.predict_taken)
+
+
+DIRECTION_PREDICTORS = {
+    'bimodal': BimodalPredictor,
+    'gshare': GSharePredictor,
+    'tournament': TournamentPredictor,
+}
@@ -1,27 +1,96 @@
 from pymtl import *
+from lizard.bitutil import clog2, clog2nz
+from lizard.bitutil.bit_struct_generator import *
 from lizard.util.rtl.interface import UseInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.drop_unit import DropUnit, DropUnitInterface
 from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+from lizard.util.rtl.wrap_inc import WrapInc
+from lizard.util.rtl.fifo import Fifo, FifoInterface
 from lizard.mem.rtl.memory_bus import MemMsgType, MemMsgStatus
-from lizard.core.rtl.messages import FetchMsg, PipelineMsgStatus
-from lizard.msg.codes import ExceptionCode
+from lizard.core.rtl.messages import FetchMsg, InstMsg, PipelineMsgStatus, BtbEntry
+from lizard.msg.codes import ExceptionCode, Opcode
+from lizard.core.rtl.frontend.return_stack import ReturnStack, ReturnStackInterface
 from lizard.config.general import *
 from lizard.util.rtl.pipeline_stage import PipelineStageInterface
 
 
-def FetchInterface():
-  return PipelineStageInterface(FetchMsg(), None)
+def FetchInterface(width):
+  return PipelineStageInterface(FetchMsg(), None, width)
+
+
+@bit_struct_generator
+def FetchSlot():
+  return [
+      # The PC of the first instruction fetched from the block
+      Field('pc', XLEN),
+      # Set if the instruction after pc in the block is also fetched
+      Field('second', 1),
+      # The predicted address of the instruction after the last one fetched
+      Field('pc_succ', XLEN),
+      # The global history before and after predicting the block
+      Field('hist', BPRED_HIST_NBITS),
+      Field('hist_next', BPRED_HIST_NBITS),
+  ]
 
 
 class Fetch(Model):
+  """Fetches instructions along the predicted path.
+
+  Instructions are fetched in aligned blocks of 2, the width of the memory
+  bus. F0 sends a request for the block containing the next PC every
+  cycle, as long as fewer than nslots requests are in flight. Each request
+  is tagged with its slot in the opaque field of the memory request, and
+  the slot remembers the PC and the prediction made for the block.
+  Responses must arrive in order.
+
+  F0 looks up both instructions of the block in the BTB and in the
+  indirect target predictor, which is indexed by the global history as
+  well, and only knows about jalrs. The block ends early at the first
+  instruction if that hits in either, and at the end of the block
+  otherwise. An indirect predictor hit is always taken, and its target
+  overrides the BTB's. So is a BTB hit on a jump. The direction predictor
+  is only consulted for the last instruction in the block, and only
+  decides BTB hits on conditional branches, so the history shifts at most
+  once per block. Fetching from a BTB target in the middle of a block fetches only
+  the second instruction.
+
+  F1 looks up the slot of each response and puts the 1 or 2 instructions
+  into a fetch queue of queue_size instructions, which Decode takes up to
+  the width of the interface from every cycle.
+  It predecodes the instructions to maintain the return address stack. A
+  jump in the first slot ends the block, since the second instruction is
+  not on the path. F1 redirects F0 if it fetched past such a jump, or if
+  a return's target differs from what F0 predicted. The jump's successor
+  is then the top of the return address stack for a return, and the next
+  instruction otherwise, to be corrected by cflow.
 
-  def __init__(s, fetch_interface, MemMsg, enable_btb):
+  On a redirect from cflow, every request in flight is dropped by the
+  drop unit, and the fetch queue is cleared. F0 starts fetching from the
+  new target the next cycle. On a redirect from F1, every request in
+  flight after the accepted block is dropped. Drops only take effect on
+  responses after the ones received in the same cycle, so accepting a
+  response never depends on the redirect it causes.
+
+  A slot is reused the cycle its response is received. So if the memory
+  responds L cycles after a request is sent, fetch sustains
+  min(1, nslots / L) blocks per cycle, at least until the fetch queue
+  fills. With the test memory, L is 1 + imem_delay.
+  """
+
+  def __init__(s, fetch_interface, MemMsg, enable_btb, enable_bpred, enable_itp,
+               enable_ras, nslots, queue_size):
     UseInterface(s, fetch_interface)
     s.MemMsg = MemMsg
     xlen = XLEN
     ilen = ILEN
     ilen_bytes = ilen / 8
+    block_nbytes = 2 * ilen_bytes
+    assert MemMsg.data_nbytes == block_nbytes
+    assert nslots <= 2**MemMsg.opaque_nbits
+    slot_nbits = clog2nz(nslots)
+    Count = Bits(clog2(nslots + 1))
     s.require(
         MethodSpec(
             'mem_recv',
@@ -43,6 +112,8 @@ class Fetch(Model):
             rets={
                 'redirect': Bits(1),
                 'target': Bits(xlen),
+                'hist': Bits(BPRED_HIST_NBITS),
+                'ras_tos': Bits(RAS_IDX_NBITS),
             },
             call=False,
             rdy=False,
@@ -53,126 +124,373 @@ class Fetch(Model):
                 'key': XLEN,
             },
             rets={
-                'value': XLEN,
+                'value': BtbEntry(),
                 'valid': Bits(1)
             },
             call=False,
             rdy=False,
+            count=2,
+        ),
+        MethodSpec(
+            'bpred_predict',
+            args={
+                'pc': XLEN,
+                'hist': Bits(BPRED_HIST_NBITS),
+            },
+            rets={
+                'taken': Bits(1),
+            },
+            call=False,
+            rdy=False,
+        ),
+        MethodSpec(
+            'itp_predict',
+            args={
+                'pc': XLEN,
+                'hist': Bits(BPRED_HIST_NBITS),
+            },
+            rets={
+                'target': XLEN,
+                'valid': Bits(1),
+            },
+            call=False,
+            rdy=False,
+            count=2,
         ),
     )
 
-    s.drop_unit = DropUnit(DropUnitInterface(s.MemMsg.resp))
+    s.drop_unit = DropUnit(DropUnitInterface(s.MemMsg.resp, nslots))
     s.connect_m(s.drop_unit.input, s.mem_recv, {
         'msg': 'data',
     })
     # PYMTL_BROKEN
     s.drop_unit_output_data_data = Wire(s.drop_unit.output_data.data.nbits)
     s.connect(s.drop_unit_output_data_data, s.drop_unit.output_data.data)
-    s.inst_from_mem = Wire(ILEN)
-    # PYMTL_BROKEN
+    s.drop_unit_output_data_opaque = Wire(MemMsg.opaque_nbits)
+    s.connect(s.drop_unit_output_data_opaque, s.drop_unit.output_data.opaque)
+    # The instructions in the block, in order, starting at the first one
+    # fetched
+    s.insts_ = [Wire(InstMsg()) for _ in range(2)]
+
+    # The PC of the next instruction to fetch
+    s.pc = Register(RegisterInterface(Bits(xlen), True, False), reset_value=0)
+    # The speculative global history, including every predicted branch
+    # before pc
+    s.ghr = Register(
+        RegisterInterface(Bits(BPRED_HIST_NBITS), True, False), reset_value=0)
+    s.pc_plus_4_ = Wire(xlen)
+    s.block_addr_ = Wire(xlen)
+    s.btb_hit_ = [Wire(1) for _ in range(2)]
+    s.itp_hit_ = [Wire(1) for _ in range(2)]
+    # Set if the instruction is a known branch or jump
+    s.hit_ = [Wire(1) for _ in range(2)]
+    s.second_ = Wire(1)
+    s.predict_taken_ = Wire(1)
+    s.pc_next_ = Wire(xlen)
+    s.ghr_next_ = Wire(BPRED_HIST_NBITS)
+
+    # The requests in flight, including ones which will be dropped
+    s.outstanding = Register(
+        RegisterInterface(Count, True, False), reset_value=0)
+    s.tag = Register(
+        RegisterInterface(Bits(slot_nbits), True, False), reset_value=0)
+    s.tag_inc = WrapInc(slot_nbits, nslots, True)
+    s.slots = AsynchronousRAM(
+        AsynchronousRAMInterface(FetchSlot(), nslots, 1, 1))
+    s.slot_ = Wire(FetchSlot())
+    s.connect(s.tag_inc.inc_in, s.tag.read_data)
+
+    width = s.interface.Width
+    assert queue_size >= width
+    s.queue = Fifo(
+        FifoInterface(FetchMsg(), queue_size, num_enq=2, num_deq=width))
+
+    # The return address stack, checkpointed by cflow
+    s.ras = ReturnStack(ReturnStackInterface(XLEN, RAS_SIZE))
+    s.jump_ = [Wire(1) for _ in range(2)]
+    s.rd_link_ = [Wire(1) for _ in range(2)]
+    s.rs1_link_ = [Wire(1) for _ in range(2)]
+    s.push_ = [Wire(1) for _ in range(2)]
+    s.pop_ = [Wire(1) for _ in range(2)]
+    s.use_second_ = Wire(1)
+    s.pc_second_ = Wire(xlen)
+    # The predicted successor of the last instruction put in the queue
+    s.pc_succ_ = Wire(xlen)
+    s.ras_pop_ = Wire(1)
+    # Set if F0 fetched past a jump in the first slot
+    s.cut_block_ = Wire(1)
+    # Set if F0 fetched the wrong successor of the block
+    s.f1_redirect_ = Wire(1)
+
+    s.issue_ = Wire(1)
+    s.accept_ = Wire(1)
+    s.exception_ = Wire(1)
+
+    # F0: predict the next PC and send the request
     @s.combinational
-    def pymtl_is_broken_connect_does_not_work():
-      s.inst_from_mem.v = s.drop_unit_output_data_data[0:ilen]
+    def compute_addrs():
+      s.pc_plus_4_.v = s.pc.read_data + ilen_bytes
+      s.block_addr_.v = s.pc.read_data
+      s.block_addr_[0:3].v = 0
 
-    s.fetch_val = Register(
-        RegisterInterface(Bits(1), True, False), reset_value=0)
-    s.fetch_msg = Register(RegisterInterface(FetchMsg(), True, False))
+    s.connect(s.btb_read_key[0], s.pc.read_data)
+    s.connect(s.btb_read_key[1], s.pc_plus_4_)
+    s.connect(s.bpred_predict_hist, s.ghr.read_data)
+    s.connect(s.itp_predict_pc[0], s.pc.read_data)
+    s.connect(s.itp_predict_pc[1], s.pc_plus_4_)
+    s.connect(s.itp_predict_hist[0], s.ghr.read_data)
+    s.connect(s.itp_predict_hist[1], s.ghr.read_data)
 
-    s.in_flight = Register(
-        RegisterInterface(Bits(1), True, False), reset_value=0)
-    s.pc = Register(RegisterInterface(Bits(xlen), True, False), reset_value=0)
+    @s.combinational
+    def handle_predict():
+      s.btb_hit_[0].v = s.btb_read_valid[0] and enable_btb
+      s.btb_hit_[1].v = s.btb_read_valid[1] and enable_btb
+      s.itp_hit_[0].v = s.itp_predict_valid[0] and enable_itp
+      s.itp_hit_[1].v = s.itp_predict_valid[1] and enable_itp
+      s.hit_[0].v = s.btb_hit_[0] or s.itp_hit_[0]
+      s.hit_[1].v = s.btb_hit_[1] or s.itp_hit_[1]
+      # The second instruction of the block is fetched if pc is the first
+      # one, unless the first one is a known branch
+      s.second_.v = not s.pc.read_data[2] and not s.hit_[0]
+
+      # Predict the direction of the last instruction in the block
+      if s.second_:
+        s.bpred_predict_pc.v = s.pc_plus_4_
+      else:
+        s.bpred_predict_pc.v = s.pc.read_data
+
+      s.predict_taken_.v = 0
+      s.ghr_next_.v = s.ghr.read_data
+      if s.second_:
+        s.pc_next_.v = s.pc_plus_4_ + ilen_bytes
+        if s.hit_[1]:
+          # A BTB hit on a branch is only followed if the direction
+          # predictor agrees, but jumps are always taken
+          s.predict_taken_.v = s.itp_hit_[1] or s.btb_read_value[
+              1].jump or not enable_bpred or s.bpred_predict_taken
+          s.ghr_next_.v = s.ghr.read_data << 1
+          s.ghr_next_[0].v = s.predict_taken_
+          if s.itp_hit_[1]:
+            s.pc_next_.v = s.itp_predict_target[1]
+          elif s.predict_taken_:
+            s.pc_next_.v = s.btb_read_value[1].target
+      else:
+        s.pc_next_.v = s.pc_plus_4_
+        if s.hit_[0]:
+          s.predict_taken_.v = s.itp_hit_[0] or s.btb_read_value[
+              0].jump or not enable_bpred or s.bpred_predict_taken
+          s.ghr_next_.v = s.ghr.read_data << 1
+          s.ghr_next_[0].v = s.predict_taken_
+          if s.itp_hit_[0]:
+            s.pc_next_.v = s.itp_predict_target[0]
+          elif s.predict_taken_:
+            s.pc_next_.v = s.btb_read_value[0].target
+
+    @s.combinational
+    def handle_issue(nslots=nslots):
+      # A slot is free if it is not in use, or its response is received now
+      s.issue_.v = not s.check_redirect_redirect and not s.f1_redirect_ and (
+          s.outstanding.read_data != nslots or
+          s.drop_unit.input_call) and s.mem_send_rdy
+      s.mem_send_call.v = s.issue_
+
+    s.connect(s.mem_send_msg.type_, int(MemMsgType.READ))
+    # A length of 0 is the whole bus width
+    s.connect(s.mem_send_msg.len_, 0)
+
+    @s.combinational
+    def write_addr():
+      s.mem_send_msg.opaque.v = s.tag.read_data
+      s.mem_send_msg.addr.v = s.block_addr_
 
-    s.advance_f1 = Wire(1)
-    s.advance_f0 = Wire(1)
+    s.connect(s.slots.write_call[0], s.issue_)
+    s.connect(s.slots.write_addr[0], s.tag.read_data)
+    s.connect(s.tag.write_call, s.issue_)
+    s.connect(s.tag.write_data, s.tag_inc.inc_out)
 
     @s.combinational
-    def handle_advance():
-      s.advance_f1.v = s.drop_unit.output_rdy and (not s.fetch_val.read_data or
-                                                   s.take_call)
-      s.advance_f0.v = not s.in_flight.read_data or s.drop_unit.drop_status_occurred or s.advance_f1
+    def handle_slot_write():
+      s.slots.write_data[0].v = 0
+      s.slots.write_data[0].pc.v = s.pc.read_data
+      s.slots.write_data[0].second.v = s.second_
+      s.slots.write_data[0].pc_succ.v = s.pc_next_
+      s.slots.write_data[0].hist.v = s.ghr.read_data
+      s.slots.write_data[0].hist_next.v = s.ghr_next_
 
     @s.combinational
-    def handle_redirect():
-      # Insert BTB here!
-      s.btb_read_key.v = s.pc.read_data
+    def handle_outstanding():
+      s.outstanding.write_call.v = s.issue_ or s.drop_unit.input_call
+      if s.issue_ and not s.drop_unit.input_call:
+        s.outstanding.write_data.v = s.outstanding.read_data + 1
+      elif s.drop_unit.input_call and not s.issue_:
+        s.outstanding.write_data.v = s.outstanding.read_data - 1
+      else:
+        s.outstanding.write_data.v = s.outstanding.read_data
+
+    @s.combinational
+    def handle_pc():
       if s.check_redirect_redirect:
-        # drop if in flight
-        s.drop_unit.drop_call.v = s.in_flight.read_data
-        # the new PC is the target
         s.pc.write_data.v = s.check_redirect_target
         s.pc.write_call.v = 1
-      else:
-        s.drop_unit.drop_call.v = 0
-        # if we are issuing now, the new PC is just ilen_bytes more than the last one
-        if s.btb_read_valid and enable_btb:
-          s.pc.write_data.v = s.btb_read_value
+        # restart from the history of the redirecting branch
+        s.ghr.write_data.v = s.check_redirect_hist
+        s.ghr.write_call.v = 1
+      elif s.f1_redirect_:
+        s.pc.write_data.v = s.pc_succ_
+        s.pc.write_call.v = 1
+        # the history only shifted for the second instruction
+        if s.cut_block_:
+          s.ghr.write_data.v = s.slot_.hist
         else:
-          s.pc.write_data.v = s.pc.read_data + ilen_bytes
-        s.pc.write_call.v = s.advance_f0
+          s.ghr.write_data.v = s.slot_.hist_next
+        s.ghr.write_call.v = 1
+      else:
+        s.pc.write_data.v = s.pc_next_
+        s.pc.write_call.v = s.issue_
+        s.ghr.write_data.v = s.ghr_next_
+        s.ghr.write_call.v = s.issue_
 
-    s.connect(s.in_flight.write_data, 1)
-    s.connect(s.in_flight.write_call, s.advance_f0)
-    s.connect(s.peek_msg, s.fetch_msg.read_data)
+    # F1: receive the response and put it in the fetch queue
+    @s.combinational
+    def read_slot(slot_nbits=slot_nbits):
+      s.slots.read_addr[0].v = s.drop_unit_output_data_opaque[0:slot_nbits]
 
+    s.connect(s.slot_, s.slots.read_data[0])
+
+    # PYMTL_BROKEN
     @s.combinational
-    def handle_f1():
-      s.fetch_val.write_call.v = 0
-      s.fetch_val.write_data.v = 0
-      s.fetch_msg.write_call.v = 0
-      s.fetch_msg.write_data.v = 0
-      s.drop_unit.output_call.v = 0
+    def split_block(ilen=ilen):
+      if s.slot_.pc[2]:
+        s.insts_[0].v = s.drop_unit_output_data_data[ilen:2 * ilen]
+      else:
+        s.insts_[0].v = s.drop_unit_output_data_data[0:ilen]
+      s.insts_[1].v = s.drop_unit_output_data_data[ilen:2 * ilen]
 
-      if s.check_redirect_redirect:
-        # invalidate the output
-        s.peek_rdy.v = 0
-        # write a 0 into the valid register
-        s.fetch_val.write_call.v = 1
+    # Predecode calls and returns, following the link register hints in
+    # table 2.1 of the RISC-V spec
+    for i in range(2):
+
+      @s.combinational
+      def predecode(i=i):
+        s.jump_[i].v = s.insts_[i].opcode == Opcode.JAL or s.insts_[
+            i].opcode == Opcode.JALR
+        s.rd_link_[i].v = s.insts_[i].rd == 1 or s.insts_[i].rd == 5
+        s.rs1_link_[i].v = s.insts_[i].rs1 == 1 or s.insts_[i].rs1 == 5
+        s.push_[i].v = s.jump_[i] and s.rd_link_[i] and enable_ras
+        s.pop_[i].v = s.insts_[i].opcode == Opcode.JALR and s.rs1_link_[i] and (
+            not s.rd_link_[i] or
+            s.insts_[i].rd != s.insts_[i].rs1) and enable_ras
+
+    @s.combinational
+    def handle_block():
+      s.exception_.v = s.drop_unit.output_data.stat != MemMsgStatus.OK
+      # A jump in the first slot is always taken, so the second
+      # instruction is not on the path
+      s.cut_block_.v = s.slot_.second and s.jump_[0] and not s.exception_
+      s.use_second_.v = s.slot_.second and not s.jump_[0] and not s.exception_
+      s.pc_second_.v = s.slot_.pc + ilen_bytes
+
+      s.ras.update_pop.v = 0
+      s.ras.update_push.v = 0
+      s.ras.update_addr.v = s.pc_second_
+      if s.jump_[0]:
+        s.ras.update_pop.v = s.pop_[0]
+        s.ras.update_push.v = s.push_[0]
+      elif s.use_second_:
+        s.ras.update_pop.v = s.pop_[1]
+        s.ras.update_push.v = s.push_[1]
+        s.ras.update_addr.v = s.pc_second_ + ilen_bytes
+      s.ras_pop_.v = s.ras.update_pop and not s.exception_
+
+      if s.cut_block_:
+        # F0 predicted the jump falls through
+        s.pc_succ_.v = s.pc_second_
       else:
-        s.peek_rdy.v = s.fetch_val.read_data
-
-        if s.drop_unit.output_rdy and (not s.fetch_val.read_data or
-                                       s.take_call):
-          s.fetch_val.write_call.v = 1
-          s.fetch_val.write_data.v = 1
-          s.fetch_msg.write_call.v = 1
-          s.drop_unit.output_call.v = 1
-
-          s.fetch_msg.write_data.hdr_pc.v = s.pc.read_data
-          if s.drop_unit.output_data.stat != MemMsgStatus.OK:
-            s.fetch_msg.write_data.hdr_status.v = PipelineMsgStatus.PIPELINE_MSG_STATUS_EXCEPTION_RAISED
-            if s.drop_unit.output_data.stat == MemMsgStatus.ADDRESS_MISALIGNED:
-              s.fetch_msg.write_data.exception_info_mcause.v = ExceptionCode.INSTRUCTION_ADDRESS_MISALIGNED
-            elif s.drop_unit.output_data.stat == MemMsgStatus.ACCESS_FAULT:
-              s.fetch_msg.write_data.exception_info_mcause.v = ExceptionCode.INSTRUCTION_ACCESS_FAULT
-            # save the faulting PC as mtval
-            s.fetch_msg.write_data.exception_info_mtval.v = s.pc.read_data
-          else:
-            s.fetch_msg.write_data.hdr_status.v = PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
-            s.fetch_msg.write_data.inst.v = s.inst_from_mem
-            s.fetch_msg.write_data.pc_succ.v = s.pc.write_data
-        elif s.take_call:
-          # someone is calling, but we are stalled, so give them output but
-          # unset valid
-          s.fetch_val.write_call.v = 1
-          s.fetch_val.write_data.v = 0
-
-    # handle_f0
-    s.connect(s.mem_send_msg.type_, int(MemMsgType.READ))
+        s.pc_succ_.v = s.slot_.pc_succ
+      if s.ras_pop_:
+        s.pc_succ_.v = s.ras.peek_addr
 
     @s.combinational
-    def write_addr():
-      s.mem_send_msg.addr.v = s.pc.write_data
+    def handle_accept():
+      s.accept_.v = not s.check_redirect_redirect and s.drop_unit.output_rdy and s.queue.enq_rdy[
+          0] and (not s.use_second_ or s.queue.enq_rdy[1])
+      s.drop_unit.output_call.v = s.accept_
+      s.ras.update_call.v = s.accept_ and not s.exception_ and (
+          s.ras.update_pop or s.ras.update_push)
+      s.f1_redirect_.v = s.accept_ and (s.cut_block_ or
+                                        s.pc_succ_ != s.slot_.pc_succ)
+
+    s.connect(s.ras.restore_tos, s.check_redirect_ras_tos)
+    s.connect(s.ras.restore_call, s.check_redirect_redirect)
+
+    @s.combinational
+    def handle_drop():
+      s.drop_unit.drop_call.v = s.check_redirect_redirect or s.f1_redirect_
+      # everything except a response received now, which is either the
+      # block being accepted, or one already being dropped
+      s.drop_unit.drop_count.v = s.outstanding.read_data - s.drop_unit.input_call
+
+    @s.combinational
+    def handle_enq():
+      s.queue.enq_call[0].v = s.accept_
+      s.queue.enq_call[1].v = s.accept_ and s.use_second_
+
+    @s.combinational
+    def handle_f1():
+      s.queue.enq_msg[0].v = 0
+      s.queue.enq_msg[0].hdr_pc.v = s.slot_.pc
+      s.queue.enq_msg[0].hdr_pred_hist.v = s.slot_.hist
+      if s.jump_[0]:
+        s.queue.enq_msg[0].hdr_ras_tos.v = s.ras.update_tos
+      else:
+        s.queue.enq_msg[0].hdr_ras_tos.v = s.ras.peek_tos
+      if s.exception_:
+        s.queue.enq_msg[
+            0].hdr_status.v = PipelineMsgStatus.PIPELINE_MSG_STATUS_EXCEPTION_RAISED
+        if s.drop_unit.output_data.stat == MemMsgStatus.ADDRESS_MISALIGNED:
+          s.queue.enq_msg[
+              0].exception_info_mcause.v = ExceptionCode.INSTRUCTION_ADDRESS_MISALIGNED
+        elif s.drop_unit.output_data.stat == MemMsgStatus.ACCESS_FAULT:
+          s.queue.enq_msg[
+              0].exception_info_mcause.v = ExceptionCode.INSTRUCTION_ACCESS_FAULT
+        # save the faulting PC as mtval
+        s.queue.enq_msg[0].exception_info_mtval.v = s.slot_.pc
+      else:
+        s.queue.enq_msg[
+            0].hdr_status.v = PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+        s.queue.enq_msg[0].inst.v = s.insts_[0]
+        if s.use_second_:
+          s.queue.enq_msg[0].pc_succ.v = s.pc_second_
+        else:
+          s.queue.enq_msg[0].pc_succ.v = s.pc_succ_
+
+      # The history did not shift for the first instruction, since the
+      # block would have ended if it were a known branch
+      s.queue.enq_msg[1].v = 0
+      s.queue.enq_msg[1].hdr_pc.v = s.pc_second_
+      s.queue.enq_msg[1].hdr_pred_hist.v = s.slot_.hist
+      s.queue.enq_msg[1].hdr_ras_tos.v = s.ras.update_tos
+      s.queue.enq_msg[
+          1].hdr_status.v = PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+      s.queue.enq_msg[1].inst.v = s.insts_[1]
+      s.queue.enq_msg[1].pc_succ.v = s.pc_succ_
+
+    # Decode takes up to width instructions from the fetch queue
+    s.connect(s.queue.clear_call, s.check_redirect_redirect)
+    for i in range(width):
+      s.connect(s.peek_msg[i], s.queue.peek_msg[i])
+      s.connect(s.queue.deq_call[i], s.take_call[i])
 
-    s.connect(s.mem_send_msg.len_, ilen_bytes)
-    # can only send it if advancing
-    s.connect(s.mem_send_call, s.advance_f0)
+      @s.combinational
+      def handle_peek(i=i):
+        s.peek_rdy[i].v = s.queue.peek_rdy[i] and not s.check_redirect_redirect
 
   def line_trace(s):
     pc = s.pc.read_data.hex()[2:]
     empty = ' ' * len(pc)
-    if s.advance_f1:
+    if s.issue_:
       trace = pc
-    elif s.peek_rdy:
+    elif s.peek_rdy[0]:
       trace = '#{}'.format(empty[1:])
     else:
       trace = empty
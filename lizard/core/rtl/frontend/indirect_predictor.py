@@ -0,0 +1,128 @@
+from pymtl import *
+from lizard.bitutil import clog2
+from lizard.bitutil.bit_struct_generator import *
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+from lizard.core.rtl.frontend.direction_predictor import PredictorIndex, PredictorIndexInterface
+
+
+class IndirectPredictorInterface(Interface):
+
+  def __init__(s, xlen, hist_nbits, num_predict=1):
+    s.Addr = Bits(xlen)
+    s.Hist = Bits(hist_nbits)
+    s.NumPredict = num_predict
+
+    super(IndirectPredictorInterface, s).__init__([
+        MethodSpec(
+            'predict',
+            args={
+                'pc': s.Addr,
+                'hist': s.Hist,
+            },
+            rets={
+                'target': s.Addr,
+                'valid': Bits(1),
+            },
+            call=False,
+            rdy=False,
+            count=num_predict,
+        ),
+        MethodSpec(
+            'update',
+            args={
+                'pc': s.Addr,
+                'hist': s.Hist,
+                'target': s.Addr,
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+    ])
+
+
+@bit_struct_generator
+def IndirectEntry(tag_nbits, xlen):
+  return [
+      Field('tag', tag_nbits),
+      Field('target', xlen),
+  ]
+
+
+class IndirectPredictor(Model):
+  """Predicts the targets of indirect jumps.
+
+  A tagged table of targets, indexed by the PC XOR the global history
+  like gshare, so a jalr reached along different paths (a call through a
+  function pointer, or a switch) can have a different target on each.
+  The tag is the tag_nbits of the PC above the index.
+
+  predict returns the target for pc and hist, and valid if the entry was
+  written by a jump with the same tag.
+  update writes the target a jump went to, with the history it was
+  predicted with.
+  """
+
+  def __init__(s, interface, nentries, tag_nbits, pc_offset_nbits):
+    UseInterface(s, interface)
+    xlen = s.interface.Addr.nbits
+    num_predict = s.interface.NumPredict
+    idx_nbits = clog2(nentries)
+    tag_lo = pc_offset_nbits + idx_nbits
+    tag_hi = tag_lo + tag_nbits
+    assert tag_hi <= xlen
+    Entry = IndirectEntry(tag_nbits, xlen)
+    index_interface = PredictorIndexInterface(xlen, s.interface.Hist.nbits,
+                                              nentries)
+
+    s.entries = AsynchronousRAM(
+        AsynchronousRAMInterface(Entry, nentries, num_predict, 1))
+    s.valid = AsynchronousRAM(
+        AsynchronousRAMInterface(Bits(1), nentries, num_predict, 1),
+        reset_values=0)
+    s.predict_index = [
+        PredictorIndex(index_interface, pc_offset_nbits, True)
+        for _ in range(num_predict)
+    ]
+    s.update_index = PredictorIndex(index_interface, pc_offset_nbits, True)
+
+    # PYMTL_BROKEN
+    s.predict_tag_ = [Wire(tag_nbits) for _ in range(num_predict)]
+    s.entry_tag_ = [Wire(tag_nbits) for _ in range(num_predict)]
+    s.entry_target_ = [Wire(xlen) for _ in range(num_predict)]
+    s.update_tag_ = Wire(tag_nbits)
+
+    for i in range(num_predict):
+      s.connect(s.predict_index[i].index_pc, s.predict_pc[i])
+      s.connect(s.predict_index[i].index_hist, s.predict_hist[i])
+      s.connect(s.entries.read_addr[i], s.predict_index[i].index_idx)
+      s.connect(s.valid.read_addr[i], s.predict_index[i].index_idx)
+      s.connect(s.entry_tag_[i], s.entries.read_data[i].tag)
+      s.connect(s.entry_target_[i], s.entries.read_data[i].target)
+      s.connect(s.predict_target[i], s.entry_target_[i])
+
+      @s.combinational
+      def handle_predict(i=i, lo=tag_lo, hi=tag_hi):
+        s.predict_tag_[i].v = s.predict_pc[i][lo:hi]
+        s.predict_valid[i].v = s.valid.read_data[i] and (
+            s.entry_tag_[i] == s.predict_tag_[i])
+
+    s.connect(s.update_index.index_pc, s.update_pc)
+    s.connect(s.update_index.index_hist, s.update_hist)
+    s.connect(s.entries.write_addr[0], s.update_index.index_idx)
+    s.connect(s.entries.write_call[0], s.update_call)
+    s.connect(s.valid.write_addr[0], s.update_index.index_idx)
+    s.connect(s.valid.write_data[0], 1)
+    s.connect(s.valid.write_call[0], s.update_call)
+
+    @s.combinational
+    def handle_update(lo=tag_lo, hi=tag_hi):
+      s.update_tag_.v = s.update_pc[lo:hi]
+      s.entries.write_data[0].v = 0
+      s.entries.write_data[0].tag.v = s.update_tag_
+      s.entries.write_data[0].target.v = s.update_target
+
+  def line_trace(s):
+    return '{}'.format(s.predict_valid[0])
@@ -0,0 +1,115 @@
+from pymtl import *
+from lizard.bitutil import clog2
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+
+
+class ReturnStackInterface(Interface):
+
+  def __init__(s, xlen, nentries):
+    assert nentries > 1 and nentries == 2**clog2(nentries)
+    s.Addr = Bits(xlen)
+    s.Tos = Bits(clog2(nentries))
+    s.nentries = nentries
+
+    super(ReturnStackInterface, s).__init__(
+        [
+            MethodSpec(
+                'peek',
+                args=None,
+                rets={
+                    'addr': s.Addr,
+                    'tos': s.Tos,
+                },
+                call=False,
+                rdy=False,
+            ),
+            MethodSpec(
+                'update',
+                args={
+                    'pop': Bits(1),
+                    'push': Bits(1),
+                    'addr': s.Addr,
+                },
+                rets={
+                    'tos': s.Tos,
+                },
+                call=True,
+                rdy=False,
+            ),
+            MethodSpec(
+                'restore',
+                args={
+                    'tos': s.Tos,
+                },
+                rets=None,
+                call=True,
+                rdy=False,
+            ),
+        ],
+        ordering_chains=[
+            ['peek', 'update', 'restore'],
+        ],
+    )
+
+
+class ReturnStack(Model):
+  """A circular stack of predicted return addresses.
+
+  peek returns the address on top of the stack, and the top of stack
+  pointer.
+  update pops the top of the stack if pop is set, then pushes addr if push
+  is set. tos is the resulting top of stack pointer, which is all that is
+  needed to checkpoint the stack.
+  restore resets the top of stack pointer to a checkpoint, and overrides
+  update.
+
+  The stack never overflows or underflows: the oldest entry is overwritten
+  when pushing onto a full stack, and popping an empty stack just returns
+  garbage. Entries overwritten on a mispredicted path are not restored, so
+  a restored stack is only exact if the wrong path pushed nothing.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+    Tos = s.interface.Tos
+
+    s.entries = AsynchronousRAM(
+        AsynchronousRAMInterface(s.interface.Addr, s.interface.nentries, 1, 1))
+    s.tos = Register(RegisterInterface(Tos, enable=True), reset_value=0)
+    s.popped_tos_ = Wire(Tos)
+    s.pushed_tos_ = Wire(Tos)
+
+    s.connect(s.entries.read_addr[0], s.tos.read_data)
+    s.connect(s.peek_addr, s.entries.read_data[0])
+    s.connect(s.peek_tos, s.tos.read_data)
+
+    @s.combinational
+    def compute_tos():
+      if s.update_pop:
+        s.popped_tos_.v = s.tos.read_data - 1
+      else:
+        s.popped_tos_.v = s.tos.read_data
+      s.pushed_tos_.v = s.popped_tos_ + 1
+      if s.update_push:
+        s.update_tos.v = s.pushed_tos_
+      else:
+        s.update_tos.v = s.popped_tos_
+
+    s.connect(s.entries.write_addr[0], s.pushed_tos_)
+    s.connect(s.entries.write_data[0], s.update_addr)
+
+    @s.combinational
+    def handle_update():
+      s.entries.write_call[
+          0].v = s.update_call and s.update_push and not s.restore_call
+      s.tos.write_call.v = s.update_call or s.restore_call
+      if s.restore_call:
+        s.tos.write_data.v = s.restore_tos
+      else:
+        s.tos.write_data.v = s.update_tos
+
+  def line_trace(s):
+    return s.tos.read_data.hex()[2:]
@@ -36,7 +36,7 @@ class KillNotifier(Model):
 
 class RedirectNotifier(Model):
 
-  def __init__(s, xlen):
+  def __init__(s, xlen, hist_nbits, ras_idx_nbits):
     UseInterface(s, Interface([]))
     s.require(
         MethodSpec(
@@ -45,6 +45,8 @@ class RedirectNotifier(Model):
             rets={
                 'redirect': Bits(1),
                 'target': Bits(xlen),
+                'hist': Bits(hist_nbits),
+                'ras_tos': Bits(ras_idx_nbits),
             },
             call=False,
             rdy=False,
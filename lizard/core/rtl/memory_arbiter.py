@@ -3,6 +3,11 @@ from lizard.util.rtl.interface import Interface, UseInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.register import Register, RegisterInterface
 from lizard.mem.rtl.memory_bus import MemMsgType
+from lizard.bitutil import clog2, clog2nz
+
+STORE_OPAQUE = 0
+# A load is tagged with LOAD_OPAQUE plus its slot
+LOAD_OPAQUE = 1
 
 
 class MemoryArbiterInterface(Interface):
@@ -56,9 +61,21 @@ class MemoryArbiterInterface(Interface):
 
 
 class MemoryArbiter(Model):
+  """Shares a memory bus port between loads and stores.
+
+  Requests are tagged in the opaque field so responses can be told apart
+  even if they return out of order (as they do behind a non-blocking
+  cache). At most max_stores stores may be awaiting acknowledgement.
+
+  Up to max_loads loads may be in flight, each in a slot of a ring, and
+  tagged with the slot. A response is written into its slot whenever it
+  arrives, and recv_load returns the loads in the order they were sent.
+  The oldest load passes straight through if it arrives as it is wanted.
+  """
 
-  def __init__(s, interface, MemMsg):
+  def __init__(s, interface, MemMsg, max_stores=1, max_loads=1):
     UseInterface(s, interface)
+    assert LOAD_OPAQUE + max_loads <= 2**MemMsg.opaque_nbits
 
     s.require(
         MethodSpec(
@@ -77,31 +94,122 @@ class MemoryArbiter(Model):
         ),
     )
 
-    s.store_in_flight = Register(RegisterInterface(Bits(1)))
-    s.store_in_flight_after_recv = Wire(1)
+    StoreCount = Bits(clog2(max_stores + 1))
+    Slot = Bits(clog2nz(max_loads))
+    s.stores_in_flight = Register(RegisterInterface(StoreCount), reset_value=0)
+    s.stores_in_flight_after_recv = Wire(StoreCount)
+    s.recv_store = Wire(1)
+
+    s.load_head = Register(RegisterInterface(Slot), reset_value=0)
+    s.load_tail = Register(RegisterInterface(Slot), reset_value=0)
+    s.load_busy = [
+        Register(RegisterInterface(Bits(1)), reset_value=0)
+        for _ in range(max_loads)
+    ]
+    s.load_done = [
+        Register(RegisterInterface(Bits(1)), reset_value=0)
+        for _ in range(max_loads)
+    ]
+    s.load_data = [
+        Register(RegisterInterface(s.interface.Data, enable=True))
+        for _ in range(max_loads)
+    ]
+    s.recv_load_resp = Wire(1)
+    s.resp_opaque = Wire(MemMsg.opaque_nbits)
+    s.resp_slot = Wire(Slot)
+    s.tail_opaque = Wire(MemMsg.opaque_nbits)
+    s.send_opaque = Wire(MemMsg.opaque_nbits)
+    s.head_resp = Wire(1)
+    s.head_done = Wire(1)
+    s.head_data = Wire(s.interface.Data)
+    s.tail_busy = Wire(1)
+    # PYMTL_BROKEN
+    s.slot_busy = [Wire(1) for _ in range(max_loads)]
+    s.slot_done = [Wire(1) for _ in range(max_loads)]
+    s.slot_data = [Wire(s.interface.Data) for _ in range(max_loads)]
+    s.slot_resp = [Wire(1) for _ in range(max_loads)]
+    for i in range(max_loads):
+      s.connect(s.slot_busy[i], s.load_busy[i].read_data)
+      s.connect(s.slot_done[i], s.load_done[i].read_data)
+      s.connect(s.slot_data[i], s.load_data[i].read_data)
+      s.connect(s.load_data[i].write_data, s.mb_recv_msg.data)
+      s.connect(s.load_data[i].write_call, s.slot_resp[i])
 
     @s.combinational
-    def handle_recv():
-      s.recv_load_data.v = s.mb_recv_msg.data
-      if s.mb_recv_rdy:
-        if s.store_in_flight.read_data:
-          s.mb_recv_call.v = 1
-          s.recv_load_rdy.v = 0
-          s.store_in_flight_after_recv.v = 0
-        else:
-          s.mb_recv_call.v = s.recv_load_call
-          s.recv_load_rdy.v = 1
-          s.store_in_flight_after_recv.v = 0
+    def handle_recv(slot_nbits=Slot.nbits):
+      s.recv_store.v = s.mb_recv_rdy and s.mb_recv_msg.opaque == STORE_OPAQUE
+      s.recv_load_resp.v = s.mb_recv_rdy and s.mb_recv_msg.opaque != STORE_OPAQUE
+      s.resp_opaque.v = s.mb_recv_msg.opaque - LOAD_OPAQUE
+      s.resp_slot.v = s.resp_opaque[0:slot_nbits]
+      # Every response has somewhere to go
+      s.mb_recv_call.v = s.mb_recv_rdy
+      if s.recv_store:
+        s.stores_in_flight_after_recv.v = s.stores_in_flight.read_data - 1
+      else:
+        s.stores_in_flight_after_recv.v = s.stores_in_flight.read_data
+
+    @s.combinational
+    def select_slots():
+      s.head_done.v = 0
+      s.head_data.v = 0
+      s.tail_busy.v = 0
+      for i in range(max_loads):
+        if s.load_head.read_data == i:
+          s.head_done.v = s.slot_done[i]
+          s.head_data.v = s.slot_data[i]
+        if s.load_tail.read_data == i:
+          s.tail_busy.v = s.slot_busy[i]
+
+    @s.combinational
+    def handle_recv_load():
+      s.head_resp.v = s.recv_load_resp and s.resp_slot == s.load_head.read_data
+      s.recv_load_rdy.v = s.head_done or s.head_resp
+      if s.head_done:
+        s.recv_load_data.v = s.head_data
       else:
-        s.mb_recv_call.v = 0
-        s.recv_load_rdy.v = 0
-        s.store_in_flight_after_recv.v = s.store_in_flight.read_data
+        s.recv_load_data.v = s.mb_recv_msg.data
+
+    for i in range(max_loads):
+
+      @s.combinational
+      def update_slot(i=i):
+        s.slot_resp[i].v = s.recv_load_resp and s.resp_slot == i
+        if s.recv_load_call and s.load_head.read_data == i:
+          s.load_busy[i].write_data.v = 0
+          s.load_done[i].write_data.v = 0
+        elif s.send_load_call and s.load_tail.read_data == i:
+          s.load_busy[i].write_data.v = 1
+          s.load_done[i].write_data.v = 0
+        else:
+          s.load_busy[i].write_data.v = s.slot_busy[i]
+          s.load_done[i].write_data.v = s.slot_done[i] or s.slot_resp[i]
+
+    @s.combinational
+    def update_ring(last=max_loads - 1):
+      s.load_head.write_data.v = s.load_head.read_data
+      if s.recv_load_call:
+        if s.load_head.read_data == last:
+          s.load_head.write_data.v = 0
+        else:
+          s.load_head.write_data.v = s.load_head.read_data + 1
+      s.load_tail.write_data.v = s.load_tail.read_data
+      if s.send_load_call:
+        if s.load_tail.read_data == last:
+          s.load_tail.write_data.v = 0
+        else:
+          s.load_tail.write_data.v = s.load_tail.read_data + 1
+
+    @s.combinational
+    def compute_send_opaque(slot_nbits=Slot.nbits):
+      s.tail_opaque.v = 0
+      s.tail_opaque[0:slot_nbits].v = s.load_tail.read_data
+      s.send_opaque.v = s.tail_opaque + LOAD_OPAQUE
 
     @s.combinational
     def handle_send_rdy():
       if s.mb_send_rdy:
-        s.send_store_rdy.v = 1
-        s.send_load_rdy.v = not s.send_store_call
+        s.send_store_rdy.v = s.stores_in_flight_after_recv != max_stores
+        s.send_load_rdy.v = not s.send_store_call and not s.tail_busy
       else:
         s.send_store_rdy.v = 0
         s.send_load_rdy.v = 0
@@ -109,26 +217,27 @@ class MemoryArbiter(Model):
     @s.combinational
     def handle_send(size=s.interface.Size.nbits - 1):
       s.mb_send_msg.v = 0
+      s.stores_in_flight.write_data.v = s.stores_in_flight_after_recv
       if s.send_store_call:
         s.mb_send_call.v = 1
         s.mb_send_msg.type_.v = MemMsgType.WRITE
-        s.mb_send_msg.opaque.v = 0
+        s.mb_send_msg.opaque.v = STORE_OPAQUE
         s.mb_send_msg.addr.v = s.send_store_addr
         # This size will have to be truncated by 1 bit because full for a mem msg
         # is 0. The length field must always be a power of 2 so this works
         s.mb_send_msg.len_.v = s.send_store_size[0:size]
         s.mb_send_msg.data.v = s.send_store_data
-        s.store_in_flight.write_data.v = 1
+        s.stores_in_flight.write_data.v = s.stores_in_flight_after_recv + 1
       elif s.send_load_call:
         s.mb_send_call.v = 1
         s.mb_send_msg.type_.v = MemMsgType.READ
-        s.mb_send_msg.opaque.v = 0
+        s.mb_send_msg.opaque.v = s.send_opaque
         s.mb_send_msg.addr.v = s.send_load_addr
         s.mb_send_msg.len_.v = s.send_load_size[0:size]
         s.mb_send_msg.data.v = 0
-        s.store_in_flight.write_data.v = 0
       else:
         s.mb_send_call.v = 0
-        s.store_in_flight.write_data.v = s.store_in_flight_after_recv
 
-    s.connect(s.store_acks_outstanding_ret, s.store_in_flight_after_recv)
+    @s.combinational
+    def handle_store_acks_outstanding():
+      s.store_acks_outstanding_ret.v = s.stores_in_flight_after_recv != 0
@@ -5,16 +5,26 @@ from lizard.util.rtl.types import canonicalize_type
 from lizard.util.rtl.registerfile import RegisterFile
 from lizard.util.rtl.overlap_checker import OverlapChecker, OverlapCheckerInterface
 from lizard.util.rtl.logic import LogicOperatorInterface, Or
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.onehot import OneHotEncoder
+from lizard.util.rtl.arbiters import ArbiterInterface, PriorityArbiter
 from lizard.core.rtl.memory_arbiter import MemoryArbiterInterface, MemoryArbiter
+from lizard.core.rtl.store_buffer import StoreBuffer, StoreBufferInterface
+from lizard.mem.rtl.dcache import DCache, DCacheInterface
+from lizard.mem.rtl.stride_prefetcher import StridePrefetcher, StridePrefetcherInterface
+from lizard.config.general import *
 from lizard.bitutil import clog2, clog2nz
 from lizard.bitutil.bit_struct_generator import *
 
 
 class MemoryFlowManagerInterface(Interface):
 
-  def __init__(s, addr_len, max_size, nslots):
+  def __init__(s, addr_len, max_size, nslots, counter_nbits=64, num_predict=1):
     s.nslots = nslots
     s.max_size = max_size
+    s.Counter = Bits(counter_nbits)
+    s.Seq = Bits(INST_IDX_NBITS)
+    s.num_predict = num_predict
     s.StoreID = canonicalize_type(clog2nz(nslots))
     s.Addr = canonicalize_type(addr_len)
     s.Size = canonicalize_type(clog2nz(max_size + 1))
@@ -26,14 +36,43 @@ class MemoryFlowManagerInterface(Interface):
             'store_pending',
             args={
                 'live_mask': Bits(nslots),
+                'seq': s.Seq,
                 'addr': s.Addr,
                 'size': s.Size,
+                'active': Bits(1),
             },
             rets={
                 'pending': Bits(1),
+                'forward': Bits(1),
+                'forward_data': s.Data,
+                'unresolved': Bits(1),
+            },
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'track_load',
+            args={
+                'addr': s.Addr,
+                'size': s.Size,
+                'seq': s.Seq,
+                'pc': s.Addr,
+            },
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'store_wait',
+            args={
+                'pc': s.Addr,
+            },
+            rets={
+                'wait': Bits(1),
             },
             call=False,
             rdy=False,
+            count=num_predict,
         ),
         MethodSpec(
             'recv_load',
@@ -73,6 +112,13 @@ class MemoryFlowManagerInterface(Interface):
             call=False,
             rdy=False,
         ),
+        MethodSpec(
+            'clean_cache',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
         MethodSpec(
             'send_load',
             args={
@@ -83,10 +129,21 @@ class MemoryFlowManagerInterface(Interface):
             call=True,
             rdy=True,
         ),
+        MethodSpec(
+            'observe_load',
+            args={
+                'pc': s.Addr,
+                'addr': s.Addr,
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
         MethodSpec(
             'register_store',
             args={
                 'id_': s.StoreID,
+                'seq': s.Seq,
             },
             rets=None,
             call=True,
@@ -98,8 +155,11 @@ class MemoryFlowManagerInterface(Interface):
                 'id_': s.StoreID,
                 'addr': s.Addr,
                 'size': s.Size,
+                'seq': s.Seq,
+            },
+            rets={
+                'violation': Bits(1),
             },
-            rets=None,
             call=True,
             rdy=False,
         ),
@@ -113,6 +173,22 @@ class MemoryFlowManagerInterface(Interface):
             call=True,
             rdy=False,
         ),
+        MethodSpec(
+            'stats',
+            args=None,
+            rets={
+                'forwarded': s.Counter,
+                'violations': s.Counter,
+                'dcache_hits': s.Counter,
+                'dcache_misses': s.Counter,
+                'dcache_prefetches': s.Counter,
+                'dcache_useful_prefetches': s.Counter,
+                'buffer_stores': s.Counter,
+                'buffer_writes': s.Counter,
+            },
+            call=False,
+            rdy=False,
+        ),
     ])
 
 
@@ -125,6 +201,35 @@ def AddrSizePair(addr_len, size_len):
 
 
 class MemoryFlowManager(Model):
+  """Tracks the stores in flight, and sends loads and stores to memory.
+
+  store_pending checks a load against the stores with known addresses,
+  forwarding from the youngest overlapping one if it can. unresolved is set
+  if any live store older than the load, by seq, has no address yet.
+  register_store records each store's seq for this. active is set while
+  there is a load to check, even if it cannot go ahead.
+
+  A load may issue ahead of older stores with unknown addresses unless
+  store_wait predicts it depends on one. Such a load is registered with
+  track_load, and enter_store_address reports a violation if a store
+  overlaps a younger tracked load which issued before the store's address
+  was known. The load's PC is then marked in the store wait table, so it
+  waits next time. The table is cleared every 2**MEM_DEP_CLEAR_NBITS
+  cycles, so loads which stop depending on stores get to go early again.
+
+  observe_load trains the data cache's stride prefetcher with the PC and
+  address of every load, if there is one.
+
+  send_store moves a committed store into the store buffer, if there is
+  one, which merges stores to the same word and drains them to memory in
+  the background. Loads check the store buffer after the live stores, and
+  an entry an active load is waiting on drains right away.
+  store_acks_outstanding is set until the buffer is empty.
+
+  stats returns the number of loads forwarded and of ordering violations,
+  along with the counters of the data cache and the store buffer, which
+  are 0 for whichever of them is disabled.
+  """
 
   def __init__(s, interface, MemMsg):
     UseInterface(s, interface)
@@ -144,6 +249,13 @@ class MemoryFlowManager(Model):
             call=True,
             rdy=True,
         ),
+        MethodSpec(
+            'cflow_get_head',
+            args=None,
+            rets={'seq': s.interface.Seq},
+            call=False,
+            rdy=True,
+        ),
     )
 
     s.store_address_table = RegisterFile(
@@ -163,14 +275,84 @@ class MemoryFlowManager(Model):
                                     s.interface.max_size))
         for _ in range(s.interface.nslots)
     ]
+    s.cache_busy_ = Wire(1)
+    s.buffer_pending_ = Wire(1)
+    s.buffer_forward_ = Wire(1)
+    s.buffer_forward_data_ = Wire(s.interface.Data)
+    s.buffer_busy_ = Wire(1)
+    s.buffer_check_ = Wire(1)
     s.memory_arbiter = MemoryArbiter(
         MemoryArbiterInterface(s.interface.Addr, s.interface.Size,
-                               s.interface.Data), MemMsg)
-    s.connect_m(s.memory_arbiter.mb_send, s.mb_send)
-    s.connect_m(s.memory_arbiter.mb_recv, s.mb_recv)
-    s.connect_m(s.memory_arbiter.store_acks_outstanding,
-                s.store_acks_outstanding)
+                               s.interface.Data),
+        MemMsg,
+        max_stores=s.interface.nslots,
+        max_loads=LOAD_QUEUE_SIZE)
+    if ENABLE_DCACHE:
+      s.dcache = DCache(
+          DCacheInterface(MemMsg), DCACHE_NSETS, DCACHE_NWAYS,
+          DCACHE_LINE_NBYTES, DCACHE_NMSHRS)
+      s.connect_m(s.memory_arbiter.mb_send, s.dcache.send)
+      s.connect_m(s.memory_arbiter.mb_recv, s.dcache.recv)
+      s.connect_m(s.dcache.mem_send, s.mb_send)
+      s.connect_m(s.dcache.mem_recv, s.mb_recv)
+      s.connect(s.dcache.clean_call, s.clean_cache_call)
+      s.connect(s.cache_busy_, s.dcache.busy_ret)
+      s.connect(s.stats_dcache_hits, s.dcache.stats_hits)
+      s.connect(s.stats_dcache_misses, s.dcache.stats_misses)
+      s.connect(s.stats_dcache_prefetches, s.dcache.stats_prefetches)
+      s.connect(s.stats_dcache_useful_prefetches,
+                s.dcache.stats_useful_prefetches)
+      if ENABLE_DCACHE_PREFETCH:
+        s.prefetcher = StridePrefetcher(
+            StridePrefetcherInterface(s.interface.Addr.nbits),
+            DCACHE_PREFETCH_NENTRIES, DCACHE_PREFETCH_TAG_NBITS,
+            DCACHE_PREFETCH_DISTANCE, clog2(ILEN_BYTES))
+        s.connect_m(s.prefetcher.observe, s.observe_load)
+        s.connect_m(s.prefetcher.prefetch, s.dcache.prefetch)
+      else:
+        s.connect(s.dcache.prefetch_call, 0)
+    else:
+      s.connect_m(s.memory_arbiter.mb_send, s.mb_send)
+      s.connect_m(s.memory_arbiter.mb_recv, s.mb_recv)
+      s.connect(s.cache_busy_, 0)
+      s.connect(s.stats_dcache_hits, 0)
+      s.connect(s.stats_dcache_misses, 0)
+      s.connect(s.stats_dcache_prefetches, 0)
+      s.connect(s.stats_dcache_useful_prefetches, 0)
 
+    if ENABLE_STORE_BUFFER:
+      s.store_buffer = StoreBuffer(
+          StoreBufferInterface(s.interface.Addr, s.interface.Size,
+                               s.interface.Data), STORE_BUFFER_NENTRIES,
+          STORE_BUFFER_DRAIN_DELAY)
+      s.connect_m(s.store_buffer.send_store, s.memory_arbiter.send_store)
+      s.connect(s.store_buffer.flush_call, s.clean_cache_call)
+      s.connect(s.store_buffer.check_addr, s.store_pending_addr)
+      s.connect(s.store_buffer.check_size, s.store_pending_size)
+      s.connect(s.store_buffer.check_call, s.buffer_check_)
+      s.connect(s.buffer_pending_, s.store_buffer.check_pending)
+      s.connect(s.buffer_forward_, s.store_buffer.check_forward)
+      s.connect(s.buffer_forward_data_, s.store_buffer.check_forward_data)
+      s.connect(s.buffer_busy_, s.store_buffer.busy_ret)
+      s.connect(s.stats_buffer_stores, s.store_buffer.stats_stores)
+      s.connect(s.stats_buffer_writes, s.store_buffer.stats_writes)
+    else:
+      s.connect(s.buffer_pending_, 0)
+      s.connect(s.buffer_forward_, 0)
+      s.connect(s.buffer_forward_data_, 0)
+      s.connect(s.buffer_busy_, 0)
+      s.connect(s.stats_buffer_stores, 0)
+      s.connect(s.stats_buffer_writes, 0)
+
+    # A fence must also wait for dirty lines to reach memory, so that
+    # fetch (which does not go through this cache) sees the stores
+    @s.combinational
+    def handle_store_acks_outstanding():
+      s.store_acks_outstanding_ret.v = (
+          s.memory_arbiter.store_acks_outstanding_ret or s.cache_busy_ or
+          s.buffer_busy_)
+
+    nslots = s.interface.nslots
     s.overlapped_and_live = [Wire(1) for _ in range(s.interface.nslots)]
     # PYMTL_BROKEN for some reason reduce_or verilates, but then the C++ fails to compile
     s.or_ = Or(LogicOperatorInterface(s.interface.nslots))
@@ -190,7 +372,272 @@ class MemoryFlowManager(Model):
             i].check_disjoint and s.store_pending_live_mask[
                 i] and s.address_valid_table.dump_out[i]
 
-    s.connect(s.store_pending_pending, s.or_.op_out)
+    # Stores issue in order, so they enter their addresses in program order.
+    # Bit j of entered_before[i] is set if store j entered its address
+    # before store i did. Every live store with an address is older than
+    # the load asking.
+    s.entered_before = [
+        Register(RegisterInterface(Bits(nslots)), reset_value=0)
+        for _ in range(nslots)
+    ]
+    s.enter_onehot = OneHotEncoder(nslots)
+    s.connect(s.enter_onehot.encode_number, s.enter_store_address_id_)
+    s.overlapped_and_live_mask = Wire(nslots)
+    s.slot_onehot = [Wire(nslots) for _ in range(nslots)]
+    s.youngest = [Wire(1) for _ in range(nslots)]
+    s.offset = [Wire(s.interface.Addr) for _ in range(nslots)]
+    s.load_end = [Wire(s.interface.Size) for _ in range(nslots)]
+    s.covers = [Wire(1) for _ in range(nslots)]
+    s.can_forward = [Wire(1) for _ in range(nslots)]
+    s.forward_shamt = [
+        Wire(clog2(s.interface.max_size) + 3) for _ in range(nslots)
+    ]
+    # PYMTL_BROKEN
+    s.dump_addr = [Wire(s.interface.Addr) for _ in range(nslots)]
+    s.dump_size = [Wire(s.interface.Size) for _ in range(nslots)]
+    s.dump_data = [Wire(s.interface.Data) for _ in range(nslots)]
+    s.dump_data_valid = [Wire(1) for _ in range(nslots)]
+
+    for i in range(nslots):
+      s.connect(s.slot_onehot[i], 1 << i)
+      s.connect(s.dump_addr[i], s.store_address_table.dump_out[i].addr)
+      s.connect(s.dump_size[i], s.store_address_table.dump_out[i].size)
+      s.connect(s.dump_data[i], s.store_data_table.dump_out[i])
+      s.connect(s.dump_data_valid[i], s.data_valid_table.dump_out[i])
+
+      @s.combinational
+      def collect_overlapped(i=i):
+        s.overlapped_and_live_mask[i].v = s.overlapped_and_live[i]
+
+      @s.combinational
+      def update_entered_before(i=i):
+        if s.enter_store_address_call and s.enter_store_address_id_ == i:
+          s.entered_before[i].write_data.v = ~s.slot_onehot[i]
+        elif s.enter_store_address_call:
+          s.entered_before[i].write_data.v = s.entered_before[i].read_data & (
+              ~s.enter_onehot.encode_onehot)
+        else:
+          s.entered_before[i].write_data.v = s.entered_before[i].read_data
+
+      @s.combinational
+      def check_forward(i=i,
+                        size_nbits=s.interface.Size.nbits,
+                        max_size=s.interface.max_size,
+                        offset_nbits=clog2(s.interface.max_size)):
+        s.youngest[i].v = s.overlapped_and_live[i] and (
+            s.overlapped_and_live_mask & ~s.entered_before[i].read_data
+            & ~s.slot_onehot[i]) == 0
+        # The load must lie entirely inside the store
+        s.offset[i].v = s.store_pending_addr - s.dump_addr[i]
+        s.load_end[i].v = s.offset[i][0:size_nbits] + s.store_pending_size
+        s.covers[
+            i].v = s.offset[i] < max_size and s.load_end[i] <= s.dump_size[i]
+        s.can_forward[
+            i].v = s.youngest[i] and s.covers[i] and s.dump_data_valid[i]
+        s.forward_shamt[i].v = 0
+        s.forward_shamt[i][3:offset_nbits + 3].v = s.offset[i][0:offset_nbits]
+
+    # The store buffer only matters if no live store overlaps
+    @s.combinational
+    def compute_buffer_check():
+      s.buffer_check_.v = s.store_pending_active and not s.or_.op_out
+
+    @s.combinational
+    def handle_store_pending():
+      s.store_pending_forward.v = 0
+      s.store_pending_forward_data.v = 0
+      for i in range(nslots):
+        if s.can_forward[i]:
+          s.store_pending_forward.v = 1
+          s.store_pending_forward_data.v = s.dump_data[i] >> s.forward_shamt[i]
+      # Only stall if the youngest overlapping store cannot forward
+      if s.or_.op_out:
+        s.store_pending_pending.v = not s.store_pending_forward
+      else:
+        # Committed stores in the store buffer are older than any live one
+        s.store_pending_forward.v = s.buffer_forward_
+        s.store_pending_forward_data.v = s.buffer_forward_data_
+        s.store_pending_pending.v = s.buffer_pending_
+
+    s.forwarded = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+
+    @s.combinational
+    def count_forwarded():
+      s.forwarded.write_call.v = s.store_pending_call and s.store_pending_forward
+      s.forwarded.write_data.v = s.forwarded.read_data + 1
+
+    s.connect(s.stats_forwarded, s.forwarded.read_data)
+
+    # Live stores older than the load without an address, which the load
+    # might be issuing ahead of. The live mask also has stores younger than
+    # the load, so each store's seq is kept to compare ages with the load
+    s.address_valid_mask = Wire(nslots)
+    s.store_seq = [
+        Register(RegisterInterface(s.interface.Seq, enable=True))
+        for _ in range(nslots)
+    ]
+    s.pending_age = Wire(s.interface.Seq)
+    s.store_seq_age = [Wire(s.interface.Seq) for _ in range(nslots)]
+    s.older_mask = Wire(nslots)
+    s.unresolved_mask = Wire(nslots)
+
+    @s.combinational
+    def compute_pending_age():
+      s.pending_age.v = s.store_pending_seq - s.cflow_get_head_seq
+
+    for i in range(nslots):
+      s.connect(s.store_seq[i].write_data, s.register_store_seq)
+
+      @s.combinational
+      def collect_address_valid(i=i):
+        s.address_valid_mask[i].v = s.address_valid_table.dump_out[i]
+        s.store_seq[i].write_call.v = (
+            s.register_store_call and s.register_store_id_ == i)
+        s.store_seq_age[i].v = s.store_seq[i].read_data - s.cflow_get_head_seq
+        s.older_mask[i].v = s.store_seq_age[i] < s.pending_age
+
+    @s.combinational
+    def handle_unresolved():
+      s.unresolved_mask.v = (
+          s.store_pending_live_mask & s.older_mask & ~s.address_valid_mask)
+      s.store_pending_unresolved.v = s.unresolved_mask != 0
+
+    # The store wait table, indexed by load PC
+    pred_nbits = clog2(MEM_DEP_PRED_SIZE)
+    s.store_wait_table = RegisterFile(
+        Bits(1), MEM_DEP_PRED_SIZE, s.interface.num_predict, 1, False, False,
+        [0] * MEM_DEP_PRED_SIZE)
+    for i in range(s.interface.num_predict):
+
+      @s.combinational
+      def handle_store_wait(i=i, pred_nbits=pred_nbits):
+        s.store_wait_table.read_addr[i].v = s.store_wait_pc[i][2:2 + pred_nbits]
+        s.store_wait_wait[i].v = s.store_wait_table.read_data[i]
+
+    s.clear_counter = Register(
+        RegisterInterface(Bits(MEM_DEP_CLEAR_NBITS)), reset_value=0)
+
+    @s.combinational
+    def handle_clear(last=2**MEM_DEP_CLEAR_NBITS - 1):
+      s.clear_counter.write_data.v = s.clear_counter.read_data + 1
+      s.store_wait_table.set_call.v = s.clear_counter.read_data == last
+
+    for port in s.store_wait_table.set_in_:
+      s.connect(port, 0)
+
+    # Loads issued ahead of stores. Bit j of load_stores[i] is set while
+    # store j had no address when load i issued, and has not entered one
+    # since. An entry is free once all its bits are clear. Store j leaving
+    # and its ID being registered again also clears the bit.
+    nloads = MEM_DEP_NLOADS
+    s.load_stores = [
+        Register(RegisterInterface(Bits(nslots)), reset_value=0)
+        for _ in range(nloads)
+    ]
+    s.load_addr = [
+        Register(RegisterInterface(s.interface.Addr, enable=True))
+        for _ in range(nloads)
+    ]
+    s.load_size = [
+        Register(RegisterInterface(s.interface.Size, enable=True))
+        for _ in range(nloads)
+    ]
+    s.load_seq = [
+        Register(RegisterInterface(s.interface.Seq, enable=True))
+        for _ in range(nloads)
+    ]
+    s.load_pred_idx = [
+        Register(RegisterInterface(Bits(pred_nbits), enable=True))
+        for _ in range(nloads)
+    ]
+    s.load_checkers = [
+        OverlapChecker(
+            OverlapCheckerInterface(s.interface.Addr.nbits,
+                                    s.interface.max_size))
+        for _ in range(nloads)
+    ]
+    s.register_onehot = OneHotEncoder(nslots)
+    s.connect(s.register_onehot.encode_number, s.register_store_id_)
+    s.load_free = Wire(nloads)
+    s.load_arbiter = PriorityArbiter(ArbiterInterface(nloads))
+    s.connect(s.load_arbiter.grant_reqs, s.load_free)
+    s.track_mask = Wire(nslots)
+    s.clear_mask = Wire(nslots)
+    s.track_pred_idx = Wire(pred_nbits)
+    s.store_age = Wire(s.interface.Seq)
+    s.load_age = [Wire(s.interface.Seq) for _ in range(nloads)]
+    s.load_violated = [Wire(1) for _ in range(nloads)]
+
+    @s.combinational
+    def handle_track_load(pred_nbits=pred_nbits):
+      s.track_load_rdy.v = s.load_arbiter.grant_grant != 0
+      s.track_mask.v = s.unresolved_mask
+      s.track_pred_idx.v = s.track_load_pc[2:2 + pred_nbits]
+      s.store_age.v = s.enter_store_address_seq - s.cflow_get_head_seq
+      s.clear_mask.v = 0
+      if s.enter_store_address_call and s.register_store_call:
+        s.clear_mask.v = (
+            s.enter_onehot.encode_onehot | s.register_onehot.encode_onehot)
+      elif s.enter_store_address_call:
+        s.clear_mask.v = s.enter_onehot.encode_onehot
+      elif s.register_store_call:
+        s.clear_mask.v = s.register_onehot.encode_onehot
+
+    for i in range(nloads):
+      s.connect(s.load_checkers[i].check_base_a, s.enter_store_address_addr)
+      s.connect(s.load_checkers[i].check_size_a, s.enter_store_address_size)
+      s.connect(s.load_checkers[i].check_base_b, s.load_addr[i].read_data)
+      s.connect(s.load_checkers[i].check_size_b, s.load_size[i].read_data)
+      s.connect(s.load_addr[i].write_data, s.track_load_addr)
+      s.connect(s.load_size[i].write_data, s.track_load_size)
+      s.connect(s.load_seq[i].write_data, s.track_load_seq)
+      s.connect(s.load_pred_idx[i].write_data, s.track_pred_idx)
+
+      @s.combinational
+      def update_load(i=i):
+        s.load_free[i].v = s.load_stores[i].read_data == 0
+        s.load_age[i].v = s.load_seq[i].read_data - s.cflow_get_head_seq
+        # Only a load younger than the store can have read stale data
+        s.load_violated[i].v = (
+            s.enter_store_address_call and
+            (s.load_stores[i].read_data & s.enter_onehot.encode_onehot) != 0 and
+            not s.load_checkers[i].check_disjoint and
+            s.load_age[i] > s.store_age)
+
+        s.load_addr[i].write_call.v = 0
+        if s.track_load_call and s.load_arbiter.grant_grant[i]:
+          s.load_addr[i].write_call.v = 1
+          s.load_stores[i].write_data.v = s.track_mask
+        else:
+          s.load_stores[
+              i].write_data.v = s.load_stores[i].read_data & ~s.clear_mask
+        s.load_size[i].write_call.v = s.load_addr[i].write_call
+        s.load_seq[i].write_call.v = s.load_addr[i].write_call
+        s.load_pred_idx[i].write_call.v = s.load_addr[i].write_call
+
+    # Train on the violating load
+    @s.combinational
+    def handle_violation(nloads=nloads):
+      s.enter_store_address_violation.v = 0
+      s.store_wait_table.write_addr[0].v = 0
+      for i in range(nloads):
+        if s.load_violated[i]:
+          s.enter_store_address_violation.v = 1
+          s.store_wait_table.write_addr[0].v = s.load_pred_idx[i].read_data
+      s.store_wait_table.write_call[0].v = s.enter_store_address_violation
+
+    s.connect(s.store_wait_table.write_data[0], 1)
+
+    s.violations = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+
+    @s.combinational
+    def count_violations():
+      s.violations.write_call.v = s.enter_store_address_violation
+      s.violations.write_data.v = s.violations.read_data + 1
+
+    s.connect(s.stats_violations, s.violations.read_data)
 
     s.connect(s.address_valid_table.write_call[0], s.register_store_call)
     s.connect(s.address_valid_table.write_addr[0], s.register_store_id_)
@@ -220,13 +667,23 @@ class MemoryFlowManager(Model):
     s.connect_m(s.memory_arbiter.send_load, s.send_load)
     s.connect(s.store_address_table.read_addr[0], s.send_store_id_)
     s.connect(s.store_data_table.read_addr[0], s.send_store_id_)
-    s.connect(s.memory_arbiter.send_store_addr,
-              s.store_address_table.read_data[0].addr)
-    s.connect(s.memory_arbiter.send_store_size,
-              s.store_address_table.read_data[0].size)
-    s.connect(s.memory_arbiter.send_store_data, s.store_data_table.read_data[0])
-    s.connect(s.memory_arbiter.send_store_call, s.send_store_call)
-    s.connect(s.send_store_rdy, s.memory_arbiter.send_store_rdy)
+    if ENABLE_STORE_BUFFER:
+      s.connect(s.store_buffer.enqueue_addr,
+                s.store_address_table.read_data[0].addr)
+      s.connect(s.store_buffer.enqueue_size,
+                s.store_address_table.read_data[0].size)
+      s.connect(s.store_buffer.enqueue_data, s.store_data_table.read_data[0])
+      s.connect(s.store_buffer.enqueue_call, s.send_store_call)
+      s.connect(s.send_store_rdy, s.store_buffer.enqueue_rdy)
+    else:
+      s.connect(s.memory_arbiter.send_store_addr,
+                s.store_address_table.read_data[0].addr)
+      s.connect(s.memory_arbiter.send_store_size,
+                s.store_address_table.read_data[0].size)
+      s.connect(s.memory_arbiter.send_store_data,
+                s.store_data_table.read_data[0])
+      s.connect(s.memory_arbiter.send_store_call, s.send_store_call)
+      s.connect(s.send_store_rdy, s.memory_arbiter.send_store_rdy)
 
     s.connect(s.data_valid_table.read_addr[0], s.store_data_available_id_)
     s.connect(s.store_data_available_ret, s.data_valid_table.read_data[0])
@@ -107,8 +107,16 @@ def FrontendHeader():
       Field('status', PipelineMsgStatus.bits),
       Field('pc', XLEN),
       Field('fence', 1),
+      # Set for fence.i, which also flushes the instruction cache
+      Field('fence_i', 1),
       Field('replay', 1),
       Field('replay_next', 1),
+      # The global history used to predict this instruction
+      Field('pred_hist', BPRED_HIST_NBITS),
+      # The return address stack pointer after this instruction
+      Field('ras_tos', RAS_IDX_NBITS),
+      # Set if this is 2 instructions fused together in decode
+      Field('fused', 1),
   ]
 
 
@@ -159,6 +167,9 @@ def AluMsg():
       Field('func', AluFunc.bits),
       Field('op32', 1),
       Field('unsigned', 1),
+      # The low 12 bits of a fused lui/auipc and addi, ORed into the
+      # shifted immediate
+      Field('fused_imm', 12),
   ]
 
 
@@ -201,6 +212,8 @@ def MemMsg():
       Field('func', MemFunc.bits),
       Field('unsigned', 1),
       Field('width', 2),
+      # Set if a load is predicted to depend on an older store
+      Field('store_wait', 1),
   ]
 
 
@@ -277,6 +290,16 @@ def FetchPayload():
 FetchMsg = FrontendMsg(FetchPayload())
 
 
+@bit_struct_generator
+def BtbEntry():
+  return [
+      Field('target', XLEN),
+      # Set for a jump, which is always taken, so the direction predictor
+      # is only used for conditional branches
+      Field('jump', 1),
+  ]
+
+
 @bit_struct_generator
 def DecodePayload():
   return [
@@ -301,6 +324,8 @@ def RenamePayload():
       ValidValuePair('rs2', PREG_IDX_NBITS),
       ValidValuePair('rd', PREG_IDX_NBITS),
       Field('areg_d', AREG_IDX_NBITS),
+      # Set if the result is known at rename, so it skips execution
+      Field('eliminated', 1),
       ExecutionDataGroup,
   ]
 
@@ -315,6 +340,8 @@ def IssuePayload():
       ValidValuePair('rs2', PREG_IDX_NBITS),
       ValidValuePair('rd', PREG_IDX_NBITS),
       Field('areg_d', AREG_IDX_NBITS),
+      # Set if the result is known at rename, so it skips execution
+      Field('eliminated', 1),
       ExecutionDataGroup,
   ]
 
@@ -353,6 +380,8 @@ def WritebackPayload():
   return [
       ValidValuePair('rd', PREG_IDX_NBITS),
       Field('areg_d', AREG_IDX_NBITS),
+      # Set if eliminated at rename, so rd may be shared with a source
+      Field('eliminated', 1),
   ]
 
 
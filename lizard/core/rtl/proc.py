@@ -4,27 +4,33 @@ from lizard.util.rtl.method import MethodSpec
 from lizard.core.rtl.controlflow import ControlFlowManager, ControlFlowManagerInterface
 from lizard.core.rtl.dataflow import DataFlowManager, DataFlowManagerInterface
 from lizard.core.rtl.memoryflow import MemoryFlowManager, MemoryFlowManagerInterface
-from lizard.core.rtl.csr_manager import CSRManager, CSRManagerInterface
-from lizard.util.rtl.cam import RandomReplacementCAM, CAMInterface
+from lizard.core.rtl.csr_manager import CSRManager, CSRManagerInterface, PERF_COUNTERS
+from lizard.util.rtl.cam import SetAssociativeCAM, CAMInterface
+from lizard.util.rtl.issue_queue import ISSUE_QUEUES
+from lizard.mem.rtl.icache import ICache, ICacheInterface
 from lizard.core.rtl.frontend.fetch import Fetch, FetchInterface
+from lizard.core.rtl.frontend.direction_predictor import DIRECTION_PREDICTORS, DirectionPredictorInterface
+from lizard.core.rtl.frontend.indirect_predictor import IndirectPredictor, IndirectPredictorInterface
 from lizard.core.rtl.frontend.decode import Decode, DecodeInterface
 from lizard.core.rtl.backend.rename import Rename, RenameInterface
 from lizard.core.rtl.backend.issue_selector import IssueSelector
-from lizard.core.rtl.backend.issue import Issue, IssueInterface, IssueInOrder, IssueOutOfOrder, IssueOrderedStores
+from lizard.core.rtl.backend.eliminate import Eliminate, EliminateInterface
+from lizard.core.rtl.backend.issue import Issue, IssueInterface, IssueInOrder, IssueOutOfOrder, IssueSpeculativeLoads
 from lizard.core.rtl.backend.dispatch import Dispatch, DispatchInterface
 from lizard.core.rtl.backend.pipe_selector import PipeSelector
 from lizard.core.rtl.backend.alu import ALU
 from lizard.core.rtl.backend.branch import Branch, BranchInterface
 from lizard.core.rtl.backend.csr import CSR, CSRInterface
 from lizard.core.rtl.backend.mem_pipe import MemInterface, Mem, MemDataInterface, MemData
-from lizard.core.rtl.backend.m_pipe import MPipe
-from lizard.core.rtl.pipeline_arbiter import PipelineArbiter, PipelineArbiterInterface
+from lizard.core.rtl.backend.m_pipe import MulPipe
+from lizard.core.rtl.backend.divide import Div
 from lizard.core.rtl.backend.writeback import Writeback, WritebackInterface
 from lizard.core.rtl.backend.commit import Commit, CommitInterface
-from lizard.core.rtl.messages import ExecuteMsg
+from lizard.core.rtl.messages import ExecuteMsg, BtbEntry
 from lizard.core.rtl.kill_unit import KillNotifier, RedirectNotifier
 from lizard.util import line_block
 from lizard.util.line_block import Divider, LineBlock
+from lizard.bitutil import clog2
 from lizard.config.general import *
 
 
@@ -101,23 +107,32 @@ class Proc(Model):
     )
 
     # Dataflow
-    DFLOW_NUM_SRC_PORTS = 2
-    DFLOW_NUM_DST_PORTS = 1
-    DFLOW_NUM_IS_READY_PORTS = 4
-    DFLOW_NUM_FORWARD_PORTS = 1
-    ISSUE_NUM_UDPATED_PORTS = DFLOW_NUM_DST_PORTS + DFLOW_NUM_FORWARD_PORTS
+    DFLOW_NUM_SRC_PORTS = 2 * FRONTEND_WIDTH
+    DFLOW_NUM_DST_PORTS = max(FRONTEND_WIDTH, COMMIT_WIDTH)
+    # is_ready: 2 for each issue queue, and 2 for each issue port to check
+    # the sources again on the way out
+    # read: 2 for each dispatch port
+    DFLOW_NUM_IS_READY_PORTS = 2 * (NUM_ALU_PIPES + 3)
+    DFLOW_OO_CHECK_PORT = 4
+    DFLOW_IO_CHECK_PORT = DFLOW_OO_CHECK_PORT + 2 * NUM_ALU_PIPES
+    # Every ALU forwards its result
+    DFLOW_NUM_FORWARD_PORTS = NUM_ALU_PIPES
+    # Every execution pipe has its own writeback port:
+    # mem, mul_pipe, div_pipe, branch, csr, and the ALUs
+    DFLOW_NUM_WRITE_PORTS = 5 + NUM_ALU_PIPES
+    ISSUE_NUM_UDPATED_PORTS = DFLOW_NUM_WRITE_PORTS + DFLOW_NUM_FORWARD_PORTS
     s.dflow_interface = DataFlowManagerInterface(
         XLEN, AREG_COUNT, PREG_COUNT, MAX_SPEC_DEPTH, STORE_QUEUE_SIZE,
         DFLOW_NUM_SRC_PORTS, DFLOW_NUM_DST_PORTS, DFLOW_NUM_IS_READY_PORTS,
-        DFLOW_NUM_FORWARD_PORTS)
+        DFLOW_NUM_FORWARD_PORTS, DFLOW_NUM_WRITE_PORTS)
     s.dflow = DataFlowManager(s.dflow_interface)
 
     # Control flow
-    s.cflow_interface = ControlFlowManagerInterface(XLEN, INST_IDX_NBITS,
-                                                    SPEC_IDX_NBITS,
-                                                    SPEC_MASK_NBITS,
-                                                    STORE_IDX_NBITS)
+    s.cflow_interface = ControlFlowManagerInterface(
+        XLEN, INST_IDX_NBITS, SPEC_IDX_NBITS, SPEC_MASK_NBITS, STORE_IDX_NBITS,
+        BPRED_HIST_NBITS, RAS_IDX_NBITS, FRONTEND_WIDTH, COMMIT_WIDTH)
     s.cflow = ControlFlowManager(s.cflow_interface, RESET_VECTOR)
+    # Only 1 store is registered per cycle
     s.connect_m(s.cflow.dflow_get_store_id, s.dflow.get_store_id[0])
     s.connect_m(s.cflow.dflow_snapshot, s.dflow.snapshot)
     s.connect_m(s.cflow.dflow_restore, s.dflow.restore)
@@ -125,69 +140,100 @@ class Proc(Model):
     s.connect_m(s.cflow.dflow_rollback, s.dflow.rollback)
 
     # Memory flow
-    s.mflow_interface = MemoryFlowManagerInterface(XLEN, MEM_MAX_SIZE,
-                                                   STORE_QUEUE_SIZE)
+    s.mflow_interface = MemoryFlowManagerInterface(
+        XLEN, MEM_MAX_SIZE, STORE_QUEUE_SIZE, num_predict=FRONTEND_WIDTH)
     s.mflow = MemoryFlowManager(s.mflow_interface, MemMsg)
+    s.connect_m(s.mflow.cflow_get_head, s.cflow.get_head)
     s.connect_m(s.mb_recv_1, s.mflow.mb_recv)
     s.connect_m(s.mb_send_1, s.mflow.mb_send)
 
     # Kill notifier
     s.kill_notifier = KillNotifier(s.cflow_interface.KillArgType)
     s.connect_m(s.kill_notifier.check_kill, s.cflow.check_kill)
-    s.redirect_notifier = RedirectNotifier(XLEN)
+    s.redirect_notifier = RedirectNotifier(XLEN, BPRED_HIST_NBITS,
+                                           RAS_IDX_NBITS)
     s.connect_m(s.redirect_notifier.check_redirect, s.cflow.check_redirect)
 
     # CSR
-    s.csr_interface = CSRManagerInterface(3, 5)
+    s.csr_interface = CSRManagerInterface(4, 6)
     s.csr = CSRManager(s.csr_interface)
     s.connect_m(s.db_recv, s.csr.debug_recv)
     s.connect_m(s.db_send, s.csr.debug_send)
 
     # BTB
-    s.btb = RandomReplacementCAM(CAMInterface(XLEN, XLEN), BTB_SIZE)
+    s.btb = SetAssociativeCAM(
+        CAMInterface(XLEN, BtbEntry(), 2), BTB_NSETS, BTB_NWAYS, key_shift=2)
 
     # Fetch
-    s.fetch_interface = FetchInterface()
-    s.fetch = Fetch(s.fetch_interface, MemMsg, ENABLE_BTB)
-    s.connect_m(s.mb_recv_0, s.fetch.mem_recv)
-    s.connect_m(s.mb_send_0, s.fetch.mem_send)
+    s.fetch_interface = FetchInterface(FRONTEND_WIDTH)
+    s.fetch = Fetch(s.fetch_interface, MemMsg, ENABLE_BTB, ENABLE_BPRED,
+                    ENABLE_ITP, ENABLE_RAS, FETCH_NSLOTS, FETCH_QUEUE_SIZE)
+    if ENABLE_ICACHE:
+      s.icache = ICache(
+          ICacheInterface(MemMsg), ICACHE_NSETS, ICACHE_NWAYS,
+          ICACHE_LINE_NBYTES, ICACHE_PREFETCH_LINES)
+      s.connect_m(s.mb_recv_0, s.icache.mem_recv)
+      s.connect_m(s.mb_send_0, s.icache.mem_send)
+      s.connect_m(s.icache.recv, s.fetch.mem_recv)
+      s.connect_m(s.icache.send, s.fetch.mem_send)
+    else:
+      s.connect_m(s.mb_recv_0, s.fetch.mem_recv)
+      s.connect_m(s.mb_send_0, s.fetch.mem_send)
     s.connect_m(s.cflow.check_redirect, s.fetch.check_redirect)
     s.connect_m(s.btb.read, s.fetch.btb_read)
+    if ENABLE_BPRED:
+      s.bpred = DIRECTION_PREDICTORS[BPRED_KIND](DirectionPredictorInterface(
+          XLEN, BPRED_HIST_NBITS), BPRED_NENTRIES, clog2(ILEN_BYTES))
+      s.connect_m(s.bpred.predict, s.fetch.bpred_predict)
+    if ENABLE_ITP:
+      s.itp = IndirectPredictor(
+          IndirectPredictorInterface(XLEN, BPRED_HIST_NBITS, 2), ITP_NENTRIES,
+          ITP_TAG_NBITS, clog2(ILEN_BYTES))
+      s.connect_m(s.itp.predict, s.fetch.itp_predict)
 
     # Decode
-    s.decode_interface = DecodeInterface()
+    s.decode_interface = DecodeInterface(FRONTEND_WIDTH)
     s.decode = Decode(s.decode_interface)
     s.connect_m(s.decode.kill_notify, s.redirect_notifier.kill_notify)
     s.connect_m(s.fetch.peek, s.decode.in_peek)
     s.connect_m(s.fetch.take, s.decode.in_take)
 
     # Rename
-    s.rename_interface = RenameInterface()
+    s.rename_interface = RenameInterface(FRONTEND_WIDTH)
     s.rename = Rename(s.rename_interface)
     s.connect_m(s.rename.kill_notify, s.kill_notifier.kill_notify)
     s.connect_m(s.decode.peek, s.rename.in_peek)
     s.connect_m(s.decode.take, s.rename.in_take)
     s.connect_m(s.cflow.register, s.rename.register)
-    s.connect_m(s.dflow.get_src[0], s.rename.get_src[0])
-    s.connect_m(s.dflow.get_src[1], s.rename.get_src[1])
-    s.connect_m(s.dflow.get_dst[0], s.rename.get_dst)
+    s.connect_m(s.dflow.get_src, s.rename.get_src)
+    for i in range(FRONTEND_WIDTH):
+      s.connect_m(s.dflow.get_dst[i], s.rename.get_dst[i])
+    for i in range(FRONTEND_WIDTH, DFLOW_NUM_DST_PORTS):
+      s.connect(s.dflow.get_dst_call[i], 0)
     s.connect_m(s.mflow.register_store, s.rename.mflow_register_store)
+    s.connect_m(s.mflow.store_wait, s.rename.mflow_store_wait)
 
     # Split to normal and mem issue queues
-    s.issue_selector = IssueSelector()
+    # Each issue queue takes 1 instruction per cycle, so instructions from
+    # rename for different queues are taken together
+    s.issue_selector = IssueSelector(FRONTEND_WIDTH)
     s.connect_m(s.issue_selector.in_peek, s.rename.peek)
     s.connect_m(s.issue_selector.in_take, s.rename.take)
 
     # Issue
     ## Out of Order (OO) Issue
-    s.oo_issue_interface = IssueInterface()
+    # Every ALU can be issued to in the same cycle
+    # The mul_pipe wakes up dependents of multiplies early
+    s.oo_issue_interface = IssueInterface(NUM_ALU_PIPES, num_wakeup=1)
     s.oo_issue = Issue(
         s.oo_issue_interface,
         PREG_COUNT,
         NUM_ISSUE_SLOTS,
         ISSUE_NUM_UDPATED_PORTS,
         set_ordered=IssueOutOfOrder,
-        bypass_ready=False)
+        bypass_ready=False,
+        queue=ISSUE_QUEUES[ISSUE_QUEUE_KIND],
+        hold_divides=True)
 
     s.connect_m(s.oo_issue.kill_notify, s.kill_notifier.kill_notify)
     s.connect_m(s.issue_selector.normal_peek, s.oo_issue.in_peek)
@@ -195,16 +241,19 @@ class Proc(Model):
     s.connect_m(s.issue_selector.normal_can_take, s.oo_issue.can_take)
     s.connect_m(s.dflow.is_ready[0], s.oo_issue.is_ready[0])
     s.connect_m(s.dflow.is_ready[1], s.oo_issue.is_ready[1])
+    for i in range(2 * NUM_ALU_PIPES):
+      s.connect_m(s.dflow.is_ready[DFLOW_OO_CHECK_PORT + i],
+                  s.oo_issue.is_ready[2 + i])
     s.connect_m(s.dflow.get_updated, s.oo_issue.get_updated)
 
     ## In Order (IO) Issue (for memory)
-    s.io_issue_interface = IssueInterface()
+    s.io_issue_interface = IssueInterface(1, num_wakeup=1)
     s.io_issue = Issue(
         s.io_issue_interface,
         PREG_COUNT,
         NUM_MEM_ISSUE_SLOTS,
         num_updated=ISSUE_NUM_UDPATED_PORTS,
-        set_ordered=IssueOrderedStores,
+        set_ordered=IssueSpeculativeLoads,
         bypass_ready=False)
     s.connect_m(s.io_issue.kill_notify, s.kill_notifier.kill_notify)
     s.connect_m(s.issue_selector.mem_peek, s.io_issue.in_peek)
@@ -212,40 +261,54 @@ class Proc(Model):
     s.connect_m(s.issue_selector.mem_can_take, s.io_issue.can_take)
     s.connect_m(s.dflow.is_ready[2], s.io_issue.is_ready[0])
     s.connect_m(s.dflow.is_ready[3], s.io_issue.is_ready[1])
+    s.connect_m(s.dflow.is_ready[DFLOW_IO_CHECK_PORT], s.io_issue.is_ready[2])
+    s.connect_m(s.dflow.is_ready[DFLOW_IO_CHECK_PORT + 1],
+                s.io_issue.is_ready[3])
     s.connect_m(s.dflow.get_updated, s.io_issue.get_updated)
 
     # Dispatch
     ## Dispatch OO
     s.oo_dispatch_interface = DispatchInterface()
-    s.oo_dispatch = Dispatch(s.oo_dispatch_interface)
-    s.connect_m(s.oo_dispatch.kill_notify, s.kill_notifier.kill_notify)
-    s.connect_m(s.oo_issue.peek, s.oo_dispatch.in_peek)
-    s.connect_m(s.oo_issue.take, s.oo_dispatch.in_take)
-    s.connect_m(s.dflow.read[0], s.oo_dispatch.read[0])
-    s.connect_m(s.dflow.read[1], s.oo_dispatch.read[1])
+    s.oo_dispatch = [
+        Dispatch(s.oo_dispatch_interface) for _ in range(NUM_ALU_PIPES)
+    ]
+    for i in range(NUM_ALU_PIPES):
+      s.connect_m(s.oo_dispatch[i].kill_notify, s.kill_notifier.kill_notify)
+      s.connect_m(s.oo_issue.peek[i], s.oo_dispatch[i].in_peek)
+      s.connect_m(s.oo_issue.take[i], s.oo_dispatch[i].in_take)
+    s.connect_m(s.dflow.read[0], s.oo_dispatch[0].read[0])
+    s.connect_m(s.dflow.read[1], s.oo_dispatch[0].read[1])
+    for i in range(1, NUM_ALU_PIPES):
+      s.connect_m(s.dflow.read[2 * i + 2], s.oo_dispatch[i].read[0])
+      s.connect_m(s.dflow.read[2 * i + 3], s.oo_dispatch[i].read[1])
 
     ## Dispatch IO
     s.io_dispatch_interface = DispatchInterface()
     s.io_dispatch = Dispatch(s.io_dispatch_interface)
     s.connect_m(s.io_dispatch.kill_notify, s.kill_notifier.kill_notify)
-    s.connect_m(s.io_issue.peek, s.io_dispatch.in_peek)
-    s.connect_m(s.io_issue.take, s.io_dispatch.in_take)
+    s.connect_m(s.io_issue.peek[0], s.io_dispatch.in_peek)
+    s.connect_m(s.io_issue.take[0], s.io_dispatch.in_take)
     s.connect_m(s.dflow.read[2], s.io_dispatch.read[0])
     s.connect_m(s.dflow.read[3], s.io_dispatch.read[1])
 
     # Split
-    # Only OO dispatch needs split - IO dispatch goes straight to mem
+    # Only the first OO dispatch port needs split - the others only carry ALU
+    # instructions, and IO dispatch goes straight to mem
     s.pipe_selector = PipeSelector()
-    s.connect_m(s.pipe_selector.in_peek, s.oo_dispatch.peek)
-    s.connect_m(s.pipe_selector.in_take, s.oo_dispatch.take)
+    s.connect_m(s.pipe_selector.in_peek, s.oo_dispatch[0].peek)
+    s.connect_m(s.pipe_selector.in_take, s.oo_dispatch[0].take)
 
     # Execute
     ## ALU
-    s.alu = ALU()
-    s.connect_m(s.alu.kill_notify, s.kill_notifier.kill_notify)
-    s.connect_m(s.alu.in_peek, s.pipe_selector.alu_peek)
-    s.connect_m(s.alu.in_take, s.pipe_selector.alu_take)
-    s.connect_m(s.alu.forward, s.dflow.forward[0])
+    s.alu = [ALU() for _ in range(NUM_ALU_PIPES)]
+    for i in range(NUM_ALU_PIPES):
+      s.connect_m(s.alu[i].kill_notify, s.kill_notifier.kill_notify)
+      s.connect_m(s.alu[i].forward, s.dflow.forward[i])
+    s.connect_m(s.alu[0].in_peek, s.pipe_selector.alu_peek)
+    s.connect_m(s.alu[0].in_take, s.pipe_selector.alu_take)
+    for i in range(1, NUM_ALU_PIPES):
+      s.connect_m(s.alu[i].in_peek, s.oo_dispatch[i].peek)
+      s.connect_m(s.alu[i].in_take, s.oo_dispatch[i].take)
 
     ## Branch
     s.branch_interface = BranchInterface()
@@ -255,6 +318,10 @@ class Proc(Model):
     s.connect_m(s.branch.in_peek, s.pipe_selector.branch_peek)
     s.connect_m(s.branch.in_take, s.pipe_selector.branch_take)
     s.connect_m(s.btb.write, s.branch.btb_write)
+    if ENABLE_BPRED:
+      s.connect_m(s.bpred.update, s.branch.bpred_update)
+    if ENABLE_ITP:
+      s.connect_m(s.itp.update, s.branch.itp_update)
 
     ## CSR
     s.csr_pipe_interface = CSRInterface()
@@ -265,10 +332,21 @@ class Proc(Model):
     s.connect_m(s.csr_pipe.in_take, s.pipe_selector.csr_take)
 
     ## M Pipe
-    s.m_pipe = MPipe()
-    s.connect_m(s.m_pipe.in_peek, s.pipe_selector.m_pipe_peek)
-    s.connect_m(s.m_pipe.in_take, s.pipe_selector.m_pipe_take)
-    s.connect_m(s.m_pipe.kill_notify, s.kill_notifier.kill_notify)
+    s.mul_pipe = MulPipe()
+    s.connect_m(s.mul_pipe.in_peek, s.pipe_selector.mul_pipe_peek)
+    s.connect_m(s.mul_pipe.in_take, s.pipe_selector.mul_pipe_take)
+    s.connect_m(s.mul_pipe.kill_notify, s.kill_notifier.kill_notify)
+    s.connect_m(s.oo_issue.wakeup[0], s.mul_pipe.wakeup)
+    s.connect_m(s.io_issue.wakeup[0], s.mul_pipe.wakeup)
+
+    # A divide holds the divider for up to XLEN / 2 cycles, so it has its
+    # own pipe and writeback port, and multiplies keep going around it. The
+    # next divide waits in the issue queue while the divider is busy
+    s.div_pipe = Div()
+    s.connect_m(s.div_pipe.in_peek, s.pipe_selector.div_pipe_peek)
+    s.connect_m(s.div_pipe.in_take, s.pipe_selector.div_pipe_take)
+    s.connect_m(s.div_pipe.kill_notify, s.kill_notifier.kill_notify)
+    s.connect_m(s.oo_issue.div_busy, s.div_pipe.busy)
 
     ## Mem
     ### Store Data
@@ -285,51 +363,83 @@ class Proc(Model):
     s.connect_m(s.mem.in_take, s.io_dispatch.take)
     s.connect_m(s.mem.kill_notify, s.kill_notifier.kill_notify)
     s.connect_m(s.mem.store_pending, s.mflow.store_pending)
+    s.connect_m(s.mem.track_load, s.mflow.track_load)
     s.connect_m(s.mem.send_load, s.mflow.send_load)
+    s.connect_m(s.mem.observe_load, s.mflow.observe_load)
     s.connect_m(s.mem.enter_store_address, s.mflow.enter_store_address)
     s.connect_m(s.mem.valid_store_mask, s.dflow.valid_store_mask)
     s.connect_m(s.mem.recv_load, s.mflow.recv_load)
 
-    # Writeback Arbiter
-    s.writeback_arbiter_interface = PipelineArbiterInterface(ExecuteMsg())
-    s.writeback_arbiter = PipelineArbiter(
-        s.writeback_arbiter_interface,
-        ['mem', 'alu', 'm_pipe', 'branch', 'csr'])
-    s.connect_m(s.writeback_arbiter.alu_peek, s.alu.peek)
-    s.connect_m(s.writeback_arbiter.alu_take, s.alu.take)
-    s.connect_m(s.writeback_arbiter.csr_peek, s.csr_pipe.peek)
-    s.connect_m(s.writeback_arbiter.csr_take, s.csr_pipe.take)
-    s.connect_m(s.writeback_arbiter.branch_peek, s.branch.peek)
-    s.connect_m(s.writeback_arbiter.branch_take, s.branch.take)
-    s.connect_m(s.writeback_arbiter.mem_peek, s.mem.peek)
-    s.connect_m(s.writeback_arbiter.mem_take, s.mem.take)
-    s.connect_m(s.writeback_arbiter.m_pipe_peek, s.m_pipe.peek)
-    s.connect_m(s.writeback_arbiter.m_pipe_take, s.m_pipe.take)
-
     # Writeback
+    # Each pipe writes back on its own port, so results never wait on each
+    # other
     s.writeback_interface = WritebackInterface()
-    s.writeback = Writeback(s.writeback_interface)
-    s.connect_m(s.writeback.kill_notify, s.kill_notifier.kill_notify)
-    s.connect_m(s.writeback_arbiter.peek, s.writeback.in_peek)
-    s.connect_m(s.writeback_arbiter.take, s.writeback.in_take)
-    s.connect_m(s.writeback.dataflow_write, s.dflow.write[0])
+    s.writeback = [
+        Writeback(s.writeback_interface) for _ in range(DFLOW_NUM_WRITE_PORTS)
+    ]
+    for i, pipe in enumerate(
+        [s.mem, s.mul_pipe, s.div_pipe, s.branch, s.csr_pipe] + s.alu):
+      s.connect_m(s.writeback[i].kill_notify, s.kill_notifier.kill_notify)
+      s.connect_m(pipe.peek, s.writeback[i].in_peek)
+      s.connect_m(pipe.take, s.writeback[i].in_take)
+      s.connect_m(s.writeback[i].dataflow_write, s.dflow.write[i])
+
+    # Instructions eliminated at rename skip straight to commit
+    s.eliminate = Eliminate(EliminateInterface())
+    s.connect_m(s.eliminate.kill_notify, s.kill_notifier.kill_notify)
+    s.connect_m(s.issue_selector.done_peek, s.eliminate.in_peek)
+    s.connect_m(s.issue_selector.done_take, s.eliminate.in_take)
 
     # Commit
-    s.commit_interface = CommitInterface()
-    s.commit = Commit(s.commit_interface, ROB_SIZE)
+    # The writeback ports, then the eliminate port
+    s.commit_interface = CommitInterface(COMMIT_WIDTH)
+    s.commit = Commit(s.commit_interface, ROB_SIZE, DFLOW_NUM_WRITE_PORTS + 1)
     s.connect_m(s.commit.kill_notify, s.kill_notifier.kill_notify)
-    s.connect_m(s.writeback.peek, s.commit.in_peek)
-    s.connect_m(s.writeback.take, s.commit.in_take)
-    s.connect_m(s.commit.dataflow_commit, s.dflow.commit[0])
-    s.connect_m(s.commit.dataflow_free_store_id, s.dflow.free_store_id)
+    for i in range(DFLOW_NUM_WRITE_PORTS):
+      s.connect_m(s.writeback[i].peek, s.commit.in_peek[i])
+      s.connect_m(s.writeback[i].take, s.commit.in_take[i])
+    s.connect_m(s.eliminate.peek, s.commit.in_peek[DFLOW_NUM_WRITE_PORTS])
+    s.connect_m(s.eliminate.take, s.commit.in_take[DFLOW_NUM_WRITE_PORTS])
+    for i in range(COMMIT_WIDTH):
+      s.connect_m(s.commit.dataflow_commit[i], s.dflow.commit[i])
+    for i in range(COMMIT_WIDTH, DFLOW_NUM_DST_PORTS):
+      s.connect(s.dflow.commit_call[i], 0)
+    s.connect_m(s.commit.dataflow_free_store_id, s.dflow.free_store_id[0])
+    for i in range(1, DFLOW_NUM_DST_PORTS):
+      s.connect(s.dflow.free_store_id_call[i], 0)
+      s.connect(s.dflow.get_store_id_call[i], 0)
     s.connect_m(s.cflow.commit, s.commit.cflow_commit)
     s.connect_m(s.cflow.get_head, s.commit.cflow_get_head)
     s.connect_m(s.commit.send_store, s.mflow.send_store)
     s.connect_m(s.commit.store_acks_outstanding, s.mflow.store_acks_outstanding)
+    s.connect_m(s.commit.clean_cache, s.mflow.clean_cache)
     s.connect_m(s.commit.store_data_available, s.mflow.store_data_available)
     s.connect_m(s.commit.read_csr, s.csr.read)
     s.connect_m(s.commit.write_csr, s.csr.write)
     s.connect_m(s.commit.btb_clear, s.btb.clear)
+    if ENABLE_ICACHE:
+      s.connect_m(s.commit.icache_flush, s.icache.flush)
+
+    # Event counters, read through the mhpmcounters
+    counters = {
+        'dcache_hits': s.mflow.stats_dcache_hits,
+        'dcache_misses': s.mflow.stats_dcache_misses,
+        'dcache_prefetches': s.mflow.stats_dcache_prefetches,
+        'dcache_useful_prefetches': s.mflow.stats_dcache_useful_prefetches,
+        'forwarded_loads': s.mflow.stats_forwarded,
+        'ordering_violations': s.mflow.stats_violations,
+        'store_buffer_stores': s.mflow.stats_buffer_stores,
+        'store_buffer_writes': s.mflow.stats_buffer_writes,
+    }
+    if ENABLE_ICACHE:
+      counters.update({
+          'icache_hits': s.icache.stats_hits,
+          'icache_misses': s.icache.stats_misses,
+          'icache_prefetches': s.icache.stats_prefetches,
+          'icache_useful_prefetches': s.icache.stats_useful_prefetches,
+      })
+    for i, name in enumerate(PERF_COUNTERS):
+      s.connect(s.csr.read_counter_value[i], counters.get(name, 0))
 
   def line_trace(s):
     return line_block.join([
@@ -351,9 +461,9 @@ class Proc(Model):
             ]).normalized().blocks),
         Divider(' | '),
         LineBlock(
+            LineBlock([d.line_trace()
+                       for d in s.oo_dispatch]).normalized().blocks +
             line_block.join([
-                s.oo_dispatch.line_trace(),
-            ]).normalized().blocks + line_block.join([
                 s.io_dispatch.line_trace(),
             ]).normalized().blocks),
         Divider(' |( '),
@@ -361,7 +471,7 @@ class Proc(Model):
             line_block.join([
                 'A',
                 Divider(': '),
-                s.alu.line_trace(),
+                LineBlock([alu.line_trace() for alu in s.alu]),
                 Divider(' '),
                 'B',
                 Divider(': '),
@@ -377,14 +487,19 @@ class Proc(Model):
                 Divider(' '),
                 'M',
                 Divider(': '),
-                s.m_pipe.line_trace(),
+                s.mul_pipe.line_trace(),
+                Divider(' '),
+                'D',
+                Divider(': '),
+                s.div_pipe.line_trace(),
             ]).normalized().blocks + line_block.join([
                 'm',
                 Divider(': '),
                 s.mem.line_trace(),
             ]).normalized().blocks),
         Divider(' )| '),
-        s.writeback.line_trace(),
+        LineBlock([wb.line_trace() for wb in s.writeback] +
+                  [s.eliminate.line_trace()]),
         Divider(' | '),
         s.commit.line_trace()
     ])
@@ -23,9 +23,15 @@ class ProcTestHarness(Model):
                vcd_file,
                use_cached_verilated=False,
                imem_delay=0,
-               dmem_delay=0):
-    s.mbi = MemoryBusInterface(2, 1, 2, 64, 8)
-    s.tmb = TestMemoryBusFL(s.mbi, initial_mem, [imem_delay, dmem_delay])
+               dmem_delay=0,
+               dmem_jitter=0):
+    s.mbi = MemoryBusInterface(2, 2, 2, 64, 8)
+    # Both ports are pipelined, so fetch can have all its requests in
+    # flight at once, and so can the loads and cache misses on the data
+    # port. Only the data port may answer out of order
+    s.tmb = TestMemoryBusFL(s.mbi, initial_mem, [imem_delay, dmem_delay],
+                            [FETCH_NSLOTS, 2**s.mbi.opaque_nbits],
+                            [0, dmem_jitter])
     s.mb = wrap_to_rtl(s.tmb)
 
     s.dbi = ProcDebugBusInterface(XLEN)
@@ -58,7 +64,8 @@ def run_mem_image(mem_image,
                   trace,
                   use_cached_verilated=False,
                   imem_delay=0,
-                  dmem_delay=0):
+                  dmem_delay=0,
+                  dmem_jitter=0):
 
   def tp(thing):
     if trace:
@@ -90,7 +97,8 @@ def run_mem_image(mem_image,
       vcd_file,
       use_cached_verilated=use_cached_verilated,
       imem_delay=imem_delay,
-      dmem_delay=dmem_delay)
+      dmem_delay=dmem_delay,
+      dmem_jitter=dmem_jitter)
   dut = wrap_to_cl(pth)
 
   curr = 0
@@ -128,11 +136,34 @@ def test_proc2mngr_handler(received_msg, proc2mngr_data, curr):
     return None
 
 
-def mem_image_test(mem_image, translate, vcd_file, max_cycles=200000):
-  run_mem_image(mem_image, translate, vcd_file, max_cycles,
-                test_proc2mngr_handler, True)
-
-
-def asm_test(asm, translate, vcd_file, max_cycles=200000):
+def mem_image_test(mem_image,
+                   translate,
+                   vcd_file,
+                   max_cycles=200000,
+                   dmem_delay=0,
+                   dmem_jitter=0):
+  run_mem_image(
+      mem_image,
+      translate,
+      vcd_file,
+      max_cycles,
+      test_proc2mngr_handler,
+      True,
+      dmem_delay=dmem_delay,
+      dmem_jitter=dmem_jitter)
+
+
+def asm_test(asm,
+             translate,
+             vcd_file,
+             max_cycles=200000,
+             dmem_delay=0,
+             dmem_jitter=0):
   mem_image = assembler.assemble(asm)
-  mem_image_test(mem_image, translate, vcd_file, max_cycles=max_cycles)
+  mem_image_test(
+      mem_image,
+      translate,
+      vcd_file,
+      max_cycles=max_cycles,
+      dmem_delay=dmem_delay,
+      dmem_jitter=dmem_jitter)
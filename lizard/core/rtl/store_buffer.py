@@ -0,0 +1,470 @@
+from pymtl import *
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.arbiters import ArbiterInterface, PriorityArbiter
+from lizard.bitutil import clog2
+
+
+class StoreBufferInterface(Interface):
+
+  def __init__(s, Addr, Size, Data, counter_nbits=64):
+    s.Addr = Addr
+    s.Size = Size
+    s.Data = Data
+    s.Counter = Bits(counter_nbits)
+
+    super(StoreBufferInterface, s).__init__([
+        MethodSpec(
+            'enqueue',
+            args={
+                'addr': s.Addr,
+                'size': s.Size,
+                'data': s.Data,
+            },
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'check',
+            args={
+                'addr': s.Addr,
+                'size': s.Size,
+            },
+            rets={
+                'pending': Bits(1),
+                'forward': Bits(1),
+                'forward_data': s.Data,
+            },
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'flush',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'busy',
+            args=None,
+            rets={
+                'ret': Bits(1),
+            },
+            call=False,
+            rdy=False,
+        ),
+        MethodSpec(
+            'stats',
+            args=None,
+            rets={
+                'stores': s.Counter,
+                'writes': s.Counter,
+            },
+            call=False,
+            rdy=False,
+        ),
+    ])
+
+
+class StoreBuffer(Model):
+  """Holds committed stores, merging them into aligned words.
+
+  Each entry is a word of the data width, with a mask of the bytes stores
+  have written. A store is merged into the entry for its word if there is
+  one, and takes a free entry otherwise. enqueue is not ready if neither
+  exists. A store crossing a word boundary waits for the buffer to empty,
+  so no entry is older than it. Its bytes in the first word go straight to
+  send_store, and the rest take a free entry for the next word, so no
+  write crosses a word boundary.
+
+  An entry drains once it is full, drain_delay cycles after it was taken,
+  when no entry is free, or while flush is called. Entries a load is
+  waiting on drain first, straight away. The memory bus has no
+  byte mask, so each write is the largest naturally aligned run of
+  written bytes, and a full entry goes out as a single write. An entry is
+  free again once all its bytes are written.
+
+  check looks up a load. forward is set if a single entry holds all the
+  bytes of the load, with the data shifted down like forwarding from the
+  store queue. pending is set if an entry holds some of the bytes but
+  cannot forward, in which case the load must wait for it to drain. The
+  arguments are looked up whether or not check is called, but only a call
+  marks the load as waiting.
+  """
+
+  def __init__(s, interface, nentries, drain_delay):
+    UseInterface(s, interface)
+    addr_nbits = s.interface.Addr.nbits
+    size_nbits = s.interface.Size.nbits
+    data_nbits = s.interface.Data.nbits
+    nbytes = data_nbits // 8
+    offset_nbits = clog2(nbytes)
+    Word = Bits(addr_nbits - offset_nbits)
+    Mask = Bits(nbytes)
+    Age = Bits(clog2(drain_delay + 1))
+    full_mask = (1 << nbytes) - 1
+    full_entries = (1 << nentries) - 1
+
+    s.require(
+        MethodSpec(
+            'send_store',
+            args={
+                'addr': s.interface.Addr,
+                'size': s.interface.Size,
+                'data': s.interface.Data,
+            },
+            rets=None,
+            call=True,
+            rdy=True,
+        ))
+
+    s.words = [
+        Register(RegisterInterface(Word, enable=True)) for _ in range(nentries)
+    ]
+    s.data = [
+        Register(RegisterInterface(s.interface.Data, enable=True))
+        for _ in range(nentries)
+    ]
+    s.masks = [
+        Register(RegisterInterface(Mask), reset_value=0)
+        for _ in range(nentries)
+    ]
+    # Cycles since the entry was taken, saturating at drain_delay
+    s.ages = [
+        Register(RegisterInterface(Age), reset_value=0) for _ in range(nentries)
+    ]
+    s.alloc_arbiter = PriorityArbiter(ArbiterInterface(nentries))
+    s.drain_arbiter = PriorityArbiter(ArbiterInterface(nentries))
+
+    # The aligned runs of bytes which can be written at once. A later one
+    # is preferred, so they go from the smallest to the largest, and from
+    # the highest offset to the lowest
+    chunks = []
+    size = 1
+    while size <= nbytes:
+      for offset in range(nbytes - size, -1, -size):
+        chunks.append((offset, size))
+      size *= 2
+    nchunks = len(chunks)
+    s.chunk_mask_ = [Wire(Mask) for _ in range(nchunks)]
+    s.chunk_offset_ = [Wire(offset_nbits) for _ in range(nchunks)]
+    s.chunk_size_ = [Wire(size_nbits) for _ in range(nchunks)]
+    for k, (offset, size) in enumerate(chunks):
+      s.connect(s.chunk_mask_[k], ((1 << size) - 1) << offset)
+      s.connect(s.chunk_offset_[k], offset)
+      s.connect(s.chunk_size_[k], size)
+
+    # PYMTL_BROKEN
+    s.entry_word_ = [Wire(Word) for _ in range(nentries)]
+    s.entry_data_ = [Wire(s.interface.Data) for _ in range(nentries)]
+    s.entry_mask_ = [Wire(Mask) for _ in range(nentries)]
+    s.entry_age_ = [Wire(Age) for _ in range(nentries)]
+    for i in range(nentries):
+      s.connect(s.entry_word_[i], s.words[i].read_data)
+      s.connect(s.entry_data_[i], s.data[i].read_data)
+      s.connect(s.entry_mask_[i], s.masks[i].read_data)
+      s.connect(s.entry_age_[i], s.ages[i].read_data)
+
+    s.valid_ = [Wire(1) for _ in range(nentries)]
+    s.free_mask_ = Wire(nentries)
+    s.any_free_ = Wire(1)
+
+    for i in range(nentries):
+
+      @s.combinational
+      def compute_valid(i=i):
+        s.valid_[i].v = s.entry_mask_[i] != 0
+        s.free_mask_[i].v = not s.valid_[i]
+
+    @s.combinational
+    def compute_any_free():
+      s.any_free_.v = s.free_mask_ != 0
+      s.busy_ret.v = s.free_mask_ != full_entries
+
+    # Enqueue
+    s.enq_offset_ = Wire(offset_nbits)
+    s.enq_word_ = Wire(Word)
+    s.enq_end_ = Wire(size_nbits + 1)
+    s.enq_cross_ = Wire(1)
+    # The number of bytes of a crossing store in each word
+    s.enq_high_size_ = Wire(size_nbits + 1)
+    s.enq_low_size_ = Wire(size_nbits)
+    # The word the entry is written for: the next one for a crossing store
+    s.enq_entry_word_ = Wire(Word)
+    s.enq_base_mask_ = Wire(Mask)
+    s.enq_mask_ = Wire(Mask)
+    s.enq_shamt_ = Wire(offset_nbits + 3)
+    s.enq_shifted_ = Wire(s.interface.Data)
+    # The mask and data shifted across 2 words, so the part shifted out of
+    # the first word lands in the upper half
+    s.enq_wide_base_mask_ = Wire(2 * nbytes)
+    s.enq_wide_mask_ = Wire(2 * nbytes)
+    s.enq_wide_data_ = Wire(2 * data_nbits)
+    s.enq_wide_shifted_ = Wire(2 * data_nbits)
+    s.connect(s.enq_wide_base_mask_[0:nbytes], s.enq_base_mask_)
+    s.connect(s.enq_wide_base_mask_[nbytes:2 * nbytes], 0)
+    s.connect(s.enq_wide_data_[0:data_nbits], s.enqueue_data)
+    s.connect(s.enq_wide_data_[data_nbits:2 * data_nbits], 0)
+    s.match_ = [Wire(1) for _ in range(nentries)]
+    s.match_mask_ = Wire(nentries)
+    s.any_match_ = Wire(1)
+    s.target_data_ = Wire(s.interface.Data)
+    s.merged_ = Wire(s.interface.Data)
+    s.write_ = [Wire(1) for _ in range(nentries)]
+    s.connect(s.alloc_arbiter.grant_reqs, s.free_mask_)
+
+    @s.combinational
+    def split_enqueue_addr(lo=offset_nbits, hi=addr_nbits):
+      s.enq_offset_.v = s.enqueue_addr[0:lo]
+      s.enq_word_.v = s.enqueue_addr[lo:hi]
+      s.enq_end_.v = s.enq_offset_ + s.enqueue_size
+      s.enq_cross_.v = s.enq_end_ > nbytes
+      s.enq_high_size_.v = s.enq_end_ - nbytes
+      s.enq_low_size_.v = s.enqueue_size - s.enq_high_size_
+      if s.enq_cross_:
+        s.enq_entry_word_.v = s.enq_word_ + 1
+      else:
+        s.enq_entry_word_.v = s.enq_word_
+      s.enq_shamt_.v = 0
+      s.enq_shamt_[3:offset_nbits + 3].v = s.enq_offset_
+      s.enq_wide_shifted_.v = s.enq_wide_data_ << s.enq_shamt_
+      if s.enq_cross_:
+        s.enq_shifted_.v = s.enq_wide_shifted_[data_nbits:2 * data_nbits]
+      else:
+        s.enq_shifted_.v = s.enq_wide_shifted_[0:data_nbits]
+
+    @s.combinational
+    def compute_enqueue_mask():
+      if s.enqueue_size == 1:
+        s.enq_base_mask_.v = 0x1
+      elif s.enqueue_size == 2:
+        s.enq_base_mask_.v = 0x3
+      elif s.enqueue_size == 4:
+        s.enq_base_mask_.v = 0xf
+      else:
+        s.enq_base_mask_.v = full_mask
+      s.enq_wide_mask_.v = s.enq_wide_base_mask_ << s.enq_offset_
+      if s.enq_cross_:
+        s.enq_mask_.v = s.enq_wide_mask_[nbytes:2 * nbytes]
+      else:
+        s.enq_mask_.v = s.enq_wide_mask_[0:nbytes]
+
+    for i in range(nentries):
+
+      @s.combinational
+      def compute_match(i=i):
+        s.match_[i].v = s.valid_[i] and s.entry_word_[i] == s.enq_entry_word_
+        s.match_mask_[i].v = s.match_[i]
+
+    @s.combinational
+    def select_target():
+      s.any_match_.v = s.match_mask_ != 0
+      s.target_data_.v = 0
+      for i in range(nentries):
+        if s.match_[i]:
+          s.target_data_.v = s.entry_data_[i]
+      if s.enq_cross_:
+        s.enqueue_rdy.v = s.free_mask_ == full_entries and s.send_store_rdy
+      else:
+        s.enqueue_rdy.v = s.any_match_ or s.any_free_
+
+    for b in range(nbytes):
+
+      @s.combinational
+      def merge_byte(lo=b * 8, hi=b * 8 + 8, b=b):
+        if s.enq_mask_[b]:
+          s.merged_[lo:hi].v = s.enq_shifted_[lo:hi]
+        else:
+          s.merged_[lo:hi].v = s.target_data_[lo:hi]
+
+    # Drain
+    s.ready_ = Wire(nentries)
+    s.urgent_ = Wire(nentries)
+    s.eligible_ = Wire(nentries)
+    s.drain_ = [Wire(1) for _ in range(nentries)]
+    s.kept_mask_ = [Wire(Mask) for _ in range(nentries)]
+    s.drain_word_ = Wire(Word)
+    s.drain_data_ = Wire(s.interface.Data)
+    s.drain_mask_ = Wire(Mask)
+    s.drain_offset_ = Wire(offset_nbits)
+    s.drain_size_ = Wire(size_nbits)
+    s.drain_clear_ = Wire(Mask)
+    s.drain_shamt_ = Wire(offset_nbits + 3)
+    s.drain_call_ = Wire(1)
+    s.connect(s.drain_arbiter.grant_reqs, s.eligible_)
+
+    for i in range(nentries):
+
+      @s.combinational
+      def compute_ready(i=i):
+        s.ready_[i].v = s.valid_[i] and (s.entry_mask_[i] == full_mask or
+                                         s.entry_age_[i] == drain_delay or
+                                         not s.any_free_ or s.flush_call)
+
+    @s.combinational
+    def compute_eligible():
+      if s.urgent_ != 0:
+        s.eligible_.v = s.urgent_
+      else:
+        s.eligible_.v = s.ready_
+
+    @s.combinational
+    def select_drain():
+      s.drain_word_.v = 0
+      s.drain_data_.v = 0
+      s.drain_mask_.v = 0
+      for i in range(nentries):
+        if s.drain_arbiter.grant_grant[i]:
+          s.drain_word_.v = s.entry_word_[i]
+          s.drain_data_.v = s.entry_data_[i]
+          s.drain_mask_.v = s.entry_mask_[i]
+
+    @s.combinational
+    def select_chunk():
+      s.drain_offset_.v = 0
+      s.drain_size_.v = 0
+      s.drain_clear_.v = 0
+      for k in range(nchunks):
+        if (s.drain_mask_ & s.chunk_mask_[k]) == s.chunk_mask_[k]:
+          s.drain_offset_.v = s.chunk_offset_[k]
+          s.drain_size_.v = s.chunk_size_[k]
+          s.drain_clear_.v = s.chunk_mask_[k]
+      s.drain_shamt_.v = 0
+      s.drain_shamt_[3:offset_nbits + 3].v = s.drain_offset_
+
+    @s.combinational
+    def handle_send_store(lo=offset_nbits, hi=addr_nbits):
+      s.drain_call_.v = 0
+      s.send_store_addr.v = 0
+      s.send_store_size.v = 0
+      s.send_store_data.v = 0
+      if s.enqueue_call and s.enq_cross_:
+        # The bytes in the first word. The low bytes of the data are the
+        # ones at enqueue_addr, so it needs no shifting
+        s.send_store_call.v = 1
+        s.send_store_addr.v = s.enqueue_addr
+        s.send_store_size.v = s.enq_low_size_
+        s.send_store_data.v = s.enqueue_data
+      else:
+        s.drain_call_.v = s.eligible_ != 0 and s.send_store_rdy
+        s.send_store_call.v = s.drain_call_
+        s.send_store_addr[0:lo].v = s.drain_offset_
+        s.send_store_addr[lo:hi].v = s.drain_word_
+        s.send_store_size.v = s.drain_size_
+        s.send_store_data.v = s.drain_data_ >> s.drain_shamt_
+
+    for i in range(nentries):
+      s.connect(s.words[i].write_data, s.enq_entry_word_)
+      s.connect(s.data[i].write_data, s.merged_)
+      s.connect(s.words[i].write_call, s.write_[i])
+      s.connect(s.data[i].write_call, s.write_[i])
+
+      @s.combinational
+      def update_entry(i=i):
+        s.write_[i].v = s.enqueue_call and (s.match_[i] or
+                                            (not s.any_match_ and
+                                             s.alloc_arbiter.grant_grant[i]))
+        s.drain_[i].v = s.drain_call_ and s.drain_arbiter.grant_grant[i]
+
+        if s.drain_[i]:
+          s.kept_mask_[i].v = s.entry_mask_[i] & ~s.drain_clear_
+        else:
+          s.kept_mask_[i].v = s.entry_mask_[i]
+        if s.write_[i]:
+          s.masks[i].write_data.v = s.kept_mask_[i] | s.enq_mask_
+        else:
+          s.masks[i].write_data.v = s.kept_mask_[i]
+
+        if s.write_[i] and not s.match_[i]:
+          s.ages[i].write_data.v = 0
+        elif s.entry_age_[i] == drain_delay:
+          s.ages[i].write_data.v = s.entry_age_[i]
+        else:
+          s.ages[i].write_data.v = s.entry_age_[i] + 1
+
+    # Check
+    s.chk_offset_ = Wire(offset_nbits)
+    s.chk_word_ = Wire(Word)
+    s.chk_next_word_ = Wire(Word)
+    s.chk_end_ = Wire(size_nbits + 1)
+    s.chk_cross_ = Wire(1)
+    s.chk_base_mask_ = Wire(Mask)
+    s.chk_mask_ = Wire(Mask)
+    s.chk_shamt_ = Wire(offset_nbits + 3)
+    s.chk_hit_ = [Wire(1) for _ in range(nentries)]
+    s.chk_covers_ = [Wire(1) for _ in range(nentries)]
+    s.chk_hit_mask_ = Wire(nentries)
+
+    @s.combinational
+    def split_check_addr(lo=offset_nbits, hi=addr_nbits):
+      s.chk_offset_.v = s.check_addr[0:lo]
+      s.chk_word_.v = s.check_addr[lo:hi]
+      s.chk_next_word_.v = s.chk_word_ + 1
+      s.chk_end_.v = s.chk_offset_ + s.check_size
+      s.chk_cross_.v = s.chk_end_ > nbytes
+      s.chk_shamt_.v = 0
+      s.chk_shamt_[3:offset_nbits + 3].v = s.chk_offset_
+
+    @s.combinational
+    def compute_check_mask():
+      if s.check_size == 1:
+        s.chk_base_mask_.v = 0x1
+      elif s.check_size == 2:
+        s.chk_base_mask_.v = 0x3
+      elif s.check_size == 4:
+        s.chk_base_mask_.v = 0xf
+      else:
+        s.chk_base_mask_.v = full_mask
+      s.chk_mask_.v = s.chk_base_mask_ << s.chk_offset_
+
+    for i in range(nentries):
+
+      @s.combinational
+      def check_entry(i=i):
+        # A load crossing into the next word conflicts with any entry for it
+        s.chk_hit_[i].v = s.valid_[i] and (
+            (s.entry_word_[i] == s.chk_word_ and
+             (s.entry_mask_[i] & s.chk_mask_) != 0) or
+            (s.chk_cross_ and s.entry_word_[i] == s.chk_next_word_))
+        s.chk_covers_[i].v = s.valid_[i] and not s.chk_cross_ and (
+            s.entry_word_[i] == s.chk_word_) and (s.entry_mask_[i]
+                                                  & s.chk_mask_) == s.chk_mask_
+        s.chk_hit_mask_[i].v = s.chk_hit_[i]
+
+    @s.combinational
+    def handle_check():
+      s.check_forward.v = 0
+      s.check_forward_data.v = 0
+      for i in range(nentries):
+        if s.chk_covers_[i]:
+          s.check_forward.v = 1
+          s.check_forward_data.v = s.entry_data_[i] >> s.chk_shamt_
+      s.check_pending.v = s.chk_hit_mask_ != 0 and not s.check_forward
+
+    @s.combinational
+    def compute_urgent():
+      if s.check_call and s.check_pending:
+        s.urgent_.v = s.chk_hit_mask_
+      else:
+        s.urgent_.v = 0
+
+    s.stores = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    s.writes = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+
+    @s.combinational
+    def count_stats():
+      s.stores.write_call.v = s.enqueue_call
+      s.stores.write_data.v = s.stores.read_data + 1
+      s.writes.write_call.v = s.send_store_call
+      s.writes.write_data.v = s.writes.read_data + 1
+
+    s.connect(s.stats_stores, s.stores.read_data)
+    s.connect(s.stats_writes, s.writes.read_data)
+
+  def line_trace(s):
+    return '{}'.format(s.free_mask_)
@@ -8,7 +8,7 @@ import subprocess
 
 
 def gen_verilog():
-  mbi = MemoryBusInterface(2, 1, 2, 64, 8)
+  mbi = MemoryBusInterface(2, 2, 2, 64, 8)
   proc = Proc(ProcInterface(), mbi.MemMsg)
   proc.explicit_modulename = 'proc'
   translate(proc)
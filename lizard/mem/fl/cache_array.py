@@ -0,0 +1,103 @@
+from pymtl import *
+from lizard.model.hardware_model import HardwareModel, Result
+from lizard.model.flmodel import FLModel
+
+
+class CacheArrayFL(FLModel):
+
+  @HardwareModel.validate
+  def __init__(s, interface):
+    super(CacheArrayFL, s).__init__(interface)
+    nsets = s.interface.nsets
+    nways = s.interface.nways
+    words_per_line = s.interface.words_per_line
+
+    s.state(
+        tags=[[0 for _ in range(nsets)] for _ in range(nways)],
+        valid=[[0 for _ in range(nsets)] for _ in range(nways)],
+        data=[[s.interface.Word(0)
+               for _ in range(nsets * words_per_line)]
+              for _ in range(nways)],
+        fifo=[0 for _ in range(nsets)],
+    )
+
+    def split(addr):
+      addr = int(addr)
+      index = (addr >> s.interface.offset_nbits) % nsets
+      tag = addr >> s.interface.tag_offset
+      word = (addr >> s.interface.word_offset_nbits) % (nsets * words_per_line)
+      return tag, index, word
+
+    @s.model_method
+    def read(addr):
+      tag, index, word = split(addr)
+      hit = 0
+      data = 0
+      for way in range(nways):
+        if s.valid[way][index] and s.tags[way][index] == tag:
+          hit = 1
+          data = s.data[way][word]
+      return Result(hit=hit, data=data)
+
+    @s.model_method
+    def fill(addr, data, last):
+      tag, index, word = split(addr)
+      victim = s.fifo[index]
+      for way in range(nways):
+        if not s.valid[way][index]:
+          victim = way
+
+      s.tags[victim][index] = tag
+      s.data[victim][word] = data
+      s.valid[victim][index] = int(last)
+      if last and victim == s.fifo[index]:
+        s.fifo[index] = (s.fifo[index] + 1) % nways
+
+    @s.model_method
+    def clear():
+      for way in range(nways):
+        for index in range(nsets):
+          s.valid[way][index] = 0
+
+
+class CacheTags(object):
+  """The tags of a set-associative cache with the victim choice of CacheArray.
+
+  For functional models of caches which look up one request at a time.
+  access returns whether addr hits, and allocates its line if it misses.
+  """
+
+  def __init__(s, nsets, nways, line_nbytes):
+    s.nsets = nsets
+    s.nways = nways
+    s.line_nbytes = line_nbytes
+    s.tags = [[0] * nsets for _ in range(nways)]
+    s.valid = [[0] * nsets for _ in range(nways)]
+    s.fifo = [0] * nsets
+
+  def split(s, addr):
+    line = int(addr) // s.line_nbytes
+    return line // s.nsets, line % s.nsets
+
+  def contains(s, addr):
+    tag, index = s.split(addr)
+    return any(s.valid[way][index] and s.tags[way][index] == tag
+               for way in range(s.nways))
+
+  def access(s, addr):
+    if s.contains(addr):
+      return True
+    tag, index = s.split(addr)
+    victim = s.fifo[index]
+    for way in range(s.nways):
+      if not s.valid[way][index]:
+        victim = way
+    if victim == s.fifo[index]:
+      s.fifo[index] = (s.fifo[index] + 1) % s.nways
+    s.tags[victim][index] = tag
+    s.valid[victim][index] = 1
+    return False
+
+  # Like CacheArray, clearing leaves the replacement pointers alone
+  def clear(s):
+    s.valid = [[0] * s.nsets for _ in range(s.nways)]
@@ -0,0 +1,93 @@
+from pymtl import *
+from lizard.model.hardware_model import HardwareModel, Result
+from lizard.model.flmodel import FLModel
+from lizard.mem.rtl.memory_bus import MemMsgType, MemMsgStatus
+from lizard.mem.fl.cache_array import CacheTags
+
+
+class DCacheFL(FLModel):
+  """Functional model of DCache: a memory which responds in order.
+
+  The memory is a dictionary from byte address to byte, as in
+  TestMemoryBusFL, and is always up to date, so busy is never set and
+  clean does nothing. The tags of a cache with the same geometry are
+  tracked, so the test field of each response (1 on a hit) and the hit
+  and miss counts match a DCache which is sent one request at a time.
+  prefetch does nothing, so the prefetch counters stay at 0. Like DCache,
+  a request crossing a bus word boundary gets ADDRESS_MISALIGNED status
+  and does nothing.
+  """
+
+  @HardwareModel.validate
+  def __init__(s, interface, nsets, nways, line_nbytes, initial_memory=None):
+    super(DCacheFL, s).__init__(interface)
+    s.MemMsg = s.interface.MemMsg
+    s.data_nbytes = s.MemMsg.data_nbytes
+    s.data_nbits = s.data_nbytes * 8
+
+    s.state(results=[], hits=0, misses=0)
+    if initial_memory is None:
+      initial_memory = {}
+    s.mem = initial_memory
+    s.tags = CacheTags(nsets, nways, line_nbytes)
+
+    @s.ready_method
+    def recv():
+      return len(s.results) != 0
+
+    @s.model_method
+    def recv():
+      return s.results.pop(0)
+
+    @s.model_method
+    def send(msg):
+      s.results.append(s.handle_request(msg))
+
+    @s.model_method
+    def prefetch(addr):
+      pass
+
+    @s.model_method
+    def busy():
+      return 0
+
+    @s.model_method
+    def clean():
+      pass
+
+    @s.model_method
+    def stats():
+      return Result(
+          hits=s.hits, misses=s.misses, prefetches=0, useful_prefetches=0)
+
+  def handle_request(s, req):
+    nbytes = int(req.len_)
+    if req.len_ == 0:
+      nbytes = s.data_nbytes
+    if int(req.addr) % s.data_nbytes + nbytes > s.data_nbytes:
+      return s.MemMsg.resp.mk_msg(req.type_, req.opaque,
+                                  MemMsgStatus.ADDRESS_MISALIGNED, req.len_, 0)
+    hit = s.tags.access(req.addr)
+    if hit:
+      s.hits += 1
+    else:
+      s.misses += 1
+    resp = s.access_memory(req)
+    resp.test = int(hit)
+    return resp
+
+  def access_memory(s, req):
+    nbytes = int(req.len_)
+    if req.len_ == 0:
+      nbytes = s.data_nbytes
+    addr = int(req.addr)
+
+    if req.type_ == MemMsgType.WRITE:
+      for j in range(nbytes):
+        s.mem[addr + j] = req.data[j * 8:j * 8 + 8].uint()
+      return s.MemMsg.resp.mk_wr(req.opaque, 0)
+    else:
+      read_data = Bits(s.data_nbits)
+      for j in range(nbytes):
+        read_data[j * 8:j * 8 + 8] = s.mem.get(addr + j, 0)
+      return s.MemMsg.resp.mk_rd(req.opaque, req.len_, read_data)
@@ -0,0 +1,70 @@
+from pymtl import *
+from lizard.model.hardware_model import HardwareModel, Result
+from lizard.model.flmodel import FLModel
+from lizard.mem.fl.cache_array import CacheTags
+
+
+class ICacheFL(FLModel):
+  """Functional model of ICache: a read-only memory which responds in order.
+
+  The memory is a dictionary from byte address to byte, as in
+  TestMemoryBusFL. The tags of a cache with the same geometry are tracked,
+  so the test field of each response (1 on a hit) and the hit and miss
+  counts match an ICache which does not prefetch. Nothing is prefetched,
+  so the prefetch counters stay at 0.
+  """
+
+  @HardwareModel.validate
+  def __init__(s, interface, nsets, nways, line_nbytes, initial_memory=None):
+    super(ICacheFL, s).__init__(interface)
+    s.MemMsg = s.interface.MemMsg
+    s.data_nbytes = s.MemMsg.data_nbytes
+    s.data_nbits = s.data_nbytes * 8
+
+    s.state(results=[], hits=0, misses=0)
+    if initial_memory is None:
+      initial_memory = {}
+    s.mem = initial_memory
+    s.tags = CacheTags(nsets, nways, line_nbytes)
+
+    @s.ready_method
+    def recv():
+      return len(s.results) != 0
+
+    @s.model_method
+    def recv():
+      return s.results.pop(0)
+
+    @s.ready_method
+    def send():
+      return len(s.results) == 0
+
+    @s.model_method
+    def send(msg):
+      s.results.append(s.handle_request(msg))
+
+    @s.model_method
+    def flush():
+      s.tags.clear()
+
+    @s.model_method
+    def stats():
+      return Result(
+          hits=s.hits, misses=s.misses, prefetches=0, useful_prefetches=0)
+
+  def handle_request(s, req):
+    hit = s.tags.access(req.addr)
+    if hit:
+      s.hits += 1
+    else:
+      s.misses += 1
+    nbytes = int(req.len_)
+    if req.len_ == 0:
+      nbytes = s.data_nbytes
+    addr = int(req.addr)
+    read_data = Bits(s.data_nbits)
+    for j in range(nbytes):
+      read_data[j * 8:j * 8 + 8] = s.mem.get(addr + j, 0)
+    resp = s.MemMsg.resp.mk_rd(req.opaque, req.len_, read_data)
+    resp.test = int(hit)
+    return resp
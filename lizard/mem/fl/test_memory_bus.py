@@ -1,3 +1,4 @@
+import random
 from functools import partial
 from pymtl import *
 from lizard.mem.rtl.memory_bus import MemMsgType
@@ -19,24 +20,40 @@ class TestMemoryBusFL(FLModel):
       MemMsgType.AMO_MAX: max,
   }
 
+  # Each port responds after its delay. A port accepts up to depths[port]
+  # requests before one is received, so a client keeping several requests
+  # in flight sees one response per cycle. Each request is delayed by up
+  # to jitters[port] more cycles, chosen at random, so responses from a
+  # port with jitter can come back out of order.
   @HardwareModel.validate
-  def __init__(s, memory_bus_interface, initial_memory=None, delays=None):
+  def __init__(s,
+               memory_bus_interface,
+               initial_memory=None,
+               delays=None,
+               depths=None,
+               jitters=None,
+               seed=0):
     super(TestMemoryBusFL, s).__init__(memory_bus_interface)
     if initial_memory is None:
       initial_memory = {}
     if delays is None:
       delays = [0] * memory_bus_interface.num_ports
+    if depths is None:
+      depths = [1] * memory_bus_interface.num_ports
+    if jitters is None:
+      jitters = [0] * memory_bus_interface.num_ports
     s.delays = delays
+    s.depths = depths
+    s.jitters = jitters
+    s.rng = random.Random(seed)
     s.data_nbytes = s.interface.data_nbytes
     s.data_nbits = s.data_nbytes * 8
     s.num_ports = memory_bus_interface.num_ports
     s.MemMsg = s.interface.MemMsg
     s.max_addr = s.MemMsg.req.addr._max
 
-    s.state(
-        results_delay=[-1 for _ in range(s.num_ports)],
-        results=[None for _ in range(s.num_ports)],
-    )
+    # Each port has a list of [remaining delay, response] pairs, oldest first
+    s.state(pending=[[] for _ in range(s.num_ports)])
     s.mem = initial_memory
 
     for i in range(s.num_ports):
@@ -49,24 +66,29 @@ class TestMemoryBusFL(FLModel):
       s.model_method_explicit(recv_name, partial(s.recv, i), False)
       s.model_method_explicit(send_name, partial(s.send, i), False)
 
+  def ready_index(s, port):
+    for i, entry in enumerate(s.pending[port]):
+      if entry[0] == 0:
+        return i
+    return None
+
   def recv_rdy(s, port):
-    return s.results_delay[port] == 0
+    return s.ready_index(port) is not None
 
   def recv(s, port):
-    s.results_delay[port] = -1
-    return s.results[port]
+    return s.pending[port].pop(s.ready_index(port))[1]
 
   def cl_delay(s, port):
-    if s.results_delay[port] != -1:
-      if s.results_delay[port] != 0:
-        s.results_delay[port] -= 1
+    for entry in s.pending[port]:
+      if entry[0] != 0:
+        entry[0] -= 1
 
   def send_rdy(s, port):
-    return s.results_delay[port] == -1
+    return len(s.pending[port]) < s.depths[port]
 
   def send(s, port, msg):
-    s.results_delay[port], s.results[port] = s.delays[port], s.handle_request(
-        msg)
+    delay = s.delays[port] + s.rng.randint(0, s.jitters[port])
+    s.pending[port].append([delay, s.handle_request(msg)])
 
   def handle_request(s, req):
     nbytes = int(req.len_)
@@ -0,0 +1,225 @@
+from pymtl import *
+from lizard.bitutil import clog2, clog2nz
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+from lizard.util.rtl.onehot import OneHotEncoder
+
+
+class CacheArrayInterface(Interface):
+
+  def __init__(s, addr_nbits, word_nbytes, nsets, nways, line_nbytes):
+    assert nsets > 1 and nsets == 2**clog2(nsets)
+    assert nways > 0
+    assert word_nbytes == 2**clog2(word_nbytes)
+    assert line_nbytes == 2**clog2(line_nbytes)
+    assert line_nbytes >= 2 * word_nbytes
+
+    s.Addr = Bits(addr_nbits)
+    s.Word = Bits(word_nbytes * 8)
+    s.Way = Bits(clog2nz(nways))
+
+    s.nsets = nsets
+    s.nways = nways
+    s.word_nbytes = word_nbytes
+    s.line_nbytes = line_nbytes
+    s.words_per_line = line_nbytes // word_nbytes
+
+    # Address layout: | tag | index | word | byte |
+    s.word_offset_nbits = clog2(word_nbytes)
+    s.offset_nbits = clog2(line_nbytes)
+    s.index_nbits = clog2(nsets)
+    s.tag_offset = s.offset_nbits + s.index_nbits
+    s.Tag = Bits(addr_nbits - s.tag_offset)
+    s.Index = Bits(s.index_nbits)
+    s.WordAddr = Bits(s.tag_offset - s.word_offset_nbits)
+
+    super(CacheArrayInterface, s).__init__([
+        MethodSpec(
+            'read',
+            args={
+                'addr': s.Addr,
+            },
+            rets={
+                'hit': Bits(1),
+                'data': s.Word,
+            },
+            call=False,
+            rdy=False,
+        ),
+        MethodSpec(
+            'fill',
+            args={
+                'addr': s.Addr,
+                'data': s.Word,
+                'last': Bits(1),
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'clear',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+    ])
+
+
+class CacheArray(Model):
+  """Tag and data storage for a set-associative cache.
+
+  Lines are refilled one word at a time. Every fill writes into the victim way
+  of the line's set and invalidates it; the fill with last set marks the line
+  valid. The victim is the highest numbered invalid way, or, if every way in
+  the set is valid, the way pointed to by the set's FIFO replacement pointer.
+  Since the first fill into a way invalidates it, the victim does not
+  change while a line is being refilled.
+
+  Methods:
+    read:
+      Looks up the word containing addr. hit is set if the line is present.
+      If more than one way matches, the highest numbered way wins.
+    fill:
+      Writes a word of the line containing addr into the victim way. If last
+      is set, the line becomes valid and the replacement pointer advances
+      past the way (if the way was the one it pointed to).
+    clear:
+      Invalidates every line.
+
+  Sequencing: read, fill, clear
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+    nsets = s.interface.nsets
+    nways = s.interface.nways
+    word_offset_nbits = s.interface.word_offset_nbits
+    offset_nbits = s.interface.offset_nbits
+    tag_offset = s.interface.tag_offset
+    addr_nbits = s.interface.Addr.nbits
+    Tag = s.interface.Tag
+    Way = s.interface.Way
+
+    s.tags = [
+        AsynchronousRAM(
+            AsynchronousRAMInterface(Tag, nsets, 1, 1), reset_values=0)
+        for _ in range(nways)
+    ]
+    s.data = [
+        AsynchronousRAM(
+            AsynchronousRAMInterface(s.interface.Word,
+                                     nsets * s.interface.words_per_line, 1, 1),
+            reset_values=0) for _ in range(nways)
+    ]
+    s.valid = [
+        Register(RegisterInterface(Bits(nsets), enable=True), reset_value=0)
+        for _ in range(nways)
+    ]
+    s.fifo = AsynchronousRAM(
+        AsynchronousRAMInterface(Way, nsets, 1, 1), reset_values=0)
+
+    s.read_index = Wire(s.interface.Index)
+    s.read_tag = Wire(Tag)
+    s.read_word = Wire(s.interface.WordAddr)
+    s.fill_index = Wire(s.interface.Index)
+    s.fill_tag = Wire(Tag)
+    s.fill_word = Wire(s.interface.WordAddr)
+
+    @s.combinational
+    def split_addrs():
+      s.read_index.v = s.read_addr[offset_nbits:tag_offset]
+      s.read_tag.v = s.read_addr[tag_offset:addr_nbits]
+      s.read_word.v = s.read_addr[word_offset_nbits:tag_offset]
+      s.fill_index.v = s.fill_addr[offset_nbits:tag_offset]
+      s.fill_tag.v = s.fill_addr[tag_offset:addr_nbits]
+      s.fill_word.v = s.fill_addr[word_offset_nbits:tag_offset]
+
+    s.read_onehot = OneHotEncoder(nsets)
+    s.fill_onehot = OneHotEncoder(nsets)
+    s.connect(s.read_onehot.encode_number, s.read_index)
+    s.connect(s.fill_onehot.encode_number, s.fill_index)
+
+    # PYMTL_BROKEN
+    s.way_tag = [Wire(Tag) for _ in range(nways)]
+    s.way_data = [Wire(s.interface.Word) for _ in range(nways)]
+    s.way_valid = [Wire(nsets) for _ in range(nways)]
+    s.way_hit = [Wire(1) for _ in range(nways)]
+    s.way_fill_valid = [Wire(1) for _ in range(nways)]
+    s.way_valid_next = [Wire(nsets) for _ in range(nways)]
+    s.way_write = [Wire(1) for _ in range(nways)]
+
+    s.victim = Wire(Way)
+
+    for i in range(nways):
+      s.connect(s.tags[i].read_addr[0], s.read_index)
+      s.connect(s.way_tag[i], s.tags[i].read_data[0])
+      s.connect(s.data[i].read_addr[0], s.read_word)
+      s.connect(s.way_data[i], s.data[i].read_data[0])
+      s.connect(s.way_valid[i], s.valid[i].read_data)
+
+      s.connect(s.tags[i].write_addr[0], s.fill_index)
+      s.connect(s.tags[i].write_data[0], s.fill_tag)
+      s.connect(s.tags[i].write_call[0], s.way_write[i])
+      s.connect(s.data[i].write_addr[0], s.fill_word)
+      s.connect(s.data[i].write_data[0], s.fill_data)
+      s.connect(s.data[i].write_call[0], s.way_write[i])
+      s.connect(s.valid[i].write_data, s.way_valid_next[i])
+
+      @s.combinational
+      def handle_way(i=i):
+        s.way_hit[i].v = (s.way_valid[i] & s.read_onehot.encode_onehot
+                         ) != 0 and (s.way_tag[i] == s.read_tag)
+        s.way_fill_valid[i].v = (s.way_valid[i]
+                                 & s.fill_onehot.encode_onehot) != 0
+        s.way_write[i].v = s.fill_call and s.victim == i
+
+      @s.combinational
+      def handle_valid(i=i):
+        if s.clear_call:
+          s.valid[i].write_call.v = 1
+          s.way_valid_next[i].v = 0
+        elif s.way_write[i]:
+          s.valid[i].write_call.v = 1
+          if s.fill_last:
+            s.way_valid_next[i].v = s.way_valid[i] | s.fill_onehot.encode_onehot
+          else:
+            s.way_valid_next[i].v = s.way_valid[i] & (
+                ~s.fill_onehot.encode_onehot)
+        else:
+          s.valid[i].write_call.v = 0
+          s.way_valid_next[i].v = 0
+
+    @s.combinational
+    def handle_read():
+      s.read_hit.v = 0
+      s.read_data.v = 0
+      for i in range(nways):
+        if s.way_hit[i]:
+          s.read_hit.v = 1
+          s.read_data.v = s.way_data[i]
+
+    s.connect(s.fifo.read_addr[0], s.fill_index)
+    s.connect(s.fifo.write_addr[0], s.fill_index)
+
+    @s.combinational
+    def handle_victim():
+      s.victim.v = s.fifo.read_data[0]
+      for i in range(nways):
+        if not s.way_fill_valid[i]:
+          s.victim.v = i
+
+    @s.combinational
+    def handle_fifo(last=nways - 1):
+      s.fifo.write_call[0].v = s.fill_call and s.fill_last and (
+          s.victim == s.fifo.read_data[0])
+      if s.fifo.read_data[0] == last:
+        s.fifo.write_data[0].v = 0
+      else:
+        s.fifo.write_data[0].v = s.fifo.read_data[0] + 1
+
+  def line_trace(s):
+    return '{}'.format(s.read_hit)
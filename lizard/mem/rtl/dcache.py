@@ -0,0 +1,857 @@
+from pymtl import *
+from lizard.bitutil import clog2, clog2nz, bit_enum
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+from lizard.util.rtl.onehot import OneHotEncoder
+from lizard.util.rtl.coders import PriorityDecoder
+from lizard.mem.rtl.memory_bus import MemMsgType, MemMsgStatus
+
+MshrState = bit_enum(
+    'MshrState',
+    None,
+    ('WRITEBACK', 'wb'),
+    ('REFILL', 'rf'),
+    ('REPLAY', 'rp'),
+)
+
+
+class DCacheInterface(Interface):
+
+  def __init__(s, MemMsg, counter_nbits=64):
+    s.MemMsg = MemMsg
+    s.Counter = Bits(counter_nbits)
+
+    super(DCacheInterface, s).__init__([
+        MethodSpec(
+            'recv',
+            args=None,
+            rets={'msg': s.MemMsg.resp},
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'send',
+            args={'msg': s.MemMsg.req},
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'prefetch',
+            args={'addr': Bits(s.MemMsg.addr_nbits)},
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'busy',
+            args=None,
+            rets={'ret': Bits(1)},
+            call=False,
+            rdy=False,
+        ),
+        MethodSpec(
+            'clean',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'stats',
+            args=None,
+            rets={
+                'hits': s.Counter,
+                'misses': s.Counter,
+                'prefetches': s.Counter,
+                'useful_prefetches': s.Counter,
+            },
+            call=False,
+            rdy=False,
+        ),
+    ])
+
+
+class DCache(Model):
+  """A non-blocking, write-back, write-allocate, set-associative data cache.
+
+  Sits between a client using the memory bus send/recv methods and a port on
+  the memory bus. Requests are accepted into a single entry input buffer and
+  looked up the following cycle. A hit responds immediately: loads return the
+  requested bytes starting at bit 0, and stores are merged into the line and
+  acknowledged. A request crossing a bus word boundary is answered right
+  away with ADDRESS_MISALIGNED status, without touching the cache or
+  memory, and counts as neither a hit nor a miss. Errors reported by the
+  memory bus are not handled.
+
+  A miss allocates a miss status holding register (MSHR) and frees the input
+  buffer, so later requests to other sets can hit under the miss, or miss
+  themselves while free MSHRs remain. Each MSHR evicts the victim way of the
+  set (writing it back first if dirty), refills the line one bus word at a
+  time, then replays its request, which now hits. Requests to a set with an
+  active MSHR wait in the input buffer; this keeps accesses to the same
+  address in order. Responses to different sets may return out of order,
+  so clients must tag requests using the opaque field, which is preserved.
+
+  MSHRs tag their bus requests with their index in the opaque field, so
+  the bus opaque field must be wide enough to hold an MSHR index.
+
+  prefetch fills the line containing addr without responding. It takes
+  the input buffer only when send does not, and is dropped if the line is
+  present, its set has an active MSHR, or no MSHR is free. Otherwise it
+  allocates an MSHR like a miss, which frees itself instead of replaying.
+
+  clean writes back every dirty line, walking the sets in order. busy is set
+  while any line is dirty, any MSHR is active, or a clean is in progress.
+
+  stats returns the number of requests which hit on their first lookup, and
+  the number of misses, since reset. It also returns the number of lines
+  prefetched, and how many of those were hit by a request before being
+  evicted. useful_prefetches / prefetches is the accuracy, and
+  useful_prefetches / (useful_prefetches + misses) the coverage.
+  """
+
+  def __init__(s, interface, nsets, nways, line_nbytes, nmshrs):
+    UseInterface(s, interface)
+    MemMsg = s.interface.MemMsg
+    addr_nbits = MemMsg.addr_nbits
+    data_nbytes = MemMsg.data_nbytes
+    data_nbits = data_nbytes * 8
+    assert nsets > 1 and nsets == 2**clog2(nsets)
+    assert nways > 0
+    assert line_nbytes == 2**clog2(line_nbytes)
+    assert line_nbytes >= 2 * data_nbytes
+    assert clog2nz(nmshrs) <= MemMsg.opaque_nbits
+
+    s.require(
+        MethodSpec(
+            'mem_recv',
+            args=None,
+            rets={'msg': MemMsg.resp},
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'mem_send',
+            args={'msg': MemMsg.req},
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+    )
+
+    words_per_line = line_nbytes // data_nbytes
+    word_offset_nbits = clog2(data_nbytes)
+    offset_nbits = clog2(line_nbytes)
+    index_nbits = clog2(nsets)
+    tag_offset = offset_nbits + index_nbits
+    word_idx_nbits = offset_nbits - word_offset_nbits
+
+    Tag = Bits(addr_nbits - tag_offset)
+    Index = Bits(index_nbits)
+    Way = Bits(clog2nz(nways))
+    WordAddr = Bits(tag_offset - word_offset_nbits)
+    WordIdx = Bits(word_idx_nbits + 1)
+    MshrIdx = Bits(clog2nz(nmshrs))
+
+    # Storage
+    # Tag read port 0 is the lookup, 1 is the clean walk
+    s.tags = [
+        AsynchronousRAM(
+            AsynchronousRAMInterface(Tag, nsets, 2, 1), reset_values=0)
+        for _ in range(nways)
+    ]
+    # Data read port 0 is the lookup, 1 is MSHR writeback
+    # Data write port 0 is a store hit, 1 is MSHR refill
+    s.data = [
+        AsynchronousRAM(
+            AsynchronousRAMInterface(
+                Bits(data_nbits), nsets * words_per_line, 2, 2),
+            reset_values=0) for _ in range(nways)
+    ]
+    s.valid = [
+        Register(RegisterInterface(Bits(nsets)), reset_value=0)
+        for _ in range(nways)
+    ]
+    s.dirty = [
+        Register(RegisterInterface(Bits(nsets)), reset_value=0)
+        for _ in range(nways)
+    ]
+    # Set for prefetched lines which have not been used yet
+    s.prefetched = [
+        Register(RegisterInterface(Bits(nsets)), reset_value=0)
+        for _ in range(nways)
+    ]
+    s.fifo = AsynchronousRAM(
+        AsynchronousRAMInterface(Way, nsets, 1, 1), reset_values=0)
+
+    # Input buffer
+    s.req_val = Register(RegisterInterface(Bits(1)), reset_value=0)
+    s.req = Register(RegisterInterface(MemMsg.req, enable=True))
+    s.req_prefetch = Register(RegisterInterface(Bits(1), enable=True))
+
+    # MSHRs
+    s.mshr_valid = [
+        Register(RegisterInterface(Bits(1)), reset_value=0)
+        for _ in range(nmshrs)
+    ]
+    s.mshr_state = [
+        Register(RegisterInterface(Bits(MshrState.bits))) for _ in range(nmshrs)
+    ]
+    s.mshr_index = [
+        Register(RegisterInterface(Index, enable=True)) for _ in range(nmshrs)
+    ]
+    s.mshr_way = [
+        Register(RegisterInterface(Way, enable=True)) for _ in range(nmshrs)
+    ]
+    s.mshr_tag = [
+        Register(RegisterInterface(Tag, enable=True)) for _ in range(nmshrs)
+    ]
+    s.mshr_victim_tag = [
+        Register(RegisterInterface(Tag, enable=True)) for _ in range(nmshrs)
+    ]
+    s.mshr_refill = [
+        Register(RegisterInterface(Bits(1), enable=True)) for _ in range(nmshrs)
+    ]
+    s.mshr_target = [
+        Register(RegisterInterface(MemMsg.req, enable=True))
+        for _ in range(nmshrs)
+    ]
+    s.mshr_prefetch = [
+        Register(RegisterInterface(Bits(1), enable=True)) for _ in range(nmshrs)
+    ]
+    s.mshr_send_idx = [
+        Register(RegisterInterface(WordIdx)) for _ in range(nmshrs)
+    ]
+    s.mshr_recv_idx = [
+        Register(RegisterInterface(WordIdx)) for _ in range(nmshrs)
+    ]
+
+    # Clean walk
+    s.cleaning = Register(RegisterInterface(Bits(1)), reset_value=0)
+    s.walk_idx = Register(RegisterInterface(Index), reset_value=0)
+
+    s.hits = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    s.misses = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    s.prefetches = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    s.useful_prefetches = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+
+    # PYMTL_BROKEN
+    s.way_tag = [Wire(Tag) for _ in range(nways)]
+    s.way_walk_tag = [Wire(Tag) for _ in range(nways)]
+    s.way_data = [Wire(data_nbits) for _ in range(nways)]
+    s.way_wb_data = [Wire(data_nbits) for _ in range(nways)]
+    s.way_valid = [Wire(nsets) for _ in range(nways)]
+    s.way_dirty = [Wire(nsets) for _ in range(nways)]
+    s.way_prefetched = [Wire(nsets) for _ in range(nways)]
+    s.mshr_valid_w = [Wire(1) for _ in range(nmshrs)]
+    s.mshr_state_w = [Wire(MshrState.bits) for _ in range(nmshrs)]
+    s.mshr_index_w = [Wire(Index) for _ in range(nmshrs)]
+    s.mshr_way_w = [Wire(Way) for _ in range(nmshrs)]
+    s.mshr_tag_w = [Wire(Tag) for _ in range(nmshrs)]
+    s.mshr_victim_tag_w = [Wire(Tag) for _ in range(nmshrs)]
+    s.mshr_refill_w = [Wire(1) for _ in range(nmshrs)]
+    s.mshr_target_w = [Wire(MemMsg.req) for _ in range(nmshrs)]
+    s.mshr_prefetch_w = [Wire(1) for _ in range(nmshrs)]
+    s.mshr_send_idx_w = [Wire(WordIdx) for _ in range(nmshrs)]
+    s.mshr_recv_idx_w = [Wire(WordIdx) for _ in range(nmshrs)]
+    for i in range(nways):
+      s.connect(s.way_tag[i], s.tags[i].read_data[0])
+      s.connect(s.way_walk_tag[i], s.tags[i].read_data[1])
+      s.connect(s.way_data[i], s.data[i].read_data[0])
+      s.connect(s.way_wb_data[i], s.data[i].read_data[1])
+      s.connect(s.way_valid[i], s.valid[i].read_data)
+      s.connect(s.way_dirty[i], s.dirty[i].read_data)
+      s.connect(s.way_prefetched[i], s.prefetched[i].read_data)
+    for i in range(nmshrs):
+      s.connect(s.mshr_valid_w[i], s.mshr_valid[i].read_data)
+      s.connect(s.mshr_state_w[i], s.mshr_state[i].read_data)
+      s.connect(s.mshr_index_w[i], s.mshr_index[i].read_data)
+      s.connect(s.mshr_way_w[i], s.mshr_way[i].read_data)
+      s.connect(s.mshr_tag_w[i], s.mshr_tag[i].read_data)
+      s.connect(s.mshr_victim_tag_w[i], s.mshr_victim_tag[i].read_data)
+      s.connect(s.mshr_refill_w[i], s.mshr_refill[i].read_data)
+      s.connect(s.mshr_target_w[i], s.mshr_target[i].read_data)
+      s.connect(s.mshr_prefetch_w[i], s.mshr_prefetch[i].read_data)
+      s.connect(s.mshr_send_idx_w[i], s.mshr_send_idx[i].read_data)
+      s.connect(s.mshr_recv_idx_w[i], s.mshr_recv_idx[i].read_data)
+
+    # Lookup: a replaying MSHR has priority over the input buffer
+    s.replay_vec = Wire(nmshrs)
+    s.replay_decoder = PriorityDecoder(nmshrs)
+    s.connect(s.replay_decoder.decode_signal, s.replay_vec)
+    s.replay_sel = Wire(1)
+    s.lk_val = Wire(1)
+    s.lk_msg = Wire(MemMsg.req)
+    s.lk_addr = Wire(addr_nbits)
+    s.lk_data = Wire(data_nbits)
+    s.lk_index = Wire(Index)
+    s.lk_tag = Wire(Tag)
+    s.lk_word = Wire(WordAddr)
+    s.lk_store = Wire(1)
+    s.lk_prefetch = Wire(1)
+    s.lk_nbytes = Wire(word_offset_nbits + 1)
+    s.lk_end = Wire(word_offset_nbits + 2)
+    # Set if the request crosses into the next bus word
+    s.lk_cross = Wire(1)
+    s.connect(s.lk_addr, s.lk_msg.addr)
+    s.connect(s.lk_data, s.lk_msg.data)
+
+    for i in range(nmshrs):
+
+      @s.combinational
+      def compute_replay_vec(i=i):
+        s.replay_vec[i].v = s.mshr_valid_w[i] and (
+            s.mshr_state_w[i] == MshrState.REPLAY)
+
+    @s.combinational
+    def select_lookup():
+      s.replay_sel.v = s.replay_decoder.decode_valid
+      s.lk_msg.v = s.req.read_data
+      s.lk_prefetch.v = s.req_prefetch.read_data
+      for i in range(nmshrs):
+        if s.replay_decoder.decode_valid and s.replay_decoder.decode_decoded == i:
+          s.lk_msg.v = s.mshr_target_w[i]
+          s.lk_prefetch.v = s.mshr_prefetch_w[i]
+      s.lk_val.v = s.replay_sel or s.req_val.read_data
+
+    @s.combinational
+    def split_lookup_addr():
+      s.lk_index.v = s.lk_addr[offset_nbits:tag_offset]
+      s.lk_tag.v = s.lk_addr[tag_offset:addr_nbits]
+      s.lk_word.v = s.lk_addr[word_offset_nbits:tag_offset]
+      s.lk_store.v = s.lk_msg.type_ == MemMsgType.WRITE
+
+    @s.combinational
+    def check_lookup_cross(data_nbytes=data_nbytes):
+      if s.lk_msg.len_ == 0:
+        s.lk_nbytes.v = data_nbytes
+      else:
+        s.lk_nbytes.v = s.lk_msg.len_
+      s.lk_end.v = s.lk_addr[0:word_offset_nbits] + s.lk_nbytes
+      s.lk_cross.v = not s.lk_prefetch and s.lk_end > data_nbytes
+
+    s.lk_onehot = OneHotEncoder(nsets)
+    s.connect(s.lk_onehot.encode_number, s.lk_index)
+
+    s.way_hit = [Wire(1) for _ in range(nways)]
+    s.way_lk_valid = [Wire(1) for _ in range(nways)]
+    s.way_lk_dirty = [Wire(1) for _ in range(nways)]
+    s.way_lk_prefetched = [Wire(1) for _ in range(nways)]
+    for i in range(nways):
+      s.connect(s.tags[i].read_addr[0], s.lk_index)
+      s.connect(s.data[i].read_addr[0], s.lk_word)
+
+      @s.combinational
+      def handle_way_lookup(i=i):
+        s.way_lk_valid[i].v = (s.way_valid[i] & s.lk_onehot.encode_onehot) != 0
+        s.way_lk_dirty[i].v = (s.way_dirty[i] & s.lk_onehot.encode_onehot) != 0
+        s.way_lk_prefetched[i].v = (s.way_prefetched[i]
+                                    & s.lk_onehot.encode_onehot) != 0
+        s.way_hit[i].v = s.way_lk_valid[i] and s.way_tag[i] == s.lk_tag
+
+    s.lk_hit = Wire(1)
+    s.lk_hit_data = Wire(data_nbits)
+    s.lk_hit_prefetched = Wire(1)
+
+    @s.combinational
+    def handle_hit():
+      s.lk_hit.v = 0
+      s.lk_hit_data.v = 0
+      s.lk_hit_prefetched.v = 0
+      for i in range(nways):
+        if s.way_hit[i]:
+          s.lk_hit.v = 1
+          s.lk_hit_data.v = s.way_data[i]
+          s.lk_hit_prefetched.v = s.way_lk_prefetched[i]
+
+    # A request may not proceed while its set has an active MSHR
+    s.set_busy_vec = Wire(nmshrs)
+    for i in range(nmshrs):
+
+      @s.combinational
+      def compute_set_busy(i=i):
+        s.set_busy_vec[
+            i].v = s.mshr_valid_w[i] and s.mshr_index_w[i] == s.lk_index
+
+    s.blocked = Wire(1)
+    s.serve = Wire(1)
+    s.serve_store = Wire(1)
+    s.serve_hit = Wire(1)
+    s.drop = Wire(1)
+    s.alloc = Wire(1)
+    s.req_done = Wire(1)
+
+    s.free_vec = Wire(nmshrs)
+    s.free_decoder = PriorityDecoder(nmshrs)
+    s.connect(s.free_decoder.decode_signal, s.free_vec)
+    for i in range(nmshrs):
+
+      @s.combinational
+      def compute_free_vec(i=i):
+        s.free_vec[i].v = not s.mshr_valid_w[i]
+
+    @s.combinational
+    def handle_lookup_result():
+      s.blocked.v = not s.replay_sel and s.set_busy_vec != 0
+      s.recv_rdy.v = s.lk_val and not s.lk_prefetch and (
+          s.lk_cross or s.lk_hit and not s.blocked)
+      # A prefetch is done without a response if it hits (always true when
+      # replaying), or cannot allocate an MSHR
+      s.drop.v = s.lk_val and s.lk_prefetch and (
+          s.lk_hit or s.blocked or not s.free_decoder.decode_valid)
+      s.serve.v = s.recv_call or s.drop
+      s.serve_hit.v = s.recv_call and not s.lk_cross
+      s.serve_store.v = s.serve_hit and s.lk_store
+      s.alloc.v = not s.replay_sel and s.req_val.read_data and not s.lk_hit and not s.lk_cross and not s.blocked and s.free_decoder.decode_valid
+      s.req_done.v = (s.serve and not s.replay_sel) or s.alloc
+
+    # Responses
+    s.shamt = Wire(word_offset_nbits + 3)
+    s.store_shifted = Wire(data_nbits)
+    s.load_data = Wire(data_nbits)
+    s.base_mask = Wire(data_nbytes)
+    s.byte_mask = Wire(data_nbytes)
+    s.merged = Wire(data_nbits)
+    s.load_resp = Wire(data_nbits)
+
+    @s.combinational
+    def compute_shift():
+      s.shamt[0:3].v = 0
+      s.shamt[3:word_offset_nbits + 3].v = s.lk_addr[0:word_offset_nbits]
+      s.load_data.v = s.lk_hit_data >> s.shamt
+      s.store_shifted.v = s.lk_data << s.shamt
+
+    @s.combinational
+    def compute_byte_mask(full=(1 << data_nbytes) - 1):
+      if s.lk_msg.len_ == 1:
+        s.base_mask.v = 0x1
+      elif s.lk_msg.len_ == 2:
+        s.base_mask.v = 0x3
+      elif s.lk_msg.len_ == 4:
+        s.base_mask.v = 0xf
+      else:
+        s.base_mask.v = full
+      s.byte_mask.v = s.base_mask << s.lk_addr[0:word_offset_nbits]
+
+    for i in range(data_nbytes):
+
+      @s.combinational
+      def merge_byte(lo=i * 8, hi=i * 8 + 8, i=i):
+        if s.byte_mask[i]:
+          s.merged[lo:hi].v = s.store_shifted[lo:hi]
+        else:
+          s.merged[lo:hi].v = s.lk_hit_data[lo:hi]
+        if s.base_mask[i]:
+          s.load_resp[lo:hi].v = s.load_data[lo:hi]
+        else:
+          s.load_resp[lo:hi].v = 0
+
+    @s.combinational
+    def handle_recv():
+      s.recv_msg.v = 0
+      s.recv_msg.type_.v = s.lk_msg.type_
+      s.recv_msg.opaque.v = s.lk_msg.opaque
+      s.recv_msg.len_.v = s.lk_msg.len_
+      if s.lk_cross:
+        s.recv_msg.stat.v = MemMsgStatus.ADDRESS_MISALIGNED
+      else:
+        s.recv_msg.stat.v = MemMsgStatus.OK
+        s.recv_msg.test.v = not s.replay_sel
+        if not s.lk_store:
+          s.recv_msg.data.v = s.load_resp
+
+    for i in range(nways):
+      s.connect(s.data[i].write_addr[0], s.lk_word)
+      s.connect(s.data[i].write_data[0], s.merged)
+
+      @s.combinational
+      def handle_store_write(i=i):
+        s.data[i].write_call[0].v = s.serve_store and s.way_hit[i]
+
+    # Victim selection for an allocation
+    s.fifo_way = Wire(Way)
+    s.victim = Wire(Way)
+    s.victim_valid = Wire(1)
+    s.victim_dirty = Wire(1)
+    s.victim_tag = Wire(Tag)
+    s.connect(s.fifo.read_addr[0], s.lk_index)
+    s.connect(s.fifo_way, s.fifo.read_data[0])
+    s.connect(s.fifo.write_addr[0], s.lk_index)
+
+    @s.combinational
+    def handle_victim():
+      s.victim.v = s.fifo_way
+      for i in range(nways):
+        if not s.way_lk_valid[i]:
+          s.victim.v = i
+      s.victim_valid.v = 0
+      s.victim_dirty.v = 0
+      s.victim_tag.v = 0
+      for i in range(nways):
+        if s.victim == i:
+          s.victim_valid.v = s.way_lk_valid[i]
+          s.victim_dirty.v = s.way_lk_dirty[i]
+          s.victim_tag.v = s.way_tag[i]
+
+    @s.combinational
+    def handle_fifo(last=nways - 1):
+      s.fifo.write_call[0].v = s.alloc and s.victim == s.fifo_way
+      if s.fifo_way == last:
+        s.fifo.write_data[0].v = 0
+      else:
+        s.fifo.write_data[0].v = s.fifo_way + 1
+
+    # Clean walk
+    s.walk_onehot = OneHotEncoder(nsets)
+    s.connect(s.walk_onehot.encode_number, s.walk_idx.read_data)
+    s.walk_found = Wire(1)
+    s.walk_way = Wire(Way)
+    s.walk_tag = Wire(Tag)
+    s.walk_set_busy = Wire(1)
+    s.walk_alloc = Wire(1)
+    s.way_walk_dirty = [Wire(1) for _ in range(nways)]
+    for i in range(nways):
+      s.connect(s.tags[i].read_addr[1], s.walk_idx.read_data)
+
+      @s.combinational
+      def handle_way_walk(i=i):
+        s.way_walk_dirty[i].v = (s.way_dirty[i] & s.way_valid[i]
+                                 & s.walk_onehot.encode_onehot) != 0
+
+    @s.combinational
+    def handle_walk():
+      s.walk_found.v = 0
+      s.walk_way.v = 0
+      s.walk_tag.v = 0
+      for i in range(nways):
+        if s.way_walk_dirty[i]:
+          s.walk_found.v = 1
+          s.walk_way.v = i
+          s.walk_tag.v = s.way_walk_tag[i]
+      s.walk_set_busy.v = 0
+      for i in range(nmshrs):
+        if s.mshr_valid_w[i] and s.mshr_index_w[i] == s.walk_idx.read_data:
+          s.walk_set_busy.v = 1
+      s.walk_alloc.v = s.cleaning.read_data and s.walk_found and not s.walk_set_busy and not s.alloc and s.free_decoder.decode_valid
+
+    @s.combinational
+    def update_walk(last=nsets - 1):
+      s.cleaning.write_data.v = s.cleaning.read_data
+      s.walk_idx.write_data.v = s.walk_idx.read_data
+      if s.cleaning.read_data:
+        if not s.walk_found:
+          if s.walk_idx.read_data == last:
+            s.cleaning.write_data.v = 0
+            s.walk_idx.write_data.v = 0
+          else:
+            s.walk_idx.write_data.v = s.walk_idx.read_data + 1
+      elif s.clean_call:
+        s.cleaning.write_data.v = 1
+        s.walk_idx.write_data.v = 0
+
+    # MSHR bus requests
+    s.send_vec = Wire(nmshrs)
+    s.send_decoder = PriorityDecoder(nmshrs)
+    s.connect(s.send_decoder.decode_signal, s.send_vec)
+    for i in range(nmshrs):
+
+      @s.combinational
+      def compute_send_vec(i=i, wpl=words_per_line):
+        s.send_vec[i].v = s.mshr_valid_w[i] and s.mshr_state_w[
+            i] != MshrState.REPLAY and s.mshr_send_idx_w[i] != wpl
+
+    s.send_sel = Wire(MshrIdx)
+    s.send_state = Wire(MshrState.bits)
+    s.send_index = Wire(Index)
+    s.send_way = Wire(Way)
+    s.send_tag = Wire(Tag)
+    s.send_word = Wire(WordIdx)
+    s.send_addr = Wire(addr_nbits)
+    s.send_wb_word = Wire(WordAddr)
+    s.send_wb_data = Wire(data_nbits)
+    s.connect(s.send_sel, s.send_decoder.decode_decoded)
+
+    @s.combinational
+    def select_send():
+      s.send_state.v = 0
+      s.send_index.v = 0
+      s.send_way.v = 0
+      s.send_tag.v = 0
+      s.send_word.v = 0
+      for i in range(nmshrs):
+        if s.send_sel == i:
+          s.send_state.v = s.mshr_state_w[i]
+          s.send_index.v = s.mshr_index_w[i]
+          s.send_way.v = s.mshr_way_w[i]
+          s.send_word.v = s.mshr_send_idx_w[i]
+          if s.mshr_state_w[i] == MshrState.WRITEBACK:
+            s.send_tag.v = s.mshr_victim_tag_w[i]
+          else:
+            s.send_tag.v = s.mshr_tag_w[i]
+
+    @s.combinational
+    def compute_send_addr():
+      s.send_addr.v = 0
+      s.send_addr[tag_offset:addr_nbits].v = s.send_tag
+      s.send_addr[offset_nbits:tag_offset].v = s.send_index
+      s.send_addr[word_offset_nbits:
+                  offset_nbits].v = s.send_word[0:word_idx_nbits]
+      s.send_wb_word.v = s.send_addr[word_offset_nbits:tag_offset]
+
+    for i in range(nways):
+      s.connect(s.data[i].read_addr[1], s.send_wb_word)
+
+    @s.combinational
+    def select_wb_data():
+      s.send_wb_data.v = 0
+      for i in range(nways):
+        if s.send_way == i:
+          s.send_wb_data.v = s.way_wb_data[i]
+
+    @s.combinational
+    def handle_mem_send():
+      s.mem_send_call.v = s.send_decoder.decode_valid and s.mem_send_rdy
+      s.mem_send_msg.v = 0
+      s.mem_send_msg.opaque.v = s.send_sel
+      s.mem_send_msg.addr.v = s.send_addr
+      if s.send_state == MshrState.WRITEBACK:
+        s.mem_send_msg.type_.v = MemMsgType.WRITE
+        s.mem_send_msg.data.v = s.send_wb_data
+      else:
+        s.mem_send_msg.type_.v = MemMsgType.READ
+
+    # MSHR bus responses
+    s.recv_sel = Wire(MshrIdx)
+    s.recv_state = Wire(MshrState.bits)
+    s.recv_index = Wire(Index)
+    s.recv_way = Wire(Way)
+    s.recv_tag = Wire(Tag)
+    s.recv_word = Wire(WordIdx)
+    s.recv_last = Wire(1)
+    s.recv_fill = Wire(1)
+    s.recv_fill_done = Wire(1)
+    s.recv_prefetch = Wire(1)
+    s.recv_fill_addr = Wire(WordAddr)
+    s.mem_recv_msg_data = Wire(data_nbits)
+    s.connect(s.mem_recv_msg_data, s.mem_recv_msg.data)
+    s.connect(s.mem_recv_call, s.mem_recv_rdy)
+
+    @s.combinational
+    def select_recv(last=words_per_line - 1):
+      s.recv_sel.v = s.mem_recv_msg.opaque[0:MshrIdx.nbits]
+      s.recv_state.v = 0
+      s.recv_index.v = 0
+      s.recv_way.v = 0
+      s.recv_tag.v = 0
+      s.recv_word.v = 0
+      s.recv_prefetch.v = 0
+      for i in range(nmshrs):
+        if s.recv_sel == i:
+          s.recv_prefetch.v = s.mshr_prefetch_w[i]
+          s.recv_state.v = s.mshr_state_w[i]
+          s.recv_index.v = s.mshr_index_w[i]
+          s.recv_way.v = s.mshr_way_w[i]
+          s.recv_tag.v = s.mshr_tag_w[i]
+          s.recv_word.v = s.mshr_recv_idx_w[i]
+      s.recv_last.v = s.recv_word == last
+      s.recv_fill.v = s.mem_recv_call and s.recv_state == MshrState.REFILL
+      s.recv_fill_done.v = s.recv_fill and s.recv_last
+      s.recv_fill_addr.v = 0
+      s.recv_fill_addr[word_idx_nbits:WordAddr.nbits].v = s.recv_index
+      s.recv_fill_addr[0:word_idx_nbits].v = s.recv_word[0:word_idx_nbits]
+
+    for i in range(nways):
+      s.connect(s.data[i].write_addr[1], s.recv_fill_addr)
+      s.connect(s.data[i].write_data[1], s.mem_recv_msg_data)
+      s.connect(s.tags[i].write_addr[0], s.recv_index)
+      s.connect(s.tags[i].write_data[0], s.recv_tag)
+
+      @s.combinational
+      def handle_fill_write(i=i):
+        s.data[i].write_call[1].v = s.recv_fill and s.recv_way == i
+        s.tags[i].write_call[0].v = s.recv_fill_done and s.recv_way == i
+
+    # Valid and dirty bits
+    s.recv_onehot = OneHotEncoder(nsets)
+    s.connect(s.recv_onehot.encode_number, s.recv_index)
+    for i in range(nways):
+
+      @s.combinational
+      def update_valid_dirty(i=i):
+        s.valid[i].write_data.v = s.way_valid[i]
+        s.dirty[i].write_data.v = s.way_dirty[i]
+        s.prefetched[i].write_data.v = s.way_prefetched[i]
+        # Evicting a line invalidates it immediately
+        if s.alloc and s.victim == i:
+          s.valid[i].write_data.v = s.valid[i].write_data & (
+              ~s.lk_onehot.encode_onehot)
+          s.dirty[i].write_data.v = s.dirty[i].write_data & (
+              ~s.lk_onehot.encode_onehot)
+          s.prefetched[i].write_data.v = s.prefetched[i].write_data & (
+              ~s.lk_onehot.encode_onehot)
+        if s.walk_alloc and s.walk_way == i:
+          s.dirty[i].write_data.v = s.dirty[i].write_data & (
+              ~s.walk_onehot.encode_onehot)
+        if s.recv_fill_done and s.recv_way == i:
+          s.valid[i].write_data.v = s.valid[
+              i].write_data | s.recv_onehot.encode_onehot
+          if s.recv_prefetch:
+            s.prefetched[i].write_data.v = s.prefetched[
+                i].write_data | s.recv_onehot.encode_onehot
+        if s.serve_store and s.way_hit[i]:
+          s.dirty[i].write_data.v = s.dirty[
+              i].write_data | s.lk_onehot.encode_onehot
+        if s.serve_hit and s.way_hit[i]:
+          s.prefetched[i].write_data.v = s.prefetched[i].write_data & (
+              ~s.lk_onehot.encode_onehot)
+
+    # MSHR updates
+    s.alloc_sel = Wire(MshrIdx)
+    s.connect(s.alloc_sel, s.free_decoder.decode_decoded)
+    for i in range(nmshrs):
+      s.connect(s.mshr_target[i].write_data, s.req.read_data)
+      s.connect(s.mshr_prefetch[i].write_data, s.req_prefetch.read_data)
+      s.connect(s.mshr_prefetch[i].write_call, s.mshr_target[i].write_call)
+
+      @s.combinational
+      def update_mshr_alloc(i=i):
+        s.mshr_index[i].write_call.v = 0
+        s.mshr_way[i].write_call.v = 0
+        s.mshr_tag[i].write_call.v = 0
+        s.mshr_victim_tag[i].write_call.v = 0
+        s.mshr_refill[i].write_call.v = 0
+        s.mshr_target[i].write_call.v = 0
+        s.mshr_index[i].write_data.v = 0
+        s.mshr_way[i].write_data.v = 0
+        s.mshr_tag[i].write_data.v = 0
+        s.mshr_victim_tag[i].write_data.v = 0
+        s.mshr_refill[i].write_data.v = 0
+        if s.alloc and s.alloc_sel == i:
+          s.mshr_index[i].write_call.v = 1
+          s.mshr_way[i].write_call.v = 1
+          s.mshr_tag[i].write_call.v = 1
+          s.mshr_victim_tag[i].write_call.v = 1
+          s.mshr_refill[i].write_call.v = 1
+          s.mshr_target[i].write_call.v = 1
+          s.mshr_index[i].write_data.v = s.lk_index
+          s.mshr_way[i].write_data.v = s.victim
+          s.mshr_tag[i].write_data.v = s.lk_tag
+          s.mshr_victim_tag[i].write_data.v = s.victim_tag
+          s.mshr_refill[i].write_data.v = 1
+        elif s.walk_alloc and s.alloc_sel == i:
+          s.mshr_index[i].write_call.v = 1
+          s.mshr_way[i].write_call.v = 1
+          s.mshr_victim_tag[i].write_call.v = 1
+          s.mshr_refill[i].write_call.v = 1
+          s.mshr_index[i].write_data.v = s.walk_idx.read_data
+          s.mshr_way[i].write_data.v = s.walk_way
+          s.mshr_victim_tag[i].write_data.v = s.walk_tag
+          s.mshr_refill[i].write_data.v = 0
+
+      @s.combinational
+      def update_mshr_state(i=i):
+        s.mshr_valid[i].write_data.v = s.mshr_valid_w[i]
+        s.mshr_state[i].write_data.v = s.mshr_state_w[i]
+        s.mshr_send_idx[i].write_data.v = s.mshr_send_idx_w[i]
+        s.mshr_recv_idx[i].write_data.v = s.mshr_recv_idx_w[i]
+        if not s.mshr_valid_w[i]:
+          if (s.alloc or s.walk_alloc) and s.alloc_sel == i:
+            s.mshr_valid[i].write_data.v = 1
+            s.mshr_send_idx[i].write_data.v = 0
+            s.mshr_recv_idx[i].write_data.v = 0
+            if s.walk_alloc or (s.victim_valid and s.victim_dirty):
+              s.mshr_state[i].write_data.v = MshrState.WRITEBACK
+            else:
+              s.mshr_state[i].write_data.v = MshrState.REFILL
+        else:
+          if s.mem_send_call and s.send_sel == i:
+            s.mshr_send_idx[i].write_data.v = s.mshr_send_idx_w[i] + 1
+          if s.mem_recv_call and s.recv_sel == i:
+            s.mshr_recv_idx[i].write_data.v = s.mshr_recv_idx_w[i] + 1
+            if s.recv_last:
+              if s.mshr_state_w[i] == MshrState.WRITEBACK:
+                if s.mshr_refill_w[i]:
+                  s.mshr_state[i].write_data.v = MshrState.REFILL
+                  s.mshr_send_idx[i].write_data.v = 0
+                  s.mshr_recv_idx[i].write_data.v = 0
+                else:
+                  s.mshr_valid[i].write_data.v = 0
+              else:
+                s.mshr_state[i].write_data.v = MshrState.REPLAY
+          if s.serve and s.replay_sel and s.replay_decoder.decode_decoded == i:
+            s.mshr_valid[i].write_data.v = 0
+
+    # Input buffer
+    @s.combinational
+    def handle_send():
+      s.send_rdy.v = not s.req_val.read_data or s.req_done
+      s.prefetch_rdy.v = s.send_rdy and not s.send_call
+      if s.send_call or s.prefetch_call:
+        s.req_val.write_data.v = 1
+      elif s.req_done:
+        s.req_val.write_data.v = 0
+      else:
+        s.req_val.write_data.v = s.req_val.read_data
+
+    s.prefetch_word = Wire(addr_nbits)
+
+    @s.combinational
+    def handle_req_write():
+      s.prefetch_word.v = s.prefetch_addr
+      s.prefetch_word[0:word_offset_nbits].v = 0
+      s.req.write_call.v = s.send_call or s.prefetch_call
+      s.req_prefetch.write_call.v = s.send_call or s.prefetch_call
+      s.req_prefetch.write_data.v = s.prefetch_call
+      if s.prefetch_call:
+        # A read of the whole bus word containing addr
+        s.req.write_data.v = 0
+        s.req.write_data.type_.v = MemMsgType.READ
+        s.req.write_data.addr.v = s.prefetch_word
+      else:
+        s.req.write_data.v = s.send_msg
+
+    s.any_mshr = Wire(1)
+    s.any_dirty = Wire(1)
+
+    @s.combinational
+    def handle_busy():
+      s.any_mshr.v = 0
+      for i in range(nmshrs):
+        if s.mshr_valid_w[i]:
+          s.any_mshr.v = 1
+      s.any_dirty.v = 0
+      for i in range(nways):
+        if s.way_dirty[i] != 0:
+          s.any_dirty.v = 1
+      s.busy_ret.v = s.any_mshr or s.any_dirty or s.cleaning.read_data
+
+    @s.combinational
+    def handle_stats():
+      s.hits.write_call.v = s.serve_hit and not s.replay_sel
+      s.hits.write_data.v = s.hits.read_data + 1
+      s.misses.write_call.v = s.alloc and not s.lk_prefetch
+      s.misses.write_data.v = s.misses.read_data + 1
+      s.prefetches.write_call.v = s.alloc and s.lk_prefetch
+      s.prefetches.write_data.v = s.prefetches.read_data + 1
+      s.useful_prefetches.write_call.v = s.serve_hit and s.lk_hit_prefetched
+      s.useful_prefetches.write_data.v = s.useful_prefetches.read_data + 1
+
+    s.connect(s.stats_hits, s.hits.read_data)
+    s.connect(s.stats_misses, s.misses.read_data)
+    s.connect(s.stats_prefetches, s.prefetches.read_data)
+    s.connect(s.stats_useful_prefetches, s.useful_prefetches.read_data)
+
+  def line_trace(s):
+    if s.recv_call:
+      return 'h' if not s.replay_sel else 'r'
+    elif s.alloc:
+      return 'p' if s.lk_prefetch else 'm'
+    else:
+      return ' '
@@ -0,0 +1,403 @@
+from pymtl import *
+from lizard.bitutil import clog2, clog2nz
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.mem.rtl.memory_bus import MemMsgType, MemMsgStatus
+from lizard.mem.rtl.cache_array import CacheArray, CacheArrayInterface
+
+
+class ICacheInterface(Interface):
+
+  def __init__(s, MemMsg, counter_nbits=64):
+    s.MemMsg = MemMsg
+    s.Counter = Bits(counter_nbits)
+
+    super(ICacheInterface, s).__init__([
+        MethodSpec(
+            'recv',
+            args=None,
+            rets={'msg': s.MemMsg.resp},
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'send',
+            args={'msg': s.MemMsg.req},
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'flush',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+        MethodSpec(
+            'stats',
+            args=None,
+            rets={
+                'hits': s.Counter,
+                'misses': s.Counter,
+                'prefetches': s.Counter,
+                'useful_prefetches': s.Counter,
+            },
+            call=False,
+            rdy=False,
+        ),
+    ])
+
+
+class ICache(Model):
+  """A blocking, read-only, set-associative instruction cache.
+
+  Sits between a client using the memory bus send/recv methods (Fetch) and a
+  port on the memory bus. The cache accepts one request at a time: send is
+  ready when no request is pending, or when the pending response is received
+  in the same cycle. A hit responds the cycle after the request was sent.
+  A miss refills the line one bus word at a time, then responds.
+
+  Requests must be reads which do not cross a bus word boundary (true of
+  aligned instruction fetches). The response data is the bus word shifted
+  down so the requested bytes start at bit 0. The test field of the response
+  is 1 if the request hit in the cache.
+
+  If a refill response reports an error, the line is not filled, and the
+  error status is forwarded in the response.
+
+  flush invalidates every line. A refill in progress during a flush will
+  not mark its line valid, since it may have read stale data.
+
+  If prefetch_lines is not 0, a miss or a hit on a prefetched line starts
+  a stream of the next prefetch_lines lines. While no request is pending
+  and the bus is idle, the next line in the stream is looked up, and
+  refilled if it is missing. A request sent during such a refill is served
+  if it hits, and otherwise waits for the refill to finish. A prefetch
+  which gets an error is dropped.
+
+  stats returns the number of hits and misses since reset, as well as the
+  number of lines prefetched, and how many of those were hit before being
+  evicted or overwritten in the record of the last prefetch_lines
+  prefetches. useful_prefetches / prefetches is the accuracy, and
+  useful_prefetches / (useful_prefetches + misses) the coverage.
+  """
+
+  def __init__(s, interface, nsets, nways, line_nbytes, prefetch_lines=0):
+    UseInterface(s, interface)
+    MemMsg = s.interface.MemMsg
+    addr_nbits = MemMsg.addr_nbits
+    data_nbytes = MemMsg.data_nbytes
+    s.require(
+        MethodSpec(
+            'mem_recv',
+            args=None,
+            rets={'msg': MemMsg.resp},
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'mem_send',
+            args={'msg': MemMsg.req},
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+    )
+
+    s.array = CacheArray(
+        CacheArrayInterface(addr_nbits, data_nbytes, nsets, nways, line_nbytes))
+    words_per_line = s.array.interface.words_per_line
+    word_offset_nbits = s.array.interface.word_offset_nbits
+    offset_nbits = s.array.interface.offset_nbits
+    WordIdx = Bits(clog2(words_per_line) + 1)
+
+    s.pending = Register(RegisterInterface(Bits(1), enable=True), reset_value=0)
+    s.req = Register(RegisterInterface(MemMsg.req, enable=True))
+    s.refill = Register(RegisterInterface(Bits(1), enable=True), reset_value=0)
+    s.send_idx = Register(RegisterInterface(WordIdx, enable=True))
+    s.recv_idx = Register(RegisterInterface(WordIdx, enable=True))
+    s.missed = Register(RegisterInterface(Bits(1), enable=True), reset_value=0)
+    s.poison = Register(RegisterInterface(Bits(1), enable=True), reset_value=0)
+    s.fault = Register(RegisterInterface(Bits(1), enable=True), reset_value=0)
+    s.fault_stat = Register(
+        RegisterInterface(Bits(MemMsgStatus.bits), enable=True))
+    s.hits = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    s.misses = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    s.prefetches = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    s.useful_prefetches = Register(
+        RegisterInterface(s.interface.Counter, enable=True), reset_value=0)
+    # The line being refilled, and whether it is a prefetch
+    s.refill_line = Register(RegisterInterface(Bits(addr_nbits), enable=True))
+    s.prefetching = Register(
+        RegisterInterface(Bits(1), enable=True), reset_value=0)
+
+    # PYMTL_BROKEN
+    s.req_addr = Wire(addr_nbits)
+    s.connect(s.req_addr, s.req.read_data.addr)
+    s.mem_recv_msg_data = Wire(data_nbytes * 8)
+    s.connect(s.mem_recv_msg_data, s.mem_recv_msg.data)
+
+    s.start_refill = Wire(1)
+    s.start_prefetch = Wire(1)
+    s.start_any = Wire(1)
+    s.useful_hit = Wire(1)
+    s.lookup_addr = Wire(addr_nbits)
+    s.req_line = Wire(addr_nbits)
+    s.line_addr = Wire(addr_nbits)
+    s.refill_send_addr = Wire(addr_nbits)
+    s.refill_recv_addr = Wire(addr_nbits)
+    s.refill_done = Wire(1)
+    s.resp_shamt = Wire(word_offset_nbits + 3)
+    s.resp_data = Wire(data_nbytes * 8)
+
+    # Lookup the pending request, or the next line to prefetch if there is
+    # none
+    s.connect(s.array.read_addr, s.lookup_addr)
+
+    @s.combinational
+    def handle_lookup():
+      s.start_refill.v = s.pending.read_data and not s.refill.read_data and not s.array.read_hit and not s.fault.read_data
+      s.recv_rdy.v = s.pending.read_data and (
+          not s.refill.read_data or
+          s.prefetching.read_data) and (s.array.read_hit or s.fault.read_data)
+      s.start_any.v = s.start_refill or s.start_prefetch
+
+    @s.combinational
+    def handle_resp_data():
+      # Shift by the byte offset within the word
+      s.resp_shamt[0:3].v = 0
+      s.resp_shamt[3:word_offset_nbits + 3].v = s.req_addr[0:word_offset_nbits]
+      s.resp_data.v = s.array.read_data >> s.resp_shamt
+
+    @s.combinational
+    def handle_recv():
+      s.recv_msg.v = 0
+      s.recv_msg.type_.v = MemMsgType.READ
+      s.recv_msg.opaque.v = s.req.read_data.opaque
+      s.recv_msg.len_.v = s.req.read_data.len_
+      if s.fault.read_data:
+        s.recv_msg.stat.v = s.fault_stat.read_data
+      else:
+        s.recv_msg.stat.v = MemMsgStatus.OK
+        s.recv_msg.test.v = not s.missed.read_data
+        s.recv_msg.data.v = s.resp_data
+
+    # A new request can be accepted once the pending one is received
+    @s.combinational
+    def handle_send():
+      s.send_rdy.v = not s.pending.read_data or s.recv_call
+
+    s.connect(s.req.write_data, s.send_msg)
+    s.connect(s.req.write_call, s.send_call)
+
+    @s.combinational
+    def handle_pending():
+      s.pending.write_call.v = s.send_call or s.recv_call
+      s.pending.write_data.v = s.send_call
+
+    @s.combinational
+    def compute_req_line():
+      s.req_line.v = s.req_addr
+      s.req_line[0:offset_nbits].v = 0
+
+    if prefetch_lines:
+      Left = Bits(clog2(prefetch_lines + 1))
+      Slot = Bits(clog2nz(prefetch_lines))
+      # The next line of the stream to prefetch, and how many are left
+      s.pf_addr = Register(RegisterInterface(Bits(addr_nbits), enable=True))
+      s.pf_left = Register(RegisterInterface(Left, enable=True), reset_value=0)
+      # The last prefetch_lines lines prefetched, valid until first hit
+      s.pf_lines = [
+          Register(RegisterInterface(Bits(addr_nbits), enable=True))
+          for _ in range(prefetch_lines)
+      ]
+      s.pf_valid = [
+          Register(RegisterInterface(Bits(1)), reset_value=0)
+          for _ in range(prefetch_lines)
+      ]
+      s.pf_slot = Register(RegisterInterface(Slot, enable=True), reset_value=0)
+      s.pf_check = Wire(1)
+      # PYMTL_BROKEN
+      s.pf_line_w = [Wire(addr_nbits) for _ in range(prefetch_lines)]
+      s.pf_valid_w = [Wire(1) for _ in range(prefetch_lines)]
+      s.pf_match = [Wire(1) for _ in range(prefetch_lines)]
+
+      @s.combinational
+      def handle_pf_check():
+        if s.pending.read_data:
+          s.lookup_addr.v = s.req_addr
+        else:
+          s.lookup_addr.v = s.pf_addr.read_data
+        # Demand requests have priority over the refill engine and the bus
+        s.pf_check.v = not s.pending.read_data and not s.refill.read_data and not s.send_call and not s.flush_call and s.pf_left.read_data != 0
+        s.start_prefetch.v = s.pf_check and not s.array.read_hit
+
+      for i in range(prefetch_lines):
+        s.connect(s.pf_line_w[i], s.pf_lines[i].read_data)
+        s.connect(s.pf_valid_w[i], s.pf_valid[i].read_data)
+        s.connect(s.pf_lines[i].write_data, s.pf_addr.read_data)
+
+        @s.combinational
+        def handle_pf_record(i=i):
+          s.pf_match[i].v = s.pf_valid_w[i] and s.pf_line_w[i] == s.req_line
+          s.pf_lines[
+              i].write_call.v = s.start_prefetch and s.pf_slot.read_data == i
+          if s.flush_call:
+            s.pf_valid[i].write_data.v = 0
+          elif s.start_prefetch and s.pf_slot.read_data == i:
+            s.pf_valid[i].write_data.v = 1
+          elif s.useful_hit and s.pf_match[i]:
+            s.pf_valid[i].write_data.v = 0
+          else:
+            s.pf_valid[i].write_data.v = s.pf_valid_w[i]
+
+      @s.combinational
+      def handle_useful_hit():
+        s.useful_hit.v = 0
+        if s.recv_call and not s.missed.read_data and not s.fault.read_data:
+          for i in range(prefetch_lines):
+            if s.pf_match[i]:
+              s.useful_hit.v = 1
+
+      @s.combinational
+      def update_pf_slot(last=prefetch_lines - 1):
+        s.pf_slot.write_call.v = s.start_prefetch
+        if s.pf_slot.read_data == last:
+          s.pf_slot.write_data.v = 0
+        else:
+          s.pf_slot.write_data.v = s.pf_slot.read_data + 1
+
+      @s.combinational
+      def update_pf_stream(nbytes=line_nbytes, n=prefetch_lines):
+        s.pf_addr.write_call.v = 0
+        s.pf_left.write_call.v = 0
+        s.pf_addr.write_data.v = s.pf_addr.read_data + nbytes
+        s.pf_left.write_data.v = s.pf_left.read_data - 1
+        if s.flush_call:
+          s.pf_left.write_call.v = 1
+          s.pf_left.write_data.v = 0
+        elif s.start_refill or s.useful_hit:
+          # Start a new stream after the line missed or used
+          s.pf_addr.write_call.v = 1
+          s.pf_left.write_call.v = 1
+          s.pf_addr.write_data.v = s.req_line + nbytes
+          s.pf_left.write_data.v = n
+        elif s.pf_check:
+          # Skip the line if it is already present
+          s.pf_addr.write_call.v = 1
+          s.pf_left.write_call.v = 1
+    else:
+      s.connect(s.lookup_addr, s.req_addr)
+      s.connect(s.start_prefetch, 0)
+      s.connect(s.useful_hit, 0)
+
+    @s.combinational
+    def handle_refill_line():
+      s.refill_line.write_call.v = s.start_any
+      s.prefetching.write_call.v = s.start_any
+      s.prefetching.write_data.v = s.start_prefetch
+      # Prefetched lines are always line aligned
+      if s.start_prefetch:
+        s.refill_line.write_data.v = s.lookup_addr
+      else:
+        s.refill_line.write_data.v = s.req_line
+
+    s.connect(s.line_addr, s.refill_line.read_data)
+
+    # Refill the line one word at a time
+    @s.combinational
+    def compute_refill_addrs():
+      s.refill_send_addr.v = s.line_addr
+      s.refill_send_addr[word_offset_nbits:
+                         offset_nbits].v = s.send_idx.read_data[
+                             0:offset_nbits - word_offset_nbits]
+      s.refill_recv_addr.v = s.line_addr
+      s.refill_recv_addr[word_offset_nbits:
+                         offset_nbits].v = s.recv_idx.read_data[
+                             0:offset_nbits - word_offset_nbits]
+
+    @s.combinational
+    def handle_mem_send(wpl=words_per_line):
+      s.mem_send_msg.v = 0
+      s.mem_send_msg.type_.v = MemMsgType.READ
+      s.mem_send_msg.addr.v = s.refill_send_addr
+      s.mem_send_call.v = s.refill.read_data and s.send_idx.read_data != wpl and s.mem_send_rdy
+
+    @s.combinational
+    def handle_mem_recv(last=words_per_line - 1):
+      s.mem_recv_call.v = s.refill.read_data and s.mem_recv_rdy
+      s.refill_done.v = s.mem_recv_call and s.recv_idx.read_data == last
+
+      s.array.fill_call.v = s.mem_recv_call and not s.fault.read_data and s.mem_recv_msg.stat == MemMsgStatus.OK
+      s.array.fill_addr.v = s.refill_recv_addr
+      s.array.fill_data.v = s.mem_recv_msg_data
+      s.array.fill_last.v = s.refill_done and not s.poison.read_data and not s.flush_call
+
+    @s.combinational
+    def handle_refill_state():
+      s.refill.write_call.v = s.start_any or s.refill_done
+      s.refill.write_data.v = s.start_any
+
+      s.send_idx.write_call.v = s.start_any or s.mem_send_call
+      s.recv_idx.write_call.v = s.start_any or s.mem_recv_call
+      if s.start_any:
+        s.send_idx.write_data.v = 0
+        s.recv_idx.write_data.v = 0
+      else:
+        s.send_idx.write_data.v = s.send_idx.read_data + 1
+        s.recv_idx.write_data.v = s.recv_idx.read_data + 1
+
+      s.missed.write_call.v = s.start_refill or s.send_call
+      s.missed.write_data.v = s.start_refill
+
+      # A prefetch which gets an error is dropped instead of faulting
+      s.poison.write_call.v = s.start_any or (
+          s.refill.read_data and
+          (s.flush_call or (s.prefetching.read_data and s.mem_recv_call and
+                            s.mem_recv_msg.stat != MemMsgStatus.OK)))
+      s.poison.write_data.v = not s.start_any
+
+    @s.combinational
+    def handle_fault():
+      s.fault.write_call.v = 0
+      s.fault.write_data.v = 0
+      s.fault_stat.write_call.v = 0
+      s.fault_stat.write_data.v = s.mem_recv_msg.stat
+      if s.recv_call:
+        s.fault.write_call.v = 1
+        s.fault.write_data.v = 0
+      elif s.mem_recv_call and s.mem_recv_msg.stat != MemMsgStatus.OK and not s.fault.read_data and not s.prefetching.read_data:
+        s.fault.write_call.v = 1
+        s.fault.write_data.v = 1
+        s.fault_stat.write_call.v = 1
+
+    s.connect(s.array.clear_call, s.flush_call)
+
+    @s.combinational
+    def handle_stats():
+      s.hits.write_call.v = s.recv_call and not s.missed.read_data and not s.fault.read_data
+      s.hits.write_data.v = s.hits.read_data + 1
+      s.misses.write_call.v = s.start_refill
+      s.misses.write_data.v = s.misses.read_data + 1
+      s.prefetches.write_call.v = s.start_prefetch
+      s.prefetches.write_data.v = s.prefetches.read_data + 1
+      s.useful_prefetches.write_call.v = s.useful_hit
+      s.useful_prefetches.write_data.v = s.useful_prefetches.read_data + 1
+
+    s.connect(s.stats_hits, s.hits.read_data)
+    s.connect(s.stats_misses, s.misses.read_data)
+    s.connect(s.stats_prefetches, s.prefetches.read_data)
+    s.connect(s.stats_useful_prefetches, s.useful_prefetches.read_data)
+
+  def line_trace(s):
+    if s.recv_call:
+      return 'h' if not s.missed.read_data else 'm'
+    elif s.refill.read_data:
+      return 'p' if s.prefetching.read_data else 'r'
+    else:
+      return ' '
@@ -0,0 +1,139 @@
+from pymtl import *
+from lizard.bitutil import clog2
+from lizard.bitutil.bit_struct_generator import *
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+
+
+class StridePrefetcherInterface(Interface):
+
+  def __init__(s, addr_nbits):
+    s.Addr = Bits(addr_nbits)
+
+    super(StridePrefetcherInterface, s).__init__([
+        MethodSpec(
+            'observe',
+            args={
+                'pc': s.Addr,
+                'addr': s.Addr,
+            },
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+    ])
+
+
+@bit_struct_generator
+def StrideEntry(tag_nbits, addr_nbits):
+  return [
+      Field('tag', tag_nbits),
+      Field('last_addr', addr_nbits),
+      Field('stride', addr_nbits),
+      # A 2-bit saturating count of repeats of the stride
+      Field('conf', 2),
+  ]
+
+
+class StridePrefetcher(Model):
+  """Prefetches ahead of loads which access memory with a constant stride.
+
+  observe trains a table indexed by the PC of a load, tagged with the
+  tag_nbits of the PC above the index. Each entry holds the last address
+  of the load, and the stride between its last 2 addresses. When a load
+  repeats the stride of an entry which had already seen it repeat, the
+  address distance strides ahead (a power of 2) is prefetched. A
+  different stride replaces the old one.
+
+  Prefetches are sent through the required prefetch method. Only the most
+  recent one waits for it to be ready, so a busy cache just drops them.
+  """
+
+  def __init__(s, interface, nentries, tag_nbits, distance, pc_offset_nbits):
+    UseInterface(s, interface)
+    assert distance > 0 and distance == 2**clog2(distance)
+    addr_nbits = s.interface.Addr.nbits
+    idx_nbits = clog2(nentries)
+    idx_lo = pc_offset_nbits
+    tag_lo = idx_lo + idx_nbits
+    tag_hi = tag_lo + tag_nbits
+    assert tag_hi <= addr_nbits
+    Entry = StrideEntry(tag_nbits, addr_nbits)
+
+    s.require(
+        MethodSpec(
+            'prefetch',
+            args={'addr': s.interface.Addr},
+            rets=None,
+            call=True,
+            rdy=True,
+        ))
+
+    s.entries = AsynchronousRAM(AsynchronousRAMInterface(Entry, nentries, 1, 1))
+    s.valid = AsynchronousRAM(
+        AsynchronousRAMInterface(Bits(1), nentries, 1, 1), reset_values=0)
+    s.pf_valid = Register(RegisterInterface(Bits(1)), reset_value=0)
+    s.pf_addr = Register(RegisterInterface(s.interface.Addr, enable=True))
+
+    s.idx_ = Wire(idx_nbits)
+    s.tag_ = Wire(tag_nbits)
+    # PYMTL_BROKEN
+    s.entry_tag_ = Wire(tag_nbits)
+    s.entry_last_addr_ = Wire(addr_nbits)
+    s.entry_stride_ = Wire(addr_nbits)
+    s.entry_conf_ = Wire(2)
+    s.connect(s.entry_tag_, s.entries.read_data[0].tag)
+    s.connect(s.entry_last_addr_, s.entries.read_data[0].last_addr)
+    s.connect(s.entry_stride_, s.entries.read_data[0].stride)
+    s.connect(s.entry_conf_, s.entries.read_data[0].conf)
+
+    s.hit_ = Wire(1)
+    s.stride_ = Wire(addr_nbits)
+    s.repeat_ = Wire(1)
+    s.trigger_ = Wire(1)
+
+    @s.combinational
+    def split_pc():
+      s.idx_.v = s.observe_pc[idx_lo:tag_lo]
+      s.tag_.v = s.observe_pc[tag_lo:tag_hi]
+
+    s.connect(s.entries.read_addr[0], s.idx_)
+    s.connect(s.valid.read_addr[0], s.idx_)
+    s.connect(s.entries.write_addr[0], s.idx_)
+    s.connect(s.entries.write_call[0], s.observe_call)
+    s.connect(s.valid.write_addr[0], s.idx_)
+    s.connect(s.valid.write_data[0], 1)
+    s.connect(s.valid.write_call[0], s.observe_call)
+
+    @s.combinational
+    def handle_observe():
+      s.hit_.v = s.valid.read_data[0] and s.entry_tag_ == s.tag_
+      s.stride_.v = s.observe_addr - s.entry_last_addr_
+      s.repeat_.v = s.hit_ and s.stride_ == s.entry_stride_
+      s.trigger_.v = s.observe_call and s.repeat_ and s.entry_stride_ != 0 and s.entry_conf_ != 0
+
+      s.entries.write_data[0].v = 0
+      s.entries.write_data[0].tag.v = s.tag_
+      s.entries.write_data[0].last_addr.v = s.observe_addr
+      if s.repeat_:
+        s.entries.write_data[0].stride.v = s.entry_stride_
+        if s.entry_conf_ == 3:
+          s.entries.write_data[0].conf.v = 3
+        else:
+          s.entries.write_data[0].conf.v = s.entry_conf_ + 1
+      elif s.hit_:
+        s.entries.write_data[0].stride.v = s.stride_
+
+    @s.combinational
+    def handle_prefetch(shamt=clog2(distance)):
+      s.prefetch_addr.v = s.pf_addr.read_data
+      s.prefetch_call.v = s.pf_valid.read_data and s.prefetch_rdy
+      s.pf_valid.write_data.v = s.trigger_ or (s.pf_valid.read_data and
+                                               not s.prefetch_rdy)
+      s.pf_addr.write_call.v = s.trigger_
+      s.pf_addr.write_data.v = s.observe_addr + (s.entry_stride_ << shamt)
+
+  def line_trace(s):
+    return '{}'.format(s.pf_valid.read_data)
@@ -73,6 +73,11 @@ def main():
       help="maximum number of cycles to simulate")
   p.add_argument('--imem-delay', default=0, type=int, help="imem delay")
   p.add_argument('--dmem-delay', default=0, type=int, help="dmem delay")
+  p.add_argument(
+      '--dmem-jitter',
+      default=0,
+      type=int,
+      help="most extra random dmem delay per request")
   p.add_argument('elf_file', help="the ELF file to run")
   opts = p.parse_args()
 
@@ -96,7 +101,8 @@ def main():
       opts.trace,
       use_cached_verilated=opts.use_cached,
       imem_delay=opts.imem_delay,
-      dmem_delay=opts.dmem_delay)
+      dmem_delay=opts.dmem_delay,
+      dmem_jitter=opts.dmem_jitter)
   sys.exit(result)
 
 
@@ -0,0 +1,71 @@
+from pymtl import *
+
+from lizard.model.hardware_model import HardwareModel, Result
+from lizard.model.clmodel import CLModel
+
+
+class Radix4DividerCL(CLModel):
+
+  @HardwareModel.validate
+  def __init__(s, divide_interface):
+    super(Radix4DividerCL, s).__init__(divide_interface)
+    s.state(busy=False, counter=0, quotient=None, rem=None)
+    s.nbits = divide_interface.DataLen
+
+    @s.model_method
+    def preempt():
+      s.busy = False
+
+    @s.ready_method
+    def result(call_index):
+      return s.busy and s.counter == 0
+
+    @s.model_method
+    def result():
+      s.busy = False
+      return Result(quotient=s.quotient, rem=s.rem)
+
+    @s.model_method
+    def cl_helper_step():
+      if s.counter != 0:
+        s.counter -= 1
+
+    @s.ready_method
+    def div(call_index):
+      return not s.busy
+
+    @s.model_method
+    def div(dividend, divisor, signed):
+      if signed:
+        a, b = dividend.int(), divisor.int()
+      else:
+        a, b = dividend.uint(), divisor.uint()
+
+      # Special cases are answered right away
+      s.counter = 0
+      if b == 0:
+        quotient, rem = -1, a
+      elif a == -2**(s.nbits - 1) and b == -1:
+        quotient, rem = a, 0
+      else:
+        quotient = abs(a) // abs(b)
+        if (a < 0) != (b < 0):
+          quotient = -quotient
+        rem = a - quotient * b
+        if abs(a) >= abs(b):
+          s.counter = s.nsteps(abs(a), abs(b))
+
+      s.quotient = Bits(s.nbits, quotient, trunc=True)
+      s.rem = Bits(s.nbits, rem, trunc=True)
+      s.busy = True
+
+  def nsteps(s, a, b):
+    # 2 bits of the quotient per step, starting from the top one
+    bits = s.clz(b) - s.clz(a) + 1
+    return (bits + 1) // 2
+
+  def clz(s, x):
+    return s.nbits - x.bit_length()
+
+  def line_trace(s):
+    return ''
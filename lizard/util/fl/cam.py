@@ -2,7 +2,7 @@ from pymtl import *
 
 from lizard.model.hardware_model import HardwareModel, Result
 from lizard.model.flmodel import FLModel
-from lizard.util.rtl.cam import Entry
+from lizard.util.rtl.cam import Entry, plru_node_range, plru_path
 from lizard.bitutil import clog2, clog2nz
 from lizard.bitutil.bit_struct_generator import *
 
@@ -66,3 +66,73 @@ class RandomReplacementCAMFL(FLModel):
     def clear():
       for i in range(len(s.entries)):
         s.entries[i] = s.Entry()
+
+
+class SetAssociativeCAMFL(FLModel):
+
+  @HardwareModel.validate
+  def __init__(s, interface, nsets, nways, key_shift=0):
+    super(SetAssociativeCAMFL, s).__init__(interface)
+    s.nsets = nsets
+    s.nways = nways
+    s.key_shift = key_shift
+
+    # Each way of each set is a (tag, value) pair, or None if invalid
+    s.state(
+        sets=[[None] * nways for _ in range(nsets)],
+        plru=[[0] * (nways - 1) for _ in range(nsets)],
+    )
+
+    @s.model_method
+    def read(key):
+      index, tag = s.split(key)
+      for entry in s.sets[index]:
+        if entry is not None and entry[0] == tag:
+          return Result(value=entry[1], valid=1)
+      return Result(value=0, valid=0)
+
+    @s.model_method
+    def write(key, remove, value):
+      index, tag = s.split(key)
+      ways = s.sets[index]
+      way = None
+      for w in range(nways):
+        if ways[w] is not None and ways[w][0] == tag:
+          way = w
+      if way is None and remove:
+        return
+      if way is None:
+        invalid = [w for w in range(nways) if ways[w] is None]
+        if invalid:
+          way = invalid[-1]
+        else:
+          way = s.victim(index)
+
+      if remove:
+        ways[way] = None
+      else:
+        ways[way] = (tag, value)
+        s.touch(index, way)
+
+    @s.model_method
+    def clear():
+      s.sets = [[None] * nways for _ in range(nsets)]
+      s.plru = [[0] * (nways - 1) for _ in range(nsets)]
+
+  def split(s, key):
+    key = int(key) >> s.key_shift
+    return key % s.nsets, key // s.nsets
+
+  def victim(s, index):
+    for way in range(s.nways):
+      if all(s.plru[index][node] == direction
+             for node, direction in plru_path(way, s.nways)):
+        return way
+
+  def touch(s, index, way):
+    for node in range(s.nways - 1):
+      lo, mid, hi = plru_node_range(node, s.nways)
+      if lo <= way < mid:
+        s.plru[index][node] = 1
+      elif mid <= way < hi:
+        s.plru[index][node] = 0
@@ -13,10 +13,11 @@ class SnapshottingFreeListFL(FLModel):
                num_alloc_ports,
                num_free_ports,
                nsnapshots,
-               used_slots_initial=0):
+               used_slots_initial=0,
+               max_refs=0):
     super(SnapshottingFreeListFL, s).__init__(
         SnapshottingFreeListInterface(nslots, num_alloc_ports, num_free_ports,
-                                      nsnapshots))
+                                      nsnapshots, max_refs))
 
     s.nslots = nslots
     s.zero_snapshot = [Bits(nslots) for _ in range(nsnapshots)]
@@ -30,7 +31,8 @@ class SnapshottingFreeListFL(FLModel):
             free_alloc_bypass=False,
             release_alloc_bypass=False,
             used_slots_initial=used_slots_initial),
-        snapshots=copy_bits(s.zero_snapshot))
+        snapshots=copy_bits(s.zero_snapshot),
+        refs=[Bits(s.interface.Refs.nbits, 0) for _ in range(nslots)])
 
     @s.model_method
     def get_state():
@@ -47,9 +49,24 @@ class SnapshottingFreeListFL(FLModel):
         s.snapshots[i][result.index] = 1
       return result
 
-    @s.model_method
-    def free(index):
-      s.freelist.free(index)
+    if max_refs == 0:
+
+      @s.model_method
+      def free(index):
+        s.freelist.free(index)
+    else:
+
+      @s.model_method
+      def share(index):
+        s.refs[int(index)] = s.refs[int(index)] + 1
+
+      @s.model_method
+      def drop(index):
+        if s.refs[int(index)] == 0:
+          s.freelist.free(index)
+          return 1
+        s.refs[int(index)] = s.refs[int(index)] - 1
+        return 0
 
     @s.model_method
     def reset_alloc_tracking(target_id):
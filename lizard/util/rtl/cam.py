@@ -5,13 +5,16 @@ from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.types import canonicalize_type
 from lizard.bitutil.bit_struct_generator import *
 from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.registerfile import RegisterFile
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
 
 
 class CAMInterface(Interface):
 
-  def __init__(s, Key, Value):
+  def __init__(s, Key, Value, num_read_ports=1):
     s.Key = canonicalize_type(Key)
     s.Value = canonicalize_type(Value)
+    s.NumReadPorts = num_read_ports
 
     super(CAMInterface, s).__init__([
         MethodSpec(
@@ -25,6 +28,7 @@ class CAMInterface(Interface):
             },
             call=False,
             rdy=False,
+            count=num_read_ports,
         ),
         MethodSpec(
             'write',
@@ -72,8 +76,11 @@ class RandomReplacementCAM(Model):
     ]
     s.overwrite_counter = Register(
         RegisterInterface(Addr, enable=True), reset_value=0)
-    s.read_addr_chain = [Wire(Addr) for _ in range(nregs)]
-    s.read_addr_valid = [Wire(1) for _ in range(nregs)]
+    nread = s.interface.NumReadPorts
+    s.read_addr_chain = [
+        [Wire(Addr) for _ in range(nregs)] for _ in range(nread)
+    ]
+    s.read_addr_valid = [[Wire(1) for _ in range(nregs)] for _ in range(nread)]
 
     # PYMTL_BROKEN
     s.entries_read_data_key = [Wire(Key) for _ in range(nregs)]
@@ -90,30 +97,32 @@ class RandomReplacementCAM(Model):
       s.connect(s.entries[i].write_data.value, s.entries_write_data_value[i])
       s.connect(s.entries[i].write_data.valid, s.entries_write_data_valid[i])
 
-    for i in range(nregs):
-      if i == 0:
+    for p in range(nread):
+      for i in range(nregs):
+        if i == 0:
 
-        @s.combinational
-        def handle_read_addr_0(i=i):
-          s.read_addr_chain[i].v = i
-          s.read_addr_valid[i].v = s.entries_read_data_key[
-              i] == s.read_key and s.entries_read_data_valid[i]
-      else:
+          @s.combinational
+          def handle_read_addr_0(p=p, i=i):
+            s.read_addr_chain[p][i].v = i
+            s.read_addr_valid[p][i].v = s.entries_read_data_key[
+                i] == s.read_key[p] and s.entries_read_data_valid[i]
+        else:
 
-        @s.combinational
-        def handle_read_addr(i=i, j=i - 1):
-          if s.entries_read_data_key[
-              i] == s.read_key and s.entries_read_data_valid[i]:
-            s.read_addr_chain[i].v = i
-            s.read_addr_valid[i].v = 1
-          else:
-            s.read_addr_chain[i].v = s.read_addr_chain[j]
-            s.read_addr_valid[i].v = s.read_addr_valid[j]
+          @s.combinational
+          def handle_read_addr(p=p, i=i, j=i - 1):
+            if s.entries_read_data_key[i] == s.read_key[
+                p] and s.entries_read_data_valid[i]:
+              s.read_addr_chain[p][i].v = i
+              s.read_addr_valid[p][i].v = 1
+            else:
+              s.read_addr_chain[p][i].v = s.read_addr_chain[p][j]
+              s.read_addr_valid[p][i].v = s.read_addr_valid[p][j]
 
-    @s.combinational
-    def handle_read():
-      s.read_value.v = s.entries_read_data_value[s.read_addr_chain[nregs - 1]]
-      s.read_valid.v = s.read_addr_valid[nregs - 1]
+      @s.combinational
+      def handle_read(p=p):
+        s.read_value[p].v = s.entries_read_data_value[s.read_addr_chain[p][nregs
+                                                                           - 1]]
+        s.read_valid[p].v = s.read_addr_valid[p][nregs - 1]
 
     s.write_addr_chain = [Wire(Addr) for _ in range(nregs)]
     s.write_addr_valid = [Wire(1) for _ in range(nregs)]
@@ -188,3 +197,252 @@ class RandomReplacementCAM(Model):
       else:
         s.overwrite_counter.write_call.v = 0
         s.overwrite_counter.write_data.v = 0
+
+
+@bit_struct_generator
+def WayEntry(tag_nbits, value_nbits):
+  return [
+      Field('tag', tag_nbits),
+      Field('value', value_nbits),
+  ]
+
+
+def plru_node_range(node, nways):
+  """The ways under a node of a tree pseudo-LRU, as (lo, mid, hi).
+
+  Nodes are numbered like a heap, and the node's left subtree holds ways
+  lo to mid - 1 and its right subtree ways mid to hi - 1.
+  """
+  level = clog2(node + 2) - 1
+  span = nways >> level
+  lo = (node - (2**level - 1)) * span
+  return lo, lo + span // 2, lo + span
+
+
+def plru_path(way, nways):
+  """The nodes from the root to a way in a tree pseudo-LRU, as a list of
+  (node, direction) pairs, where direction 1 is the right subtree.
+  """
+  levels = clog2(nways)
+  path = []
+  node = 0
+  for level in range(levels):
+    direction = (way >> (levels - 1 - level)) & 1
+    path.append((node, direction))
+    node = 2 * node + 1 + direction
+  return path
+
+
+class SetAssociativeCAM(Model):
+  """A CAM split into nsets sets of nways ways each, like a cache.
+
+  The key_shift bits after the lowest ones index the set, and everything
+  above them is the tag. The lowest key_shift bits are ignored, so they
+  must be the same for every key, like the low bits of a PC.
+
+  A write to a key not in its set fills an invalid way if there is one,
+  and the tree pseudo-LRU way otherwise. Reads are never called, so only
+  writes count as uses. Writing with remove set invalidates the key. A read
+  which misses returns a value of 0.
+  """
+
+  def __init__(s, interface, nsets, nways, key_shift=0):
+    UseInterface(s, interface)
+    assert nsets == 2**clog2(nsets)
+    assert nways == 2**clog2(nways)
+
+    Key = s.interface.Key
+    Value = s.interface.Value
+    nread = s.interface.NumReadPorts
+    tag_start = key_shift + clog2(nsets)
+    tag_nbits = Key.nbits - tag_start
+    assert tag_nbits > 0
+    Index = Bits(clog2nz(nsets))
+    Tag = Bits(tag_nbits)
+    Way = Bits(clog2nz(nways))
+    levels = clog2(nways)
+
+    # Read port nread of every way is used by write
+    nports = nread + 1
+    s.WayEntry = WayEntry(tag_nbits, Value.nbits)
+    s.ways = [
+        AsynchronousRAM(
+            AsynchronousRAMInterface(s.WayEntry(), nsets, nports, 1))
+        for _ in range(nways)
+    ]
+    s.valid = [
+        RegisterFile(Bits(1), nsets, nports, 1, False, False, [0] * nsets)
+        for _ in range(nways)
+    ]
+
+    s.index_ = [Wire(Index) for _ in range(nports)]
+    s.tag_ = [Wire(Tag) for _ in range(nports)]
+    # Entry p * nways + w is for port p and way w
+    s.hit_ = [Wire(1) for _ in range(nports * nways)]
+    # PYMTL_BROKEN
+    s.way_tag_ = [Wire(Tag) for _ in range(nports * nways)]
+    s.way_value_ = [Wire(Value) for _ in range(nports * nways)]
+    s.way_valid_ = [Wire(1) for _ in range(nports * nways)]
+
+    # PYMTL_BROKEN
+    s.key_ = [Wire(Key) for _ in range(nports)]
+    for p in range(nread):
+      s.connect(s.key_[p], s.read_key[p])
+    s.connect(s.key_[nread], s.write_key)
+
+    for p in range(nports):
+      if nsets == 1:
+        s.connect(s.index_[p], 0)
+      else:
+
+        @s.combinational
+        def split_index(p=p, key_shift=key_shift, tag_start=tag_start):
+          s.index_[p].v = s.key_[p][key_shift:tag_start]
+
+      @s.combinational
+      def split_tag(p=p, tag_start=tag_start, key_nbits=Key.nbits):
+        s.tag_[p].v = s.key_[p][tag_start:key_nbits]
+
+    for p in range(nports):
+      for w in range(nways):
+        n = p * nways + w
+        s.connect(s.ways[w].read_addr[p], s.index_[p])
+        s.connect(s.valid[w].read_addr[p], s.index_[p])
+        s.connect(s.way_tag_[n], s.ways[w].read_data[p].tag)
+        s.connect(s.way_value_[n], s.ways[w].read_data[p].value)
+        s.connect(s.way_valid_[n], s.valid[w].read_data[p])
+
+        @s.combinational
+        def check_hit(n=n, p=p):
+          s.hit_[n].v = s.way_valid_[n] and s.way_tag_[n] == s.tag_[p]
+
+    for p in range(nread):
+
+      @s.combinational
+      def handle_read(p=p, base=p * nways, nways=nways):
+        s.read_value[p].v = 0
+        s.read_valid[p].v = 0
+        for w in range(nways):
+          if s.hit_[base + w]:
+            s.read_value[p].v = s.way_value_[base + w]
+            s.read_valid[p].v = 1
+
+    # The way to write: the one holding the key, else the last invalid one,
+    # else the victim
+    s.write_hit_ = Wire(1)
+    s.write_hit_way_ = Wire(Way)
+    s.has_invalid_ = Wire(1)
+    s.invalid_way_ = Wire(Way)
+    s.victim_way_ = Wire(Way)
+    s.fill_way_ = Wire(Way)
+    s.writing_ = Wire(1)
+
+    @s.combinational
+    def find_ways(base=nread * nways, nways=nways):
+      s.write_hit_.v = 0
+      s.write_hit_way_.v = 0
+      s.has_invalid_.v = 0
+      s.invalid_way_.v = 0
+      for w in range(nways):
+        if s.hit_[base + w]:
+          s.write_hit_.v = 1
+          s.write_hit_way_.v = w
+        if not s.way_valid_[base + w]:
+          s.has_invalid_.v = 1
+          s.invalid_way_.v = w
+
+    @s.combinational
+    def compute_fill_way():
+      if s.write_hit_:
+        s.fill_way_.v = s.write_hit_way_
+      elif s.has_invalid_:
+        s.fill_way_.v = s.invalid_way_
+      else:
+        s.fill_way_.v = s.victim_way_
+      # Removing a key which is not there does nothing
+      s.writing_.v = s.write_call and (s.write_hit_ or not s.write_remove)
+
+    for w in range(nways):
+      s.connect(s.ways[w].write_addr[0], s.index_[nread])
+      s.connect(s.ways[w].write_data[0].tag, s.tag_[nread])
+      s.connect(s.ways[w].write_data[0].value, s.write_value)
+      s.connect(s.valid[w].write_addr[0], s.index_[nread])
+      s.connect(s.valid[w].set_call, s.clear_call)
+      for port in s.valid[w].set_in_:
+        s.connect(port, 0)
+
+      @s.combinational
+      def handle_write(w=w):
+        s.ways[w].write_call[0].v = s.writing_ and s.fill_way_ == w
+        s.valid[w].write_call[0].v = s.writing_ and s.fill_way_ == w
+        s.valid[w].write_data[0].v = not s.write_remove
+
+    if nways == 1:
+      s.connect(s.victim_way_, 0)
+    else:
+      # Bit k of a set's pseudo-LRU state is node k of a tree over its ways,
+      # and points to the subtree used least recently
+      s.plru = RegisterFile(
+          Bits(nways - 1), nsets, 1, 1, False, False, [0] * nsets)
+      s.plru_state_ = Wire(nways - 1)
+      s.plru_next_ = Wire(nways - 1)
+      s.connect(s.plru.read_addr[0], s.index_[nread])
+      s.connect(s.plru_state_, s.plru.read_data[0])
+      s.connect(s.plru.write_addr[0], s.index_[nread])
+      s.connect(s.plru.write_data[0], s.plru_next_)
+      s.connect(s.plru.set_call, s.clear_call)
+      for port in s.plru.set_in_:
+        s.connect(port, 0)
+
+      @s.combinational
+      def handle_plru_write():
+        s.plru.write_call[0].v = s.writing_ and not s.write_remove
+
+      # The victim is the way every node on its path points to.
+      # victim_path_[w * levels + l] is set if the first l + 1 nodes do
+      s.victim_path_ = [Wire(1) for _ in range(nways * levels)]
+      for w in range(nways):
+        for l, (node, direction) in enumerate(plru_path(w, nways)):
+          if l == 0:
+
+            @s.combinational
+            def follow_root(n=w * levels, node=node, direction=direction):
+              s.victim_path_[n].v = s.plru_state_[node] == direction
+          else:
+
+            @s.combinational
+            def follow_node(n=w * levels + l,
+                            m=w * levels + l - 1,
+                            node=node,
+                            direction=direction):
+              s.victim_path_[n].v = s.victim_path_[m] and (
+                  s.plru_state_[node] == direction)
+
+      @s.combinational
+      def find_victim(nways=nways, levels=levels):
+        s.victim_way_.v = 0
+        for w in range(nways):
+          if s.victim_path_[w * levels + levels - 1]:
+            s.victim_way_.v = w
+
+      # Every node above the filled way points away from it
+      s.fill_onehot_ = Wire(nways)
+      for w in range(nways):
+
+        @s.combinational
+        def compute_fill_onehot(w=w):
+          s.fill_onehot_[w].v = s.fill_way_ == w
+
+      for node in range(nways - 1):
+        lo, mid, hi = plru_node_range(node, nways)
+
+        @s.combinational
+        def update_plru(node=node,
+                        left=((1 << (mid - lo)) - 1) << lo,
+                        right=((1 << (hi - mid)) - 1) << mid):
+          if (s.fill_onehot_ & left) != 0:
+            s.plru_next_[node].v = 1
+          elif (s.fill_onehot_ & right) != 0:
+            s.plru_next_[node].v = 0
+          else:
+            s.plru_next_[node].v = s.plru_state_[node]
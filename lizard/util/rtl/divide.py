@@ -1,8 +1,9 @@
 from pymtl import *
-from lizard.bitutil import clog2
+from lizard.bitutil import clog2, clog2nz
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.interface import Interface, UseInterface
 from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.coders import PriorityDecoder
 
 
 class DivideInterface(Interface):
@@ -27,6 +28,13 @@ class DivideInterface(Interface):
             call=True,
             rdy=True,
         ),
+        MethodSpec(
+            'cl_helper_step',
+            args=None,
+            rets=None,
+            call=False,
+            rdy=False,
+        ),
         MethodSpec(
             'div',
             args={
@@ -174,3 +182,175 @@ class NonRestoringDivider(Model):
     def handle_busy():
       s.busy.write_call.v = s.div_call or s.result_call or s.preempt_call
       s.busy.write_data.v = s.div_call
+
+
+class Radix4Divider(Model):
+  """Divides 2 quotient bits per cycle, skipping the bits known to be 0.
+
+  The quotient of a / b has at most clz(b) - clz(a) + 1 bits, so a is
+  shifted to start there, and only that many bits (rounded up to an even
+  number) are computed. Every cycle computes the next quotient digit from
+  0 to 3 by comparing the partial remainder against b, 2b and 3b.
+
+  A zero divisor, the signed overflow case, and |a| < |b| are answered
+  the cycle after div is called. Otherwise the result is ready
+  ceil(bits / 2) cycles after that.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+    dlen = s.interface.DataLen
+    assert dlen % 2 == 0
+    END = dlen - 1
+    # Wide enough for the partial remainder shifted by a digit, and 3b
+    WIDE = dlen + 2
+    # Wide enough to count to dlen
+    bits_nbits = clog2(dlen + 1)
+    counter_nbits = clog2(dlen // 2 + 1)
+
+    s.rem = Register(RegisterInterface(dlen, enable=True))
+    s.quot = Register(RegisterInterface(dlen, enable=True))
+    s.divisor = Register(RegisterInterface(dlen, enable=True))
+    # Set if we need to take twos compliment at end
+    s.negate = Register(RegisterInterface(1, enable=True))
+    s.negate_rem = Register(RegisterInterface(1, enable=True))
+    s.counter = Register(RegisterInterface(counter_nbits, enable=True))
+    s.busy = Register(RegisterInterface(1, enable=True), reset_value=0)
+    s.connect(s.divisor.write_call, s.div_call)
+    s.connect(s.negate.write_call, s.div_call)
+    s.connect(s.negate_rem.write_call, s.div_call)
+
+    # The magnitudes of the operands
+    s.a_ = Wire(dlen)
+    s.b_ = Wire(dlen)
+
+    # Leading zeros, found as the first set bit from the top
+    s.a_clz = PriorityDecoder(dlen)
+    s.b_clz = PriorityDecoder(dlen)
+    for i in range(dlen):
+      s.connect(s.a_clz.decode_signal[i], s.a_[END - i])
+      s.connect(s.b_clz.decode_signal[i], s.b_[END - i])
+
+    s.special_ = Wire(1)
+    s.special_quot_ = Wire(dlen)
+    s.special_rem_ = Wire(dlen)
+    s.raw_bits_ = Wire(bits_nbits)
+    s.bits_ = Wire(bits_nbits)
+    s.shamt_ = Wire(bits_nbits)
+
+    @s.combinational
+    def handle_operands():
+      s.a_.v = ~s.div_dividend + 1 if (s.div_signed and
+                                       s.div_dividend[END]) else s.div_dividend
+      s.b_.v = ~s.div_divisor + 1 if (s.div_signed and
+                                      s.div_divisor[END]) else s.div_divisor
+      s.negate.write_data.v = s.div_signed and (s.div_divisor[END]
+                                                ^ s.div_dividend[END])
+      s.negate_rem.write_data.v = s.div_signed and s.div_dividend[END]
+      s.divisor.write_data.v = s.b_
+
+    @s.combinational
+    def handle_special(min_int=1 << END, neg_one=(1 << dlen) - 1):
+      s.special_.v = 1
+      if s.div_divisor == 0:
+        s.special_quot_.v = neg_one
+        s.special_rem_.v = s.div_dividend
+      elif (s.div_signed and s.div_dividend == min_int and
+            s.div_divisor == neg_one):
+        s.special_quot_.v = s.div_dividend
+        s.special_rem_.v = 0
+      elif s.a_ < s.b_:
+        s.special_quot_.v = 0
+        s.special_rem_.v = s.div_dividend
+      else:
+        s.special_.v = 0
+        s.special_quot_.v = 0
+        s.special_rem_.v = 0
+
+    @s.combinational
+    def handle_normalize(dlen=dlen):
+      # Round the number of quotient bits up to a whole digit
+      s.raw_bits_.v = zext(s.b_clz.decode_decoded, bits_nbits) - zext(
+          s.a_clz.decode_decoded, bits_nbits) + 1
+      s.bits_.v = s.raw_bits_ + zext(s.raw_bits_[0], bits_nbits)
+      s.shamt_.v = dlen - s.bits_
+
+    # One radix-4 step
+    s.shifted_ = Wire(WIDE)
+    s.b1_ = Wire(WIDE)
+    s.b2_ = Wire(WIDE)
+    s.b3_ = Wire(WIDE)
+    s.rem_next_ = Wire(WIDE)
+    s.quot_next_ = Wire(dlen)
+    s.quot_top_ = Wire(2)
+    s.digit_ = Wire(2)
+    s.connect(s.quot_top_, s.quot.read_data[dlen - 2:dlen])
+
+    @s.combinational
+    def handle_step():
+      s.shifted_.v = (zext(s.rem.read_data, WIDE) << 2) | zext(
+          s.quot_top_, WIDE)
+      s.b1_.v = zext(s.divisor.read_data, WIDE)
+      s.b2_.v = s.b1_ << 1
+      s.b3_.v = s.b1_ + s.b2_
+      if s.shifted_ >= s.b3_:
+        s.digit_.v = 3
+        s.rem_next_.v = s.shifted_ - s.b3_
+      elif s.shifted_ >= s.b2_:
+        s.digit_.v = 2
+        s.rem_next_.v = s.shifted_ - s.b2_
+      elif s.shifted_ >= s.b1_:
+        s.digit_.v = 1
+        s.rem_next_.v = s.shifted_ - s.b1_
+      else:
+        s.digit_.v = 0
+        s.rem_next_.v = s.shifted_
+      s.quot_next_.v = (s.quot.read_data << 2) | zext(s.digit_, dlen)
+
+    @s.combinational
+    def handle_calls():
+      s.div_rdy.v = not s.busy.read_data or s.result_call
+      s.result_rdy.v = s.busy.read_data and s.counter.read_data == 0
+      s.result_quotient.v = s.quot.read_data
+      s.result_rem.v = s.rem.read_data
+
+    @s.combinational
+    def handle_counter():
+      s.counter.write_call.v = s.counter.read_data != 0 or s.div_call
+      if s.div_call:
+        if s.special_:
+          s.counter.write_data.v = 0
+        else:
+          s.counter.write_data.v = s.bits_[1:bits_nbits]
+      else:
+        s.counter.write_data.v = s.counter.read_data - 1
+
+    @s.combinational
+    def set_div_regs(dlen=dlen):
+      s.rem.write_call.v = s.div_call or s.counter.read_data != 0
+      s.quot.write_call.v = s.div_call or s.counter.read_data != 0
+      if s.div_call:
+        if s.special_:
+          s.rem.write_data.v = s.special_rem_
+          s.quot.write_data.v = s.special_quot_
+        else:
+          # The bits above the quotient are the first partial remainder
+          s.rem.write_data.v = s.a_ >> s.bits_
+          s.quot.write_data.v = s.a_ << s.shamt_
+      else:
+        s.rem.write_data.v = s.rem_next_[0:dlen]
+        s.quot.write_data.v = s.quot_next_
+        # Last step, compliment
+        if s.counter.read_data == 1:
+          if s.negate_rem.read_data:
+            s.rem.write_data.v = ~s.rem_next_[0:dlen] + 1
+          if s.negate.read_data:
+            s.quot.write_data.v = ~s.quot_next_ + 1
+
+    @s.combinational
+    def handle_busy():
+      s.busy.write_call.v = s.div_call or s.result_call or s.preempt_call
+      s.busy.write_data.v = s.div_call
+
+  def line_trace(s):
+    return '{}:{}'.format(s.busy.read_data, s.counter.read_data)
@@ -1,4 +1,5 @@
 from pymtl import *
+from lizard.bitutil import clog2
 from lizard.util.rtl.register import Register, RegisterInterface
 from lizard.util.rtl.types import canonicalize_type
 from lizard.util.rtl.method import MethodSpec
@@ -7,12 +8,13 @@ from lizard.util.rtl.interface import Interface, UseInterface
 
 class DropUnitInterface(Interface):
 
-  def __init__(s, dtype):
+  def __init__(s, dtype, max_drops=1):
     s.Data = canonicalize_type(dtype)
+    s.Count = Bits(clog2(max_drops + 1))
     super(DropUnitInterface, s).__init__([
         MethodSpec(
             'drop',
-            args=None,
+            args={'count': s.Count},
             rets=None,
             call=True,
             rdy=True,
@@ -37,6 +39,13 @@ class DropUnitInterface(Interface):
 
 
 class DropUnit(Model):
+  """Discards inputs which have been requested but are no longer wanted.
+
+  drop discards the next count inputs after any taken in the same cycle,
+  replacing any drop still pending. Inputs are discarded as soon as they
+  arrive, starting the cycle after the drop call, so whether an input is
+  ready or discarded never depends on the drop call.
+  """
 
   def __init__(s, interface):
     UseInterface(s, interface)
@@ -52,26 +61,32 @@ class DropUnit(Model):
         ))
 
     s.drop_pending = Register(
-        RegisterInterface(Bits(1), False, False), reset_value=0)
-    s.drop_pending_curr = Wire(1)
+        RegisterInterface(s.interface.Count, False, False), reset_value=0)
+    s.drop_pending_curr = Wire(s.interface.Count.nbits)
 
     s.connect(s.output_data, s.input_data)
 
     @s.combinational
     def handle_drop():
-      s.drop_pending_curr.v = s.drop_pending.read_data or s.drop_call
-      s.drop_status_occurred.v = s.drop_pending_curr and s.input_rdy
-      s.drop_rdy.v = not s.drop_pending.read_data
+      s.drop_status_occurred.v = s.drop_pending.read_data != 0 and s.input_rdy
+      s.drop_rdy.v = s.drop_pending.read_data == 0
 
       if s.drop_status_occurred:
         s.input_call.v = 1
         s.output_rdy.v = 0
-        s.drop_pending.write_data.v = 0
-      elif s.drop_pending_curr:
+        s.drop_pending_curr.v = s.drop_pending.read_data - 1
+      elif s.drop_pending.read_data != 0:
         s.input_call.v = 0
         s.output_rdy.v = 0
-        s.drop_pending.write_data.v = 1
+        s.drop_pending_curr.v = s.drop_pending.read_data
       else:
         s.input_call.v = s.output_call
         s.output_rdy.v = s.input_rdy
-        s.drop_pending.write_data.v = 0
+        s.drop_pending_curr.v = 0
+
+    @s.combinational
+    def handle_write():
+      if s.drop_call:
+        s.drop_pending.write_data.v = s.drop_count
+      else:
+        s.drop_pending.write_data.v = s.drop_pending_curr
@@ -0,0 +1,166 @@
+from pymtl import *
+from lizard.bitutil import clog2, clog2nz
+from lizard.util.rtl.interface import Interface, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.types import canonicalize_type
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+from lizard.util.rtl.wrap_inc import WrapInc
+
+
+class FifoInterface(Interface):
+
+  def __init__(s, dtype, nentries, num_enq=1, num_deq=1):
+    s.Data = canonicalize_type(dtype)
+    s.Count = Bits(clog2(nentries + 1))
+    s.nentries = nentries
+    s.num_enq = num_enq
+    s.num_deq = num_deq
+
+    super(FifoInterface, s).__init__(
+        [
+            MethodSpec(
+                'status',
+                args=None,
+                rets={
+                    'count': s.Count,
+                },
+                call=False,
+                rdy=False,
+            ),
+            MethodSpec(
+                'peek',
+                args=None,
+                rets={
+                    'msg': s.Data,
+                },
+                call=False,
+                rdy=True,
+                count=num_deq,
+            ),
+            MethodSpec(
+                'deq',
+                args=None,
+                rets=None,
+                call=True,
+                rdy=True,
+                count=num_deq,
+            ),
+            MethodSpec(
+                'enq',
+                args={
+                    'msg': s.Data,
+                },
+                rets=None,
+                call=True,
+                rdy=True,
+                count=num_enq,
+            ),
+            MethodSpec(
+                'clear',
+                args=None,
+                rets=None,
+                call=True,
+                rdy=False,
+            ),
+        ],
+        ordering_chains=[
+            ['status', 'peek', 'deq', 'enq', 'clear'],
+        ],
+    )
+
+
+class Fifo(Model):
+  """A first-in, first-out queue.
+
+  Up to num_enq entries can be added, and num_deq removed, every cycle.
+  peek[i] and deq[i] refer to the ith oldest entry, and enq[i] adds after
+  the entries added by enq[0] through enq[i - 1]. The calls made in a
+  cycle must be a prefix of each port array.
+
+  enq[i] is not ready unless the queue has room for i + 1 more entries,
+  even if deq is called in the same cycle, so the ready signals never
+  depend on calls. clear empties the queue, and overrides enq and deq.
+  """
+
+  def __init__(s, interface):
+    UseInterface(s, interface)
+    nentries = s.interface.nentries
+    num_enq = s.interface.num_enq
+    num_deq = s.interface.num_deq
+    idx_nbits = clog2nz(nentries)
+    Count = s.interface.Count
+
+    s.entries = AsynchronousRAM(
+        AsynchronousRAMInterface(s.interface.Data, nentries, num_deq, num_enq))
+    s.head = Register(
+        RegisterInterface(Bits(idx_nbits), enable=True), reset_value=0)
+    s.tail = Register(
+        RegisterInterface(Bits(idx_nbits), enable=True), reset_value=0)
+    s.count = Register(RegisterInterface(Count, enable=True), reset_value=0)
+
+    # head_ptrs[i] is the index of the ith oldest entry, and tail_ptrs[i]
+    # is where enq[i] writes
+    s.head_ptrs = [Wire(idx_nbits) for _ in range(num_deq + 1)]
+    s.tail_ptrs = [Wire(idx_nbits) for _ in range(num_enq + 1)]
+    s.head_incs = [WrapInc(idx_nbits, nentries, True) for _ in range(num_deq)]
+    s.tail_incs = [WrapInc(idx_nbits, nentries, True) for _ in range(num_enq)]
+    s.connect(s.head_ptrs[0], s.head.read_data)
+    s.connect(s.tail_ptrs[0], s.tail.read_data)
+    for i in range(num_deq):
+      s.connect(s.head_incs[i].inc_in, s.head_ptrs[i])
+      s.connect(s.head_ptrs[i + 1], s.head_incs[i].inc_out)
+    for i in range(num_enq):
+      s.connect(s.tail_incs[i].inc_in, s.tail_ptrs[i])
+      s.connect(s.tail_ptrs[i + 1], s.tail_incs[i].inc_out)
+
+    s.connect(s.status_count, s.count.read_data)
+
+    for i in range(num_deq):
+      s.connect(s.entries.read_addr[i], s.head_ptrs[i])
+      s.connect(s.peek_msg[i], s.entries.read_data[i])
+
+      @s.combinational
+      def handle_deq_rdy(i=i):
+        s.peek_rdy[i].v = s.count.read_data > i
+        s.deq_rdy[i].v = s.count.read_data > i
+
+    for i in range(num_enq):
+      s.connect(s.entries.write_addr[i], s.tail_ptrs[i])
+      s.connect(s.entries.write_data[i], s.enq_msg[i])
+
+      @s.combinational
+      def handle_enq(i=i, limit=nentries - i):
+        s.enq_rdy[i].v = s.count.read_data < limit
+        s.entries.write_call[i].v = s.enq_call[i] and not s.clear_call
+
+    s.num_enq_ = Wire(clog2(num_enq + 1))
+    s.num_deq_ = Wire(clog2(num_deq + 1))
+
+    @s.combinational
+    def count_calls(num_enq=num_enq, num_deq=num_deq):
+      s.num_enq_.v = 0
+      for i in range(num_enq):
+        if s.enq_call[i]:
+          s.num_enq_.v = i + 1
+      s.num_deq_.v = 0
+      for i in range(num_deq):
+        if s.deq_call[i]:
+          s.num_deq_.v = i + 1
+
+    @s.combinational
+    def handle_update():
+      s.head.write_call.v = s.num_deq_ != 0 or s.clear_call
+      s.tail.write_call.v = s.num_enq_ != 0 or s.clear_call
+      s.count.write_call.v = s.num_enq_ != 0 or s.num_deq_ != 0 or s.clear_call
+      if s.clear_call:
+        s.head.write_data.v = 0
+        s.tail.write_data.v = 0
+        s.count.write_data.v = 0
+      else:
+        s.head.write_data.v = s.head_ptrs[s.num_deq_]
+        s.tail.write_data.v = s.tail_ptrs[s.num_enq_]
+        s.count.write_data.v = s.count.read_data + s.num_enq_ - s.num_deq_
+
+  def line_trace(s):
+    return '{}'.format(s.count.read_data)
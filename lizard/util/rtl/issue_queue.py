@@ -5,6 +5,7 @@ from lizard.util.rtl.register import Register, RegisterInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.interface import Interface, UseInterface
 from lizard.util.rtl.types import canonicalize_type
+from lizard.util.rtl.arbiters import PriorityArbiter, ArbiterInterface
 
 
 class AbstractIssueType(BitStructDefinition):
@@ -20,11 +21,22 @@ class AbstractIssueType(BitStructDefinition):
     s.opaque = BitField(canonicalize_type(opaque).nbits)
     s.kill_opaque = BitField(canonicalize_type(KillOpaqueType).nbits)
     s.ordered = BitField(1)  # This is ignore if the interface is not ordered
+    # Issue without waiting for ordered predecessors. Also ignored if the
+    # interface is not ordered
+    s.bypass = BitField(1)
+    # Passed over while the queue is told to hold. Ignored if the interface
+    # cannot hold
+    s.holdable = BitField(1)
 
 
 class IssueQueueSlotInterface(Interface):
 
-  def __init__(s, slot_type, KillArgType, num_notify, with_order=False):
+  def __init__(s,
+               slot_type,
+               KillArgType,
+               num_notify,
+               with_order=False,
+               with_hold=False):
     s.SlotType = slot_type
     s.SrcTag = Bits(slot_type.src0.nbits)
     s.Opaque = Bits(slot_type.opaque.nbits)
@@ -32,10 +44,14 @@ class IssueQueueSlotInterface(Interface):
 
     s.NumNotify = num_notify
     s.WithOrder = with_order
+    s.WithHold = with_hold
 
     status_rets = {'valid': Bits(1), 'ready': Bits(1)}
     if s.WithOrder:
       status_rets['ordered'] = Bits(1)
+      status_rets['bypass'] = Bits(1)
+    if s.WithHold:
+      status_rets['holdable'] = Bits(1)
     super(IssueQueueSlotInterface, s).__init__(
         [
             MethodSpec(
@@ -127,6 +143,17 @@ class GenericIssueSlot(Model):
       s.connect(s.status_ordered, s.ordered_.read_data)
       s.connect(s.ordered_.write_data, s.input_value.ordered)
       s.connect(s.ordered_.write_call, s.input_call)
+      s.bypass_ = Register(RegisterInterface(Bits(1), enable=True))
+      s.connect(s.peek_value.bypass, s.bypass_.read_data)
+      s.connect(s.status_bypass, s.bypass_.read_data)
+      s.connect(s.bypass_.write_data, s.input_value.bypass)
+      s.connect(s.bypass_.write_call, s.input_call)
+    if s.interface.WithHold:
+      s.holdable_ = Register(RegisterInterface(Bits(1), enable=True))
+      s.connect(s.peek_value.holdable, s.holdable_.read_data)
+      s.connect(s.status_holdable, s.holdable_.read_data)
+      s.connect(s.holdable_.write_data, s.input_value.holdable)
+      s.connect(s.holdable_.write_call, s.input_call)
 
     s.srcs_ready_ = Wire(1)
     s.kill_ = Wire(1)
@@ -216,19 +243,40 @@ class GenericIssueSlot(Model):
 
 class IssueQueueInterface(Interface):
 
-  def __init__(s, slot_type, KillArgType, num_notify, ordered=True):
+  def __init__(s,
+               slot_type,
+               KillArgType,
+               num_notify,
+               ordered=True,
+               num_remove=1,
+               holdable=False):
     s.SlotType = slot_type
     s.SrcTag = Bits(slot_type.src0.nbits)
     s.Opaque = Bits(slot_type.opaque.nbits)
     s.KillArgType = KillArgType
     s.NumNotify = num_notify
     s.Ordered = ordered
+    s.NumRemove = num_remove
+    s.Holdable = holdable
 
-    super(IssueQueueInterface, s).__init__([
+    methods = [
         MethodSpec(
             'add', args={
                 'value': s.SlotType,
             }, rets=None, call=True, rdy=True),
+    ]
+    # While hold is called, holdable slots are not removed, and remove[k]
+    # picks from the other ready slots
+    if holdable:
+      methods.append(
+          MethodSpec(
+              'hold',
+              args=None,
+              rets=None,
+              call=True,
+              rdy=False,
+          ))
+    super(IssueQueueInterface, s).__init__(methods + [
         MethodSpec(
             'remove',
             args=None,
@@ -236,7 +284,8 @@ class IssueQueueInterface(Interface):
                 'value': s.SlotType,
             },
             call=True,
-            rdy=True),
+            rdy=True,
+            count=num_remove),
         MethodSpec(
             'notify',
             args={
@@ -276,8 +325,12 @@ class CompactingIssueQueue(Model):
       BranchType: A Bits() or BitStruct() that will be broadcasted to each IS when a branch/kill event happens
 
       num_slots: The number of slots in the IQ
+
+      remove[k] removes the kth oldest ready slot, so up to num_remove slots
+      can be removed every cycle
     """
     UseInterface(s, interface)
+    num_remove = s.interface.NumRemove
 
     # Create all the slots in our issue queue
     s.slots_ = [
@@ -286,7 +339,8 @@ class CompactingIssueQueue(Model):
                 s.interface.SlotType,
                 s.interface.KillArgType,
                 s.interface.NumNotify,
-                with_order=s.interface.Ordered), make_kill, bypass_ready)
+                with_order=s.interface.Ordered,
+                with_hold=s.interface.Holdable), make_kill, bypass_ready)
         for _ in range(num_slots)
     ]
 
@@ -294,8 +348,13 @@ class CompactingIssueQueue(Model):
     s.do_shift_ = [Wire(1) for _ in range(num_slots - 1)]
     s.will_issue_ = [Wire(1) for _ in range(num_slots)]
 
-    s.prev_rdy_ = Wire(num_slots)
-    s.first_rdy_ = Wire(num_slots)
+    # left_rdy_[k] are the ready slots not picked by remove[0] to
+    # remove[k - 1], and first_rdy_[k] is the oldest of them
+    s.left_rdy_ = [Wire(num_slots) for _ in range(num_remove)]
+    s.prev_rdy_ = [Wire(num_slots) for _ in range(num_remove)]
+    s.first_rdy_ = [Wire(num_slots) for _ in range(num_remove)]
+    # Slots passed over because of a hold
+    s.held_ = Wire(num_slots)
 
     # PYMTL-BROKEN: array -> bitstruct -> element assignment broken
     s.last_slot_in_ = Wire(s.interface.SlotType)
@@ -322,29 +381,61 @@ class CompactingIssueQueue(Model):
           s.prev_nonordered[i].v = s.prev_nonordered[i - 1] or (
               s.slots_[i - 1].status_valid and
               not s.slots_[i - 1].status_ordered)
-          if s.slots_[i].status_ordered:  # If ordered, must make sure first one
+          if s.slots_[i].status_bypass:
+            s.wait_pred[i].v = 0
+          elif s.slots_[
+              i].status_ordered:  # If ordered, must make sure first one
             s.wait_pred[i].v = s.prev_ordered[i] or s.prev_nonordered[i]
           else:  # Otherwise only need to make sure there is not aordered predecessor
             s.wait_pred[i].v = s.prev_ordered[i]
 
-    @s.combinational
-    def set_first_rdy():
-      s.prev_rdy_[0].v = s.slots_[0].status_ready
-      s.first_rdy_[0].v = s.slots_[0].status_ready
+    if s.interface.Holdable:
 
-    @s.combinational
-    def set_first_rdy():
-      for i in range(1, num_slots):
-        s.prev_rdy_[i].v = s.prev_rdy_[i - 1].v or s.slots_[i].status_ready
-        s.first_rdy_[i].v.v = not s.prev_rdy_[i -
-                                              1].v and s.slots_[i].status_ready
+      @s.combinational
+      def set_held():
+        for i in range(num_slots):
+          s.held_[i].v = s.hold_call and s.slots_[i].status_holdable
+    else:
+      s.connect(s.held_, 0)
 
-    @s.combinational
-    def mux_output():
-      s.remove_value.v = 0
-      for i in range(num_slots):
-        if s.first_rdy_[i]:
-          s.remove_value.v = s.slots_[i].peek_value
+    # A slot waiting on a predecessor is passed over, like in the age queue,
+    # so a bypassing slot is not stuck behind one
+    if s.interface.Ordered:
+
+      @s.combinational
+      def set_left_rdy():
+        for i in range(num_slots):
+          s.left_rdy_[0][i].v = s.slots_[
+              i].status_ready and not s.wait_pred[i] and not s.held_[i]
+    else:
+
+      @s.combinational
+      def set_left_rdy():
+        for i in range(num_slots):
+          s.left_rdy_[0][i].v = s.slots_[i].status_ready and not s.held_[i]
+
+    for k in range(1, num_remove):
+
+      @s.combinational
+      def set_left_rdy_k(k=k):
+        s.left_rdy_[k].v = s.left_rdy_[k - 1] & ~s.first_rdy_[k - 1]
+
+    for k in range(num_remove):
+
+      @s.combinational
+      def set_first_rdy(k=k):
+        s.prev_rdy_[k][0].v = s.left_rdy_[k][0]
+        s.first_rdy_[k][0].v = s.left_rdy_[k][0]
+        for i in range(1, num_slots):
+          s.prev_rdy_[k][i].v = s.prev_rdy_[k][i - 1] or s.left_rdy_[k][i]
+          s.first_rdy_[k][i].v = not s.prev_rdy_[k][i - 1] and s.left_rdy_[k][i]
+
+      @s.combinational
+      def mux_output(k=k):
+        s.remove_value[k].v = 0
+        for i in range(num_slots):
+          if s.first_rdy_[k][i]:
+            s.remove_value[k].v = s.slots_[i].peek_value
 
     @s.combinational
     def last_slot_input():
@@ -428,21 +519,214 @@ class CompactingIssueQueue(Model):
 
     if s.interface.Ordered:
 
+      for k in range(num_remove):
+
+        @s.combinational
+        def handle_remove_rdy(k=k):
+          # Must be valid and first entry
+          s.remove_rdy[k].v = s.first_rdy_[k] != 0 and (
+              (s.first_rdy_[k] & ~s.wait_pred) != 0)
+
       @s.combinational
       def handle_remove():
-        # Must be valid and first entry
-        s.remove_rdy.v = s.first_rdy_ != 0 and (
-            (s.first_rdy_ & ~s.wait_pred) != 0)
         for i in range(num_slots):
-          s.will_issue_[i].v = s.first_rdy_ != 0 and s.remove_call and (
-              s.first_rdy_[i] and not s.wait_pred[i])
+          s.will_issue_[i].v = 0
+          for k in range(num_remove):
+            if s.remove_call[k] and s.first_rdy_[k][i] and not s.wait_pred[i]:
+              s.will_issue_[i].v = 1
     else:
 
+      for k in range(num_remove):
+
+        @s.combinational
+        def handle_remove_rdy(k=k):
+          s.remove_rdy[k].v = s.first_rdy_[k] != 0
+
       @s.combinational
       def handle_remove():
-        s.remove_rdy.v = s.first_rdy_ != 0
         for i in range(num_slots):
-          s.will_issue_[i].v = s.remove_call and s.first_rdy_[i]
+          s.will_issue_[i].v = 0
+          for k in range(num_remove):
+            if s.remove_call[k] and s.first_rdy_[k][i]:
+              s.will_issue_[i].v = 1
 
   def line_trace(s):
     return ":".join(["{}".format(x.valid_out) for x in s.slots_])
+
+
+class AgeIssueQueue(Model):
+
+  def __init__(s, interface, make_kill, num_slots=4, bypass_ready=False):
+    """ This model implements a generic issue queue which does not compact
+
+      Entries are added to any free slot, found with a priority arbiter, and
+      stay there until they are removed. An age matrix records which slots
+      hold older entries: older_[i][j] is set if slot j was added before
+      slot i. The oldest ready slot is the one with no older ready slots,
+      so selection is a single AND-reduction per slot instead of a chain
+      through the whole queue.
+
+      Takes the same arguments as CompactingIssueQueue.
+
+      remove[k] removes the kth oldest ready slot, so up to num_remove slots
+      can be removed every cycle
+    """
+    UseInterface(s, interface)
+    num_remove = s.interface.NumRemove
+
+    s.slots_ = [
+        GenericIssueSlot(
+            IssueQueueSlotInterface(
+                s.interface.SlotType,
+                s.interface.KillArgType,
+                s.interface.NumNotify,
+                with_order=s.interface.Ordered,
+                with_hold=s.interface.Holdable), make_kill, bypass_ready)
+        for _ in range(num_slots)
+    ]
+    s.older_ = [
+        Register(RegisterInterface(Bits(num_slots)), reset_value=0)
+        for _ in range(num_slots)
+    ]
+    s.free_arbiter_ = PriorityArbiter(ArbiterInterface(num_slots))
+
+    s.valid_ = Wire(num_slots)
+    s.ready_ = Wire(num_slots)
+    s.ordered_ = Wire(num_slots)
+    s.bypass_ = Wire(num_slots)
+    s.wait_pred = Wire(num_slots)
+    # Slots passed over because of a hold
+    s.held_ = Wire(num_slots)
+    s.add_mask_ = Wire(num_slots)
+    s.will_issue_ = [Wire(1) for _ in range(num_slots)]
+    # left_rdy_[k] are the ready slots not picked by remove[0] to
+    # remove[k - 1], and first_rdy_[k] is the oldest of them
+    s.left_rdy_ = [Wire(num_slots) for _ in range(num_remove)]
+    s.first_rdy_ = [Wire(num_slots) for _ in range(num_remove)]
+
+    # PYMTL-BROKEN: array -> bitstruct -> element assignment broken
+    s.slot_in_ = Wire(s.interface.SlotType)
+
+    for i in range(num_slots):
+      # Kill signal
+      s.connect_m(s.slots_[i].kill_notify, s.kill_notify)
+      # preg notify signal
+      s.connect_m(s.slots_[i].notify, s.notify)
+      s.connect(s.slots_[i].input_value, s.slot_in_)
+      s.connect(s.slots_[i].take_call, s.will_issue_[i])
+
+      s.connect(s.valid_[i], s.slots_[i].status_valid)
+      s.connect(s.ready_[i], s.slots_[i].status_ready)
+      if s.interface.Ordered:
+        s.connect(s.ordered_[i], s.slots_[i].status_ordered)
+        s.connect(s.bypass_[i], s.slots_[i].status_bypass)
+      else:
+        s.connect(s.ordered_[i], 0)
+        s.connect(s.bypass_[i], 0)
+      if s.interface.Holdable:
+
+        @s.combinational
+        def set_held(i=i):
+          s.held_[i].v = s.hold_call and s.slots_[i].status_holdable
+      else:
+        s.connect(s.held_[i], 0)
+
+      @s.combinational
+      def handle_input(i=i):
+        s.slots_[i].input_call.v = s.add_mask_[i]
+
+      @s.combinational
+      def update_age(i=i):
+        if s.add_mask_[i]:
+          # Everything already in the queue is older
+          s.older_[i].write_data.v = s.valid_
+        else:
+          s.older_[i].write_data.v = s.older_[i].read_data & ~s.add_mask_
+
+      @s.combinational
+      def set_wait_pred(i=i):
+        if s.bypass_[i]:
+          s.wait_pred[i].v = 0
+        elif s.ordered_[i]:  # If ordered, must make sure first one
+          s.wait_pred[i].v = (s.older_[i].read_data & s.valid_) != 0
+        else:  # Otherwise only need to make sure there is not a ordered predecessor
+          s.wait_pred[i].v = (s.older_[i].read_data & s.valid_
+                              & s.ordered_) != 0
+
+    # Add into the first free slot
+    @s.combinational
+    def find_free():
+      s.free_arbiter_.grant_reqs.v = ~s.valid_
+
+    @s.combinational
+    def add_rdy():
+      s.add_rdy.v = s.free_arbiter_.grant_grant != 0
+      if s.add_call:
+        s.add_mask_.v = s.free_arbiter_.grant_grant
+      else:
+        s.add_mask_.v = 0
+
+    # We need to forward the notify from the current cycle into the input
+    s.src0_notify_match = Wire(s.interface.NumNotify)
+    s.src1_notify_match = Wire(s.interface.NumNotify)
+
+    @s.combinational
+    def match_src():
+      for i in range(s.interface.NumNotify):
+        s.src0_notify_match[i].v = s.notify_call[i] and (
+            s.add_value.src0 == s.notify_tag[i])
+        s.src1_notify_match[i].v = s.notify_call[i] and (
+            s.add_value.src1 == s.notify_tag[i])
+
+    @s.combinational
+    def handle_add():
+      s.slot_in_.v = s.add_value
+      # Forward any notifications from current cycle
+      s.slot_in_.src0_rdy.v = reduce_or(
+          s.src0_notify_match) or s.add_value.src0_rdy
+      s.slot_in_.src1_rdy.v = reduce_or(
+          s.src1_notify_match) or s.add_value.src1_rdy
+
+    # Select the oldest ready slots
+    @s.combinational
+    def set_left_rdy():
+      s.left_rdy_[0].v = s.ready_ & ~s.wait_pred & ~s.held_
+
+    for k in range(1, num_remove):
+
+      @s.combinational
+      def set_left_rdy_k(k=k):
+        s.left_rdy_[k].v = s.left_rdy_[k - 1] & ~s.first_rdy_[k - 1]
+
+    for k in range(num_remove):
+
+      @s.combinational
+      def set_first_rdy(k=k):
+        for i in range(num_slots):
+          s.first_rdy_[k][i].v = s.left_rdy_[k][i] and ((s.older_[i].read_data
+                                                         & s.left_rdy_[k]) == 0)
+
+      @s.combinational
+      def mux_output(k=k):
+        s.remove_rdy[k].v = s.first_rdy_[k] != 0
+        s.remove_value[k].v = 0
+        for i in range(num_slots):
+          if s.first_rdy_[k][i]:
+            s.remove_value[k].v = s.slots_[i].peek_value
+
+    @s.combinational
+    def handle_remove():
+      for i in range(num_slots):
+        s.will_issue_[i].v = 0
+        for k in range(num_remove):
+          if s.remove_call[k] and s.first_rdy_[k][i]:
+            s.will_issue_[i].v = 1
+
+  def line_trace(s):
+    return str(s.valid_)
+
+
+ISSUE_QUEUES = {
+    'compacting': CompactingIssueQueue,
+    'age': AgeIssueQueue,
+}
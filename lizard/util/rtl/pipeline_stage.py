@@ -3,13 +3,17 @@ from lizard.util.rtl.interface import Interface, UseInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.register import Register, RegisterInterface
 from lizard.util.rtl.types import canonicalize_type
+from lizard.bitutil import clog2
 
 
 class PipelineStageInterface(Interface):
 
-  def __init__(s, MsgType, KillArgType):
+  def __init__(s, MsgType, KillArgType, width=None):
     s.MsgType = MsgType
     s.KillArgType = KillArgType
+    # If there is a width, up to width messages can be taken every cycle,
+    # oldest first
+    s.Width = width
     methods = []
     if KillArgType is not None:
       methods.append(
@@ -33,6 +37,7 @@ class PipelineStageInterface(Interface):
               },
               call=False,
               rdy=True,
+              count=width,
           ),
           MethodSpec(
               'take',
@@ -40,6 +45,7 @@ class PipelineStageInterface(Interface):
               rets=None,
               call=True,
               rdy=False,
+              count=width,
           ),
       ])
     super(PipelineStageInterface, s).__init__(methods)
@@ -279,6 +285,132 @@ def gen_valid_value_manager(drop_controller_class, tracking=False):
   return Gen
 
 
+class ValidValueGroupInterface(Interface):
+
+  def __init__(s, DataIn, DataOut, KillArgType, width):
+    s.DataIn = DataIn
+    s.DataOut = DataOut
+    s.KillArgType = KillArgType
+    s.Width = width
+    if KillArgType is not None:
+      methods = [
+          MethodSpec(
+              'kill_notify',
+              args={
+                  'msg': KillArgType,
+              },
+              rets=None,
+              call=False,
+              rdy=False,
+          ),
+      ]
+    else:
+      methods = []
+
+    methods += [
+        MethodSpec(
+            'peek',
+            args=None,
+            rets={
+                'msg': DataOut,
+            },
+            call=False,
+            rdy=True,
+            count=width,
+        ),
+        MethodSpec(
+            'take',
+            args=None,
+            rets=None,
+            call=True,
+            rdy=False,
+            count=width,
+        ),
+        MethodSpec(
+            'add',
+            args={
+                'msg': DataIn,
+            },
+            rets=None,
+            call=True,
+            rdy=True,
+            count=width,
+        ),
+    ]
+
+    super(ValidValueGroupInterface, s).__init__(methods)
+
+
+class ValidValueGroup(Model):
+  """A group of up to width values, held by a ValidValueManager each.
+
+  A new group can only be added once every value in the old one has been
+  taken or dropped, so add[i] is either ready for every i or for none.
+  The adds in a cycle must be a prefix of the ports, oldest first.
+
+  peek[i] and take[i] refer to the ith oldest value left in the group, and
+  the takes in a cycle must also be a prefix. Values are taken oldest
+  first, and killing a value kills every younger one, so the values left
+  in the group are always contiguous.
+  """
+
+  def __init__(s, interface, drop_controller_class):
+    UseInterface(s, interface)
+    width = s.interface.Width
+
+    s.vvms = [
+        gen_valid_value_manager(drop_controller_class)() for _ in range(width)
+    ]
+    s.lane_rdy_ = [Wire(1) for _ in range(width)]
+    s.lane_msg_ = [Wire(s.interface.DataOut) for _ in range(width)]
+    s.lane_clear_ = [Wire(1) for _ in range(width)]
+    # The index of the oldest value, or width if the group is empty
+    s.first_ = Wire(clog2(width + 1))
+    s.group_clear_ = Wire(1)
+
+    for i in range(width):
+      if s.interface.KillArgType is not None:
+        s.connect_m(s.vvms[i].kill_notify, s.kill_notify)
+      s.connect(s.lane_rdy_[i], s.vvms[i].peek_rdy)
+      s.connect(s.lane_msg_[i], s.vvms[i].peek_msg)
+      s.connect(s.lane_clear_[i], s.vvms[i].add_rdy)
+      s.connect(s.vvms[i].add_msg, s.add_msg[i])
+      s.connect(s.vvms[i].add_call, s.add_call[i])
+      s.connect(s.add_rdy[i], s.group_clear_)
+
+    @s.combinational
+    def compute_first(width=width):
+      s.first_.v = 0
+      for i in range(width):
+        if not s.lane_rdy_[i] and s.first_ == i:
+          s.first_.v = i + 1
+
+    for i in range(width):
+
+      @s.combinational
+      def handle_peek(i=i, width=width):
+        s.peek_rdy[i].v = 0
+        s.peek_msg[i].v = 0
+        for j in range(i, width):
+          if s.first_ == j - i:
+            s.peek_rdy[i].v = s.lane_rdy_[j]
+            s.peek_msg[i].v = s.lane_msg_[j]
+
+      @s.combinational
+      def handle_take(i=i):
+        s.vvms[i].take_call.v = 0
+        for j in range(i + 1):
+          if s.take_call[j] and s.first_ == i - j:
+            s.vvms[i].take_call.v = 1
+
+    @s.combinational
+    def handle_add_rdy(width=width):
+      s.group_clear_.v = 1
+      for i in range(width):
+        if not s.lane_clear_[i]:
+          s.group_clear_.v = 0
+
+
 class PipelineStage(Model):
 
   def __init__(s, interface, In, Intermediate=None):
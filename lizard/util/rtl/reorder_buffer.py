@@ -10,12 +10,20 @@ from lizard.util.rtl.onehot import OneHotEncoder
 
 class ReorderBufferInterface(Interface):
 
-  def __init__(s, entry_type, num_entries, KillOpaqueType, KillArgType):
+  def __init__(s,
+               entry_type,
+               num_entries,
+               KillOpaqueType,
+               KillArgType,
+               num_free_ports=1,
+               num_add_ports=1):
     s.EntryType = entry_type
     s.EntryIdx = clog2(num_entries)
     s.NumEntries = num_entries
     s.KillOpaqueType = KillOpaqueType
     s.KillArgType = KillArgType
+    s.NumFreePorts = num_free_ports
+    s.NumAddPorts = num_add_ports
 
     super(ReorderBufferInterface, s).__init__([
         MethodSpec(
@@ -28,6 +36,7 @@ class ReorderBufferInterface(Interface):
             rets=None,
             call=True,
             rdy=False,
+            count=num_add_ports,
         ),
         MethodSpec(
             'check_done',
@@ -39,6 +48,7 @@ class ReorderBufferInterface(Interface):
             },
             call=False,
             rdy=False,
+            count=num_free_ports,
         ),
         MethodSpec(
             'peek',
@@ -50,6 +60,7 @@ class ReorderBufferInterface(Interface):
             },
             call=False,
             rdy=False,
+            count=num_free_ports,
         ),
         MethodSpec(
             'free',
@@ -57,6 +68,7 @@ class ReorderBufferInterface(Interface):
             rets=None,
             call=True,
             rdy=False,
+            count=num_free_ports,
         ),
         MethodSpec(
             'kill_notify',
@@ -70,54 +82,86 @@ class ReorderBufferInterface(Interface):
 
 
 class ReorderBuffer(Model):
+  """Holds finished instructions until they are freed.
+
+  check_done[i], peek[i], and free[i] each refer to the entry at
+  peek_idx[i], so up to num_free_ports entries can be freed every cycle.
+  Up to num_add_ports entries can be added every cycle, to distinct indices.
+  """
 
   def __init__(s, interface, make_kill):
     UseInterface(s, interface)
 
     num_entries = s.interface.NumEntries
     entry_type = s.interface.EntryType
+    num_free_ports = s.interface.NumFreePorts
+    num_add_ports = s.interface.NumAddPorts
     # All the finished instructions are stored here:
     #s.entries_ = RegisterFile(entry_type, num_entries, 1, 1, False, False)
     s.entries_ = AsynchronousRAM(
-        AsynchronousRAMInterface(entry_type, num_entries, 1, 1))
+        AsynchronousRAMInterface(entry_type, num_entries, num_free_ports,
+                                 num_add_ports))
     s.valids_ = [
         gen_valid_value_manager(make_kill)() for _ in range(num_entries)
     ]
-    s.mux_done_ = Mux(Bits(1), num_entries)
+    s.mux_done_ = [Mux(Bits(1), num_entries) for _ in range(num_free_ports)]
 
-    s.add_encoder_ = OneHotEncoder(num_entries, enable=True)
-    s.free_encoder_ = OneHotEncoder(num_entries, enable=True)
+    s.add_encoder_ = [
+        OneHotEncoder(num_entries, enable=True) for _ in range(num_add_ports)
+    ]
+    s.free_encoder_ = [
+        OneHotEncoder(num_entries, enable=True) for _ in range(num_free_ports)
+    ]
 
     # Connect enable to add encode
-    s.connect(s.add_encoder_.encode_call, s.add_call)
-    s.connect(s.add_encoder_.encode_number, s.add_idx)
-    s.connect(s.free_encoder_.encode_call, s.free_call)
-    s.connect(s.free_encoder_.encode_number, s.peek_idx)
+    for j in range(num_add_ports):
+      s.connect(s.add_encoder_[j].encode_call, s.add_call[j])
+      s.connect(s.add_encoder_[j].encode_number, s.add_idx[j])
+    for j in range(num_free_ports):
+      s.connect(s.free_encoder_[j].encode_call, s.free_call[j])
+      s.connect(s.free_encoder_[j].encode_number, s.peek_idx[j])
 
     # Check done
     # Connect up the mux for check done method
     for i in range(num_entries):
       # Connect peek
-      s.connect(s.mux_done_.mux_in_[i], s.valids_[i].peek_rdy)
+      for j in range(num_free_ports):
+        s.connect(s.mux_done_[j].mux_in_[i], s.valids_[i].peek_rdy)
       # Connect up add method
-      s.connect(s.valids_[i].add_msg, s.add_kill_opaque)
-      s.connect(s.valids_[i].add_call, s.add_encoder_.encode_onehot[i])
+      @s.combinational
+      def handle_add(i=i, num_add_ports=num_add_ports):
+        s.valids_[i].add_call.v = 0
+        s.valids_[i].add_msg.v = 0
+        for j in range(num_add_ports):
+          if s.add_encoder_[j].encode_onehot[i]:
+            s.valids_[i].add_call.v = 1
+            s.valids_[i].add_msg.v = s.add_kill_opaque[j]
+
       # Connect up take method
-      s.connect(s.valids_[i].take_call, s.free_encoder_.encode_onehot[i])
+      @s.combinational
+      def handle_take(i=i, num_free_ports=num_free_ports):
+        s.valids_[i].take_call.v = 0
+        for j in range(num_free_ports):
+          if s.free_encoder_[j].encode_onehot[i]:
+            s.valids_[i].take_call.v = 1
+
       # Connect kill_notify
       s.connect_m(s.valids_[i].kill_notify, s.kill_notify)
 
-    s.connect(s.mux_done_.mux_select, s.check_done_idx)
-    s.connect(s.check_done_is_rdy, s.mux_done_.mux_out)
+    for j in range(num_free_ports):
+      s.connect(s.mux_done_[j].mux_select, s.check_done_idx[j])
+      s.connect(s.check_done_is_rdy[j], s.mux_done_[j].mux_out)
 
     # Add
-    s.connect(s.entries_.write_call[0], s.add_call)
-    s.connect(s.entries_.write_addr[0], s.add_idx)
-    s.connect(s.entries_.write_data[0], s.add_value)
+    for j in range(num_add_ports):
+      s.connect(s.entries_.write_call[j], s.add_call[j])
+      s.connect(s.entries_.write_addr[j], s.add_idx[j])
+      s.connect(s.entries_.write_data[j], s.add_value[j])
 
     # free
-    s.connect(s.entries_.read_addr[0], s.peek_idx)
-    s.connect(s.peek_value, s.entries_.read_data[0])
+    for j in range(num_free_ports):
+      s.connect(s.entries_.read_addr[j], s.peek_idx[j])
+      s.connect(s.peek_value[j], s.entries_.read_data[j])
 
   def line_trace(s):
     return str(s.valids_.read_data)
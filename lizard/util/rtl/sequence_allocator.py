@@ -3,12 +3,15 @@ from pymtl import *
 from lizard.util.rtl.interface import Interface, UseInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.bitutil import clog2
 
 
 class SequenceAllocatorInterface(Interface):
 
-  def __init__(s, seq_idx_nbits):
+  def __init__(s, seq_idx_nbits, num_alloc_ports=1, num_free_ports=1):
     s.SeqIdxNbits = seq_idx_nbits
+    s.NumAllocPorts = num_alloc_ports
+    s.NumFreePorts = num_free_ports
     super(SequenceAllocatorInterface, s).__init__([
         MethodSpec(
             'allocate',
@@ -18,6 +21,7 @@ class SequenceAllocatorInterface(Interface):
             },
             call=True,
             rdy=True,
+            count=num_alloc_ports,
         ),
         MethodSpec(
             'get_head',
@@ -34,6 +38,7 @@ class SequenceAllocatorInterface(Interface):
             rets={},
             call=True,
             rdy=True,
+            count=num_free_ports,
         ),
         MethodSpec(
             'rollback',
@@ -46,10 +51,19 @@ class SequenceAllocatorInterface(Interface):
 
 
 class SequenceAllocator(Model):
+  """Allocates sequence numbers in order, and frees them in the same order.
+
+  allocate[i] returns the ith sequence number after the tail, and is ready
+  if there is room for i + 1 more. free[i] frees the ith sequence number
+  after the head, and is ready if at least i + 1 are allocated. The
+  allocate and free calls in a cycle must each be a prefix of the ports.
+  """
 
   def __init__(s, interface):
     UseInterface(s, interface)
     seqidx_nbits = s.interface.SeqIdxNbits
+    num_alloc_ports = s.interface.NumAllocPorts
+    num_free_ports = s.interface.NumFreePorts
     max_entries = 1 << seqidx_nbits
 
     # ROB stuff: Dealloc from head, alloc at tail
@@ -64,36 +78,58 @@ class SequenceAllocator(Model):
     s.tail_next = Wire(seqidx_nbits)
 
     s.empty_ = Wire(1)
-    s.full_ = Wire(1)
+    s.num_alloc_ = Wire(clog2(num_alloc_ports + 1))
+    s.num_free_ = Wire(clog2(num_free_ports + 1))
 
     # Connect methods
-    s.connect(s.allocate_idx, s.tail.read_data)
     s.connect(s.get_head_idx, s.head.read_data)
 
+    for i in range(num_alloc_ports):
+
+      @s.combinational
+      def handle_allocate(i=i, limit=max_entries - i):
+        s.allocate_idx[i].v = s.tail.read_data + i
+        s.allocate_rdy[i].v = s.num.read_data < limit
+
+    for i in range(num_free_ports):
+
+      @s.combinational
+      def handle_free_rdy(i=i):
+        s.free_rdy[i].v = s.num.read_data > i
+
+    @s.combinational
+    def count_calls(num_alloc_ports=num_alloc_ports,
+                    num_free_ports=num_free_ports):
+      s.num_alloc_.v = 0
+      for i in range(num_alloc_ports):
+        if s.allocate_call[i]:
+          s.num_alloc_.v = i + 1
+      s.num_free_.v = 0
+      for i in range(num_free_ports):
+        if s.free_call[i]:
+          s.num_free_.v = i + 1
+
     # All the following comb blocks are for ROB stuff:
     @s.combinational
     def set_method_rdy():
-      s.allocate_rdy.v = not s.full_
       s.get_head_rdy.v = not s.empty_
-      s.free_rdy.v = not s.empty_
 
     @s.combinational
     def set_flags():
-      s.full_.v = s.num.read_data == max_entries
       s.empty_.v = s.num.read_data == 0
 
     @s.combinational
     def update_tail():
-      s.tail.write_call.v = s.allocate_call or s.rollback_call
-      s.tail_next.v = s.tail.read_data + 1
+      s.tail.write_call.v = s.num_alloc_ != 0 or s.rollback_call
+      s.tail_next.v = s.tail.read_data + s.num_alloc_
       if s.rollback_call:
         s.tail_next.v = s.rollback_idx + 1
       s.tail.write_data.v = s.tail_next.v
 
     @s.combinational
     def update_head():
-      s.head_next.v = s.head.read_data + 1 if s.free_call else s.head.read_data
-      s.head.write_call.v = s.free_call
+      s.head_next.v = s.head.read_data + s.num_free_
+      s.head.write_call.v = s.num_free_ != 0
       s.head.write_data.v = s.head_next
 
     s.head_tail_delta = Wire(seqidx_nbits)
@@ -110,8 +146,5 @@ class SequenceAllocator(Model):
         else:
           s.num.write_data.v = zext(s.head_tail_delta,
                                     seqp1)  # An exception clears everything
-      elif s.allocate_call ^ s.free_call:
-        if s.allocate_call:
-          s.num.write_data.v = s.num.read_data + 1
-        elif s.free_call:
-          s.num.write_data.v = s.num.read_data - 1
+      else:
+        s.num.write_data.v = s.num.read_data + s.num_alloc_ - s.num_free_
@@ -3,14 +3,18 @@ from lizard.bitutil import clog2nz
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.interface import Interface, IncludeSome, UseInterface
 from lizard.util.rtl.freelist import FreeList, FreeListInterface
-from lizard.util.rtl.registerfile import RegisterFile
+from lizard.util.rtl.register import Register, RegisterInterface
 from lizard.util.rtl.mux import Mux
-from lizard.util.rtl.packers import Packer
 
 
 class SnapshottingFreeListInterface(Interface):
 
-  def __init__(s, nslots, num_alloc_ports, num_free_ports, nsnapshots):
+  def __init__(s,
+               nslots,
+               num_alloc_ports,
+               num_free_ports,
+               nsnapshots,
+               max_refs=0):
     base = FreeListInterface(
         nslots,
         num_alloc_ports,
@@ -19,9 +23,42 @@ class SnapshottingFreeListInterface(Interface):
         release_alloc_bypass=False)
 
     s.SnapshotId = Bits(clog2nz(nsnapshots))
+    s.MaxRefs = max_refs
+    s.Refs = Bits(clog2nz(max_refs + 1))
+
+    # With reference counts, share and drop replace free
+    if max_refs != 0:
+      ref_methods = [
+          MethodSpec(
+              'share',
+              args={
+                  'index': base.Index,
+              },
+              rets=None,
+              call=True,
+              rdy=False,
+              count=num_free_ports,
+          ),
+          MethodSpec(
+              'drop',
+              args={
+                  'index': base.Index,
+              },
+              rets={
+                  'freed': Bits(1),
+              },
+              call=True,
+              rdy=False,
+              count=num_free_ports,
+          ),
+      ]
+      included = {'alloc', 'set', 'get_state'}
+    else:
+      ref_methods = []
+      included = {'free', 'alloc', 'set', 'get_state'}
 
     super(SnapshottingFreeListInterface, s).__init__(
-        [
+        ref_methods + [
             MethodSpec(
                 'reset_alloc_tracking',
                 args={
@@ -44,15 +81,25 @@ class SnapshottingFreeListInterface(Interface):
             # with the same target ID in the same cycle is not permitted
         ],
         bases=[
-            IncludeSome(base, {'free', 'alloc', 'set', 'get_state'}),
+            IncludeSome(base, included),
         ],
         ordering_chains=[
             ['alloc', 'reset_alloc_tracking', 'revert_allocs', 'set'],
-        ],
+        ] + ([['alloc', 'share', 'drop', 'set']] if max_refs != 0 else []),
     )
 
 
 class SnapshottingFreeList(Model):
+  """A free list which can revert the allocations made since a snapshot.
+
+  If max_refs is not 0, each allocated slot also counts the references to
+  it beyond the first, up to max_refs. share adds a reference, and drop
+  removes one, freeing the slot if it was the last. freed is set if it
+  was. Every share comes before every drop, and drops on lower ports
+  come first. The counts are not part of any snapshot: the caller must only
+  share and drop when the change can no longer be undone, like at commit,
+  so reverting allocations and set leave them alone.
+  """
 
   def __init__(s,
                nslots,
@@ -60,11 +107,12 @@ class SnapshottingFreeList(Model):
                num_free_ports,
                nsnapshots,
                used_slots_initial=0,
-               freelist_impl=FreeList):
+               freelist_impl=FreeList,
+               max_refs=0):
     UseInterface(
         s,
         SnapshottingFreeListInterface(nslots, num_alloc_ports, num_free_ports,
-                                      nsnapshots))
+                                      nsnapshots, max_refs))
 
     s.free_list = freelist_impl(
         nslots,
@@ -75,45 +123,118 @@ class SnapshottingFreeList(Model):
         used_slots_initial=used_slots_initial)
 
     s.connect_m(s.alloc, s.free_list.alloc)
-    s.connect_m(s.free, s.free_list.free)
     s.connect_m(s.set, s.free_list.set)
     s.connect_m(s.get_state, s.free_list.get_state)
 
+    if max_refs == 0:
+      s.connect_m(s.free, s.free_list.free)
+    else:
+      Refs = s.interface.Refs
+      s.refs = [
+          Register(RegisterInterface(Refs), reset_value=0)
+          for _ in range(nslots)
+      ]
+      # PYMTL_BROKEN
+      s.refs_read_ = [Wire(Refs) for _ in range(nslots)]
+      # The references to the slot each drop is for, counted up through
+      # every share, then down through the drops on lower ports which do
+      # not free
+      s.drop_acc_ = [[Wire(Refs)
+                      for _ in range(num_free_ports + i + 1)]
+                     for i in range(num_free_ports)]
+      # The next count of each slot, through every share then every drop
+      s.refs_acc_ = [[Wire(Refs)
+                      for _ in range(2 * num_free_ports + 1)]
+                     for _ in range(nslots)]
+
+      for i in range(num_free_ports):
+
+        @s.combinational
+        def read_refs(i=i, nslots=nslots):
+          s.drop_acc_[i][0].v = 0
+          for k in range(nslots):
+            if s.drop_index[i] == k:
+              s.drop_acc_[i][0].v = s.refs_read_[k]
+
+        for j in range(num_free_ports):
+
+          @s.combinational
+          def count_share(i=i, j=j):
+            if s.share_call[j] and s.share_index[j] == s.drop_index[i]:
+              s.drop_acc_[i][j + 1].v = s.drop_acc_[i][j] + 1
+            else:
+              s.drop_acc_[i][j + 1].v = s.drop_acc_[i][j]
+
+        for j in range(i):
+
+          @s.combinational
+          def count_drop(i=i, j=j, n=num_free_ports):
+            if s.drop_call[j] and not s.drop_freed[j] and (
+                s.drop_index[j] == s.drop_index[i]):
+              s.drop_acc_[i][n + j + 1].v = s.drop_acc_[i][n + j] - 1
+            else:
+              s.drop_acc_[i][n + j + 1].v = s.drop_acc_[i][n + j]
+
+        @s.combinational
+        def handle_drop(i=i, last=num_free_ports + i):
+          s.drop_freed[i].v = s.drop_acc_[i][last] == 0
+          s.free_list.free_call[i].v = s.drop_call[i] and s.drop_freed[i]
+
+        s.connect(s.free_list.free_index[i], s.drop_index[i])
+
+      for k in range(nslots):
+        s.connect(s.refs_read_[k], s.refs[k].read_data)
+        s.connect(s.refs_acc_[k][0], s.refs_read_[k])
+        s.connect(s.refs[k].write_data, s.refs_acc_[k][2 * num_free_ports])
+
+        for j in range(num_free_ports):
+
+          @s.combinational
+          def share_refs(k=k, j=j):
+            if s.share_call[j] and s.share_index[j] == k:
+              s.refs_acc_[k][j + 1].v = s.refs_acc_[k][j] + 1
+            else:
+              s.refs_acc_[k][j + 1].v = s.refs_acc_[k][j]
+
+          @s.combinational
+          def drop_refs(k=k, j=j, n=num_free_ports):
+            if s.drop_call[j] and not s.drop_freed[j] and s.drop_index[j] == k:
+              s.refs_acc_[k][n + j + 1].v = s.refs_acc_[k][n + j] - 1
+            else:
+              s.refs_acc_[k][n + j + 1].v = s.refs_acc_[k][n + j]
+
+    # Each snapshot is the mask of the slots allocated since tracking was
+    # last reset for it, so reverting is a single mask release no matter
+    # how many snapshots there are
     s.snapshots = [
-        RegisterFile(
-            Bits(1),
-            nslots,
-            0,
-            num_alloc_ports,
-            write_read_bypass=False,
-            write_dump_bypass=True) for _ in range(nsnapshots)
+        Register(RegisterInterface(Bits(nslots)), reset_value=0)
+        for _ in range(nsnapshots)
     ]
-
-    # pack the dump ports (arrays of 1 bit ports) into bit vectors to make
-    # them easier to manage
-    s.snapshot_packers = [Packer(Bits(1), nslots) for _ in range(nsnapshots)]
+    # The slots allocated this cycle
+    s.alloc_mask_ = Wire(nslots)
+    # Every snapshot, including the slots allocated this cycle
+    s.tracked_ = [Wire(nslots) for _ in range(nsnapshots)]
 
     s.dump_mux = Mux(Bits(nslots), nsnapshots)
 
-    for i in range(nsnapshots):
+    @s.combinational
+    def compute_alloc_mask(num_alloc_ports=num_alloc_ports):
+      s.alloc_mask_.v = 0
       for j in range(num_alloc_ports):
-        # Write a 1 into every snapshot for every allocated entry
-        s.connect(s.alloc_index[j], s.snapshots[i].write_addr[j])
-        s.connect(s.snapshots[i].write_data[j], 1)
-        s.connect(s.alloc_call[j], s.snapshots[i].write_call[j])
+        if s.alloc_call[j]:
+          s.alloc_mask_.v = s.alloc_mask_ | s.alloc_mask[j]
 
-      for j in range(nslots):
-        s.connect(s.snapshots[i].dump_out[j], s.snapshot_packers[i].pack_in_[j])
-        s.connect(s.snapshots[i].set_in_[j], 0)
+    for i in range(nsnapshots):
 
       @s.combinational
-      def handle_reset_alloc_tracking_set_call(i=i):
+      def handle_tracking(i=i):
+        s.tracked_[i].v = s.snapshots[i].read_data | s.alloc_mask_
         if s.reset_alloc_tracking_call and s.reset_alloc_tracking_target_id == i:
-          s.snapshots[i].set_call.v = 1
+          s.snapshots[i].write_data.v = 0
         else:
-          s.snapshots[i].set_call.v = 0
+          s.snapshots[i].write_data.v = s.tracked_[i]
 
-      s.connect(s.dump_mux.mux_in_[i], s.snapshot_packers[i].pack_packed)
+      s.connect(s.dump_mux.mux_in_[i], s.tracked_[i])
 
     # Pick from a snapshot to revert
     s.connect(s.dump_mux.mux_select, s.revert_allocs_source_id)
@@ -4,6 +4,8 @@ from lizard.util.rtl.interface import Interface, IncludeSome, UseInterface
 from lizard.util.rtl.method import MethodSpec
 from lizard.util.rtl.registerfile import RegisterFile, RegisterFileInterface
 from lizard.util.rtl.mux import Mux
+from lizard.util.rtl.async_ram import AsynchronousRAM, AsynchronousRAMInterface
+from lizard.util.rtl.packers import Packer, Unpacker
 
 
 class SnapshottingRegisterFileInterface(Interface):
@@ -81,32 +83,28 @@ class SnapshottingRegisterFile(Model):
         write_snapshot_bypass,
         reset_values=reset_values)
 
-    s.snapshots = [
-        RegisterFile(dtype, nregs, 0, 0, False, False)
-        for _ in range(nsnapshots)
-    ]
+    # Every snapshot is a single word holding the whole register file, so
+    # taking or restoring one is a single write or read however many there
+    # are
+    s.snapshots = AsynchronousRAM(
+        AsynchronousRAMInterface(
+            Bits(s.interface.Data.nbits * nregs), nsnapshots, 1, 1))
+    s.snapshot_packer = Packer(dtype, nregs)
+    s.snapshot_unpacker = Unpacker(dtype, nregs)
 
     # Forward read and writes to register file
     s.connect_m(s.read, s.regs.read)
     s.connect_m(s.write, s.regs.write)
 
-    # Connect the dump data from the primary register file
-    # to the set port on each snapshot
-    for i in range(nsnapshots):
-      for j in range(nregs):
-        s.connect(s.snapshots[i].set_in_[j], s.regs.dump_out[j])
-
-      # Write to a given snapshot if it matches the target and snapshot was called
-      @s.combinational
-      def handle_snapshot_save(i=i):
-        s.snapshots[
-            i].set_call.v = s.snapshot_call and s.snapshot_target_id == i
-
-    s.snapshot_muxes = [Mux(dtype, nsnapshots) for _ in range(nregs)]
+    # Save the dump data from the primary register file into the target
     for j in range(nregs):
-      s.connect(s.snapshot_muxes[j].mux_select, s.restore_source_id)
-      for i in range(nsnapshots):
-        s.connect(s.snapshot_muxes[j].mux_in_[i], s.snapshots[i].dump_out[j])
+      s.connect(s.snapshot_packer.pack_in_[j], s.regs.dump_out[j])
+    s.connect(s.snapshots.write_addr[0], s.snapshot_target_id)
+    s.connect(s.snapshots.write_data[0], s.snapshot_packer.pack_packed)
+    s.connect(s.snapshots.write_call[0], s.snapshot_call)
+
+    s.connect(s.snapshots.read_addr[0], s.restore_source_id)
+    s.connect(s.snapshot_unpacker.unpack_packed, s.snapshots.read_data[0])
 
     # Restore by writing data from the snapshot back into the register file
     # set port.
@@ -132,7 +130,7 @@ class SnapshottingRegisterFile(Model):
           if s.snapshot_call and s.restore_call and s.snapshot_target_id == s.restore_source_id:
             s.restore_vector[j].v = s.regs.dump_out[j]
           else:
-            s.restore_vector[j].v = s.snapshot_muxes[j].mux_out
+            s.restore_vector[j].v = s.snapshot_unpacker.unpack_out[j]
     else:
 
       @s.combinational
@@ -143,7 +141,7 @@ class SnapshottingRegisterFile(Model):
           s.should_restore.v = s.restore_call
 
       for j in range(nregs):
-        s.connect(s.restore_vector[j], s.snapshot_muxes[j].mux_out)
+        s.connect(s.restore_vector[j], s.snapshot_unpacker.unpack_out[j])
 
     # Handle the restore-set conflict for case 2
     s.set_vector = [Wire(dtype) for _ in range(nregs)]
@@ -5,6 +5,7 @@ from lizard.model.test_model import run_test_state_machine
 from lizard.core.rtl.dataflow import DataFlowManager, DataFlowManagerInterface
 from lizard.core.fl.dataflow import DataFlowManagerFL
 from lizard.model.wrapper import wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
 
 
 @pytest.mark.parametrize("model", [DataFlowManager, DataFlowManagerFL])
@@ -18,7 +19,7 @@ def test_method(model):
   assert s1_preg.preg == 0
   s2_preg = df.get_src(0)
   assert s2_preg.preg == 63
-  d1_preg = df.get_dst(2)
+  d1_preg = df.get_dst(areg=2, zero=0, move=0, src=0)
   assert d1_preg.preg == 31
   s1_read = df.read(s1_preg.preg)
   assert s1_read.value == 0
@@ -29,13 +30,13 @@ def test_method(model):
   df.write(tag=d1_preg.preg, value=0)
   df.cycle()
 
-  df.commit(tag=d1_preg.preg, areg=2)
+  df.commit(tag=d1_preg.preg, areg=2, move=0)
   df.cycle()
 
   # simulate addi x2, x2, 42
   s1_preg = df.get_src(2)
   assert s1_preg.preg == 31
-  d1_preg = df.get_dst(2)
+  d1_preg = df.get_dst(areg=2, zero=0, move=0, src=0)
   assert d1_preg.preg == 1
   s1_read = df.read(s1_preg.preg)
   assert s1_read.value == 0
@@ -44,10 +45,99 @@ def test_method(model):
   df.write(tag=d1_preg.preg, value=42)
   df.cycle()
 
-  df.commit(tag=d1_preg.preg, areg=2)
+  df.commit(tag=d1_preg.preg, areg=2, move=0)
   df.cycle()
 
 
+def test_commit_same_areg():
+  df = wrap_to_cl(
+      DataFlowManager(DataFlowManagerInterface(64, 32, 64, 4, 2, 4, 2, 4, 1)))
+  df.reset()
+
+  # Two writes to x2 which commit in the same cycle
+  d1_preg = df.get_dst(areg=2, zero=0, move=0, src=0)
+  d2_preg = df.get_dst(areg=2, zero=0, move=0, src=0)
+  df.cycle()
+
+  df.commit(tag=d1_preg.preg, areg=2, move=0)
+  df.commit(tag=d2_preg.preg, areg=2, move=0)
+  df.cycle()
+
+  # The architectural state only has the second write
+  df.rollback()
+  df.cycle()
+  assert df.get_src(2).preg == d2_preg.preg
+
+  # Both the original preg and the first write's preg were freed
+  allocated = 0
+  for _ in range(40):
+    if df.get_dst(areg=3, zero=0, move=0, src=0) != not_ready_instance:
+      allocated += 1
+    df.cycle()
+  assert allocated == 32
+
+
+@pytest.mark.parametrize("model", [DataFlowManager, DataFlowManagerFL])
+def test_zero_idiom(model):
+  df = wrap_to_cl(model(DataFlowManagerInterface(64, 32, 64, 4, 2, 2, 1, 4, 1)))
+  df.reset()
+
+  # xor x2, x5, x5 maps x2 to the zero tag without allocating
+  assert df.get_dst(areg=2, zero=1, move=0, src=0).preg == 63
+  df.cycle()
+  assert df.get_src(2).preg == 63
+  df.commit(tag=63, areg=2, move=0)
+  df.cycle()
+
+  # The preg x2 had was freed, and the zero tag is never handed out
+  allocated = 0
+  for _ in range(40):
+    if df.get_dst(areg=3, zero=0, move=0, src=0) != not_ready_instance:
+      allocated += 1
+    df.cycle()
+  assert allocated == 33
+
+  # The architectural state has x2 on the zero tag
+  df.rollback()
+  df.cycle()
+  assert df.get_src(2).preg == 63
+
+
+@pytest.mark.parametrize("model", [DataFlowManager, DataFlowManagerFL])
+def test_move_elimination(model):
+  df = wrap_to_cl(model(DataFlowManagerInterface(64, 32, 64, 4, 2, 2, 1, 4, 1)))
+  df.reset()
+
+  # mv x3, x1 maps x3 to the preg of x1 without allocating
+  x1_preg = df.get_src(1).preg
+  assert df.get_dst(areg=3, zero=0, move=1, src=x1_preg).preg == x1_preg
+  df.cycle()
+  assert df.get_src(3).preg == x1_preg
+  df.commit(tag=x1_preg, areg=3, move=1)
+  df.cycle()
+
+  # Overwriting x1 leaves the preg to x3
+  new_preg = df.get_dst(areg=1, zero=0, move=0, src=0).preg
+  df.cycle()
+  df.commit(tag=new_preg, areg=1, move=0)
+  df.cycle()
+
+  df.rollback()
+  df.cycle()
+  assert df.get_src(1).preg == new_preg
+  assert df.get_src(3).preg == x1_preg
+
+  # The preg x3 had was freed, but the shared one is still in use
+  allocated = []
+  for _ in range(40):
+    result = df.get_dst(areg=4, zero=0, move=0, src=0)
+    if result != not_ready_instance:
+      allocated.append(int(result.preg))
+    df.cycle()
+  assert len(allocated) == 32
+  assert x1_preg not in allocated
+
+
 @pytest.mark.parametrize('translate', ['verilate', 'sim'])
 def test_state_machine(translate):
 
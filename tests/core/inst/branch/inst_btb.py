@@ -264,6 +264,33 @@ def gen_branch_collision_test():
   """.format(
       nop_gen=gen_nops(59),)
 
+def gen_indirect_alternating_test():
+  return """
+    addi x1, x0, 20 # iterations
+    addi x4, x0, 0 # accumulator
+    la x5, target_a
+    la x6, target_b
+  loop:
+    # the branch puts the parity in the history, which picks the target
+    andi x2, x1, 1
+    add x3, x5, x0
+    beq x2, x0, even
+    add x3, x6, x0
+  even:
+    jalr x0, x3, 0
+  target_a:
+    addi x4, x4, 1
+    j next
+  target_b:
+    addi x4, x4, 2
+  next:
+    addi x1, x1, -1
+    bne x1, x0, loop
+
+    csrw proc2mngr, x4 > 30
+  """
+
+
 def gen_fence_i_speculative_error_test():
   return """
     addi x30, x0, 42
@@ -7,6 +7,7 @@ import random
 from pymtl import *
 from tests.context import lizard
 from tests.core.inst_utils import *
+from lizard.config.general import ENABLE_ICACHE, ENABLE_DCACHE, ENABLE_STORE_BUFFER
 
 #-------------------------------------------------------------------------
 # gen_basic_asm_test
@@ -121,6 +122,59 @@ def gen_csr_exception_squash_test():
   """
 
 
+def gen_read_only_csr_test():
+  return """
+    csrr x1, mhartid
+    csrr x2, marchid
+    csrw proc2mngr, x1 > 0
+    csrw proc2mngr, x2 > 0x42424242
+
+    # Counter reads do not serialize, but still never go backwards, and a
+    # read which is squashed does not write the counter back
+    csrr x3, mcycle
+    j check
+    csrr x4, minstret
+  check:
+    csrr x5, mcycle
+    sltu x6, x5, x3
+    csrw proc2mngr, x6 > 0
+  """
+
+
+def gen_perf_counter_test():
+  # The event counters of disabled units stay at 0
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    csrr x2, mhpmcounter14
+    sd x0, 0(x1)
+    sd x0, 8(x1)
+    sw x0, 16(x1)
+    ld x3, 64(x1)
+    csrr x4, mhpmcounter14
+    sub x4, x4, x2
+    csrw proc2mngr, x4 > {stores}
+
+    # Fetch and the load each miss at least once
+    csrr x5, mhpmcounter5
+    sltu x5, x0, x5
+    csrw proc2mngr, x5 > {icache}
+    csrr x6, mhpmcounter9
+    sltu x6, x0, x6
+    csrw proc2mngr, x6 > {dcache}
+
+    # Counters never go backwards
+    csrr x7, mhpmcounter4
+    csrr x8, mhpmcounter4
+    sltu x9, x8, x7
+    csrw proc2mngr, x9 > 0
+
+    .data
+  """.format(
+      stores=3 * ENABLE_STORE_BUFFER,
+      icache=ENABLE_ICACHE,
+      dcache=ENABLE_DCACHE) + "\n".join([".word 0"] * 32)
+
+
 #-------------------------------------------------------------------------
 # gen_value_asm_test
 #-------------------------------------------------------------------------
@@ -172,3 +226,16 @@ def various_csrs_test():
   fail:
     csrw proc2mngr, x2
   """
+
+
+def fused_minstret_test():
+  return """
+
+    csrw minstret, x0
+    lui x1, 0x12345
+    addi x1, x1, 0x678
+    add x0, x0, x0
+    csrr x2, minstret
+    csrw proc2mngr, x2 > 4
+    csrw proc2mngr, x1 > 0x12345678
+  """
@@ -0,0 +1,75 @@
+#=========================================================================
+# eliminate
+#=========================================================================
+
+import random
+
+from pymtl import *
+from tests.context import lizard
+from tests.core.inst_utils import *
+
+
+#-------------------------------------------------------------------------
+# gen_move_test
+# Moves share the preg of their source, which stays live after the source
+# is overwritten, and a move of a register to itself changes nothing
+#-------------------------------------------------------------------------
+def gen_move_test():
+  return """
+    csrr x1, mngr2proc < 5
+    addi x2, x1, 0
+    addi x1, x1, 1
+    addi x3, x3, 0
+    or x4, x2, x0
+    addi x2, x1, 0
+    addi x4, x4, 10
+    xori x5, x4, 0
+    addi x4, x0, 0
+    csrw proc2mngr, x1 > 6
+    csrw proc2mngr, x2 > 6
+    csrw proc2mngr, x3 > 0
+    csrw proc2mngr, x4 > 0
+    csrw proc2mngr, x5 > 15
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_move_squash_test
+# Moves after a taken branch are squashed, and leave no sharing behind
+#-------------------------------------------------------------------------
+def gen_move_squash_test():
+  return """
+    csrr x1, mngr2proc < 7
+    csrr x2, mngr2proc < 9
+    beq x0, x0, skip
+    addi x1, x2, 0
+    addi x2, x1, 0
+  skip:
+    addi x3, x1, 0
+    addi x1, x1, 1
+    add x4, x3, x2
+    csrw proc2mngr, x1 > 8
+    csrw proc2mngr, x3 > 7
+    csrw proc2mngr, x4 > 16
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_move_loop_test
+# Pregs shared by moves are freed once no areg uses them, so a loop of
+# moves runs far past the number of free pregs
+#-------------------------------------------------------------------------
+def gen_move_loop_test():
+  return """
+    csrr x7, mngr2proc < 100
+    addi x6, x0, 0
+  loop:
+    addi x5, x6, 0
+    addi x6, x5, 1
+    addi x8, x5, 0
+    addi x7, x7, -1
+    bne x7, x0, loop
+    csrw proc2mngr, x5 > 99
+    csrw proc2mngr, x6 > 100
+    csrw proc2mngr, x8 > 99
+  """
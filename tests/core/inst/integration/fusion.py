@@ -0,0 +1,60 @@
+#=========================================================================
+# fusion
+#=========================================================================
+
+import random
+
+from pymtl import *
+from tests.context import lizard
+from tests.core.inst_utils import *
+
+
+#-------------------------------------------------------------------------
+# gen_basic_test
+# Every fusible pair is run at both alignments in a fetch group
+#-------------------------------------------------------------------------
+def gen_basic_test():
+  return """
+    csrr x5, mngr2proc < 0xdeadbeef
+    lui x1, 0x12345
+    addi x1, x1, 0x678
+    nop
+    lui x2, 0x12345
+    addi x2, x2, 0x678
+    lui x3, 0x12345
+    addi x3, x3, 0xfff
+    lui x4, 0x7ffff
+    addiw x4, x4, 0x800
+    slli x5, x5, 16
+    slli x6, x5, 32
+    srli x6, x6, 32
+    nop
+    slli x7, x5, 32
+    srli x7, x7, 32
+    csrw proc2mngr, x1 > 0x12345678
+    csrw proc2mngr, x2 > 0x12345678
+    csrw proc2mngr, x3 > 0x12344fff
+    csrw proc2mngr, x4 > 0x7fffe800
+    csrw proc2mngr, x6 > 0xbeef0000
+    csrw proc2mngr, x7 > 0xbeef0000
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_auipc_test
+# The fused auipc and addi is checked against a later auipc
+#-------------------------------------------------------------------------
+def gen_auipc_test():
+  return """
+    auipc x1, 0x1
+    addi x1, x1, 0x10
+    auipc x2, 0
+    sub x3, x1, x2
+    nop
+    auipc x4, 0x1
+    addi x4, x4, 0xff0
+    auipc x5, 0
+    sub x6, x4, x5
+    csrw proc2mngr, x3 > 0x1008
+    csrw proc2mngr, x6 > 0xfe8
+  """
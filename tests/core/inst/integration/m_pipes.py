@@ -0,0 +1,84 @@
+#=========================================================================
+# m_pipes
+#=========================================================================
+
+import random
+
+from pymtl import *
+from tests.context import lizard
+from tests.core.inst_utils import *
+
+
+#-------------------------------------------------------------------------
+# gen_mul_during_div_test
+# Multiplies, and instructions which depend on them, finish while a
+# divide is still in the divider
+#-------------------------------------------------------------------------
+def gen_mul_during_div_test():
+  return """
+    csrr x1, mngr2proc < 1000000007
+    csrr x2, mngr2proc < 13
+    csrr x3, mngr2proc < 12345
+    csrr x4, mngr2proc < 6789
+    div x5, x1, x2
+    mul x6, x3, x4
+    add x7, x6, x6
+    mul x8, x7, x0
+    add x9, x6, x7
+    add x9, x9, x8
+    add x10, x5, x9
+    csrw proc2mngr, x6 > 83810205
+    csrw proc2mngr, x9 > 251430615
+    csrw proc2mngr, x5 > 76923077
+    csrw proc2mngr, x10 > 328353692
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_back_to_back_div_test
+# A divide waits in the issue queue for the one ahead of it
+#-------------------------------------------------------------------------
+def gen_back_to_back_div_test():
+  return """
+    csrr x1, mngr2proc < 1000000007
+    csrr x2, mngr2proc < 13
+    divu x3, x1, x2
+    remu x4, x1, x2
+    addi x5, x2, 1
+    mul x6, x5, x5
+    div x7, x3, x2
+    rem x8, x3, x2
+    addi x9, x6, 1
+    csrw proc2mngr, x3 > 76923077
+    csrw proc2mngr, x4 > 6
+    csrw proc2mngr, x6 > 196
+    csrw proc2mngr, x7 > 5917159
+    csrw proc2mngr, x8 > 10
+    csrw proc2mngr, x9 > 197
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_mul_dependent_test
+# Each instruction depends on the multiply right before it, so it issues
+# on the multiply's early wakeup
+#-------------------------------------------------------------------------
+def gen_mul_dependent_test():
+  return """
+    csrr x1, mngr2proc < 3
+    csrr x2, mngr2proc < 7
+    mul x3, x1, x1
+    mul x4, x3, x2
+    add x5, x4, x3
+    mul x6, x5, x5
+    sub x7, x6, x4
+    mulw x8, x7, x1
+    addi x9, x8, 1
+    csrw proc2mngr, x3 > 9
+    csrw proc2mngr, x4 > 63
+    csrw proc2mngr, x5 > 72
+    csrw proc2mngr, x6 > 5184
+    csrw proc2mngr, x7 > 5121
+    csrw proc2mngr, x8 > 15363
+    csrw proc2mngr, x9 > 15364
+  """
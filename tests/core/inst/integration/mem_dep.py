@@ -0,0 +1,56 @@
+#=========================================================================
+# mem_dep
+#=========================================================================
+
+import random
+
+from pymtl import *
+from tests.context import lizard
+from tests.core.inst_utils import *
+
+
+#-------------------------------------------------------------------------
+# gen_alias_test
+# The store address waits on a divide, so the load issues ahead of it and
+# has to run again. The second time around the load is predicted to wait
+#-------------------------------------------------------------------------
+def gen_alias_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    csrr x2, mngr2proc < 0x00000002
+    addi x3, x0, 1
+  label_a:
+    div x4, x1, x3
+    sw x2, 0(x4)
+    lwu x5, 0(x1)
+    add x6, x6, x5
+    addi x2, x2, -1
+    bne x2, x0, label_a
+    csrw proc2mngr, x5 > 0x00000001
+    csrw proc2mngr, x6 > 0x00000003
+
+    .data
+    .word 0x01020304
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_no_alias_test
+# The load issues ahead of a store to a different word
+#-------------------------------------------------------------------------
+def gen_no_alias_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    csrr x2, mngr2proc < 0xdeadbeef
+    addi x3, x0, 1
+    div x4, x1, x3
+    sw x2, 4(x4)
+    lwu x5, 0(x1)
+    lwu x6, 4(x1)
+    csrw proc2mngr, x5 > 0x01020304
+    csrw proc2mngr, x6 > 0xdeadbeef
+
+    .data
+    .word 0x01020304
+    .word 0x05060708
+  """
@@ -0,0 +1,63 @@
+#=========================================================================
+# prefetch
+#=========================================================================
+
+import random
+
+from pymtl import *
+from tests.context import lizard
+from tests.core.inst_utils import *
+
+
+#-------------------------------------------------------------------------
+# gen_stride_test
+# A loop of loads with a constant stride trains the stride prefetcher,
+# which runs ahead into lines the loop has not touched yet
+#-------------------------------------------------------------------------
+def gen_stride_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    addi x2, x0, 32
+    addi x3, x0, 0
+  loop:
+    lwu x4, 0(x1)
+    add x3, x3, x4
+    addi x1, x1, 4
+    addi x2, x2, -1
+    bne x2, x0, loop
+    csrw proc2mngr, x3 > 528
+
+    .data
+    .word 0x00000001
+    .word 0x00000002
+    .word 0x00000003
+    .word 0x00000004
+    .word 0x00000005
+    .word 0x00000006
+    .word 0x00000007
+    .word 0x00000008
+    .word 0x00000009
+    .word 0x0000000a
+    .word 0x0000000b
+    .word 0x0000000c
+    .word 0x0000000d
+    .word 0x0000000e
+    .word 0x0000000f
+    .word 0x00000010
+    .word 0x00000011
+    .word 0x00000012
+    .word 0x00000013
+    .word 0x00000014
+    .word 0x00000015
+    .word 0x00000016
+    .word 0x00000017
+    .word 0x00000018
+    .word 0x00000019
+    .word 0x0000001a
+    .word 0x0000001b
+    .word 0x0000001c
+    .word 0x0000001d
+    .word 0x0000001e
+    .word 0x0000001f
+    .word 0x00000020
+  """
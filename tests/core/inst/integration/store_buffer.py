@@ -0,0 +1,61 @@
+#=========================================================================
+# store_buffer
+#=========================================================================
+
+import random
+
+from pymtl import *
+from tests.context import lizard
+from tests.core.inst_utils import *
+
+
+#-------------------------------------------------------------------------
+# gen_memset_test
+# A loop of byte stores merges into words in the store buffer. The last
+# word is only partly written, so loads from it either forward from the
+# buffer or wait for it to drain
+#-------------------------------------------------------------------------
+def gen_memset_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    addi x2, x0, 12
+    addi x3, x0, 0x5a
+    addi x4, x1, 0
+  loop:
+    sb x3, 0(x4)
+    addi x4, x4, 1
+    addi x2, x2, -1
+    bne x2, x0, loop
+    lbu x5, 11(x1)
+    lwu x6, 8(x1)
+    lwu x7, 12(x1)
+    lwu x8, 0(x1)
+    csrw proc2mngr, x5 > 0x0000005a
+    csrw proc2mngr, x6 > 0x5a5a5a5a
+    csrw proc2mngr, x7 > 0x0d0e0f10
+    csrw proc2mngr, x8 > 0x5a5a5a5a
+
+    .data
+    .word 0x01020304
+    .word 0x05060708
+    .word 0x090a0b0c
+    .word 0x0d0e0f10
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_fence_test
+# A fence waits for the store buffer to drain
+#-------------------------------------------------------------------------
+def gen_fence_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    csrr x2, mngr2proc < 0x00000077
+    sb x2, 1(x1)
+    fence
+    lwu x3, 0(x1)
+    csrw proc2mngr, x3 > 0x01027704
+
+    .data
+    .word 0x01020304
+  """
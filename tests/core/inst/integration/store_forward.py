@@ -0,0 +1,119 @@
+#=========================================================================
+# store_forward
+#=========================================================================
+
+import random
+
+from pymtl import *
+from tests.context import lizard
+from tests.core.inst_utils import *
+
+
+#-------------------------------------------------------------------------
+# gen_full_cover_test
+# Loads fully covered by an older store of each size, at different
+# offsets within the store, get the store data shifted and extended
+#-------------------------------------------------------------------------
+def gen_full_cover_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    csrr x2, mngr2proc < 0x8877665544332211
+    sd x2, 0(x1)
+    ld x3, 0(x1)
+    lwu x4, 4(x1)
+    lhu x5, 2(x1)
+    lbu x6, 7(x1)
+    lb x7, 7(x1)
+    sw x2, 8(x1)
+    lwu x8, 8(x1)
+    lhu x9, 10(x1)
+    lb x10, 11(x1)
+    sh x2, 18(x1)
+    lh x11, 18(x1)
+    lbu x12, 19(x1)
+    sb x2, 29(x1)
+    lbu x13, 29(x1)
+    csrw proc2mngr, x3 > 0x8877665544332211
+    csrw proc2mngr, x4 > 0x88776655
+    csrw proc2mngr, x5 > 0x4433
+    csrw proc2mngr, x6 > 0x88
+    csrw proc2mngr, x7 > 0xffffffffffffff88
+    csrw proc2mngr, x8 > 0x44332211
+    csrw proc2mngr, x9 > 0x4433
+    csrw proc2mngr, x10 > 0x44
+    csrw proc2mngr, x11 > 0x2211
+    csrw proc2mngr, x12 > 0x22
+    csrw proc2mngr, x13 > 0x11
+
+    .data
+    .word 0x01020304
+    .word 0x05060708
+    .word 0x090a0b0c
+    .word 0x0d0e0f10
+    .word 0x11121314
+    .word 0x15161718
+    .word 0x191a1b1c
+    .word 0x1d1e1f20
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_partial_overlap_test
+# A load only partly covered by an older store waits for the store to
+# reach memory, and sees both the store and the bytes around it
+#-------------------------------------------------------------------------
+def gen_partial_overlap_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    csrr x2, mngr2proc < 0x000000ff
+    sb x2, 1(x1)
+    lwu x3, 0(x1)
+    sh x2, 6(x1)
+    ld x4, 0(x1)
+    sw x2, 12(x1)
+    ld x5, 8(x1)
+    csrw proc2mngr, x3 > 0x0102ff04
+    csrw proc2mngr, x4 > 0x00ff07080102ff04
+    csrw proc2mngr, x5 > 0x000000ff090a0b0c
+
+    .data
+    .word 0x01020304
+    .word 0x05060708
+    .word 0x090a0b0c
+    .word 0x0d0e0f10
+  """
+
+
+#-------------------------------------------------------------------------
+# gen_youngest_store_test
+# With several older stores overlapping a load, the youngest one
+# forwards
+#-------------------------------------------------------------------------
+def gen_youngest_store_test():
+  return """
+    csrr x1, mngr2proc < 0x00002000
+    csrr x2, mngr2proc < 0x1111111111111111
+    csrr x3, mngr2proc < 0x2222222222222222
+    csrr x4, mngr2proc < 0x33333333
+    csrr x5, mngr2proc < 0x44
+    sd x2, 0(x1)
+    sd x3, 0(x1)
+    ld x6, 0(x1)
+    sw x4, 0(x1)
+    sb x5, 0(x1)
+    lbu x7, 0(x1)
+    lwu x8, 4(x1)
+    sb x5, 9(x1)
+    sh x4, 8(x1)
+    lhu x9, 8(x1)
+    csrw proc2mngr, x6 > 0x2222222222222222
+    csrw proc2mngr, x7 > 0x44
+    csrw proc2mngr, x8 > 0x22222222
+    csrw proc2mngr, x9 > 0x3333
+
+    .data
+    .word 0x01020304
+    .word 0x05060708
+    .word 0x090a0b0c
+    .word 0x0d0e0f10
+  """
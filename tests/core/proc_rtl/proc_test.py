@@ -17,3 +17,29 @@ def test_basic():
       True,
       'proc.vcd',
       max_cycles=200)
+
+
+def test_random_dmem_delays():
+  # Independent loads overlap, and data memory answers them out of order
+  asm_test(
+      """
+  csrr x1, mngr2proc < 0x00002000
+  addi x2, x0, 16
+  addi x3, x0, 0
+loop:
+  lwu x4, 0(x1)
+  lwu x5, 4(x1)
+  add x3, x3, x4
+  add x3, x3, x5
+  addi x1, x1, 8
+  addi x2, x2, -1
+  bne x2, x0, loop
+  csrw proc2mngr, x3 > 528
+
+  .data
+""" + '\n'.join('  .word 0x{:08x}'.format(i) for i in range(1, 33)),
+      False,
+      'proc_random_dmem_delays.vcd',
+      max_cycles=20000,
+      dmem_delay=3,
+      dmem_jitter=8)
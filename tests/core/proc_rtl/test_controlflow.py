@@ -16,20 +16,20 @@ class TestControlFlowManagerFL(FLModel):
     def check_redirect():
       if s.init:
         s.init = False
-        return Result(redirect=1, target=reset_vector)
+        return Result(redirect=1, target=reset_vector, hist=0, ras_tos=0)
       else:
-        return Result(redirect=0, target=0)
+        return Result(redirect=0, target=0, hist=0, ras_tos=0)
 
     @s.model_method
     def check_kill():
       return 0
 
     @s.model_method
-    def redirect(seq, spec_idx, branch_mask, target, force):
+    def redirect(seq, spec_idx, branch_mask, target, hist, force):
       pass
 
     @s.model_method
-    def register(speculative, serialize, store, pc, pc_succ):
+    def register(speculative, serialize, store, pc, pc_succ, ras_tos):
       ret = s.head
       s.head += 1
       return ret
@@ -16,7 +16,7 @@ class TestFetchFL(FLModel):
 
   @HardwareModel.validate
   def __init__(s, fetch_msgs):
-    super(TestFetchFL, s).__init__(TestFetchInterface())
+    super(TestFetchFL, s).__init__(TestFetchInterface(1))
 
     s.state(fetch_msgs=deque(fetch_msgs))
 
@@ -10,3 +10,9 @@ from lizard.model.translate import translate
 def test_translate():
   translate(
       DataFlowManager(DataFlowManagerInterface(64, 32, 64, 4, 2, 2, 1, 4, 1)))
+
+
+def test_translate_write_ports():
+  translate(
+      DataFlowManager(
+          DataFlowManagerInterface(64, 32, 64, 4, 2, 4, 2, 4, 1, 5)))
@@ -2,15 +2,30 @@ import pytest
 from pymtl import *
 from tests.context import lizard
 from lizard.model.test_model import run_test_state_machine
-from lizard.util.rtl.cam import RandomReplacementCAM, CAMInterface
-from lizard.util.fl.cam import RandomReplacementCAMFL
+from lizard.util.rtl.cam import RandomReplacementCAM, SetAssociativeCAM, CAMInterface
+from lizard.util.fl.cam import RandomReplacementCAMFL, SetAssociativeCAMFL
 from lizard.model.wrapper import wrap_to_cl
 
 
 @pytest.mark.parametrize('size', [1, 2, 3, 4, 20])
-def test_state_machine(size):
+@pytest.mark.parametrize('num_read_ports', [1, 2])
+def test_state_machine(size, num_read_ports):
   run_test_state_machine(
       RandomReplacementCAM,
       RandomReplacementCAMFL,
-      (CAMInterface(Bits(4), Bits(8)), size),
+      (CAMInterface(Bits(4), Bits(8), num_read_ports), size),
+      translate_model=True)
+
+
+@pytest.mark.parametrize('nsets, nways, key_shift', [(1, 1, 0), (1, 4, 0),
+                                                     (4, 1, 0), (4, 2, 1),
+                                                     (2, 8, 2)])
+@pytest.mark.parametrize('num_read_ports', [1, 2])
+def test_set_associative_state_machine(nsets, nways, key_shift,
+                                       num_read_ports):
+  run_test_state_machine(
+      SetAssociativeCAM,
+      SetAssociativeCAMFL,
+      (CAMInterface(Bits(6), Bits(8), num_read_ports), nsets, nways,
+       key_shift),
       translate_model=True)
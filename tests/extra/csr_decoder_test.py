@@ -0,0 +1,41 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.model.wrapper import wrap_to_cl
+from lizard.util.arch import rv64g
+from lizard.core.rtl.frontend.csr_decoder import CsrDecoder
+from lizard.core.rtl.csr_manager import PERF_COUNTERS
+
+
+def decode(dut, inst_str):
+  result = dut.decode(inst=rv64g.isa.assemble_inst({}, 0, inst_str))
+  assert result.success
+  dut.cycle()
+  return int(result.serialize)
+
+
+@pytest.mark.parametrize('csr', [
+    'mcycle',
+    'minstret',
+    'mhpmcounter3',
+    'mhpmcounter4',
+    'mhpmcounter{}'.format(3 + len(PERF_COUNTERS)),
+])
+def test_counter_read_speculates(csr):
+  dut = wrap_to_cl(CsrDecoder())
+  dut.reset()
+
+  assert decode(dut, 'csrrs x5, {}, x0'.format(csr)) == 0
+  assert decode(dut, 'csrrc x5, {}, x0'.format(csr)) == 0
+  # Anything which could write the CSR still serializes
+  assert decode(dut, 'csrrs x5, {}, x6'.format(csr)) == 1
+  assert decode(dut, 'csrrw x5, {}, x0'.format(csr)) == 1
+
+
+def test_other_read_serializes():
+  dut = wrap_to_cl(CsrDecoder())
+  dut.reset()
+
+  assert decode(dut, 'csrrs x5, mscratch, x0') == 1
+  assert decode(
+      dut, 'csrrs x5, mhpmcounter{}, x0'.format(4 + len(PERF_COUNTERS))) == 1
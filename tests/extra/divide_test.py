@@ -1,6 +1,8 @@
 from pymtl import *
 from tests.context import lizard
-from lizard.util.rtl.divide import DivideInterface, NonRestoringDivider
+from lizard.util.rtl.divide import DivideInterface, NonRestoringDivider, Radix4Divider
+from lizard.util.cl.divide import Radix4DividerCL
+from lizard.util.arch.semantics import RV64GSemantics
 from tests.config import test_verilog
 from lizard.util.test_utils import run_model_translation, run_test_vector_sim
 from lizard.model.test_model import run_test_state_machine
@@ -14,6 +16,7 @@ def test_translation():
   iface = DivideInterface(64)
   run_model_translation(NonRestoringDivider(iface, 64), lint=True)
   run_model_translation(NonRestoringDivider(iface, 16), lint=True)
+  run_model_translation(Radix4Divider(iface), lint=True)
 
 
 @pytest.mark.parametrize(
@@ -65,3 +68,61 @@ def test_edge_cases(dividend, divisor, quot, remain, signed):
     assert x.quotient.uint() == quot
     assert x.rem.uint() == remain
   dut.cycle()
+
+
+def run_divide(dut, N, dividend, divisor, signed):
+  dut.div(dividend=Bits(N, dividend), divisor=Bits(N, divisor), signed=signed)
+  for _ in range(N):
+    dut.cycle()
+    x = dut.result()
+    if x != not_ready_instance:
+      break
+  dut.cycle()
+  return x
+
+
+@pytest.mark.parametrize("signed", [0, 1])
+def test_radix4_exhaustive(signed):
+  N = 4
+  semantics = RV64GSemantics(None, None, None)
+  dut = wrap_to_cl(Radix4Divider(DivideInterface(N)))
+  dut.reset()
+  for dividend in range(2**N):
+    for divisor in range(2**N):
+      x = run_divide(dut, N, dividend, divisor, signed)
+      if signed:
+        a, b = Bits(N, dividend).int(), Bits(N, divisor).int()
+        assert x.quotient.int() == semantics.sane_divide(a, b, N)
+        assert x.rem.int() == semantics.sane_rem(a, b, N)
+      else:
+        assert x.quotient.uint() == semantics.sane_divide(dividend, divisor, N)
+        assert x.rem.uint() == semantics.sane_rem(dividend, divisor, N)
+
+
+@pytest.mark.parametrize(
+    "dividend, divisor, ncycles",
+    [
+        # Answered right away
+        (17, 0, 1),
+        (3, 7, 1),
+        # 1 quotient bit takes a whole step
+        (7, 7, 2),
+        (2**64 - 1, 2**63, 2),
+        # Every quotient bit
+        (2**64 - 1, 1, 33),
+    ])
+def test_radix4_latency(dividend, divisor, ncycles):
+  N = 64
+  dut = wrap_to_cl(Radix4Divider(DivideInterface(N)))
+  dut.reset()
+  dut.div(dividend=Bits(N, dividend), divisor=Bits(N, divisor), signed=0)
+  dut.cycle()
+  for _ in range(ncycles - 1):
+    assert dut.result() == not_ready_instance
+    dut.cycle()
+  x = dut.result()
+  assert x.quotient.uint() == (dividend // divisor if divisor else 2**N - 1)
+
+
+def test_radix4_state_machine():
+  run_test_state_machine(Radix4Divider, Radix4DividerCL, (DivideInterface(64),))
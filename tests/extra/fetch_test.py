@@ -0,0 +1,145 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.model.test_harness import TestHarness
+from lizard.model.wrapper import wrap_to_rtl, wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.mem.rtl.memory_bus import MemoryBusInterface
+from lizard.mem.fl.test_memory_bus import TestMemoryBusFL
+from lizard.core.rtl.frontend.fetch import Fetch, FetchInterface
+from lizard.util.arch.rv64g import assembler
+
+
+class FetchTestHarness(Model):
+  """Fetch straight from a pipelined test memory, as without the icache.
+
+  There are no redirects from cflow and no predictors, so F1 redirects on
+  jumps and returns are the only ones.
+  """
+
+  def __init__(s, asm, nslots, delay):
+    text = assembler.assemble(asm).get_section('.text')
+    # Fetch starts at 0, and the jumps are PC relative
+    initial_mem = {i: b for i, b in enumerate(text.data)}
+    s.mbi = MemoryBusInterface(1, 2, 2, 64, 8)
+    s.tmb = TestMemoryBusFL(s.mbi, initial_mem, [delay], [nslots])
+    s.mb = wrap_to_rtl(s.tmb)
+
+    TestHarness(
+        s,
+        Fetch(
+            FetchInterface(1),
+            s.mbi.MemMsg,
+            enable_btb=False,
+            enable_bpred=False,
+            enable_itp=False,
+            enable_ras=True,
+            nslots=nslots,
+            queue_size=4), False)
+
+    s.connect_m(s.dut.mem_send, s.mb.send_0)
+    s.connect_m(s.dut.mem_recv, s.mb.recv_0)
+    s.connect(s.dut.check_redirect_redirect, 0)
+    s.connect(s.dut.check_redirect_target, 0)
+    s.connect(s.dut.check_redirect_hist, 0)
+    s.connect(s.dut.check_redirect_ras_tos, 0)
+    s.connect(s.dut.bpred_predict_taken, 0)
+    for i in range(2):
+      s.connect(s.dut.btb_read_value[i], 0)
+      s.connect(s.dut.btb_read_valid[i], 0)
+      s.connect(s.dut.itp_predict_target[i], 0)
+      s.connect(s.dut.itp_predict_valid[i], 0)
+
+  def line_trace(s):
+    return s.dut.line_trace()
+
+
+def fetch_stream(dut, count, stall_every):
+  stream = []
+  for i in range(200):
+    if len(stream) == count:
+      return stream
+    if i % stall_every != 0:
+      msg = dut.peek()
+      if msg != not_ready_instance:
+        stream.append((int(msg.msg.hdr_pc), int(msg.msg.pc_succ)))
+        dut.take()
+    dut.cycle()
+  assert False
+
+
+# A call in the second slot, then a jump in the first slot, which cuts
+# the block, then a return in the first slot, which redirects to the top
+# of the return address stack. Without cflow, the call and the jump
+# fall through.
+JUMP_ASM = """
+  nop
+  jal x1, far
+  nop
+  nop
+  jal x0, far
+  nop
+  jalr x0, x1, 0
+  nop
+far:
+  nop
+"""
+
+
+@pytest.mark.parametrize('nslots,delay,stall_every', [
+    (1, 0, 1000),
+    (4, 0, 1000),
+    (4, 3, 1000),
+    (4, 3, 3),
+    (2, 1, 2),
+    (3, 5, 1000),
+])
+def test_redirect_in_flight(nslots, delay, stall_every):
+  th = FetchTestHarness(JUMP_ASM, nslots, delay)
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  # The blocks fetched past the jump and the return are dropped, even
+  # though several of them are in flight when F1 sees the jump
+  assert fetch_stream(dut, 9, stall_every) == [
+      (0x00, 0x04),
+      (0x04, 0x08),
+      (0x08, 0x0c),
+      (0x0c, 0x10),
+      (0x10, 0x14),
+      (0x14, 0x18),
+      (0x18, 0x08),
+      (0x08, 0x0c),
+      (0x0c, 0x10),
+  ]
+
+
+# Every block starts with a jump, so the second instruction of each block
+# is fetched again on its own after F1 cuts the block
+CUT_ASM = """
+  jal x0, far
+  nop
+  jal x0, far
+  nop
+  jal x0, far
+  nop
+  nop
+  nop
+far:
+  nop
+"""
+
+
+@pytest.mark.parametrize('nslots,delay,stall_every', [
+    (4, 0, 1000),
+    (4, 3, 1000),
+    (4, 2, 2),
+    (2, 4, 1000),
+])
+def test_jump_in_first_slot(nslots, delay, stall_every):
+  th = FetchTestHarness(CUT_ASM, nslots, delay)
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  assert fetch_stream(dut, 8,
+                      stall_every) == [(pc, pc + 4) for pc in range(0, 0x20, 4)]
@@ -0,0 +1,73 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.test_utils import run_model_translation
+from lizard.model.wrapper import wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.util.rtl.fifo import Fifo, FifoInterface
+
+
+@pytest.mark.parametrize('nentries', [1, 3, 4])
+def test_translation(nentries):
+  run_model_translation(Fifo(FifoInterface(Bits(8), nentries)))
+  run_model_translation(Fifo(FifoInterface(Bits(8), nentries, 2, 2)))
+
+
+@pytest.mark.parametrize('nentries', [1, 3, 4])
+def test_order(nentries):
+  dut = wrap_to_cl(Fifo(FifoInterface(Bits(8), nentries)))
+  dut.reset()
+
+  expected = []
+  received = []
+  for i in range(20):
+    if i % 3 != 2 and dut.peek() != not_ready_instance:
+      received.append(int(dut.peek().msg))
+      dut.deq()
+    if dut.enq(msg=i) != not_ready_instance:
+      expected.append(i)
+    dut.cycle()
+  while dut.peek() != not_ready_instance:
+    received.append(int(dut.peek().msg))
+    dut.deq()
+    dut.cycle()
+  assert received == expected
+
+
+def test_clear():
+  dut = wrap_to_cl(Fifo(FifoInterface(Bits(8), 2)))
+  dut.reset()
+
+  dut.enq(msg=1)
+  dut.cycle()
+  dut.enq(msg=2)
+  dut.cycle()
+  assert dut.enq(msg=3) == not_ready_instance
+  assert dut.status().count == 2
+  dut.clear()
+  dut.cycle()
+  assert dut.status().count == 0
+  assert dut.peek() == not_ready_instance
+
+
+def test_two_wide():
+  dut = wrap_to_cl(Fifo(FifoInterface(Bits(8), 4, num_enq=2, num_deq=2)))
+  dut.reset()
+
+  dut.enq(msg=1)
+  dut.enq(msg=2)
+  dut.cycle()
+  dut.enq(msg=3)
+  dut.cycle()
+  assert dut.status().count == 3
+  assert dut.peek().msg == 1
+  assert dut.peek().msg == 2
+  dut.deq()
+  dut.deq()
+  # Only 1 entry is free until the dequeues take effect
+  dut.enq(msg=4)
+  assert dut.enq(msg=5) == not_ready_instance
+  dut.cycle()
+  assert dut.status().count == 2
+  assert dut.peek().msg == 3
+  assert dut.peek().msg == 4
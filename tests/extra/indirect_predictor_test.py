@@ -0,0 +1,31 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.test_utils import run_model_translation
+from lizard.model.wrapper import wrap_to_cl
+from lizard.core.rtl.frontend.indirect_predictor import IndirectPredictor, IndirectPredictorInterface
+
+
+def test_translation():
+  run_model_translation(
+      IndirectPredictor(IndirectPredictorInterface(16, 2, 2), 8, 4, 2))
+
+
+def test_separates_histories():
+  dut = wrap_to_cl(
+      IndirectPredictor(IndirectPredictorInterface(16, 2), 8, 4, 2))
+  dut.reset()
+
+  assert dut.predict(pc=0x10, hist=0).valid == 0
+  dut.update(pc=0x10, hist=1, target=0x100)
+  dut.cycle()
+  dut.update(pc=0x10, hist=2, target=0x200)
+  dut.cycle()
+  assert dut.predict(pc=0x10, hist=1).target == 0x100
+  dut.cycle()
+  assert dut.predict(pc=0x10, hist=2).target == 0x200
+  dut.cycle()
+  assert dut.predict(pc=0x10, hist=0).valid == 0
+  dut.cycle()
+  # A jump with the same index but a different tag misses
+  assert dut.predict(pc=0x30, hist=1).valid == 0
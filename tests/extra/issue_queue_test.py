@@ -0,0 +1,122 @@
+import random
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.test_utils import run_model_translation
+from lizard.model.wrapper import wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.util.rtl.issue_queue import ISSUE_QUEUES, IssueQueueInterface, AbstractIssueType
+from lizard.core.rtl.kill_unit import KillDropController, KillDropControllerInterface
+from lizard.core.rtl.controlflow import KillType
+
+SlotType = AbstractIssueType(8, Bits(8), 4)
+
+
+def make_kill():
+  return KillDropController(KillDropControllerInterface(4))
+
+
+def slot(opaque, src0=0, src0_rdy=1, ordered=0, bypass=0):
+  value = SlotType()
+  value.ordered = ordered
+  value.bypass = bypass
+  value.src0_val = 1
+  value.src0_rdy = src0_rdy
+  value.src0 = src0
+  value.opaque = opaque
+  return value
+
+
+@pytest.mark.parametrize('num_slots', [32, 64])
+def test_age_translation(num_slots):
+  run_model_translation(ISSUE_QUEUES['age'](IssueQueueInterface(
+      SlotType(), KillType(4), 1), make_kill, num_slots))
+
+
+@pytest.mark.parametrize('kind', ['compacting', 'age'])
+def test_oldest_first(kind):
+  dut = wrap_to_cl(ISSUE_QUEUES[kind](IssueQueueInterface(
+      SlotType(), KillType(4), 1), make_kill, 4))
+  dut.reset()
+
+  dut.add(value=slot(1, src0=5, src0_rdy=0))
+  dut.cycle()
+  dut.add(value=slot(2))
+  dut.cycle()
+  dut.add(value=slot(3))
+  dut.cycle()
+  assert dut.remove().value.opaque == 2
+  dut.cycle()
+  # Reuses the slot freed by the last remove
+  dut.add(value=slot(4))
+  dut.cycle()
+  assert dut.remove().value.opaque == 3
+  dut.cycle()
+  assert dut.remove().value.opaque == 4
+  dut.cycle()
+  assert dut.remove() == not_ready_instance
+  dut.notify(tag=5)
+  dut.cycle()
+  assert dut.remove().value.opaque == 1
+
+
+@pytest.mark.parametrize('kind', ['compacting', 'age'])
+def test_bypass_ordered(kind):
+  dut = wrap_to_cl(ISSUE_QUEUES[kind](IssueQueueInterface(
+      SlotType(), KillType(4), 1), make_kill, 4))
+  dut.reset()
+
+  dut.add(value=slot(1, src0=5, src0_rdy=0, ordered=1))
+  dut.cycle()
+  dut.add(value=slot(2))
+  dut.cycle()
+  dut.add(value=slot(3, bypass=1))
+  dut.cycle()
+  # Only the bypassing slot can pass the waiting ordered one
+  assert dut.remove().value.opaque == 3
+  dut.cycle()
+  assert dut.remove() == not_ready_instance
+  dut.notify(tag=5)
+  dut.cycle()
+  assert dut.remove().value.opaque == 1
+  dut.cycle()
+  assert dut.remove().value.opaque == 2
+
+
+@pytest.mark.parametrize('num_slots,num_remove', [(4, 1), (8, 1), (8, 2)])
+def test_random_against_compacting(num_slots, num_remove):
+  duts = [
+      wrap_to_cl(ISSUE_QUEUES[kind](IssueQueueInterface(
+          SlotType(), KillType(4), 2, num_remove=num_remove), make_kill,
+                                    num_slots))
+      for kind in ['compacting', 'age']
+  ]
+  for dut in duts:
+    dut.reset()
+
+  # Both queues see the same adds, removes and wakeups, and must remove
+  # the same slots in the same order
+  rng = random.Random(num_slots + num_remove)
+  for i in range(500):
+    if rng.random() < 0.6:
+      value = slot(
+          i % 256,
+          src0=rng.randrange(1, 8),
+          src0_rdy=rng.random() < 0.5,
+          ordered=rng.random() < 0.1,
+          bypass=rng.random() < 0.1)
+      added = [dut.add(value=value) != not_ready_instance for dut in duts]
+      assert added[0] == added[1]
+    for _ in range(rng.randrange(num_remove + 1)):
+      removed = [dut.remove() for dut in duts]
+      if removed[0] == not_ready_instance:
+        assert removed[1] == not_ready_instance
+      else:
+        assert removed[1] != not_ready_instance
+        assert removed[0].value.opaque == removed[1].value.opaque
+    for _ in range(rng.randrange(3)):
+      tag = rng.randrange(1, 8)
+      for dut in duts:
+        dut.notify(tag=tag)
+    for dut in duts:
+      dut.cycle()
@@ -0,0 +1,162 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.rtl.interface import Interface, IncludeAll, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.model.wrapper import wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.core.rtl.backend.issue_selector import IssueSelector
+from lizard.core.rtl.messages import IssueMsg, PipelineMsgStatus, OpClass, MemFunc
+
+
+class IssueSelectorTestHarness(Model):
+  """IssueSelector, fed a group of 2 instructions like rename's, with issue
+  queues which always have room.
+
+  add fills the group once it is empty. As in rename, peek[i] is the ith
+  oldest instruction left in the group.
+  """
+
+  def __init__(s):
+    s.dut = IssueSelector(2)
+    UseInterface(
+        s,
+        Interface([
+            MethodSpec(
+                'add',
+                args={'msg': IssueMsg()},
+                rets=None,
+                call=True,
+                rdy=True,
+                count=2,
+            ),
+        ],
+                  bases=[IncludeAll(s.dut.interface)]))
+    for name in s.dut.interface.methods.keys():
+      s.connect_m(getattr(s, name), getattr(s.dut, name))
+    s.connect(s.dut.normal_can_take_rdy, 1)
+    s.connect(s.dut.mem_can_take_rdy, 1)
+
+    s.valid = [
+        Register(RegisterInterface(Bits(1)), reset_value=0) for _ in range(2)
+    ]
+    s.msg = [
+        Register(RegisterInterface(IssueMsg(), enable=True)) for _ in range(2)
+    ]
+    # Set if only the oldest is taken, so the other one moves down
+    s.shift_ = Wire(1)
+    for i in range(2):
+      s.connect(s.dut.in_peek_rdy[i], s.valid[i].read_data)
+      s.connect(s.dut.in_peek_msg[i], s.msg[i].read_data)
+
+    @s.combinational
+    def handle_add():
+      s.shift_.v = s.dut.in_take_call[0] and not s.dut.in_take_call[1]
+      for i in range(2):
+        s.add_rdy[i].v = not s.valid[0].read_data and not s.valid[1].read_data
+
+      s.valid[0].write_data.v = s.add_call[0] or s.shift_ and s.valid[
+          1].read_data or s.valid[0].read_data and not s.dut.in_take_call[0]
+      s.msg[0].write_call.v = s.add_call[0] or s.shift_
+      if s.add_call[0]:
+        s.msg[0].write_data.v = s.add_msg[0]
+      else:
+        s.msg[0].write_data.v = s.msg[1].read_data
+
+      s.valid[1].write_data.v = s.add_call[1] or (s.valid[1].read_data and
+                                                  not s.dut.in_take_call[0])
+      s.msg[1].write_call.v = s.add_call[1]
+      s.msg[1].write_data.v = s.add_msg[1]
+
+  def line_trace(s):
+    return '{}{}'.format(s.valid[0].read_data, s.valid[1].read_data)
+
+
+def make_msg(seq, op_class=OpClass.OP_CLASS_ALU, load=False, eliminated=0):
+  msg = IssueMsg()
+  msg.hdr_status = PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+  msg.hdr_seq = seq
+  msg.op_class = op_class
+  msg.rs1_val = 1
+  msg.rs2_val = 1
+  msg.eliminated = eliminated
+  if op_class == OpClass.OP_CLASS_MEM:
+    if load:
+      msg.mem_msg_func = MemFunc.MEM_FUNC_LOAD
+    else:
+      msg.mem_msg_func = MemFunc.MEM_FUNC_STORE
+  return msg
+
+
+def add_group(dut, first, second):
+  assert dut.add(msg=first) != not_ready_instance
+  assert dut.add(msg=second) != not_ready_instance
+  dut.cycle()
+
+
+def seq(result):
+  assert result != not_ready_instance
+  return int(result.msg.hdr_seq)
+
+
+def test_different_queues():
+  dut = wrap_to_cl(IssueSelectorTestHarness())
+  dut.reset()
+
+  add_group(dut, make_msg(1), make_msg(2, OpClass.OP_CLASS_MEM, load=True))
+  # Both leave rename in the same cycle
+  assert seq(dut.normal_peek()) == 1
+  dut.normal_take()
+  assert seq(dut.mem_peek()) == 2
+  dut.mem_take()
+  dut.cycle()
+  assert dut.normal_peek() == not_ready_instance
+  assert dut.mem_peek() == not_ready_instance
+  assert dut.done_peek() == not_ready_instance
+
+  # An instruction eliminated at rename can go with the ones before it
+  add_group(dut, make_msg(3), make_msg(4, eliminated=1))
+  assert seq(dut.normal_peek()) == 3
+  dut.normal_take()
+  assert seq(dut.done_peek()) == 4
+  dut.done_take()
+  dut.cycle()
+  assert dut.normal_peek() == not_ready_instance
+  assert dut.done_peek() == not_ready_instance
+
+
+@pytest.mark.parametrize('first,second', [
+    (make_msg(1), make_msg(2)),
+    (make_msg(1, OpClass.OP_CLASS_MEM,
+              load=True), make_msg(2, OpClass.OP_CLASS_MEM, load=True)),
+    (make_msg(1, OpClass.OP_CLASS_MEM), make_msg(2)),
+    (make_msg(
+        1, OpClass.OP_CLASS_MEM), make_msg(2, OpClass.OP_CLASS_MEM, load=True)),
+    (make_msg(1, eliminated=1), make_msg(2)),
+])
+def test_second_waits(first, second):
+  dut = wrap_to_cl(IssueSelectorTestHarness())
+  dut.reset()
+
+  add_group(dut, first, second)
+  # The second uses a queue the first uses, or comes after an eliminated
+  # instruction, so it is not offered until the first is taken
+  offered = []
+  for name in ['normal', 'mem', 'done']:
+    result = getattr(dut, name + '_peek')()
+    if result != not_ready_instance:
+      offered.append(seq(result))
+      getattr(dut, name + '_take')()
+  assert offered == [1] * len(offered)
+  assert len(offered) != 0
+  dut.cycle()
+
+  offered = []
+  for name in ['normal', 'mem', 'done']:
+    result = getattr(dut, name + '_peek')()
+    if result != not_ready_instance:
+      offered.append(seq(result))
+      getattr(dut, name + '_take')()
+  assert offered == [2] * len(offered)
+  assert len(offered) != 0
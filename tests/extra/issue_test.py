@@ -0,0 +1,243 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.rtl.interface import Interface, IncludeAll, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.util.rtl.register import Register, RegisterInterface
+from lizard.util.rtl.issue_queue import ISSUE_QUEUES
+from lizard.model.wrapper import wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.core.rtl.backend.issue import Issue, IssueInterface
+from lizard.core.rtl.messages import RenameMsg, PipelineMsgStatus, OpClass, MFunc
+from lizard.config.general import *
+
+
+class IssueTestHarness(Model):
+  """Issue, fed one instruction at a time, with a stand-in for dataflow.
+
+  add holds an instruction until issue takes it. write marks a tag ready,
+  which is seen by get_updated the same cycle and by is_ready after. If
+  hold_divides is set, set_div_busy sets div_busy from the next cycle.
+  """
+
+  def __init__(s, width, kind, hold_divides=False):
+    s.dut = Issue(
+        IssueInterface(width, num_wakeup=1),
+        PREG_COUNT,
+        4,
+        1,
+        bypass_ready=False,
+        queue=ISSUE_QUEUES[kind],
+        hold_divides=hold_divides)
+    methods = [
+        MethodSpec(
+            'add',
+            args={'msg': RenameMsg()},
+            rets=None,
+            call=True,
+            rdy=True,
+        ),
+        MethodSpec(
+            'write',
+            args={'tag': PREG_IDX_NBITS},
+            rets=None,
+            call=True,
+            rdy=False,
+        ),
+    ]
+    if hold_divides:
+      methods.append(
+          MethodSpec(
+              'set_div_busy',
+              args={'busy': Bits(1)},
+              rets=None,
+              call=True,
+              rdy=False,
+          ))
+    UseInterface(s, Interface(methods, bases=[IncludeAll(s.dut.interface)]))
+    for name in s.dut.interface.methods.keys():
+      s.connect_m(getattr(s, name), getattr(s.dut, name))
+
+    s.in_valid = Register(RegisterInterface(Bits(1)), reset_value=0)
+    s.in_msg = Register(RegisterInterface(RenameMsg(), enable=True))
+    s.connect(s.dut.in_peek_rdy, s.in_valid.read_data)
+    s.connect(s.dut.in_peek_msg, s.in_msg.read_data)
+    s.connect(s.in_msg.write_data, s.add_msg)
+    s.connect(s.in_msg.write_call, s.add_call)
+
+    @s.combinational
+    def handle_in():
+      s.add_rdy.v = not s.in_valid.read_data or s.dut.in_take_call
+      s.in_valid.write_data.v = s.add_call or (s.in_valid.read_data and
+                                               not s.dut.in_take_call)
+
+    # Every tag but 0 starts out not ready
+    s.ready = Register(RegisterInterface(Bits(PREG_COUNT)), reset_value=1)
+    s.one_ = Wire(PREG_COUNT)
+    s.connect(s.one_, 1)
+    s.connect(s.dut.get_updated_tags[0], s.write_tag)
+    s.connect(s.dut.get_updated_valid[0], s.write_call)
+
+    @s.combinational
+    def handle_write():
+      if s.write_call:
+        s.ready.write_data.v = s.ready.read_data | (s.one_ << s.write_tag)
+      else:
+        s.ready.write_data.v = s.ready.read_data
+
+    for i in range(2 + 2 * width):
+
+      @s.combinational
+      def handle_is_ready(i=i):
+        s.dut.is_ready_ready[i].v = s.ready.read_data[s.dut.is_ready_tag[i]]
+
+    if hold_divides:
+      s.div_busy = Register(
+          RegisterInterface(Bits(1), enable=True), reset_value=0)
+      s.connect(s.div_busy.write_data, s.set_div_busy_busy)
+      s.connect(s.div_busy.write_call, s.set_div_busy_call)
+      s.connect(s.dut.div_busy_ret, s.div_busy.read_data)
+
+  def line_trace(s):
+    return s.dut.line_trace()
+
+
+def make_msg(seq,
+             rd,
+             rs1=0,
+             rs2=0,
+             op_class=OpClass.OP_CLASS_ALU,
+             m_func=MFunc.M_FUNC_MUL):
+  msg = RenameMsg()
+  msg.hdr_status = PipelineMsgStatus.PIPELINE_MSG_STATUS_VALID
+  msg.hdr_seq = seq
+  msg.op_class = op_class
+  msg.m_msg_func = m_func
+  msg.rd = rd
+  msg.rd_val = 1
+  msg.rs1 = rs1
+  msg.rs1_val = 1
+  msg.rs2 = rs2
+  msg.rs2_val = 1
+  return msg
+
+
+def add(dut, msg):
+  assert dut.add(msg=msg) != not_ready_instance
+  dut.cycle()
+
+
+@pytest.mark.parametrize('kind', ['compacting', 'age'])
+def test_early_wakeup_waits_for_value(kind):
+  dut = wrap_to_cl(IssueTestHarness(1, kind))
+  dut.reset()
+
+  add(dut, make_msg(1, 6, rs1=5))
+  dut.cycle()
+  assert dut.peek() == not_ready_instance
+
+  # The producer promised tag 5, but is late, so the dependent stays in
+  # the queue until the value is written
+  dut.wakeup(tag=5)
+  dut.cycle()
+  for _ in range(3):
+    assert dut.peek() == not_ready_instance
+    dut.cycle()
+  dut.write(tag=5)
+  dut.cycle()
+  msg = dut.peek().msg
+  assert int(msg.hdr_seq) == 1
+  assert int(msg.rs1) == 5
+  dut.take()
+  dut.cycle()
+  assert dut.peek() == not_ready_instance
+
+
+@pytest.mark.parametrize('kind', ['compacting', 'age'])
+def test_early_wakeup_on_time(kind):
+  dut = wrap_to_cl(IssueTestHarness(1, kind))
+  dut.reset()
+
+  add(dut, make_msg(1, 6, rs1=5))
+  dut.cycle()
+  dut.wakeup(tag=5)
+  dut.cycle()
+  # The value is written the cycle the dependent issues
+  dut.write(tag=5)
+  msg = dut.peek().msg
+  assert int(msg.hdr_seq) == 1
+  dut.take()
+  dut.cycle()
+
+
+@pytest.mark.parametrize('kind', ['compacting', 'age'])
+def test_dual_alu_issue(kind):
+  dut = wrap_to_cl(IssueTestHarness(2, kind))
+  dut.reset()
+
+  add(dut, make_msg(1, 6))
+  add(dut, make_msg(2, 7))
+  dut.cycle()
+  # Independent ALU instructions issue together, oldest first
+  first = dut.peek()
+  second = dut.peek()
+  assert int(first.msg.hdr_seq) == 1
+  assert int(second.msg.hdr_seq) == 2
+  dut.take()
+  dut.take()
+  dut.cycle()
+  assert dut.peek() == not_ready_instance
+
+
+@pytest.mark.parametrize('kind', ['compacting', 'age'])
+@pytest.mark.parametrize(
+    'op_class',
+    [OpClass.OP_CLASS_MUL, OpClass.OP_CLASS_MEM, OpClass.OP_CLASS_BRANCH])
+def test_second_port_alu_only(kind, op_class):
+  dut = wrap_to_cl(IssueTestHarness(2, kind))
+  dut.reset()
+
+  add(dut, make_msg(1, 6))
+  add(dut, make_msg(2, 7, op_class=op_class))
+  dut.cycle()
+  # Only the first port takes anything but the ALU, so the second
+  # instruction waits for it
+  assert int(dut.peek().msg.hdr_seq) == 1
+  assert dut.peek() == not_ready_instance
+  dut.take()
+  dut.cycle()
+  msg = dut.peek().msg
+  assert int(msg.hdr_seq) == 2
+  assert msg.op_class == op_class
+  dut.take()
+  dut.cycle()
+  assert dut.peek() == not_ready_instance
+
+
+@pytest.mark.parametrize('kind', ['compacting', 'age'])
+def test_held_divide_passed_over(kind):
+  dut = wrap_to_cl(IssueTestHarness(2, kind, hold_divides=True))
+  dut.reset()
+
+  dut.set_div_busy(busy=1)
+  dut.cycle()
+  add(dut,
+      make_msg(1, 6, op_class=OpClass.OP_CLASS_MUL, m_func=MFunc.M_FUNC_DIV))
+  add(dut, make_msg(2, 7, op_class=OpClass.OP_CLASS_MUL))
+  add(dut, make_msg(3, 8))
+  dut.cycle()
+  # The divide waits for the divider, but the multiply behind it issues
+  assert int(dut.peek().msg.hdr_seq) == 2
+  assert int(dut.peek().msg.hdr_seq) == 3
+  dut.take()
+  dut.take()
+  dut.cycle()
+  assert dut.peek() == not_ready_instance
+  dut.set_div_busy(busy=0)
+  dut.cycle()
+  msg = dut.peek().msg
+  assert int(msg.hdr_seq) == 1
+  assert msg.m_msg_func == MFunc.M_FUNC_DIV
+  dut.take()
+  dut.cycle()
+  assert dut.peek() == not_ready_instance
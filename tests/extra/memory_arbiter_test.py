@@ -0,0 +1,85 @@
+import random
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.test_utils import run_model_translation
+from lizard.model.test_harness import TestHarness
+from lizard.model.wrapper import wrap_to_rtl, wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.mem.rtl.memory_bus import MemoryBusInterface
+from lizard.mem.fl.test_memory_bus import TestMemoryBusFL
+from lizard.core.rtl.memory_arbiter import MemoryArbiterInterface, MemoryArbiter
+
+
+def make_interface():
+  return MemoryArbiterInterface(Bits(16), Bits(4), Bits(64))
+
+
+class MemoryArbiterTestHarness(Model):
+
+  def __init__(s, max_loads, delay, jitter, initial_memory):
+    s.mbi = MemoryBusInterface(1, 2, 2, 16, 8)
+    s.tmb = TestMemoryBusFL(s.mbi, initial_memory, [delay], [4], [jitter])
+    s.mb = wrap_to_rtl(s.tmb)
+
+    TestHarness(
+        s,
+        MemoryArbiter(
+            make_interface(), s.mbi.MemMsg, max_stores=2, max_loads=max_loads),
+        False)
+
+    s.connect_m(s.dut.mb_send, s.mb.send_0)
+    s.connect_m(s.dut.mb_recv, s.mb.recv_0)
+
+  def line_trace(s):
+    return ''
+
+
+def test_translation():
+  mbi = MemoryBusInterface(1, 2, 2, 16, 8)
+  run_model_translation(MemoryArbiter(make_interface(), mbi.MemMsg, 2, 3))
+
+
+@pytest.mark.parametrize('max_loads,delay,jitter', [
+    (1, 0, 0),
+    (3, 0, 0),
+    (3, 2, 0),
+    (2, 1, 3),
+    (3, 0, 5),
+])
+def test_random(max_loads, delay, jitter):
+  rng = random.Random(max_loads + delay + jitter)
+  mem = {addr: rng.getrandbits(8) for addr in range(256)}
+  th = MemoryArbiterTestHarness(max_loads, delay, jitter, dict(mem))
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  # Loads must come back in the order they were sent, whatever order
+  # memory answers them in
+  expected = []
+  nsent = 0
+  most_in_flight = 0
+  for _ in range(2000):
+    if nsent == 100 and not expected:
+      break
+    if expected:
+      resp = dut.recv_load()
+      if resp != not_ready_instance:
+        assert resp.data == expected.pop(0)
+    if nsent < 100:
+      addr = rng.randrange(0, 256, 8)
+      if rng.random() < 0.2:
+        data = rng.getrandbits(64)
+        if dut.send_store(addr=addr, size=8, data=data) != not_ready_instance:
+          for i in range(8):
+            mem[addr + i] = (data >> (i * 8)) & 0xff
+          nsent += 1
+      elif dut.send_load(addr=addr, size=8) != not_ready_instance:
+        expected.append(sum(mem[addr + i] << (i * 8) for i in range(8)))
+        nsent += 1
+    most_in_flight = max(most_in_flight, len(expected))
+    dut.cycle()
+  assert nsent == 100 and not expected
+  assert most_in_flight <= max_loads
+  if delay + jitter > 0:
+    assert most_in_flight == max_loads
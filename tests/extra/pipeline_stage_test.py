@@ -1,7 +1,7 @@
 from pymtl import *
 from tests.context import lizard
 from lizard.util.rtl.interface import UseInterface
-from lizard.util.rtl.pipeline_stage import StageInterface, DropControllerInterface, DropControllerInterface, PipelineStageInterface, gen_stage
+from lizard.util.rtl.pipeline_stage import StageInterface, DropControllerInterface, DropControllerInterface, PipelineStageInterface, gen_stage, NullDropController, ValidValueGroup, ValidValueGroupInterface
 from lizard.util.rtl.register import Register, RegisterInterface
 from lizard.model.wrapper import wrap_to_cl
 from lizard.model.translate import translate
@@ -71,3 +71,31 @@ def test_basic():
 
   dut.cycle()
   assert dut.peek().msg == 3
+
+
+def NullByteDropController():
+  return NullDropController(DropControllerInterface(Bits(8), Bits(8), None))
+
+
+def test_group():
+  dut = wrap_to_cl(
+      ValidValueGroup(
+          ValidValueGroupInterface(Bits(8), Bits(8), None, 2),
+          NullByteDropController))
+  dut.reset()
+
+  dut.add(msg=1)
+  dut.add(msg=2)
+  dut.cycle()
+  assert dut.peek().msg == 1
+  assert dut.peek().msg == 2
+  dut.take()
+  # The group is not empty yet
+  assert isinstance(dut.add(msg=3), NotReady)
+  dut.cycle()
+  assert dut.peek().msg == 2
+  dut.take()
+  dut.add(msg=3)
+  dut.cycle()
+  assert dut.peek().msg == 3
+  assert isinstance(dut.peek(), NotReady)
@@ -0,0 +1,32 @@
+from pymtl import *
+from tests.context import lizard
+from lizard.util.test_utils import run_model_translation
+from lizard.model.wrapper import wrap_to_cl
+from lizard.core.rtl.frontend.return_stack import ReturnStack, ReturnStackInterface
+
+
+def test_translation():
+  run_model_translation(ReturnStack(ReturnStackInterface(16, 4)))
+
+
+def test_push_pop_restore():
+  dut = wrap_to_cl(ReturnStack(ReturnStackInterface(16, 4)))
+  dut.reset()
+
+  assert dut.update(pop=0, push=1, addr=0x10).tos == 1
+  dut.cycle()
+  assert dut.update(pop=0, push=1, addr=0x20).tos == 2
+  dut.cycle()
+  assert dut.peek().addr == 0x20
+  # Pop then push replaces the top
+  assert dut.update(pop=1, push=1, addr=0x30).tos == 2
+  dut.cycle()
+  assert dut.peek().addr == 0x30
+  assert dut.update(pop=1, push=0, addr=0).tos == 1
+  dut.cycle()
+  assert dut.peek().addr == 0x10
+
+  # A checkpoint taken with 2 entries can be restored after a pop
+  dut.restore(tos=2)
+  dut.cycle()
+  assert dut.peek().addr == 0x30
@@ -8,6 +8,7 @@ from tests.config import test_verilog
 from lizard.util.fl.snapshotting_freelist import SnapshottingFreeListFL
 from lizard.util.fl.freelist import FreeListFL
 from lizard.model.wrapper import wrap_to_cl, wrap_to_rtl
+from lizard.model.hardware_model import not_ready_instance
 
 
 def test_basic():
@@ -68,6 +69,63 @@ def test_wrapped_freelist():
       test_verilog=False)
 
 
+def test_shared_refs():
+  run_test_vector_sim(
+      SnapshottingFreeList(4, 1, 1, 4, max_refs=2),
+      [
+          ('alloc_call[0] alloc_rdy[0]* alloc_index[0]* share_call[0] share_index[0] drop_call[0] drop_index[0] drop_freed[0]* set_call'
+          ),
+          (1, 1, 0, 0, 0, 0, 0, '?', 0),
+          (0, 1, '?', 1, 0, 0, 0, '?', 0),  # 0 is shared
+          (0, 1, '?', 0, 0, 1, 0, 0, 0),  # 0 is still used
+          (0, 1, '?', 1, 0, 1, 0, 0, 0),  # the share comes first
+          (1, 1, 1, 0, 0, 0, 0, '?', 0),
+          (0, 1, '?', 0, 0, 1, 0, 1, 0),  # the last reference frees 0
+          (1, 1, 0, 0, 0, 0, 0, '?', 0),
+      ],
+      dump_vcd=None,
+      test_verilog=test_verilog)
+
+
 def test_state_machine():
   run_test_state_machine(SnapshottingFreeList, SnapshottingFreeListFL,
                          (4, 1, 1, 4))
+
+
+def alloc(dut):
+  result = dut.alloc()
+  dut.cycle()
+  if result == not_ready_instance:
+    return None
+  return int(result.index)
+
+
+@pytest.mark.parametrize('model',
+                         [SnapshottingFreeList, SnapshottingFreeListFL])
+def test_nested_snapshots(model):
+  dut = wrap_to_cl(model(16, 1, 1, 8))
+  dut.reset()
+
+  # 8 nested branches, each with a slot allocated after it
+  assert alloc(dut) == 0
+  for depth in range(8):
+    dut.reset_alloc_tracking(target_id=depth)
+    dut.cycle()
+    assert alloc(dut) == depth + 1
+
+  # The deepest branch only frees its own slot
+  dut.revert_allocs(source_id=7)
+  dut.cycle()
+  assert alloc(dut) == 8
+  assert alloc(dut) == 9
+
+  # The shallowest frees everything allocated after it, including the
+  # slots allocated after the deeper revert
+  dut.revert_allocs(source_id=0)
+  dut.cycle()
+  allocated = []
+  for _ in range(16):
+    index = alloc(dut)
+    if index is not None:
+      allocated.append(index)
+  assert sorted(allocated) == range(1, 16)
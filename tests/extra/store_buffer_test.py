@@ -0,0 +1,202 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.test_utils import run_model_translation
+from lizard.util.rtl.interface import Interface, IncludeAll, UseInterface
+from lizard.util.rtl.method import MethodSpec
+from lizard.model.test_harness import TestHarness
+from lizard.model.wrapper import wrap_to_rtl, wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.mem.rtl.memory_bus import MemoryBusInterface
+from lizard.mem.fl.test_memory_bus import TestMemoryBusFL
+from lizard.mem.rtl.dcache import DCache, DCacheInterface
+from lizard.core.rtl.memory_arbiter import MemoryArbiterInterface, MemoryArbiter
+from lizard.core.rtl.store_buffer import StoreBuffer, StoreBufferInterface
+
+
+def make_interface():
+  return StoreBufferInterface(Bits(16), Bits(4), Bits(64))
+
+
+class StoreBufferTestHarness(Model):
+  """StoreBuffer writing to memory through an arbiter.
+
+  If dcache is set, a DCache sits between the arbiter and memory, like in
+  the processor. It answers a write crossing a word as misaligned, without
+  writing it. clean_cache and cache_busy are its clean and busy.
+  """
+
+  def __init__(s, nentries, drain_delay, dcache=False):
+    s.mbi = MemoryBusInterface(1, 2, 2, 16, 8)
+    s.tmb = TestMemoryBusFL(s.mbi)
+    s.mb = wrap_to_rtl(s.tmb)
+    s.arbiter = MemoryArbiter(
+        MemoryArbiterInterface(Bits(16), Bits(4), Bits(64)),
+        s.mbi.MemMsg,
+        max_stores=2)
+
+    if not dcache:
+      TestHarness(s, StoreBuffer(make_interface(), nentries, drain_delay),
+                  False)
+      s.connect_m(s.arbiter.mb_send, s.mb.send_0)
+      s.connect_m(s.arbiter.mb_recv, s.mb.recv_0)
+    else:
+      s.dut = StoreBuffer(make_interface(), nentries, drain_delay)
+      UseInterface(
+          s,
+          Interface([
+              MethodSpec(
+                  'clean_cache',
+                  args=None,
+                  rets=None,
+                  call=True,
+                  rdy=False,
+              ),
+              MethodSpec(
+                  'cache_busy',
+                  args=None,
+                  rets={'ret': Bits(1)},
+                  call=False,
+                  rdy=False,
+              ),
+          ],
+                    bases=[IncludeAll(s.dut.interface)]))
+      for name in s.dut.interface.methods.keys():
+        s.connect_m(getattr(s, name), getattr(s.dut, name))
+
+      s.cache = DCache(DCacheInterface(s.mbi.MemMsg), 2, 1, 16, 1)
+      s.connect_m(s.arbiter.mb_send, s.cache.send)
+      s.connect_m(s.arbiter.mb_recv, s.cache.recv)
+      s.connect_m(s.cache.mem_send, s.mb.send_0)
+      s.connect_m(s.cache.mem_recv, s.mb.recv_0)
+      s.connect(s.cache.prefetch_call, 0)
+      s.connect(s.cache.clean_call, s.clean_cache_call)
+      s.connect(s.cache_busy_ret, s.cache.busy_ret)
+
+    s.connect_m(s.dut.send_store, s.arbiter.send_store)
+    s.connect(s.arbiter.send_load_call, 0)
+    s.connect(s.arbiter.send_load_addr, 0)
+    s.connect(s.arbiter.send_load_size, 0)
+    s.connect(s.arbiter.recv_load_call, 0)
+
+  def line_trace(s):
+    return s.dut.line_trace()
+
+
+def test_translation():
+  run_model_translation(StoreBuffer(make_interface(), 4, 3))
+
+
+def enqueue(dut, addr, size, data):
+  for _ in range(100):
+    if dut.enqueue(addr=addr, size=size, data=data) != not_ready_instance:
+      dut.cycle()
+      return
+    dut.cycle()
+  assert False
+
+
+def drain(dut):
+  for _ in range(100):
+    if not dut.busy().ret:
+      return
+    dut.cycle()
+  assert False
+
+
+@pytest.mark.parametrize('nentries', [2, 4])
+def test_coalesce(nentries):
+  th = StoreBufferTestHarness(nentries, 16)
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  # A byte at a time into one word, which goes out once it is full
+  for i in range(8):
+    enqueue(dut, 0x10 + i, 1, 0xa0 + i)
+  check = dut.check(addr=0x12, size=2)
+  assert check.forward == 1
+  assert check.forward_data[0:16] == 0xa3a2
+  dut.cycle()
+  drain(dut)
+  assert int(dut.stats().writes) == 1
+  assert th.tmb.read_mem(0x10, 8) == 0xa7a6a5a4a3a2a1a0
+
+  # A partial word goes out in aligned pieces after a flush
+  enqueue(dut, 0x20, 4, 0x11223344)
+  enqueue(dut, 0x26, 1, 0x55)
+  check = dut.check(addr=0x24, size=4)
+  assert check.forward == 0 and check.pending == 1
+  dut.cycle()
+  assert dut.check(addr=0x28, size=8).pending == 0
+  dut.cycle()
+  dut.flush()
+  drain(dut)
+  assert int(dut.stats().writes) == 3
+  assert th.tmb.read_mem(0x20, 4) == 0x11223344
+  assert th.tmb.read_mem(0x26, 1) == 0x55
+
+  # A store crossing into the next word goes out in 2 writes
+  enqueue(dut, 0x2f, 2, 0x6677)
+  drain(dut)
+  stats = dut.stats()
+  assert int(stats.stores) == 11
+  assert int(stats.writes) == 5
+  assert th.tmb.read_mem(0x2f, 2) == 0x6677
+
+
+def test_waiting_load_drains():
+  th = StoreBufferTestHarness(4, 16)
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  enqueue(dut, 0x10, 2, 0xbeef)
+  enqueue(dut, 0x30, 1, 0x11)
+  for _ in range(4):
+    dut.cycle()
+  assert int(dut.stats().writes) == 0
+
+  # A load waiting on the second entry drains it well before drain_delay,
+  # and ahead of the first one
+  for _ in range(4):
+    if dut.check(addr=0x30, size=4).pending == 0:
+      break
+    dut.cycle()
+  else:
+    assert False
+  assert int(dut.stats().writes) == 1
+  assert dut.busy().ret == 1
+
+  dut.flush()
+  drain(dut)
+  assert int(dut.stats().writes) == 2
+  assert th.tmb.read_mem(0x10, 2) == 0xbeef
+  assert th.tmb.read_mem(0x30, 1) == 0x11
+
+
+def test_crossing_store_through_cache():
+  th = StoreBufferTestHarness(2, 16, dcache=True)
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  # Each store crossing a word is split, as the cache would not take it
+  # whole. The second one waits for the part of the first in the next word
+  # to drain, as its first part is in that word
+  enqueue(dut, 0x2f, 2, 0x6677)
+  enqueue(dut, 0x35, 8, 0x0123456789abcdef)
+  dut.flush()
+  drain(dut)
+  stats = dut.stats()
+  assert int(stats.stores) == 2
+  # 1 byte in each word, then 3 bytes, and 5 bytes as 4 and 1
+  assert int(stats.writes) == 5
+
+  dut.clean_cache()
+  dut.cycle()
+  for _ in range(100):
+    if not dut.cache_busy().ret:
+      break
+    dut.cycle()
+  else:
+    assert False
+  assert th.tmb.read_mem(0x2f, 2) == 0x6677
+  assert th.tmb.read_mem(0x35, 8) == 0x0123456789abcdef
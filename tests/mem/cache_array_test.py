@@ -0,0 +1,20 @@
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.model.test_model import run_test_state_machine
+from lizard.mem.rtl.cache_array import CacheArray, CacheArrayInterface
+from lizard.mem.fl.cache_array import CacheArrayFL
+
+
+@pytest.mark.parametrize('nsets,nways,line_nbytes', [
+    (2, 1, 4),
+    (2, 2, 4),
+    (4, 2, 8),
+    (2, 3, 4),
+    (4, 4, 4),
+])
+def test_state_machine(nsets, nways, line_nbytes):
+  run_test_state_machine(
+      CacheArray,
+      CacheArrayFL, (CacheArrayInterface(7, 2, nsets, nways, line_nbytes),),
+      translate_model=True)
@@ -0,0 +1,287 @@
+import random
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.model.test_harness import TestHarness
+from lizard.model.wrapper import wrap_to_rtl, wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.mem.rtl.memory_bus import MemoryBusInterface
+from lizard.mem.fl.test_memory_bus import TestMemoryBusFL
+from lizard.mem.rtl.dcache import DCache, DCacheInterface
+from lizard.mem.fl.dcache import DCacheFL
+
+
+class DCacheTestHarness(Model):
+
+  def __init__(s, nsets, nways, line_nbytes, nmshrs, delay, jitter):
+    s.mbi = MemoryBusInterface(1, 2, 2, 16, 8)
+    s.tmb = TestMemoryBusFL(s.mbi, {}, [delay], [nmshrs], [jitter])
+    s.mb = wrap_to_rtl(s.tmb)
+
+    TestHarness(
+        s,
+        DCache(
+            DCacheInterface(s.mbi.MemMsg), nsets, nways, line_nbytes, nmshrs),
+        False)
+
+    s.connect_m(s.mb.recv_0, s.dut.mem_recv)
+    s.connect_m(s.mb.send_0, s.dut.mem_send)
+
+  def line_trace(s):
+    return s.dut.line_trace()
+
+
+def gen_requests(MemMsg, n, addr_range, seed):
+  rng = random.Random(seed)
+  reqs = []
+  for _ in range(n):
+    size = rng.choice([1, 2, 4, 8])
+    addr = rng.randrange(0, addr_range, size)
+    # Some requests are misaligned, and some of those cross into the next
+    # bus word
+    if size != 1 and rng.random() < 0.1:
+      addr = rng.randrange(0, addr_range - size)
+    len_ = size % 8
+    if rng.random() < 0.5:
+      data = rng.getrandbits(size * 8)
+      reqs.append(MemMsg.req.mk_wr(0, addr, len_, data))
+    else:
+      reqs.append(MemMsg.req.mk_rd(0, addr, len_))
+  return reqs
+
+
+@pytest.mark.parametrize('nsets,nways,line_nbytes,nmshrs,delay,jitter,prefetch',
+                         [
+                             (2, 1, 16, 1, 0, 0, False),
+                             (2, 2, 16, 2, 0, 0, False),
+                             (4, 2, 32, 2, 2, 0, False),
+                             (2, 1, 16, 4, 1, 0, False),
+                             (2, 2, 16, 2, 0, 0, True),
+                             (4, 2, 32, 2, 2, 0, True),
+                             (4, 2, 32, 2, 1, 4, False),
+                             (2, 1, 16, 4, 0, 3, True),
+                         ])
+def test_random(nsets, nways, line_nbytes, nmshrs, delay, jitter, prefetch):
+  th = DCacheTestHarness(nsets, nways, line_nbytes, nmshrs, delay, jitter)
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  ref = DCacheFL(DCacheInterface(MemMsg), nsets, nways, line_nbytes)
+  expected = {}
+  reqs = gen_requests(MemMsg, 200, 256, nsets * nways + nmshrs)
+  free_tags = range(4)
+  rng = random.Random(nsets + nways)
+  for _ in range(5000):
+    if not reqs and not expected:
+      break
+    resp = dut.recv()
+    if resp != not_ready_instance:
+      tag = int(resp.msg.opaque)
+      assert resp.msg.type_ == expected[tag].type_
+      assert resp.msg.stat == expected[tag].stat
+      assert resp.msg.data == expected[tag].data
+      del expected[tag]
+      free_tags.append(tag)
+    if reqs and free_tags:
+      req = MemMsg.req.mk_msg(reqs[0].type_, free_tags[0], reqs[0].addr,
+                              reqs[0].len_, reqs[0].data)
+      if dut.send(msg=req) != not_ready_instance:
+        reqs.pop(0)
+        free_tags.pop(0)
+        expected[int(req.opaque)] = ref.handle_request(req)
+    # Prefetches take the input buffer when it is free, and must not
+    # change the results
+    if prefetch:
+      dut.prefetch(addr=rng.randrange(0, 256))
+    dut.cycle()
+  assert not reqs and not expected
+
+  # Cleaning writes every dirty line back to memory
+  dut.clean()
+  dut.cycle()
+  for _ in range(1000):
+    if not dut.busy().ret:
+      break
+    dut.cycle()
+  assert not dut.busy().ret
+  for addr, value in ref.mem.iteritems():
+    assert th.tmb.mem.get(addr, 0) == value
+
+  stats = dut.stats()
+  assert int(stats.hits) + int(stats.misses) > 0
+  assert (int(stats.prefetches) > 0) == prefetch
+  assert int(stats.useful_prefetches) <= int(stats.prefetches)
+
+
+def access(dut, req):
+  while dut.send(msg=req) == not_ready_instance:
+    dut.cycle()
+  dut.cycle()
+  for _ in range(200):
+    resp = dut.recv()
+    dut.cycle()
+    if resp != not_ready_instance:
+      return resp.msg
+  assert False
+
+
+def zero_memory(th):
+  th.tmb.mem.update((addr, 0) for addr in range(256))
+
+
+def wait_idle(dut):
+  for _ in range(1000):
+    if not dut.busy().ret:
+      return
+    dut.cycle()
+  assert False
+
+
+@pytest.mark.parametrize('nsets,nways,line_nbytes,nmshrs,delay', [
+    (2, 1, 16, 1, 0),
+    (2, 2, 16, 2, 1),
+    (4, 2, 32, 2, 0),
+    (2, 4, 16, 4, 2),
+])
+def test_exact_counts(nsets, nways, line_nbytes, nmshrs, delay):
+  th = DCacheTestHarness(nsets, nways, line_nbytes, nmshrs, delay, 0)
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  # One request at a time, so every lookup matches the reference
+  ref = DCacheFL(DCacheInterface(MemMsg), nsets, nways, line_nbytes)
+  for req in gen_requests(MemMsg, 200, 256, nsets + nways):
+    resp = access(dut, req)
+    expected = ref.handle_request(req)
+    assert resp.type_ == expected.type_
+    assert resp.stat == expected.stat
+    assert resp.data == expected.data
+    assert resp.test == expected.test
+
+  stats = dut.stats()
+  assert int(stats.hits) == ref.hits
+  assert int(stats.misses) == ref.misses
+  assert ref.hits > 0 and ref.misses > 0
+
+
+def test_dirty_writeback_on_eviction():
+  th = DCacheTestHarness(2, 1, 16, 1, 1, 0)
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+  zero_memory(th)
+
+  access(dut, MemMsg.req.mk_wr(0, 0x00, 0, 0x1122334455667788))
+  assert dut.busy().ret
+  assert th.tmb.read_mem(0x00, 8) == 0
+
+  # 0x20 is in the same set, so the dirty line is written back first
+  assert access(dut, MemMsg.req.mk_rd(1, 0x20, 0)).data == 0
+  wait_idle(dut)
+  assert th.tmb.read_mem(0x00, 8) == 0x1122334455667788
+  assert access(dut, MemMsg.req.mk_rd(2, 0x04, 4)).data == 0x11223344
+  stats = dut.stats()
+  assert int(stats.hits) == 0
+  assert int(stats.misses) == 3
+
+
+def test_mshr_full_stall():
+  th = DCacheTestHarness(4, 1, 16, 2, 4, 0)
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+  for addr in range(0x00, 0x40, 8):
+    th.tmb.mem[addr] = addr + 1
+
+  # Misses to 3 different sets: the first 2 take both MSHRs, and the
+  # third waits in the input buffer, so nothing more can be sent
+  for tag in range(3):
+    while dut.send(msg=MemMsg.req.mk_rd(tag, tag *
+                                        0x10, 0)) == not_ready_instance:
+      dut.cycle()
+    dut.cycle()
+  assert dut.send(msg=MemMsg.req.mk_rd(3, 0x30, 0)) == not_ready_instance
+  dut.cycle()
+
+  sent = 3
+  received = {}
+  for _ in range(200):
+    if len(received) == 4:
+      break
+    resp = dut.recv()
+    if resp != not_ready_instance:
+      received[int(resp.msg.opaque)] = int(resp.msg.data)
+    if sent == 3 and dut.send(
+        msg=MemMsg.req.mk_rd(3, 0x30, 0)) != not_ready_instance:
+      sent += 1
+    dut.cycle()
+  assert received == {tag: tag * 0x10 + 1 for tag in range(4)}
+  stats = dut.stats()
+  assert int(stats.hits) == 0
+  assert int(stats.misses) == 4
+
+
+def test_hit_under_miss_same_line():
+  th = DCacheTestHarness(2, 1, 16, 2, 3, 0)
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+  th.tmb.mem[0x00] = 0x5a
+
+  # A store and a load to the line being refilled wait for the refill,
+  # then hit in order
+  reqs = [
+      MemMsg.req.mk_rd(0, 0x00, 1),
+      MemMsg.req.mk_wr(1, 0x08, 4, 0xdeadbeef),
+      MemMsg.req.mk_rd(2, 0x08, 0),
+  ]
+  order = []
+  data = {}
+  for _ in range(200):
+    if len(order) == 3:
+      break
+    resp = dut.recv()
+    if resp != not_ready_instance:
+      order.append(int(resp.msg.opaque))
+      data[int(resp.msg.opaque)] = int(resp.msg.data)
+    if reqs and dut.send(msg=reqs[0]) != not_ready_instance:
+      reqs.pop(0)
+    dut.cycle()
+  assert order == [0, 1, 2]
+  assert data[0] == 0x5a
+  assert data[2] == 0xdeadbeef
+  stats = dut.stats()
+  assert int(stats.hits) == 2
+  assert int(stats.misses) == 1
+
+
+def test_clean_drains_every_dirty_line():
+  th = DCacheTestHarness(4, 2, 16, 2, 1, 0)
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+  zero_memory(th)
+
+  # Fill both ways of every set with dirty lines
+  addrs = range(0x00, 0x80, 0x10)
+  for i, addr in enumerate(addrs):
+    access(dut, MemMsg.req.mk_wr(i % 4, addr + 8, 0, 0x100 + i))
+  assert dut.busy().ret
+  for addr in addrs:
+    assert th.tmb.read_mem(addr + 8, 8) == 0
+
+  dut.clean()
+  dut.cycle()
+  wait_idle(dut)
+  for i, addr in enumerate(addrs):
+    assert th.tmb.read_mem(addr + 8, 8) == 0x100 + i
+
+  # Cleaning keeps the lines, now clean
+  for i, addr in enumerate(addrs):
+    assert access(dut, MemMsg.req.mk_rd(i % 4, addr + 8, 0)).data == 0x100 + i
+  assert not dut.busy().ret
+  stats = dut.stats()
+  assert int(stats.hits) == len(addrs)
+  assert int(stats.misses) == len(addrs)
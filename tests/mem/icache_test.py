@@ -0,0 +1,128 @@
+import random
+import pytest
+from pymtl import *
+from tests.context import lizard
+from lizard.util.test_utils import run_model_translation
+from lizard.model.test_harness import TestHarness
+from lizard.model.wrapper import wrap_to_rtl, wrap_to_cl
+from lizard.model.hardware_model import not_ready_instance
+from lizard.mem.rtl.memory_bus import MemoryBusInterface
+from lizard.mem.fl.test_memory_bus import TestMemoryBusFL
+from lizard.mem.rtl.icache import ICache, ICacheInterface
+from lizard.mem.fl.icache import ICacheFL
+
+
+def make_memory(seed):
+  rng = random.Random(seed)
+  return {addr: rng.getrandbits(8) for addr in range(512)}
+
+
+class ICacheTestHarness(Model):
+
+  def __init__(s, nsets, nways, line_nbytes, prefetch_lines, delay,
+               initial_memory):
+    s.mbi = MemoryBusInterface(1, 2, 2, 16, 8)
+    s.tmb = TestMemoryBusFL(s.mbi, initial_memory, [delay], [line_nbytes // 8])
+    s.mb = wrap_to_rtl(s.tmb)
+
+    TestHarness(
+        s,
+        ICache(
+            ICacheInterface(s.mbi.MemMsg), nsets, nways, line_nbytes,
+            prefetch_lines), False)
+
+    s.connect_m(s.mb.recv_0, s.dut.mem_recv)
+    s.connect_m(s.mb.send_0, s.dut.mem_send)
+
+  def line_trace(s):
+    return s.dut.line_trace()
+
+
+def test_translation():
+  mbi = MemoryBusInterface(1, 2, 2, 16, 8)
+  run_model_translation(ICache(ICacheInterface(mbi.MemMsg), 4, 2, 16, 2))
+
+
+def fetch(dut, MemMsg, addr):
+  while dut.send(msg=MemMsg.req.mk_rd(0, addr, 0)) == not_ready_instance:
+    dut.cycle()
+  dut.cycle()
+  for _ in range(100):
+    resp = dut.recv()
+    dut.cycle()
+    if resp != not_ready_instance:
+      return resp.msg
+  assert False
+
+
+@pytest.mark.parametrize('nsets,nways,line_nbytes,prefetch_lines,delay', [
+    (2, 1, 16, 0, 0),
+    (2, 2, 16, 0, 0),
+    (4, 2, 32, 0, 2),
+    (2, 4, 16, 0, 1),
+    (4, 2, 32, 2, 0),
+    (2, 2, 16, 1, 3),
+])
+def test_random(nsets, nways, line_nbytes, prefetch_lines, delay):
+  mem = make_memory(nsets + nways)
+  th = ICacheTestHarness(nsets, nways, line_nbytes, prefetch_lines, delay,
+                         dict(mem))
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  ref = ICacheFL(ICacheInterface(MemMsg), nsets, nways, line_nbytes, dict(mem))
+  rng = random.Random(line_nbytes + delay)
+  # Mostly nearby blocks, like instruction fetch, with some jumps
+  addr = 0
+  for i in range(200):
+    if rng.random() < 0.2:
+      addr = rng.randrange(0, 512, 8)
+    else:
+      addr = (addr + 8) % 512
+    if i % 50 == 49:
+      dut.flush()
+      ref.flush()
+      dut.cycle()
+    resp = fetch(dut, MemMsg, addr)
+    expected = ref.handle_request(MemMsg.req.mk_rd(0, addr, 0))
+    assert resp.data == expected.data
+    # Prefetched lines hit where the reference misses
+    if not prefetch_lines:
+      assert resp.test == expected.test
+
+  stats = dut.stats()
+  expected = ref.stats()
+  if prefetch_lines:
+    assert int(stats.hits) + int(stats.misses) == 200
+    assert int(stats.prefetches) > 0
+    assert int(stats.useful_prefetches) <= int(stats.prefetches)
+  else:
+    assert int(stats.hits) == expected.hits
+    assert int(stats.misses) == expected.misses
+    assert int(stats.prefetches) == 0
+
+
+def test_replacement_and_flush():
+  mem = make_memory(0)
+  th = ICacheTestHarness(2, 2, 16, 0, 1, dict(mem))
+  MemMsg = th.mbi.MemMsg
+  dut = wrap_to_cl(th)
+  dut.reset()
+
+  # Lines 0x00, 0x20 and 0x40 are all in set 0. The third line evicts the
+  # first one filled into a full set
+  hits = [
+      int(fetch(dut, MemMsg, addr).test)
+      for addr in [0x00, 0x20, 0x08, 0x40, 0x28, 0x00]
+  ]
+  assert hits == [0, 0, 1, 0, 1, 0]
+
+  # A flush invalidates every line
+  dut.flush()
+  dut.cycle()
+  assert int(fetch(dut, MemMsg, 0x40).test) == 0
+  assert int(fetch(dut, MemMsg, 0x48).test) == 1
+  stats = dut.stats()
+  assert int(stats.hits) == 3
+  assert int(stats.misses) == 5